@@ -1,9 +1,9 @@
 from django.contrib import admin
 
-from .models import (ActivityLog, Attachment, DailyReport, DailyReportPhoto,
-                     Department, Employee, MaterialWriteOff, Note,
-                     Notification, Project, ProjectTask, Task, TaskProject,
-                     TaskReport)
+from .models import (ActivityLog, Attachment, Blob, DailyReport,
+                     DailyReportEntry, DailyReportPhoto, Department, Employee,
+                     MaterialWriteOff, Note, Notification, Project,
+                     ProjectTask, Task, TaskProject, TaskReport)
 
 
 @admin.register(Department)
@@ -94,10 +94,19 @@ class AttachmentAdmin(admin.ModelAdmin):
     list_display = [
         'filename', 'attachment_type', 'uploaded_by', 'file_size', 'uploaded_at'
     ]
-    list_filter = ['attachment_type', 'uploaded_at']
+    list_filter = ['attachment_type', 'file_present', 'uploaded_at']
     search_fields = ['filename']
-    raw_id_fields = ['uploaded_by']
-    readonly_fields = ['file_size', 'uploaded_at']
+    raw_id_fields = ['uploaded_by', 'blob']
+    readonly_fields = ['file_size', 'uploaded_at', 'file_present', 'file_checked_at']
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'content_type', 'size', 'ref_count', 'created_at']
+    list_filter = ['content_type']
+    search_fields = ['sha256']
+    # Счётчик ссылок ведёт services.blob_storage — вручную не редактируется
+    readonly_fields = ['sha256', 'file', 'size', 'content_type', 'ref_count', 'created_at']
 
 
 @admin.register(Notification)
@@ -132,6 +141,16 @@ class ActivityLogAdmin(admin.ModelAdmin):
         return False
 
 
+class DailyReportEntryInline(admin.TabularInline):
+    model = DailyReportEntry
+    extra = 0
+    fields = ['created_at', 'author', 'text', 'folded']
+    readonly_fields = ['created_at', 'author', 'text', 'folded']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(DailyReport)
 class DailyReportAdmin(admin.ModelAdmin):
     list_display = ['department', 'employee', 'date', 'created_by', 'updated_at']
@@ -140,6 +159,7 @@ class DailyReportAdmin(admin.ModelAdmin):
     raw_id_fields = ['created_by', 'employee']
     readonly_fields = ['updated_at']
     date_hierarchy = 'date'
+    inlines = [DailyReportEntryInline]
     fieldsets = (
         ('Основная информация', {
             'fields': ('department', 'employee', 'date', 'comment')
@@ -154,10 +174,10 @@ class DailyReportAdmin(admin.ModelAdmin):
 @admin.register(DailyReportPhoto)
 class DailyReportPhotoAdmin(admin.ModelAdmin):
     list_display = ['daily_report', 'caption', 'uploaded_by', 'uploaded_at']
-    list_filter = ['uploaded_at', 'daily_report__department']
+    list_filter = ['uploaded_at', 'file_present', 'daily_report__department']
     search_fields = ['caption', 'daily_report__department__name']
     raw_id_fields = ['daily_report', 'uploaded_by']
-    readonly_fields = ['uploaded_at']
+    readonly_fields = ['uploaded_at', 'file_present', 'file_size', 'file_checked_at']
     date_hierarchy = 'uploaded_at'
 
 admin.site.register(MaterialWriteOff)
@@ -4,3 +4,75 @@ from django.apps import AppConfig
 class ShiftLogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shift_log'
+
+    def ready(self):
+        from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                              pre_save)
+
+        from django.contrib.auth.models import User
+
+        from .models import (Attachment, DailyReportPhoto, Employee,
+                             MaterialWriteOff, Shift, ShiftAssignment,
+                             ShiftType)
+        from .services.blob_storage import release_blob_on_delete
+        from .services.shift_calendar import rebuild_calendar_on_save
+        from .services.shift_schedule import (
+            invalidate_on_assignment_change, invalidate_on_employee_change,
+            invalidate_on_employee_move, invalidate_on_employees_change,
+            invalidate_on_shift_change, invalidate_on_shift_move,
+            invalidate_on_shift_type_change, invalidate_on_user_change)
+        from .services.material_stock import (stock_on_writeoff_delete,
+                                              stock_on_writeoff_save)
+        from .services.writeoff_summary import (remember_writeoff_state,
+                                                rollup_on_writeoff_delete,
+                                                rollup_on_writeoff_save)
+
+        # Записи, ссылающиеся на blob, освобождают ссылку при удалении
+        for model in (Attachment, DailyReportPhoto):
+            post_delete.connect(
+                release_blob_on_delete, sender=model,
+                dispatch_uid=f'release_blob_{model.__name__}'
+            )
+
+        # Календарь типа смены разворачивается заново при изменении правила
+        post_save.connect(
+            rebuild_calendar_on_save, sender=ShiftType,
+            dispatch_uid='rebuild_shift_calendar'
+        )
+
+        # Кэш графиков смен сбрасывается при изменении назначений, смен,
+        # типов смен и сотрудников
+        for signal in (post_save, post_delete):
+            signal.connect(
+                invalidate_on_assignment_change, sender=ShiftAssignment,
+                dispatch_uid=f'shift_schedule_assignment_{signal is post_save}'
+            )
+            signal.connect(
+                invalidate_on_shift_change, sender=Shift,
+                dispatch_uid=f'shift_schedule_shift_{signal is post_save}'
+            )
+        m2m_changed.connect(
+            invalidate_on_employees_change, sender=Shift.employees.through,
+            dispatch_uid='shift_schedule_shift_employees'
+        )
+        pre_save.connect(invalidate_on_shift_move, sender=Shift, dispatch_uid='shift_schedule_shift_move')
+        post_save.connect(
+            invalidate_on_shift_type_change, sender=ShiftType,
+            dispatch_uid='shift_schedule_shift_type'
+        )
+        for signal in (post_save, post_delete):
+            signal.connect(
+                invalidate_on_employee_change, sender=Employee,
+                dispatch_uid=f'shift_schedule_employee_{signal is post_save}'
+            )
+        pre_save.connect(invalidate_on_employee_move, sender=Employee, dispatch_uid='shift_schedule_employee_move')
+        post_save.connect(invalidate_on_user_change, sender=User, dispatch_uid='shift_schedule_user')
+
+        # Списания за день пересчитываются при каждом изменении списания
+        pre_save.connect(remember_writeoff_state, sender=MaterialWriteOff, dispatch_uid='writeoff_rollup_previous')
+        post_save.connect(rollup_on_writeoff_save, sender=MaterialWriteOff, dispatch_uid='writeoff_rollup_save')
+        post_delete.connect(rollup_on_writeoff_delete, sender=MaterialWriteOff, dispatch_uid='writeoff_rollup_delete')
+
+        # Списания меняют остатки материалов (журнал движений)
+        post_save.connect(stock_on_writeoff_save, sender=MaterialWriteOff, dispatch_uid='material_stock_save')
+        post_delete.connect(stock_on_writeoff_delete, sender=MaterialWriteOff, dispatch_uid='material_stock_delete')
@@ -1,13 +1,17 @@
 import mimetypes
+from decimal import Decimal
 
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.urls import reverse_lazy
 from django.utils import timezone
 
-from .models import (Attachment, DailyReport, Department, Employee,
+from .models import (UNIT_CHOICES, Attachment, Department, Employee,
                      MaterialWriteOff, Note, Project, ProjectTask, Shift,
                      ShiftLog, ShiftType, Task, TaskProject, TaskReport)
+from .services.blob_storage import SNIFF_SIZE, sniff_content_type
+from .services.shift_conflicts import ShiftConflictService
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -310,9 +314,10 @@ class TaskForm(forms.ModelForm):
             # Делаем поле assigned_to необязательным для общих задач
             self.fields['assigned_to'].required = False
             
-            # Настраиваем поле project - показываем все проекты заданий
+            # Настраиваем поле project: queryset нужен только для проверки значения,
+            # в разметку попадает выбранный проект, остальные ищутся автодополнением
             self.fields['project'].required = False
-            self.fields['project'].queryset = TaskProject.objects.all().order_by('name')
+            self.fields['project'].queryset = TaskProject.objects.all()
             self.fields['project'].empty_label = 'Без проекта'
             
             # Если редактируем существующую задачу, устанавливаем начальные значения
@@ -323,6 +328,13 @@ class TaskForm(forms.ModelForm):
                     # Устанавливаем начальное значение для project_name (на случай, если выберут "Создать новый")
                     self.fields['project_name'].initial = self.instance.project.name
 
+        # Выбранный проект (для единственной опции в списке проектов)
+        project_value = self.data.get('project') if self.is_bound else self.instance.project_id
+        self.selected_project = (
+            TaskProject.objects.filter(pk=project_value).first()
+            if project_value and str(project_value).isdigit() else None
+        )
+
         # Настраиваем поддерживаемые форматы даты/времени
         due_date_field = self.fields['due_date']
         due_date_formats = ['%Y-%m-%dT%H:%M']
@@ -579,51 +591,72 @@ class AttachmentForm(forms.ModelForm):
     def clean_file(self):
         file = self.cleaned_data.get('file')
         if file:
-            # Проверяем размер файла (50MB)
-            if file.size > 50 * 1024 * 1024:
-                raise forms.ValidationError('Размер файла не должен превышать 50MB')
-            
-            # Проверяем тип файла более гибко
-            allowed_types = [
-                'image/jpeg', 'image/png', 'image/gif', 'application/pdf',
-                'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                'text/plain', 'application/zip', 'application/x-rar-compressed'
-            ]
-            
-            # Дополнительные типы, которые могут отправляться с разных ОС
-            additional_types = [
-                'application/octet-stream',  # Windows часто отправляет так
-                'application/x-zip-compressed',  # Альтернативный MIME для ZIP
-                'application/zip-compressed',  # Еще один вариант
-                'image/jpg',  # Альтернативный MIME для JPEG
-            ]
-            
-            # Проверяем расширение файла для дополнительной валидации
-            filename = file.name.lower()
-            allowed_extensions = [
-                '.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx',
-                '.txt', '.zip', '.rar', '.json', '.xml'
-            ]
-            
-            # Проверяем MIME-тип
-            if file.content_type not in allowed_types + additional_types:
-                # Если MIME-тип не подходит, проверяем расширение файла
-                if not any(filename.endswith(ext) for ext in allowed_extensions):
-                    # Попробуем определить MIME-тип по расширению файла
-                    guessed_type, _ = mimetypes.guess_type(filename)
-                    if guessed_type and guessed_type in allowed_types:
-                        # Если угаданный тип разрешен, принимаем файл
-                        pass
-                    else:
-                        raise forms.ValidationError(
-                            f'Неподдерживаемый тип файла: {file.content_type}. '
-                            f'Разрешены: изображения (JPG, PNG, GIF), PDF, документы Word, '
-                            f'текстовые файлы, архивы (ZIP, RAR)'
-                        )
+            # Тип определяем по сигнатуре содержимого, а не по заголовку клиента
+            file.seek(0)
+            content_type = sniff_content_type(file.read(SNIFF_SIZE), file.name)
+            file.seek(0)
+            validate_attachment_upload(file.name, content_type, file.size)
         
         return file
 
 
+def validate_attachment_upload(filename, content_type, size):
+    """
+    Проверяет размер и тип загружаемого вложения
+    
+    Используется формой AttachmentForm и порционной загрузкой, где файл
+    целиком на момент проверки ещё не получен.
+    
+    Raises:
+        forms.ValidationError: Если файл слишком большой или тип не разрешён
+    """
+    # Проверяем размер файла (50MB)
+    if size > 50 * 1024 * 1024:
+        raise forms.ValidationError('Размер файла не должен превышать 50MB')
+    
+    # Исполняемые файлы не принимаем независимо от расширения
+    if content_type in ('application/x-msdownload', 'application/x-executable'):
+        raise forms.ValidationError('Загрузка исполняемых файлов запрещена')
+    
+    # Проверяем тип файла более гибко
+    allowed_types = [
+        'image/jpeg', 'image/png', 'image/gif', 'application/pdf',
+        'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'text/plain', 'application/zip', 'application/x-rar-compressed'
+    ]
+    
+    # Дополнительные типы, которые могут отправляться с разных ОС
+    additional_types = [
+        'application/octet-stream',  # Windows часто отправляет так
+        'application/x-zip-compressed',  # Альтернативный MIME для ZIP
+        'application/zip-compressed',  # Еще один вариант
+        'image/jpg',  # Альтернативный MIME для JPEG
+    ]
+    
+    # Проверяем расширение файла для дополнительной валидации
+    filename = filename.lower()
+    allowed_extensions = [
+        '.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx',
+        '.txt', '.zip', '.rar', '.json', '.xml'
+    ]
+    
+    # Проверяем MIME-тип
+    if content_type not in allowed_types + additional_types:
+        # Если MIME-тип не подходит, проверяем расширение файла
+        if not any(filename.endswith(ext) for ext in allowed_extensions):
+            # Попробуем определить MIME-тип по расширению файла
+            guessed_type, _ = mimetypes.guess_type(filename)
+            if guessed_type and guessed_type in allowed_types:
+                # Если угаданный тип разрешен, принимаем файл
+                pass
+            else:
+                raise forms.ValidationError(
+                    f'Неподдерживаемый тип файла: {content_type}. '
+                    f'Разрешены: изображения (JPG, PNG, GIF), PDF, документы Word, '
+                    f'текстовые файлы, архивы (ZIP, RAR)'
+                )
+
+
 class ShiftAssignmentForm(forms.ModelForm):
     """Форма назначения на смену"""
     class Meta:
@@ -631,7 +664,7 @@ class ShiftAssignmentForm(forms.ModelForm):
         fields = []
 
     employees = forms.ModelMultipleChoiceField(
-        queryset=Employee.objects.filter(is_active=True),
+        queryset=Employee.objects.filter(is_active=True).select_related('user'),
         widget=forms.CheckboxSelectMultiple,
         required=False
     )
@@ -641,6 +674,20 @@ class ShiftAssignmentForm(forms.ModelForm):
         if self.instance.pk:
             self.fields['employees'].initial = self.instance.employees.all()
 
+    def clean_employees(self):
+        """Не даёт назначить сотрудника на смену, пересекающуюся с его сменами или без отдыха"""
+        employees = self.cleaned_data['employees']
+        if not self.instance.pk:
+            return employees
+        by_id = {employee.pk: employee for employee in employees}
+        errors = [
+            f'{by_id[conflict.employee_id].get_full_name()}: {conflict.describe()}'
+            for conflict in ShiftConflictService.for_assignments(self.instance, employees)
+        ]
+        if errors:
+            raise forms.ValidationError(errors)
+        return employees
+
     def save(self, commit=True):
         shift = super().save(commit=False)
         if commit:
@@ -802,7 +849,24 @@ class TaskStatusUpdateForm(forms.Form):
         return cleaned_data 
 
 
-class DailyReportForm(forms.ModelForm):
+class DailyReportForm(forms.Form):
+    """
+    Новая запись ежедневного отчёта
+
+    Текст не редактирует отчёт, а добавляется к нему отдельной записью
+    (DailyReport.add_entry).
+    """
+    comment = forms.CharField(
+        widget=forms.Textarea(
+            attrs={
+                'class': 'form-control',
+                'rows': 4,
+                'placeholder': 'Добавьте запись в ежедневный отчёт...'
+            }
+        ),
+        required=False,
+        label='Ежедневный отчёт (новая запись)'
+    )
     photo = forms.ImageField(
         widget=forms.FileInput(
             attrs={
@@ -824,24 +888,6 @@ class DailyReportForm(forms.ModelForm):
         label='Подпись к фотографии'
     )
 
-    class Meta:
-        model = DailyReport
-        fields = ['comment']
-        widgets = {
-            'comment': forms.Textarea(
-                attrs={
-                    'class': 'form-control',
-                    'rows': 4,
-                    'placeholder': (
-                        'Введите или дополните ежедневный отчёт...'
-                    )
-                }
-            )
-        }
-        labels = {
-            'comment': 'Ежедневный отчёт (комментарий)'
-        }
-    
     def __init__(self, *args, **kwargs):
         self.employee = kwargs.pop('employee', None)
         self.department = kwargs.pop('department', None)
@@ -850,17 +896,17 @@ class DailyReportForm(forms.ModelForm):
         # Устанавливаем placeholder в зависимости от режима
         if (self.employee and self.employee.individual_report):
             self.fields['comment'].widget.attrs['placeholder'] = (
-                'Введите или дополните ваш ежедневный отчёт...'
+                'Добавьте запись в ваш ежедневный отчёт...'
             )
             self.fields['comment'].label = (
-                'Ваш ежедневный отчёт (комментарий)'
+                'Ваш ежедневный отчёт (новая запись)'
             )
         else:
             self.fields['comment'].widget.attrs['placeholder'] = (
-                'Введите или дополните ежедневный отчёт отдела...'
+                'Добавьте запись в ежедневный отчёт отдела...'
             )
             self.fields['comment'].label = (
-                'Ежедневный отчёт отдела (комментарий)'
+                'Ежедневный отчёт отдела (новая запись)'
             )
 
     def clean_photo(self):
@@ -879,7 +925,10 @@ class MaterialWriteOffForm(forms.ModelForm):
         model = MaterialWriteOff
         fields = ['material_name', 'quantity', 'unit', 'destination', 'department']
         widgets = {
-            'material_name': forms.TextInput(attrs={'class': 'form-control'}),
+            'material_name': forms.TextInput(attrs={
+                'class': 'form-control', 'autocomplete': 'off',
+                'data-autocomplete-url': reverse_lazy('shift_log:api_autocomplete_materials'),
+            }),
             'quantity': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'}),
             'unit': forms.Select(attrs={'class': 'form-control'}),
             'destination': forms.TextInput(attrs={'class': 'form-control'}),
@@ -899,6 +948,53 @@ class MaterialWriteOffForm(forms.ModelForm):
                 self.fields['department'].queryset = Department.objects.all() 
 
 
+class MaterialReceiptForm(forms.Form):
+    """Поступление материала на остаток отдела"""
+    material_name = forms.CharField(
+        label='Материал', max_length=255,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control', 'autocomplete': 'off',
+            'data-autocomplete-url': reverse_lazy('shift_log:api_autocomplete_materials'),
+        })
+    )
+    quantity = forms.DecimalField(
+        label='Количество', max_digits=14, decimal_places=2, min_value=Decimal('0.01'),
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0.01'})
+    )
+    unit = forms.ChoiceField(
+        label='Ед. изм.', choices=UNIT_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    department = forms.ModelChoiceField(
+        label='Отдел', queryset=Department.objects.all(),
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    comment = forms.CharField(
+        label='Комментарий', max_length=255, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Накладная, поставщик...'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        employee = kwargs.pop('employee', None)
+        super().__init__(*args, **kwargs)
+        if employee and not employee.is_admin:
+            self.fields['department'].widget = forms.HiddenInput()
+            self.fields['department'].initial = employee.department
+            self.fields['department'].queryset = Department.objects.filter(id=employee.department_id)
+
+
+class MaterialAdjustmentForm(forms.Form):
+    """Инвентаризация: фактический остаток материала"""
+    balance = forms.DecimalField(
+        label='Фактический остаток', max_digits=14, decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'})
+    )
+    comment = forms.CharField(
+        label='Комментарий', max_length=255, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control'})
+    )
+
+
 class NoteForm(forms.ModelForm):
     class Meta:
         model = Note
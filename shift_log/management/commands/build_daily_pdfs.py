@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shift_log.models import DailyReport, Department, MaterialWriteOff, Task
+from shift_log.services.daily_pdf import DailyReportPdf
+from shift_log.utils import local_date_range_filter
+
+
+class Command(BaseCommand):
+    help = 'Строит PDF-сводки отделов за день (по умолчанию за вчера); неизменившиеся не перестраиваются'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            help='День в формате ГГГГ-ММ-ДД'
+        )
+        parser.add_argument(
+            '--department',
+            type=int,
+            help='ID отдела (по умолчанию — все отделы, где за день что-то было)'
+        )
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('Неверный формат даты, ожидается ГГГГ-ММ-ДД')
+        else:
+            day = timezone.localdate() - timedelta(days=1)
+
+        if options['department']:
+            department_ids = {options['department']}
+        else:
+            department_ids = (
+                set(DailyReport.objects.filter(date=day).values_list('department_id', flat=True))
+                | set(Task.objects.filter(status='completed', **local_date_range_filter('completed_at', day, day))
+                      .values_list('department_id', flat=True))
+                | set(MaterialWriteOff.objects.filter(**local_date_range_filter('created_at', day, day))
+                      .values_list('department_id', flat=True))
+            )
+
+        departments = Department.objects.filter(pk__in=department_ids).order_by('name')
+        for department in departments:
+            name = DailyReportPdf.ensure(department, day)
+            DailyReportPdf.prune(department, day, keep=name)
+            self.stdout.write(f'{department.name}: {name}')
+        self.stdout.write(self.style.SUCCESS(f'PDF-сводок за {day:%d.%m.%Y}: {len(departments)}'))
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shift_log.models import ShiftType
+from shift_log.services.shift_calendar import ShiftCalendar
+
+
+class Command(BaseCommand):
+    help = 'Разворачивает даты типов смен в таблицу календаря на заданный горизонт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'SHIFT_CALENDAR_HORIZON_DAYS', 400),
+            help='На сколько дней вперёд развернуть календарь (по умолчанию SHIFT_CALENDAR_HORIZON_DAYS)'
+        )
+        parser.add_argument(
+            '--past',
+            type=int,
+            default=getattr(settings, 'SHIFT_CALENDAR_PAST_DAYS', 31),
+            help='На сколько дней назад развернуть календарь (по умолчанию SHIFT_CALENDAR_PAST_DAYS)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Перестроить календарь заново, а не только дополнить'
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        start = today - timedelta(days=options['past'])
+        end = today + timedelta(days=options['days'])
+        shift_types = ShiftType.objects.all()
+
+        if options['rebuild']:
+            count = sum(ShiftCalendar.rebuild(shift_type, start, end) for shift_type in shift_types)
+        else:
+            count = ShiftCalendar.extend(shift_types, start, end)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Календарь смен {start} - {end}: добавлено дат {count}')
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from shift_log.services.material_stock import MaterialStockService
+
+
+class Command(BaseCommand):
+    help = 'Сверяет остатки материалов с журналом движений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Записать в остатки суммы движений'
+        )
+
+    def handle(self, *args, **options):
+        mismatches = MaterialStockService.check(fix=options['fix'])
+        for mismatch in mismatches:
+            stock = mismatch.stock
+            self.stdout.write(
+                f'{stock.department.name} / {stock.material_name} ({stock.get_unit_display()}): '
+                f'остаток {mismatch.stored}, по журналу {mismatch.expected}'
+            )
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Остатки совпадают с журналом движений'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено остатков: {len(mismatches)}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'Расхождений: {len(mismatches)} (исправить: --fix)'))
@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shift_log.models import Department, Employee
+from shift_log.services.shift_conflicts import ShiftConflictService
+
+
+class Command(BaseCommand):
+    help = 'Ищет пересечения смен и нехватку отдыха между сменами сотрудников'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--department',
+            type=str,
+            help='Название отдела (если не указано, проверяются все)'
+        )
+        parser.add_argument(
+            '--start-date',
+            type=str,
+            help='Начальная дата (YYYY-MM-DD, по умолчанию сегодня)',
+            default=date.today().strftime('%Y-%m-%d')
+        )
+        parser.add_argument(
+            '--end-date',
+            type=str,
+            help='Конечная дата (YYYY-MM-DD, по умолчанию через 30 дней)',
+            default=(date.today() + timedelta(days=30)).strftime('%Y-%m-%d')
+        )
+        parser.add_argument(
+            '--min-rest',
+            type=float,
+            help='Минимальный отдых между сменами, часов (по умолчанию SHIFT_MIN_REST_HOURS)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start_date = date.fromisoformat(options['start_date'])
+            end_date = date.fromisoformat(options['end_date'])
+        except ValueError as e:
+            raise CommandError(f'Неверный формат даты: {e}')
+        if start_date > end_date:
+            raise CommandError('Начальная дата должна быть не больше конечной')
+
+        if options['department']:
+            departments = list(Department.objects.filter(name=options['department']))
+            if not departments:
+                raise CommandError(f'Отдел "{options["department"]}" не найден')
+        else:
+            departments = list(Department.objects.all())
+
+        min_rest = timedelta(hours=options['min_rest']) if options['min_rest'] is not None else None
+        total = 0
+        for department in departments:
+            conflicts = ShiftConflictService.for_department(department, start_date, end_date, min_rest)
+            if not conflicts:
+                continue
+            names = {
+                employee.pk: employee.get_full_name() for employee in
+                Employee.objects.filter(pk__in={c.employee_id for c in conflicts}).select_related('user')
+            }
+            self.stdout.write(f'Отдел: {department.name}')
+            for conflict in conflicts:
+                style = self.style.ERROR if conflict.kind == 'overlap' else self.style.WARNING
+                self.stdout.write(style(f'  {names.get(conflict.employee_id)}: {conflict.describe()}'))
+            total += len(conflicts)
+
+        self.stdout.write(f'Период: {start_date} - {end_date}')
+        if total:
+            self.stdout.write(self.style.ERROR(f'Найдено конфликтов: {total}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Конфликтов не найдено'))
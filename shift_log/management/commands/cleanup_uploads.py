@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from shift_log.services.chunked_upload import ChunkedUploadService
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные сеансы порционной загрузки и их временные файлы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Удалять сеансы без активности дольше указанного числа часов (по умолчанию 24)'
+        )
+
+    def handle(self, *args, **options):
+        count = ChunkedUploadService.purge_stale(timedelta(hours=options['hours']))
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено брошенных сеансов загрузки: {count}')
+        )
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shift_log.models import DailyReport
+
+
+class Command(BaseCommand):
+    help = 'Собирает записи прошедших ежедневных отчётов в итоговый текст (закрытие дня)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--include-today',
+            action='store_true',
+            help='Закрыть и отчёты за сегодня'
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        reports = DailyReport.objects.filter(
+            date__lte=today if options['include_today'] else today - timedelta(days=1)
+        ).filter(entries__folded=False).distinct()
+
+        closed = sum(report.close() for report in reports.iterator(chunk_size=200))
+        self.stdout.write(self.style.SUCCESS(f'Закрыто ежедневных отчётов: {closed}'))
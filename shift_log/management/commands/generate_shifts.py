@@ -1,10 +1,11 @@
 from datetime import date, timedelta
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
 
 from shift_log.models import Department, Employee, ShiftType
-from shift_log.utils import generate_shift_schedule, validate_shift_pattern
+from shift_log.services.shift_generation import (DEFAULT_WORKERS,
+                                                 ShiftGenerationService)
+from shift_log.utils import validate_shift_pattern
 
 
 class Command(BaseCommand):
@@ -43,6 +44,22 @@ class Command(BaseCommand):
             action='store_true',
             help='Создавать смены даже если они уже существуют'
         )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать, какие смены будут созданы, ничего не создавая'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help=f'Число отделов, обрабатываемых параллельно (по умолчанию {DEFAULT_WORKERS})'
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='В режиме --dry-run выводить даты создаваемых смен'
+        )
 
     def handle(self, *args, **options):
         try:
@@ -135,47 +152,55 @@ class Command(BaseCommand):
             return
 
         # Генерируем смены
-        self.stdout.write('Генерация смен...')
-        
+        dry_run = options['dry_run']
+        self.stdout.write('Планирование смен...' if dry_run else 'Генерация смен...')
+
         total_created = 0
         total_errors = 0
-        
-        for department in departments:
-            self.stdout.write(f'Обработка отдела: {department.name}')
-            
-            try:
-                results = generate_shift_schedule(
-                    department=department,
-                    start_date=start_date,
-                    end_date=end_date,
-                    employees=employees
-                )
-                
-                if results['total_shifts_created'] > 0:
+
+        all_results = ShiftGenerationService.generate(
+            departments,
+            start_date,
+            end_date,
+            employees=employees,
+            dry_run=dry_run,
+            workers=options['workers']
+        )
+
+        for results in all_results:
+            self.stdout.write(f'Обработка отдела: {results["department"]}')
+
+            if dry_run:
+                for entry in results['diff']:
                     self.stdout.write(
-                        self.style.SUCCESS(
-                            f'Создано {results["total_shifts_created"]} смен'
-                        )
+                        f'  - {entry["shift_type"]}: по расписанию {entry["planned"]}, '
+                        f'уже есть {entry["existing"]}, будет создано {len(entry["missing"])}'
                     )
-                    
-                    for shift_type_name, count in results['shifts_by_type'].items():
-                        self.stdout.write(f'  - {shift_type_name}: {count} смен')
-                    
-                    total_created += results['total_shifts_created']
-                else:
-                    self.stdout.write(
-                        self.style.WARNING('Смены не созданы (возможно, уже существуют)')
+                    if options['verbose'] and entry['missing']:
+                        dates = ', '.join(d.strftime('%d.%m.%Y') for d in entry['missing'])
+                        self.stdout.write(f'      + {dates}')
+                total_created += results['total_shifts_created']
+            elif results['total_shifts_created'] > 0:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'Создано {results["total_shifts_created"]} смен'
                     )
-                
-                if results['errors']:
-                    for error in results['errors']:
-                        self.stdout.write(self.style.ERROR(f'  Ошибка: {error}'))
-                        total_errors += 1
-                        
-            except Exception as e:
+                )
+
+                for shift_type_name, count in results['shifts_by_type'].items():
+                    self.stdout.write(f'  - {shift_type_name}: {count} смен')
+
+                total_created += results['total_shifts_created']
+            else:
                 self.stdout.write(
-                    self.style.ERROR(f'Ошибка при обработке отдела {department.name}: {e}')
+                    self.style.WARNING('Смены не созданы (возможно, уже существуют)')
                 )
+
+            for message in results['skipped_assignments']:
+                self.stdout.write(self.style.WARNING(f'  Назначение пропущено: {message}'))
+
+            for error in results['errors']:
+                self.stdout.write(self.style.ERROR(f'  Ошибка: {error}'))
                 total_errors += 1
 
         # Итоговая статистика
@@ -183,10 +208,14 @@ class Command(BaseCommand):
         self.stdout.write('ИТОГИ ГЕНЕРАЦИИ:')
         self.stdout.write(f'Период: {start_date} - {end_date}')
         self.stdout.write(f'Отделов обработано: {len(departments)}')
-        self.stdout.write(f'Всего смен создано: {total_created}')
+        self.stdout.write(f'Всего смен {"будет создано" if dry_run else "создано"}: {total_created}')
         self.stdout.write(f'Ошибок: {total_errors}')
         
-        if total_created > 0:
+        if dry_run:
+            self.stdout.write(
+                self.style.WARNING('Режим предварительного просмотра - смены не созданы')
+            )
+        elif total_created > 0:
             self.stdout.write(
                 self.style.SUCCESS('Генерация смен завершена успешно!')
             )
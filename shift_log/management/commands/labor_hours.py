@@ -0,0 +1,63 @@
+import sys
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shift_log.models import Department
+from shift_log.services.labor_hours import LaborHoursService
+
+
+class Command(BaseCommand):
+    help = 'Рассчитывает месячные сводки рабочего времени отделов и выгружает их в CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            type=str,
+            help='Месяц (YYYY-MM, по умолчанию предыдущий)'
+        )
+        parser.add_argument(
+            '--department',
+            type=str,
+            help='Название отдела (если не указано, все отделы)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересчитать сводки, даже если данные не менялись'
+        )
+        parser.add_argument(
+            '--csv',
+            action='store_true',
+            help='Вывести сводку в CSV в stdout'
+        )
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                year, month = (int(part) for part in options['month'].split('-'))
+                if not 1 <= month <= 12:
+                    raise ValueError(month)
+            except ValueError:
+                raise CommandError('Неверный формат месяца, ожидается YYYY-MM')
+        else:
+            previous = timezone.localdate().replace(day=1) - timedelta(days=1)
+            year, month = previous.year, previous.month
+
+        departments = Department.objects.all()
+        if options['department']:
+            departments = departments.filter(name=options['department'])
+            if not departments:
+                raise CommandError(f'Отдел "{options["department"]}" не найден')
+
+        for department in departments:
+            LaborHoursService.get_month(department, year, month, force=options['force'])
+            if options['csv']:
+                # stdout самой команды добавляет перевод строки к каждой записи
+                sys.stdout.write(f'# {department.name} {year}-{month:02d}\n')
+                LaborHoursService.write_csv(LaborHoursService.report(department, year, month), sys.stdout)
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Сводка рабочего времени {department.name} за {month:02d}.{year} готова'
+                ))
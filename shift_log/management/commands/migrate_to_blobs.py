@@ -0,0 +1,78 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shift_log.models import Attachment, DailyReportPhoto
+from shift_log.services.blob_storage import BlobStorage
+from testing.models import FeatureAttachment
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит файлы вложений и фотографий, загруженные до появления '
+        'хранилища blob, в хранилище с дедупликацией по SHA-256'
+    )
+
+    # (модель, имя поля файла, имя поля для исходного имени файла)
+    TARGETS = [
+        (Attachment, 'file', 'filename'),
+        (FeatureAttachment, 'file', 'filename'),
+        (DailyReportPhoto, 'image', None),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать количество записей без переноса'
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Подробный вывод'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        verbose = options['verbose']
+
+        for model, file_field, name_field in self.TARGETS:
+            queryset = model.objects.filter(blob__isnull=True).exclude(**{file_field: ''})
+            label = model._meta.verbose_name_plural
+            total = queryset.count()
+            self.stdout.write(f'{label}: записей без blob — {total}')
+            if dry_run or not total:
+                continue
+
+            moved = missing = 0
+            for obj in queryset.iterator(chunk_size=200):
+                field_file = getattr(obj, file_field)
+                old_path = field_file.path
+                if not os.path.exists(old_path):
+                    missing += 1
+                    if verbose:
+                        self.stdout.write(f'  Файл не найден: {field_file.name} (ID: {obj.pk})')
+                    continue
+
+                filename = getattr(obj, name_field) if name_field else os.path.basename(field_file.name)
+                with transaction.atomic():
+                    with open(old_path, 'rb') as f:
+                        blob = BlobStorage.ingest(f, filename)
+                    setattr(obj, file_field, blob.file.name)
+                    obj.blob = blob
+                    update_fields = [file_field, 'blob']
+                    if hasattr(obj, 'content_type'):
+                        obj.content_type = blob.content_type
+                        update_fields.append('content_type')
+                    obj.save(update_fields=update_fields)
+                    # Старый файл больше не нужен — содержимое теперь в blob
+                    transaction.on_commit(lambda path=old_path: os.path.exists(path) and os.remove(path))
+
+                moved += 1
+                if verbose:
+                    self.stdout.write(f'  {field_file.name} → {blob.file.name}')
+
+            self.stdout.write(
+                self.style.SUCCESS(f'  Перенесено: {moved}, файлов не найдено: {missing}')
+            )
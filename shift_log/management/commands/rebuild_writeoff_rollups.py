@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shift_log.services.writeoff_summary import WriteOffSummaryService
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списания по дням (сводку списаний) по самим списаниям материалов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date-from',
+            type=str,
+            help='Первый день в формате ГГГГ-ММ-ДД (по умолчанию — с начала)'
+        )
+        parser.add_argument(
+            '--date-to',
+            type=str,
+            help='Последний день в формате ГГГГ-ММ-ДД (по умолчанию — по сегодня)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from']) if options['date_from'] else None
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else None
+        except ValueError:
+            raise CommandError('Неверный формат даты, ожидается ГГГГ-ММ-ДД')
+
+        rows = WriteOffSummaryService.rebuild(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(f'Строк списаний по дням: {rows}'))
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from shift_log.services.media_scan import MediaScanner
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет целостность медиафайлов: записи без файлов и файлы без записей. '
+        'По умолчанию только сохраняет состояние и выводит отчёт; повторные '
+        'запуски проверяют лишь изменившееся'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Проверить все записи и все каталоги, а не только изменившиеся'
+        )
+        parser.add_argument(
+            '--verify-checksums',
+            action='store_true',
+            help='Сверять содержимое файлов blob с SHA-256 (читает файлы целиком)'
+        )
+        parser.add_argument(
+            '--delete-missing',
+            action='store_true',
+            help='Удалить записи, файлы которых не найдены'
+        )
+        parser.add_argument(
+            '--delete-orphans',
+            action='store_true',
+            help='Удалить файлы, на которые не ссылается ни одна запись'
+        )
+        parser.add_argument(
+            '--orphan-min-age',
+            type=int,
+            default=60,
+            help='Не трогать файлы моложе указанного числа минут (по умолчанию 60)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Число потоков проверки файлов (по умолчанию 8)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Размер пачки записей (по умолчанию 500)'
+        )
+        parser.add_argument(
+            '--skip-rows',
+            action='store_true',
+            help='Не проверять записи'
+        )
+        parser.add_argument(
+            '--skip-files',
+            action='store_true',
+            help='Не искать файлы без записей'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Ничего не сохранять и не удалять'
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Выводить каждую найденную проблему'
+        )
+
+    def handle(self, *args, **options):
+        scanner = MediaScanner(
+            full=options['full'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            verify_checksums=options['verify_checksums'],
+            delete_missing=options['delete_missing'],
+            delete_orphans=options['delete_orphans'],
+            orphan_min_age=timedelta(minutes=options['orphan_min_age']),
+            dry_run=options['dry_run'],
+            report=self.stdout.write if options['verbose'] else None,
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Режим предварительного просмотра - изменения не сохраняются'))
+
+        if not options['skip_rows']:
+            self.stdout.write('Проверка записей...')
+            for label, stats in scanner.scan_rows().items():
+                problems = stats['missing'] or stats['corrupt']
+                style = self.style.WARNING if problems else self.style.SUCCESS
+                line = f'  {label}: проверено {stats["checked"]}, файлов не найдено {stats["missing"]}'
+                if options['verify_checksums']:
+                    line += f', повреждено {stats["corrupt"]}'
+                if options['delete_missing']:
+                    line += f', удалено записей {stats["deleted"]}'
+                self.stdout.write(style(line))
+
+        if not options['skip_files']:
+            self.stdout.write('Поиск файлов без записей...')
+            stats = scanner.scan_files()
+            style = self.style.WARNING if stats['orphans'] else self.style.SUCCESS
+            line = (
+                f'  Просмотрено файлов {stats["scanned"]}, без записей {stats["orphans"]} '
+                f'({filesizeformat(stats["orphan_bytes"])})'
+            )
+            if options['delete_orphans']:
+                line += f', удалено {stats["deleted"]}'
+            self.stdout.write(style(line))
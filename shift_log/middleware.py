@@ -0,0 +1,42 @@
+"""
+Middleware приложения shift_log.
+"""
+from django.contrib.auth import get_user_model
+
+from .models import Employee
+
+
+class EmployeeContextMiddleware:
+    """
+    Загружает сотрудника текущего пользователя один раз на запрос
+
+    Сотрудник выбирается одним запросом вместе с отделом и кладётся в кэш
+    обратной связи user.employee, поэтому представления и фильтры шаблонов,
+    обращающиеся к request.user.employee и employee.department, больше не
+    делают ленивых запросов. Для пользователей без профиля сотрудника кэш
+    заполняется отрицательным значением — hasattr(user, 'employee') вернёт
+    False без обращения к БД.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        self.process_request(request)
+        return self.get_response(request)
+
+    def process_request(self, request):
+        user = getattr(request, 'user', None)
+
+        if user is not None and user.is_authenticated:
+            employee = (
+                Employee.objects
+                .select_related('department')
+                .filter(user_id=user.pk)
+                .first()
+            )
+            if employee is not None:
+                # Заполняет кэш в обе стороны: user.employee и employee.user
+                user.employee = employee
+            else:
+                get_user_model().employee.related.set_cached_value(user, None)
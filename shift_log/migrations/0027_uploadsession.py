@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0026_taskproject_alter_task_project'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target', models.CharField(choices=[('attachment', 'Вложение'), ('feature_attachment', 'Вложение к функционалу')], default='attachment', max_length=20, verbose_name='Назначение')),
+                ('attachment_type', models.CharField(blank=True, choices=[('task', 'Задание'), ('shift_log', 'Журнал смены'), ('task_report', 'Отчет по заданию')], max_length=20, verbose_name='Тип вложения')),
+                ('object_id', models.IntegerField(verbose_name='ID объекта')),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('content_type', models.CharField(max_length=100, verbose_name='Тип контента')),
+                ('total_size', models.BigIntegerField(verbose_name='Размер файла')),
+                ('received_size', models.BigIntegerField(default=0, verbose_name='Получено байт')),
+                ('sha256', models.CharField(max_length=64, verbose_name='Контрольная сумма SHA-256')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='shift_log.employee', verbose_name='Загружает')),
+            ],
+            options={
+                'verbose_name': 'Сеанс загрузки',
+                'verbose_name_plural': 'Сеансы загрузки',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
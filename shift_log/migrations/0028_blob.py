@@ -0,0 +1,50 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0027_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.FileField(max_length=255, upload_to='blobs/', verbose_name='Файл')),
+                ('size', models.BigIntegerField(verbose_name='Размер')),
+                ('content_type', models.CharField(max_length=100, verbose_name='Тип контента (по сигнатуре)')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Содержимое файла',
+                'verbose_name_plural': 'Содержимое файлов',
+            },
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(max_length=255, upload_to='attachments/', verbose_name='Файл'),
+        ),
+        migrations.AlterField(
+            model_name='dailyreportphoto',
+            name='image',
+            field=models.ImageField(max_length=255, upload_to='daily_reports/photos/', verbose_name='Фотография'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='shift_log.blob', verbose_name='Содержимое'),
+        ),
+        migrations.AddField(
+            model_name='dailyreportphoto',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='daily_report_photos', to='shift_log.blob', verbose_name='Содержимое'),
+        ),
+    ]
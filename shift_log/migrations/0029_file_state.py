@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_photo_sizes(apps, schema_editor):
+    """Размер фотографий, уже перенесённых в blob, известен без обращения к диску"""
+    DailyReportPhoto = apps.get_model('shift_log', 'DailyReportPhoto')
+    Blob = apps.get_model('shift_log', 'Blob')
+    DailyReportPhoto.objects.filter(blob__isnull=False).update(
+        file_size=Subquery(Blob.objects.filter(pk=OuterRef('blob_id')).values('size')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0028_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='file_checked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Проверено'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='file_present',
+            field=models.BooleanField(default=True, verbose_name='Файл на диске'),
+        ),
+        migrations.AddField(
+            model_name='dailyreportphoto',
+            name='file_checked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Проверено'),
+        ),
+        migrations.AddField(
+            model_name='dailyreportphoto',
+            name='file_present',
+            field=models.BooleanField(default=True, verbose_name='Файл на диске'),
+        ),
+        migrations.AddField(
+            model_name='dailyreportphoto',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер файла'),
+        ),
+        migrations.RunPython(fill_photo_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0029_file_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaScanCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('rows', 'Записи'), ('files', 'Файлы')], max_length=20, unique=True, verbose_name='Проход')),
+                ('started_at', models.DateTimeField(verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершение')),
+                ('stats', models.JSONField(blank=True, default=dict, verbose_name='Итоги')),
+            ],
+            options={
+                'verbose_name': 'Отметка проверки медиафайлов',
+                'verbose_name_plural': 'Отметки проверки медиафайлов',
+            },
+        ),
+    ]
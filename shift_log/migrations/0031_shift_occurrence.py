@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0030_mediascancheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shifttype',
+            name='calendar_from',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Календарь с'),
+        ),
+        migrations.AddField(
+            model_name='shifttype',
+            name='calendar_until',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Календарь по'),
+        ),
+        migrations.CreateModel(
+            name='ShiftOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shift_log.department', verbose_name='Отдел')),
+                ('shift_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='shift_log.shifttype', verbose_name='Тип смены')),
+            ],
+            options={
+                'verbose_name': 'Дата типа смены',
+                'verbose_name_plural': 'Календарь типов смен',
+                'indexes': [models.Index(fields=['date', 'department'], name='shift_occurrence_date_dept')],
+                'unique_together': {('shift_type', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0031_shift_occurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='calendar_token',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Токен календаря'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0033_replacement_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LaborHoursMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц (первое число)')),
+                ('signature', models.CharField(max_length=64, verbose_name='Отпечаток данных')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='Рассчитано')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shift_log.department', verbose_name='Отдел')),
+            ],
+            options={
+                'verbose_name': 'Сводка рабочего времени',
+                'verbose_name_plural': 'Сводки рабочего времени',
+                'unique_together': {('department', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LaborHoursRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shifts', models.PositiveIntegerField(default=0, verbose_name='Смен')),
+                ('planned_minutes', models.PositiveIntegerField(default=0, verbose_name='По плану, мин')),
+                ('actual_minutes', models.PositiveIntegerField(default=0, verbose_name='Фактически, мин')),
+                ('overtime_minutes', models.PositiveIntegerField(default=0, verbose_name='Переработка, мин')),
+                ('late_starts', models.PositiveIntegerField(default=0, verbose_name='Опозданий')),
+                ('late_minutes', models.PositiveIntegerField(default=0, verbose_name='Опоздания, мин')),
+                ('missing_actuals', models.PositiveIntegerField(default=0, verbose_name='Смен без факта')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shift_log.employee', verbose_name='Сотрудник')),
+                ('summary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='shift_log.laborhoursmonth', verbose_name='Сводка')),
+            ],
+            options={
+                'verbose_name': 'Рабочее время сотрудника',
+                'verbose_name_plural': 'Рабочее время сотрудников',
+                'unique_together': {('summary', 'employee')},
+            },
+        ),
+    ]
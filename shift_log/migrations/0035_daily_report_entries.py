@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-19 06:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0034_labor_hours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyreport',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Текст собран'),
+        ),
+        migrations.CreateModel(
+            name='DailyReportEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время')),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shift_log.employee', verbose_name='Автор')),
+                ('daily_report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='shift_log.dailyreport', verbose_name='Ежедневный отчет')),
+            ],
+            options={
+                'verbose_name': 'Запись ежедневного отчёта',
+                'verbose_name_plural': 'Записи ежедневных отчётов',
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-19 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0035_daily_report_entries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailyreport',
+            index=models.Index(fields=['department', '-date', 'id'], name='daily_report_dept_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyreport',
+            index=models.Index(fields=['-date', 'id'], name='daily_report_page_idx'),
+        ),
+    ]
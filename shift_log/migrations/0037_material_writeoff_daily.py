@@ -0,0 +1,79 @@
+# Generated by Django 4.2.23 on 2026-10-19 06:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fill_daily_rollups(apps, schema_editor):
+    """Строки дней для уже сделанных списаний"""
+    MaterialWriteOff = apps.get_model('shift_log', 'MaterialWriteOff')
+    MaterialWriteOffDaily = apps.get_model('shift_log', 'MaterialWriteOffDaily')
+    totals = (
+        MaterialWriteOff.objects
+        .annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        .values('department_id', 'day', 'material_name', 'unit', 'destination')
+        .annotate(total_quantity=Sum('quantity'), total_writeoffs=Count('id'))
+        .order_by()
+    )
+    MaterialWriteOffDaily.objects.bulk_create(
+        [
+            MaterialWriteOffDaily(
+                department_id=row['department_id'], date=row['day'], material_name=row['material_name'],
+                unit=row['unit'], destination=row['destination'], quantity=row['total_quantity'],
+                writeoffs=row['total_writeoffs'],
+            )
+            for row in totals.iterator()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0036_daily_report_page_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialWriteOffDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('material_name', models.CharField(max_length=255, verbose_name='Что списали')),
+                ('unit', models.CharField(choices=[('m', 'м'), ('pcs', 'шт')], max_length=10, verbose_name='Ед. изм.')),
+                ('destination', models.CharField(max_length=255, verbose_name='Куда')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Количество')),
+                ('writeoffs', models.PositiveIntegerField(default=0, verbose_name='Списаний')),
+            ],
+            options={
+                'verbose_name': 'Списания за день',
+                'verbose_name_plural': 'Списания по дням',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='materialwriteoff',
+            index=models.Index(fields=['department', 'created_at'], name='writeoff_dept_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='materialwriteoff',
+            index=models.Index(fields=['created_at'], name='writeoff_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='materialwriteoffdaily',
+            name='department',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shift_log.department', verbose_name='Отдел'),
+        ),
+        migrations.AddIndex(
+            model_name='materialwriteoffdaily',
+            index=models.Index(fields=['date'], name='writeoff_daily_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='materialwriteoffdaily',
+            unique_together={('department', 'date', 'material_name', 'unit', 'destination')},
+        ),
+        migrations.RunPython(fill_daily_rollups, migrations.RunPython.noop),
+    ]
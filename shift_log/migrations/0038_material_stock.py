@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-19 06:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0037_material_writeoff_daily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('material_name', models.CharField(max_length=255, verbose_name='Материал')),
+                ('unit', models.CharField(choices=[('m', 'м'), ('pcs', 'шт')], max_length=10, verbose_name='Ед. изм.')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Остаток')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shift_log.department', verbose_name='Отдел')),
+            ],
+            options={
+                'verbose_name': 'Остаток материала',
+                'verbose_name_plural': 'Остатки материалов',
+                'ordering': ['material_name', 'unit'],
+                'unique_together': {('department', 'material_name', 'unit')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MaterialMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receipt', 'Поступление'), ('writeoff', 'Списание'), ('correction', 'Исправление списания'), ('adjustment', 'Инвентаризация')], max_length=20, verbose_name='Вид')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Количество')),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Остаток после')),
+                ('comment', models.CharField(blank=True, max_length=255, verbose_name='Комментарий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shift_log.employee', verbose_name='Кто внёс')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='shift_log.materialstock', verbose_name='Остаток')),
+                ('writeoff', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='shift_log.materialwriteoff', verbose_name='Списание')),
+            ],
+            options={
+                'verbose_name': 'Движение материала',
+                'verbose_name_plural': 'Движения материалов',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['stock', '-id'], name='material_movement_stock_idx')],
+            },
+        ),
+    ]
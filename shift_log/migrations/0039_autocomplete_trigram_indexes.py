@@ -0,0 +1,42 @@
+from django.db import migrations, transaction
+
+# (имя индекса, таблица, колонка) — поиск подсказок идёт по UPPER(колонка) LIKE '%...%'
+TRIGRAM_INDEXES = [
+    ('task_project_name_trgm', 'shift_log_taskproject', 'name'),
+    ('writeoff_daily_material_trgm', 'shift_log_materialwriteoffdaily', 'material_name'),
+    ('material_stock_name_trgm', 'shift_log_materialstock', 'material_name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Триграммные индексы для автодополнения (только PostgreSQL)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except Exception:
+        # Нет прав на создание расширения — подсказки работают и без индекса, только медленнее
+        return
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0038_material_stock'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.23 on 2026-10-19 06:56
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def fill_closed_entry_id(apps, schema_editor):
+    """Граница закрытых отчётов: последняя запись не позже прежнего closed_at"""
+    DailyReport = apps.get_model('shift_log', 'DailyReport')
+    DailyReportEntry = apps.get_model('shift_log', 'DailyReportEntry')
+    last_folded = (
+        DailyReportEntry.objects
+        .filter(daily_report=OuterRef('pk'), created_at__lte=OuterRef('closed_at'))
+        .order_by().values('daily_report').annotate(last_id=Max('id')).values('last_id')
+    )
+    DailyReport.objects.filter(closed_at__isnull=False).update(closed_entry_id=Subquery(last_folded))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0039_autocomplete_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyreport',
+            name='closed_entry_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Последняя собранная запись'),
+        ),
+        migrations.RunPython(fill_closed_entry_id, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='dailyreport',
+            name='closed_at',
+        ),
+    ]
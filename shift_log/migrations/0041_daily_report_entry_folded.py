@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-19 07:15
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_folded_entries(apps, schema_editor):
+    """Записи не позже прежней границы closed_entry_id уже собраны в comment"""
+    DailyReportEntry = apps.get_model('shift_log', 'DailyReportEntry')
+    DailyReportEntry.objects.filter(
+        daily_report__closed_entry_id__isnull=False, id__lte=F('daily_report__closed_entry_id')
+    ).update(folded=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0040_daily_report_closed_entry_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyreportentry',
+            name='folded',
+            field=models.BooleanField(default=False, verbose_name='Собрана в текст отчёта'),
+        ),
+        migrations.RunPython(mark_folded_entries, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='dailyreport',
+            name='closed_entry_id',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-19 09:40
+
+from django.db import migrations
+
+
+def record_past_writeoffs(apps, schema_editor):
+    """
+    Движения «списание» для списаний, сделанных до журнала остатков
+
+    Без них исправление или удаление старого списания вернуло бы в остаток
+    количество, которое из него никогда не вычиталось.
+    """
+    MaterialWriteOff = apps.get_model('shift_log', 'MaterialWriteOff')
+    MaterialStock = apps.get_model('shift_log', 'MaterialStock')
+    MaterialMovement = apps.get_model('shift_log', 'MaterialMovement')
+
+    stocks = {}
+    movements = []
+    writeoffs = (
+        MaterialWriteOff.objects.filter(movements__isnull=True)
+        .order_by('created_at', 'id')
+        .only('id', 'department_id', 'material_name', 'unit', 'quantity', 'created_by_id')
+    )
+    for writeoff in writeoffs.iterator(chunk_size=2000):
+        key = (writeoff.department_id, ' '.join(writeoff.material_name.split()), writeoff.unit)
+        stock = stocks.get(key)
+        if stock is None:
+            stock, _ = MaterialStock.objects.get_or_create(
+                department_id=key[0], material_name=key[1], unit=key[2]
+            )
+            stocks[key] = stock
+        stock.balance -= writeoff.quantity
+        movements.append(MaterialMovement(
+            stock=stock, kind='writeoff', quantity=-writeoff.quantity, balance_after=stock.balance,
+            writeoff_id=writeoff.pk, created_by_id=writeoff.created_by_id,
+        ))
+    MaterialMovement.objects.bulk_create(movements, batch_size=1000)
+    MaterialStock.objects.bulk_update(stocks.values(), ['balance'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0041_daily_report_entry_folded'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_past_writeoffs, migrations.RunPython.noop),
+    ]
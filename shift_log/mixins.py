@@ -0,0 +1,39 @@
+"""
+Миксины представлений, общие для приложений проекта.
+"""
+
+
+class CachedObjectMixin:
+    """
+    Кэширует результат get_object() и производные факты о правах на время запроса
+
+    DetailView/UpdateView вызывают get_object() сами, а представления проекта
+    повторяют этот вызов в get_context_data(), test_func() и проверках прав.
+    Экземпляр представления создаётся на каждый запрос, поэтому кэш на
+    экземпляре живёт ровно один запрос: объект загружается из БД один раз.
+    """
+
+    def get_object(self, queryset=None):
+        """Возвращает объект, загружая его из БД только при первом вызове"""
+        if queryset is not None:
+            # Явно переданный queryset не кэшируем — он может отличаться
+            return super().get_object(queryset)
+        if not hasattr(self, '_cached_object'):
+            self._cached_object = super().get_object()
+        return self._cached_object
+
+    def get_permission_fact(self, name, compute):
+        """
+        Возвращает закэшированный факт о правах доступа к объекту
+
+        Args:
+            name: Имя факта (например, 'can_edit')
+            compute: Функция без аргументов, вычисляющая факт
+
+        Returns:
+            Результат compute(), вычисленный не более одного раза за запрос
+        """
+        facts = self.__dict__.setdefault('_permission_facts', {})
+        if name not in facts:
+            facts[name] = compute()
+        return facts[name]
@@ -1,8 +1,16 @@
+import os
+import secrets
+import uuid
+
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
+from django.utils import timezone
+
+from .services.recurrence import compile_recurrence, parse_weekdays
 
 
 class Department(models.Model):
@@ -51,6 +59,12 @@ class Employee(models.Model):
         verbose_name="Индивидуальный отчет"
     )
     is_active = models.BooleanField(default=True, verbose_name="Активен")
+    # Секрет ссылок подписки на календарь смен (.ics): приложения календаря
+    # не умеют входить в систему, поэтому доступ даёт сам токен в URL
+    calendar_token = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False,
+        verbose_name="Токен календаря"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
 
     class Meta:
@@ -69,6 +83,18 @@ class Employee(models.Model):
             return full_name
         return self.user.username
 
+    def get_calendar_token(self):
+        """Возвращает токен подписки на календарь, создавая его при первом обращении"""
+        if not self.calendar_token:
+            self.reset_calendar_token()
+        return self.calendar_token
+
+    def reset_calendar_token(self):
+        """Выпускает новый токен; ссылки со старым перестают работать"""
+        self.calendar_token = secrets.token_urlsafe(32)
+        Employee.objects.filter(pk=self.pk).update(calendar_token=self.calendar_token)
+        return self.calendar_token
+
     @property
     def is_supervisor(self):
         return self.position in ['supervisor', 'admin']
@@ -135,7 +161,7 @@ class Employee(models.Model):
             return self.department == shift.department
         else:
             # Обычный сотрудник может управлять только своими сменами
-            return shift.employees.filter(id=self.id).exists()
+            return shift.has_employee(self)
     
     def can_view_department_data(self, department):
         """
@@ -323,6 +349,10 @@ class ShiftType(models.Model):
         verbose_name="Дата окончания действия (необязательно)"
     )
     
+    # Период, за который даты смен развёрнуты в таблицу ShiftOccurrence
+    calendar_from = models.DateField(null=True, blank=True, editable=False, verbose_name="Календарь с")
+    calendar_until = models.DateField(null=True, blank=True, editable=False, verbose_name="Календарь по")
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -337,9 +367,7 @@ class ShiftType(models.Model):
     
     def get_working_days_list(self):
         """Возвращает список рабочих дней как числа"""
-        if not self.working_days:
-            return []
-        return [int(day.strip()) for day in self.working_days.split(',') if day.strip().isdigit()]
+        return parse_weekdays(self.working_days)
     
     def get_shift_duration(self):
         """Возвращает длительность смены в часах"""
@@ -353,40 +381,27 @@ class ShiftType(models.Model):
             return (end - start).total_seconds() / 3600
         else:
             return self.duration_hours
+
+    @property
+    def recurrence(self):
+        """
+        Скомпилированное правило повторения (см. services.recurrence)
+
+        Кэшируется по значениям полей правила, поэтому после изменения
+        типа смены сразу используется новое правило.
+        """
+        return compile_recurrence(
+            self.periodicity, self.working_days, self.day_of_month,
+            self.custom_interval_days, self.start_date, self.end_date
+        )
     
     def get_next_shift_date(self, from_date):
-        """Возвращает дату следующей смены от указанной даты"""
-        from datetime import timedelta
-        
-        if self.periodicity == 'daily':
-            return from_date + timedelta(days=1)
-        elif self.periodicity == 'every_2_days':
-            return from_date + timedelta(days=2)
-        elif self.periodicity == 'every_3_days':
-            return from_date + timedelta(days=3)
-        elif self.periodicity == 'weekly':
-            return from_date + timedelta(days=7)
-        elif self.periodicity == 'biweekly':
-            return from_date + timedelta(days=14)
-        elif self.periodicity == 'monthly':
-            # Простая логика для месячных смен
-            next_date = from_date + timedelta(days=28)
-            if self.day_of_month:
-                # Устанавливаем конкретный день месяца
-                next_date = next_date.replace(day=min(self.day_of_month, 28))
-            return next_date
-        elif self.periodicity == 'custom' and self.custom_interval_days:
-            return from_date + timedelta(days=self.custom_interval_days)
-        else:
-            return from_date + timedelta(days=1)
+        """Возвращает дату следующей смены после указанной (None, если смен больше нет)"""
+        return self.recurrence.next_after(from_date)
     
     def is_working_day(self, date):
         """Проверяет, является ли дата рабочим днем для этого типа смены"""
-        if self.periodicity in ['daily', 'every_2_days', 'every_3_days', 'custom']:
-            return True  # Эти периодичности работают каждый день
-        
-        weekday = date.isoweekday()  # 1=Понедельник, 7=Воскресенье
-        return weekday in self.get_working_days_list()
+        return self.recurrence.occurs_on(date)
     
     def get_periodicity_description(self):
         """Возвращает читаемое описание периодичности"""
@@ -400,6 +415,68 @@ class ShiftType(models.Model):
             return base_desc
 
 
+class ShiftOccurrence(models.Model):
+    """
+    Дата, в которую по расписанию работает тип смены
+
+    Материализованный календарь: ответ на «какие смены идут в дату X»
+    — индексированная выборка, без развёртывания правил. Заполняется
+    сервисом ShiftCalendar при сохранении типа смены и командой
+    build_shift_calendar.
+    """
+    shift_type = models.ForeignKey(
+        ShiftType, on_delete=models.CASCADE, related_name='occurrences', verbose_name="Тип смены"
+    )
+    # Копия shift_type.department — для выборки по отделу без соединения
+    department = models.ForeignKey(
+        Department, on_delete=models.CASCADE, related_name='+', verbose_name="Отдел"
+    )
+    date = models.DateField(verbose_name="Дата")
+
+    class Meta:
+        verbose_name = "Дата типа смены"
+        verbose_name_plural = "Календарь типов смен"
+        unique_together = ['shift_type', 'date']
+        indexes = [
+            models.Index(fields=['date', 'department'], name='shift_occurrence_date_dept'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.shift_type.name}"
+
+
+class ShiftQuerySet(models.QuerySet):
+    """QuerySet смен с правилами видимости"""
+
+    def visible_to(self, employee):
+        """
+        Ограничивает смены теми, что доступны сотруднику
+
+        Правило компилируется в одно SQL-условие, поэтому проверка доступа
+        выполняется в том же запросе, что и выборка данных.
+
+        Args:
+            employee: Сотрудник (или None)
+
+        Returns:
+            QuerySet: Доступные смены
+        """
+        if employee is None:
+            return self.none()
+        if employee.position == 'admin':
+            return self
+        if employee.position == 'supervisor':
+            return self.filter(shift_type__department_id=employee.department_id)
+        return self.filter(
+            models.Exists(
+                ShiftAssignment.objects.filter(
+                    shift=models.OuterRef('pk'),
+                    employee=employee
+                )
+            )
+        )
+
+
 class Shift(models.Model):
     """Модель конкретной смены - экземпляр типа смены на определенную дату"""
     date = models.DateField(verbose_name="Дата смены")
@@ -420,6 +497,8 @@ class Shift(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    objects = ShiftQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Смена"
         verbose_name_plural = "Смены"
@@ -432,25 +511,22 @@ class Shift(models.Model):
     @property
     def department(self):
         return self.shift_type.department
+
+    def has_employee(self, employee):
+        """Проверяет назначение сотрудника на смену одним EXISTS-запросом"""
+        return ShiftAssignment.objects.filter(shift=self, employee=employee).exists()
     
     @property
     def planned_start_time(self):
         """Плановое время начала смены"""
-        from datetime import datetime
-        return datetime.combine(self.date, self.shift_type.start_time)
+        from .services.shift_conflicts import planned_interval
+        return planned_interval(self.date, self.shift_type.start_time, self.shift_type.end_time)[0]
     
     @property
     def planned_end_time(self):
-        """Плановое время окончания смены"""
-        from datetime import datetime, timedelta
-        end_time = self.shift_type.end_time
-        end_datetime = datetime.combine(self.date, end_time)
-        
-        # Если смена переходит через полночь
-        if self.shift_type.is_overnight and end_time < self.shift_type.start_time:
-            end_datetime += timedelta(days=1)
-        
-        return end_datetime
+        """Плановое время окончания смены (на следующий день, если смена переходит через полночь)"""
+        from .services.shift_conflicts import planned_interval
+        return planned_interval(self.date, self.shift_type.start_time, self.shift_type.end_time)[1]
     
     @property
     def duration_hours(self):
@@ -485,6 +561,124 @@ class ShiftAssignment(models.Model):
         verbose_name_plural = "Назначения на смены"
         unique_together = ['shift', 'employee']
 
+    def get_conflicts(self, min_rest=None):
+        """Конфликты с другими сменами сотрудника (пересечения и недостаточный отдых)"""
+        from .services.shift_conflicts import ShiftConflictService
+        return ShiftConflictService.for_assignment(self.shift, self.employee, min_rest)
+
+    def clean(self):
+        """Запрещает назначение, пересекающееся с другими сменами или не оставляющее отдыха"""
+        super().clean()
+        if self.shift_id and self.employee_id:
+            conflicts = self.get_conflicts()
+            if conflicts:
+                raise ValidationError([conflict.describe() for conflict in conflicts])
+
+
+class LaborHoursMonth(models.Model):
+    """
+    Заголовок месячной сводки рабочего времени отдела
+
+    signature — отпечаток исходных данных (число назначений, последние
+    изменения смен и назначений): если он не совпадает с текущим, сводка
+    устарела и пересчитывается (см. services.labor_hours).
+    """
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, verbose_name="Отдел")
+    month = models.DateField(verbose_name="Месяц (первое число)")
+    signature = models.CharField(max_length=64, verbose_name="Отпечаток данных")
+    computed_at = models.DateTimeField(auto_now=True, verbose_name="Рассчитано")
+
+    class Meta:
+        verbose_name = "Сводка рабочего времени"
+        verbose_name_plural = "Сводки рабочего времени"
+        unique_together = ['department', 'month']
+
+    def __str__(self):
+        return f"{self.department.name} - {self.month:%m.%Y}"
+
+
+class LaborHoursRollup(models.Model):
+    """Рабочее время сотрудника в отделе за месяц (строка сводки LaborHoursMonth)"""
+    summary = models.ForeignKey(
+        LaborHoursMonth, on_delete=models.CASCADE, related_name='rows', verbose_name="Сводка"
+    )
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name="Сотрудник")
+    shifts = models.PositiveIntegerField(default=0, verbose_name="Смен")
+    # Время хранится в минутах — суммы точные, без ошибок округления
+    planned_minutes = models.PositiveIntegerField(default=0, verbose_name="По плану, мин")
+    actual_minutes = models.PositiveIntegerField(default=0, verbose_name="Фактически, мин")
+    overtime_minutes = models.PositiveIntegerField(default=0, verbose_name="Переработка, мин")
+    late_starts = models.PositiveIntegerField(default=0, verbose_name="Опозданий")
+    late_minutes = models.PositiveIntegerField(default=0, verbose_name="Опоздания, мин")
+    missing_actuals = models.PositiveIntegerField(default=0, verbose_name="Смен без факта")
+
+    class Meta:
+        verbose_name = "Рабочее время сотрудника"
+        verbose_name_plural = "Рабочее время сотрудников"
+        unique_together = ['summary', 'employee']
+
+    def __str__(self):
+        return f"{self.summary} - {self.employee.get_full_name()}"
+
+
+class TaskQuerySet(models.QuerySet):
+    """QuerySet заданий с правилами видимости"""
+
+    def visible_to(self, employee, assigned_only=False):
+        """
+        Ограничивает задания теми, что доступны сотруднику
+
+        - администратор видит все задания;
+        - руководитель видит задания своего отдела;
+        - сотрудник видит назначенные ему задания и общие задания своего
+          отдела, а при assigned_only=True (список отчётов) — только
+          назначенные ему;
+        - пользователь без профиля сотрудника не видит ничего.
+
+        Args:
+            employee: Сотрудник (или None)
+            assigned_only: Сотруднику показывать только назначенные ему задания
+
+        Returns:
+            QuerySet: Доступные задания
+        """
+        if employee is None:
+            return self.none()
+        if employee.position == 'admin':
+            return self
+        if employee.position == 'supervisor':
+            return self.filter(department_id=employee.department_id)
+        if assigned_only:
+            return self.filter(assigned_to=employee)
+        return self.filter(
+            models.Q(assigned_to=employee) |
+            models.Q(department_id=employee.department_id, task_scope='general')
+        )
+
+    def handled_by(self, employee):
+        """
+        Ограничивает задания теми, с которыми сотрудник работает сам
+        (история изменений и вложения задания)
+
+        - администратор — все задания;
+        - руководитель — задания своего отдела;
+        - сотрудник — назначенные ему или созданные им;
+        - пользователь без профиля сотрудника — ничего.
+
+        Args:
+            employee: Сотрудник (или None)
+
+        Returns:
+            QuerySet: Доступные задания
+        """
+        if employee is None:
+            return self.none()
+        if employee.position == 'admin':
+            return self
+        if employee.position == 'supervisor':
+            return self.filter(department_id=employee.department_id)
+        return self.filter(models.Q(assigned_to=employee) | models.Q(created_by=employee))
+
 
 class Task(models.Model):
     """Модель задания"""
@@ -543,6 +737,8 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Задание"
         verbose_name_plural = "Задания"
@@ -645,6 +841,70 @@ class TaskReport(models.Model):
         return f"Отчет по заданию {self.task.title}"
 
 
+class AttachmentQuerySet(models.QuerySet):
+    """QuerySet вложений с правилами видимости"""
+
+    def visible_to(self, employee):
+        """
+        Ограничивает вложения теми, что доступны сотруднику
+
+        Администратор видит все вложения, остальные — только вложения
+        заданий, с которыми они работают (см. TaskQuerySet.handled_by).
+        Проверка задания выполняется подзапросом, без отдельного
+        обращения к БД.
+
+        Args:
+            employee: Сотрудник (или None)
+
+        Returns:
+            QuerySet: Доступные вложения
+        """
+        if employee is None:
+            return self.none()
+        if employee.position == 'admin':
+            return self
+        return self.filter(
+            attachment_type='task',
+            object_id__in=Task.objects.handled_by(employee).values('id')
+        )
+
+
+class Blob(models.Model):
+    """
+    Содержимое файла, хранимое один раз под своим SHA-256
+
+    Вложения, фотографии отчётов и вложения к функционалу ссылаются на blob;
+    одинаковые файлы, загруженные повторно, занимают место на диске один раз.
+    ref_count — число ссылающихся записей, blob удаляется вместе с файлом,
+    когда счётчик доходит до нуля (см. services.blob_storage).
+    """
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    file = models.FileField(upload_to='blobs/', max_length=255, verbose_name="Файл")
+    size = models.BigIntegerField(verbose_name="Размер")
+    content_type = models.CharField(max_length=100, verbose_name="Тип контента (по сигнатуре)")
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Число ссылок")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Содержимое файла"
+        verbose_name_plural = "Содержимое файлов"
+
+    def __str__(self):
+        return f"{self.sha256[:12]}… ({self.size} B, ссылок: {self.ref_count})"
+
+    @property
+    def is_image(self):
+        """Можно ли строить для содержимого миниатюры"""
+        from .services.image_derivatives import IMAGE_CONTENT_TYPES
+        return self.content_type in IMAGE_CONTENT_TYPES
+
+    def get_derivative_url(self, variant, fmt='jpg'):
+        """URL миниатюры ('thumb') или превью ('preview') в формате jpg/webp"""
+        return reverse('shift_log:image_derivative', kwargs={
+            'sha256': self.sha256, 'variant': variant, 'fmt': fmt,
+        })
+
+
 class Attachment(models.Model):
     """Модель вложения (файлы, скриншоты)"""
     ATTACHMENT_TYPE_CHOICES = [
@@ -653,7 +913,11 @@ class Attachment(models.Model):
         ('task_report', 'Отчет по заданию'),
     ]
 
-    file = models.FileField(upload_to='attachments/', verbose_name="Файл")
+    file = models.FileField(upload_to='attachments/', max_length=255, verbose_name="Файл")
+    blob = models.ForeignKey(
+        Blob, on_delete=models.PROTECT, null=True, blank=True,
+        related_name='attachments', verbose_name="Содержимое"
+    )
     filename = models.CharField(max_length=255, verbose_name="Имя файла")
     content_type = models.CharField(max_length=100, verbose_name="Тип контента")
     file_size = models.IntegerField(verbose_name="Размер файла")
@@ -664,6 +928,12 @@ class Attachment(models.Model):
     uploaded_by = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name="Загружен")
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
 
+    # Состояние файла хранится в записи, чтобы списки не обращались к диску
+    file_present = models.BooleanField(default=True, verbose_name="Файл на диске")
+    file_checked_at = models.DateTimeField(null=True, blank=True, verbose_name="Проверено")
+
+    objects = AttachmentQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Вложение"
         verbose_name_plural = "Вложения"
@@ -706,19 +976,105 @@ class Attachment(models.Model):
 
     def is_viewable_in_browser(self):
         """Проверяет, можно ли отобразить файл в браузере"""
-        viewable_types = [
-            'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/webp',
-            'application/pdf',
-            'text/plain', 'text/html', 'text/css', 'text/javascript',
-            'application/json', 'application/xml'
-        ]
-        return self.content_type.lower() in viewable_types
+        from shift_log.services.file_delivery import VIEWABLE_CONTENT_TYPES
+        return self.content_type.lower() in VIEWABLE_CONTENT_TYPES
+
+    def get_thumbnail_url(self):
+        """URL миниатюры (JPEG) для изображений, None для остальных файлов"""
+        if self.blob_id and self.blob.is_image:
+            return self.blob.get_derivative_url('thumb')
+        return None
+
+    def get_thumbnail_webp_url(self):
+        """URL миниатюры в WebP для изображений"""
+        if self.blob_id and self.blob.is_image:
+            return self.blob.get_derivative_url('thumb', 'webp')
+        return None
+
+
+class UploadSession(models.Model):
+    """
+    Сеанс порционной (возобновляемой) загрузки файла
+
+    Порции дописываются во временный файл внутри MEDIA_ROOT, received_size —
+    последнее подтверждённое смещение, с которого клиент продолжает загрузку
+    после обрыва. После финализации создаётся Attachment или
+    FeatureAttachment, а сеанс удаляется.
+    """
+    TARGET_CHOICES = [
+        ('attachment', 'Вложение'),
+        ('feature_attachment', 'Вложение к функционалу'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(
+        Employee, on_delete=models.CASCADE, related_name='upload_sessions',
+        verbose_name="Загружает"
+    )
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES, default='attachment', verbose_name="Назначение")
+    attachment_type = models.CharField(
+        max_length=20, choices=Attachment.ATTACHMENT_TYPE_CHOICES, blank=True,
+        verbose_name="Тип вложения"
+    )
+    object_id = models.IntegerField(verbose_name="ID объекта")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    content_type = models.CharField(max_length=100, verbose_name="Тип контента")
+    total_size = models.BigIntegerField(verbose_name="Размер файла")
+    received_size = models.BigIntegerField(default=0, verbose_name="Получено байт")
+    sha256 = models.CharField(max_length=64, verbose_name="Контрольная сумма SHA-256")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Сеанс загрузки"
+        verbose_name_plural = "Сеансы загрузки"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_size}/{self.total_size})"
+
+    @property
+    def temp_path(self):
+        """Путь к временному файлу (в MEDIA_ROOT, чтобы финализация была переименованием)"""
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial', f'{self.id}.part')
+
+    @property
+    def is_complete(self):
+        return self.received_size >= self.total_size
+
+
+class MediaScanCheckpoint(models.Model):
+    """
+    Отметка прохода команды scan_media
+
+    started_at — начало прохода, finished_at — его завершение (пусто,
+    если проход прерван). Следующий запуск продолжает прерванный проход
+    или проверяет только то, что изменилось после started_at завершённого.
+    """
+    SCOPE_CHOICES = [
+        ('rows', 'Записи'),
+        ('files', 'Файлы'),
+    ]
+
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES, unique=True, verbose_name="Проход")
+    started_at = models.DateTimeField(verbose_name="Начало")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершение")
+    stats = models.JSONField(default=dict, blank=True, verbose_name="Итоги")
+
+    class Meta:
+        verbose_name = "Отметка проверки медиафайлов"
+        verbose_name_plural = "Отметки проверки медиафайлов"
+
+    def __str__(self):
+        return f"{self.get_scope_display()}: {self.started_at:%d.%m.%Y %H:%M}"
 
 
 class Notification(models.Model):
     """Модель уведомления"""
     NOTIFICATION_TYPE_CHOICES = [
         ('task_assigned', 'Задание назначено'),
+        ('shift_assigned', 'Назначена смена'),
+        ('shift_replacement', 'Нужна замена'),
         ('shift_started', 'Смена началась'),
         ('shift_completed', 'Смена завершена'),
         ('task_completed', 'Задание завершено'),
@@ -752,6 +1108,8 @@ class Notification(models.Model):
         """Возвращает цвет для типа уведомления"""
         colors = {
             'task_assigned': 'primary',
+            'shift_assigned': 'primary',
+            'shift_replacement': 'danger',
             'shift_started': 'success',
             'shift_completed': 'info',
             'task_completed': 'success',
@@ -928,6 +1286,11 @@ class DailyReport(models.Model):
         verbose_name="Сотрудник"
     )
     date = models.DateField()
+    # Собранный текст отчёта: записи с folded=True (и текст, написанный до
+    # появления DailyReportEntry). Новые записи в него не дописываются.
+    # Собранные записи помечаются явно, а не по границе времени или id:
+    # и то и другое выдаётся до COMMIT, и запись из долгой транзакции
+    # оказалась бы «раньше» границы, не попав в текст.
     comment = models.TextField(blank=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
@@ -937,6 +1300,11 @@ class DailyReport(models.Model):
     class Meta:
         unique_together = ('department', 'employee', 'date')
         ordering = ['-date']
+        # Постраничный вывод списка отчётов по ключу (-date, id)
+        indexes = [
+            models.Index(fields=['department', '-date', 'id'], name='daily_report_dept_page_idx'),
+            models.Index(fields=['-date', 'id'], name='daily_report_page_idx'),
+        ]
         verbose_name = 'Ежедневный отчёт'
         verbose_name_plural = 'Ежедневные отчёты'
 
@@ -959,6 +1327,79 @@ class DailyReport(models.Model):
                    f"{self.employee.get_full_name()}")
         return f"Ежедневный отчёт отдела {self.department.name}"
 
+    def add_entry(self, author, text):
+        """
+        Добавляет запись в отчёт
+
+        Один INSERT: строка отчёта не перезаписывается, поэтому
+        одновременные записи нескольких сотрудников не теряются.
+        """
+        return DailyReportEntry.objects.create(daily_report=self, author=author, text=text)
+
+    def pending_entries(self):
+        """Записи, ещё не собранные в comment (из prefetch_related, если он был)"""
+        return [entry for entry in self.entries.all() if not entry.folded]
+
+    @property
+    def text(self):
+        """Полный текст отчёта: собранный текст и новые записи"""
+        parts = [self.comment] if self.comment else []
+        parts += [entry.text for entry in self.pending_entries()]
+        return '\n'.join(parts)
+
+    @property
+    def last_updated(self):
+        """Время последнего изменения с учётом записей"""
+        return max([self.updated_at] + [entry.created_at for entry in self.pending_entries()])
+
+    def close(self):
+        """
+        Собирает записи в comment (закрытие дня)
+
+        Строка отчёта блокируется на время сборки, поэтому параллельные
+        закрытия не соберут одни и те же записи дважды. Собранными
+        помечаются ровно прочитанные записи: запись, которая ещё не была
+        закоммичена, останется до следующего закрытия.
+
+        Returns:
+            True, если текст был собран
+        """
+        with transaction.atomic():
+            comment = DailyReport.objects.select_for_update().values_list(
+                'comment', flat=True
+            ).get(pk=self.pk)
+            pending = list(self.entries.filter(folded=False).order_by('created_at', 'id'))
+            if not pending:
+                return False
+            text = '\n'.join(([comment] if comment else []) + [entry.text for entry in pending])
+            DailyReport.objects.filter(pk=self.pk).update(comment=text)
+            DailyReportEntry.objects.filter(pk__in=[entry.pk for entry in pending]).update(folded=True)
+        self.comment = text
+        # Сброс prefetch: собранные записи больше не показываются отдельно
+        getattr(self, '_prefetched_objects_cache', {}).pop('entries', None)
+        return True
+
+
+class DailyReportEntry(models.Model):
+    """Запись ежедневного отчёта (только добавляется, не редактируется)"""
+    daily_report = models.ForeignKey(
+        DailyReport, on_delete=models.CASCADE, related_name='entries', verbose_name="Ежедневный отчет"
+    )
+    author = models.ForeignKey(
+        Employee, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Автор"
+    )
+    text = models.TextField(verbose_name="Текст")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время")
+    folded = models.BooleanField(default=False, verbose_name="Собрана в текст отчёта")
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        verbose_name = 'Запись ежедневного отчёта'
+        verbose_name_plural = 'Записи ежедневных отчётов'
+
+    def __str__(self):
+        return f"{self.daily_report} — {timezone.localtime(self.created_at):%H:%M}"
+
 
 class DailyReportPhoto(models.Model):
     """Модель фотографии для ежедневного отчета"""
@@ -970,8 +1411,17 @@ class DailyReportPhoto(models.Model):
     )
     image = models.ImageField(
         upload_to='daily_reports/photos/',
+        max_length=255,
         verbose_name="Фотография"
     )
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='daily_report_photos',
+        verbose_name="Содержимое"
+    )
     caption = models.CharField(
         max_length=255, 
         blank=True, 
@@ -986,6 +1436,20 @@ class DailyReportPhoto(models.Model):
         auto_now_add=True,
         verbose_name="Дата загрузки"
     )
+    file_present = models.BooleanField(
+        default=True,
+        verbose_name="Файл на диске"
+    )
+    file_size = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Размер файла"
+    )
+    file_checked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Проверено"
+    )
 
     class Meta:
         verbose_name = "Фотография ежедневного отчета"
@@ -999,20 +1463,40 @@ class DailyReportPhoto(models.Model):
         """Возвращает URL изображения"""
         return self.image.url if self.image else None
 
+    def _get_derivative_url(self, variant, fmt):
+        """URL варианта изображения; без blob'а — исходный файл (для jpg)"""
+        if self.blob_id and self.blob.is_image:
+            return self.blob.get_derivative_url(variant, fmt)
+        return self.get_image_url() if fmt == 'jpg' else None
+
+    def get_thumbnail_url(self):
+        """Возвращает URL миниатюры (JPEG)"""
+        return self._get_derivative_url('thumb', 'jpg')
+
+    def get_thumbnail_webp_url(self):
+        """Возвращает URL миниатюры в WebP (None, если её нет)"""
+        return self._get_derivative_url('thumb', 'webp')
+
+    def get_preview_url(self):
+        """Возвращает URL превью для просмотра (JPEG)"""
+        return self._get_derivative_url('preview', 'jpg')
+
+    def get_preview_webp_url(self):
+        """Возвращает URL превью в WebP (None, если его нет)"""
+        return self._get_derivative_url('preview', 'webp')
+
     def get_filename(self):
         """Возвращает имя файла"""
         return self.image.name.split('/')[-1] if self.image else None
     
     def file_exists(self):
-        """Проверяет существование файла на диске"""
-        if not self.image:
-            return False
-        try:
-            # Проверяем реальное существование файла через storage
-            return self.image.storage.exists(self.image.name)
-        except Exception:
-            # Если произошла ошибка, возвращаем False
-            return False
+        """
+        Есть ли файл на диске — по сохранённому флагу, без обращения к storage
+
+        Флаг обновляется при загрузке, при неудачной отдаче файла
+        и командой scan_media.
+        """
+        return bool(self.image) and self.file_present
 
 UNIT_CHOICES = [
     ('m', 'м'),
@@ -1055,6 +1539,10 @@ class MaterialWriteOff(models.Model):
         verbose_name = "Списание материала"
         verbose_name_plural = "Списания материалов"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['department', 'created_at'], name='writeoff_dept_created_idx'),
+            models.Index(fields=['created_at'], name='writeoff_created_idx'),
+        ]
 
     def __str__(self):
         return (
@@ -1063,6 +1551,95 @@ class MaterialWriteOff(models.Model):
         )
 
 
+class MaterialStock(models.Model):
+    """
+    Остаток материала в отделе
+
+    balance — текущий остаток, сумма всех движений (MaterialMovement);
+    меняется только через services.material_stock под блокировкой строки.
+    """
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, verbose_name="Отдел")
+    material_name = models.CharField(max_length=255, verbose_name="Материал")
+    unit = models.CharField(max_length=10, choices=UNIT_CHOICES, verbose_name="Ед. изм.")
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Остаток")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Остаток материала"
+        verbose_name_plural = "Остатки материалов"
+        unique_together = ['department', 'material_name', 'unit']
+        ordering = ['material_name', 'unit']
+
+    def __str__(self):
+        return f"{self.material_name}: {self.balance} {self.get_unit_display()} ({self.department.name})"
+
+
+class MaterialMovement(models.Model):
+    """Движение материала: поступление, списание или корректировка остатка"""
+    KIND_CHOICES = [
+        ('receipt', 'Поступление'),
+        ('writeoff', 'Списание'),
+        ('correction', 'Исправление списания'),
+        ('adjustment', 'Инвентаризация'),
+    ]
+
+    stock = models.ForeignKey(
+        MaterialStock, on_delete=models.CASCADE, related_name='movements', verbose_name="Остаток"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Вид")
+    # Поступление положительно, списание отрицательно
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Количество")
+    balance_after = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Остаток после")
+    writeoff = models.ForeignKey(
+        MaterialWriteOff, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='movements', verbose_name="Списание"
+    )
+    comment = models.CharField(max_length=255, blank=True, verbose_name="Комментарий")
+    created_by = models.ForeignKey(
+        Employee, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Кто внёс"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата и время")
+
+    class Meta:
+        verbose_name = "Движение материала"
+        verbose_name_plural = "Движения материалов"
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['stock', '-id'], name='material_movement_stock_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock.material_name}: {self.quantity:+} ({self.get_kind_display()})"
+
+
+class MaterialWriteOffDaily(models.Model):
+    """
+    Списания за день (по местному времени), сгруппированные по отделу,
+    материалу, единице измерения и назначению
+
+    Поддерживается сигналами MaterialWriteOff (см. services.writeoff_summary):
+    сводки за любой период суммируют эти строки, а не сами списания.
+    """
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, verbose_name="Отдел")
+    date = models.DateField(verbose_name="Дата")
+    material_name = models.CharField(max_length=255, verbose_name="Что списали")
+    unit = models.CharField(max_length=10, choices=UNIT_CHOICES, verbose_name="Ед. изм.")
+    destination = models.CharField(max_length=255, verbose_name="Куда")
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Количество")
+    writeoffs = models.PositiveIntegerField(default=0, verbose_name="Списаний")
+
+    class Meta:
+        verbose_name = "Списания за день"
+        verbose_name_plural = "Списания по дням"
+        unique_together = ['department', 'date', 'material_name', 'unit', 'destination']
+        indexes = [
+            models.Index(fields=['date'], name='writeoff_daily_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.department.name} {self.date:%d.%m.%Y}: {self.material_name} {self.quantity}"
+
+
 class Project(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='projects', verbose_name='Сотрудник')
     name = models.CharField(max_length=100, verbose_name='Название проекта')
@@ -0,0 +1,141 @@
+"""
+Автодополнение названий материалов и проектов заданий.
+
+Подсказки получаются в два шага:
+    1. названия, содержащие введённый текст, выбираются из БД запросом
+       UPPER(name) LIKE UPPER('%текст%') — на PostgreSQL его обслуживает
+       триграммный GIN-индекс (миграция 0039), поэтому он не зависит от
+       размера таблицы. Число кандидатов ограничено CANDIDATE_LIMIT, и
+       чтобы обрезка не отбросила лучшие, сначала берутся начинающиеся с
+       текста, затем остальные, и каждая выборка — по убыванию частоты;
+    2. кандидаты упорядочиваются: сначала начинающиеся с текста, затем
+       по частоте использования, затем по алфавиту.
+
+Частота (сколько раз материал списывали в отделе, сколько заданий в
+проекте) считается одним агрегирующим запросом и кэшируется на
+AUTOCOMPLETE_CACHE_TIMEOUT секунд: порядок может немного отставать, но
+новые названия попадают в подсказки сразу — их находит шаг 1.
+"""
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from ..models import MaterialStock, MaterialWriteOffDaily, TaskProject
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+CANDIDATE_LIMIT = 200
+
+
+def _cache_timeout() -> int:
+    return getattr(settings, 'AUTOCOMPLETE_CACHE_TIMEOUT', 300)
+
+
+def _candidates(queryset, field: str, query: str, order_by: Sequence[str]) -> List:
+    """
+    Не более CANDIDATE_LIMIT значений, содержащих query
+
+    Сначала начинающиеся с query, затем остальные; внутри — в порядке order_by.
+    """
+    values = list(
+        queryset.filter(**{f'{field}__istartswith': query}).order_by(*order_by)[:CANDIDATE_LIMIT]
+    )
+    if len(values) < CANDIDATE_LIMIT:
+        values += queryset.filter(**{f'{field}__icontains': query}).exclude(
+            **{f'{field}__istartswith': query}
+        ).order_by(*order_by)[:CANDIDATE_LIMIT - len(values)]
+    return values
+
+
+def _rank(candidates: List[str], query: str, uses: Dict[str, int], limit: int) -> List[str]:
+    folded = query.casefold()
+    return sorted(
+        candidates,
+        key=lambda name: (not name.casefold().startswith(folded), -uses.get(name, 0), name.casefold())
+    )[:limit]
+
+
+class AutocompleteService:
+    """Сервис подсказок для полей ввода"""
+
+    @staticmethod
+    def material_usage(department_id: int) -> Dict[str, int]:
+        """{материал: число списаний в отделе} (из кэша)"""
+        key = f'autocomplete:materials:{department_id}'
+        usage = cache.get(key)
+        if usage is None:
+            usage = dict(
+                MaterialWriteOffDaily.objects.filter(department_id=department_id).order_by()
+                .values('material_name').annotate(uses=Sum('writeoffs')).values_list('material_name', 'uses')
+            )
+            cache.set(key, usage, _cache_timeout())
+        return usage
+
+    @staticmethod
+    def project_usage() -> Dict[int, int]:
+        """{id проекта: число заданий} (из кэша)"""
+        key = 'autocomplete:task_projects'
+        usage = cache.get(key)
+        if usage is None:
+            usage = dict(
+                TaskProject.objects.order_by().annotate(uses=Count('tasks')).values_list('pk', 'uses')
+            )
+            cache.set(key, usage, _cache_timeout())
+        return usage
+
+    @staticmethod
+    def materials(query: str, department_id: int, limit: int = DEFAULT_LIMIT) -> List[str]:
+        """
+        Названия материалов отдела: из списаний по дням и остатков
+
+        Args:
+            query: Введённый текст (пустой — самые частые)
+            department_id: Отдел
+            limit: Сколько подсказок вернуть
+        """
+        query = query.strip()
+        usage = AutocompleteService.material_usage(department_id)
+        if not query:
+            return sorted(usage, key=lambda name: (-usage[name], name.casefold()))[:limit]
+
+        candidates = set(_candidates(
+            MaterialWriteOffDaily.objects.filter(department_id=department_id).values('material_name')
+            .annotate(uses=Sum('writeoffs')).values_list('material_name', flat=True),
+            'material_name', query, ('-uses', 'material_name')
+        ))
+        candidates.update(_candidates(
+            MaterialStock.objects.filter(department_id=department_id).values_list('material_name', flat=True),
+            'material_name', query, ('material_name',)
+        ))
+        return _rank(list(candidates), query, usage, limit)
+
+    @staticmethod
+    def task_projects(query: str, limit: int = DEFAULT_LIMIT) -> List[dict]:
+        """
+        Проекты заданий
+
+        Returns:
+            [{'id', 'name'}]
+        """
+        query = query.strip()
+        usage = AutocompleteService.project_usage()
+        if query:
+            names = dict(_candidates(
+                TaskProject.objects.annotate(uses=Count('tasks')).values_list('name', 'pk'),
+                'name', query, ('-uses', 'name')
+            ))
+        else:
+            top = sorted(usage, key=lambda pk: -usage[pk])[:limit]
+            names = dict(TaskProject.objects.filter(pk__in=top).values_list('name', 'pk'))
+        uses = {name: usage.get(pk, 0) for name, pk in names.items()}
+        return [{'id': names[name], 'name': name} for name in _rank(list(names), query, uses, limit)]
+
+
+def parse_limit(value: Optional[str]) -> int:
+    """Число подсказок из параметра запроса"""
+    try:
+        return max(1, min(int(value), MAX_LIMIT))
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
@@ -0,0 +1,280 @@
+"""
+Хранилище файлов с адресацией по содержимому.
+
+Каждый файл хранится один раз под именем blobs/ab/cd/<sha256>.<ext>.
+При приёме файл читается один раз: данные пишутся во временный файл,
+одновременно считается SHA-256 и по первым байтам определяется настоящий
+тип содержимого (клиентскому content_type не доверяем). Если blob с таким
+хэшем уже есть, временный файл удаляется и увеличивается счётчик ссылок.
+
+Записи Attachment, FeatureAttachment и DailyReportPhoto ссылаются на blob
+полем blob, а их FileField указывает на файл blob'а, так что отдача файлов
+и URL работают как раньше. При удалении записи счётчик уменьшается
+(сигнал post_delete), файл и его миниатюры удаляются после коммита,
+когда ссылок не осталось.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import uuid
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..models import Attachment, Blob, DailyReportPhoto
+from .file_state import FileStateService
+from .image_derivatives import derivative_names
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+SNIFF_SIZE = 2048
+
+# Сигнатуры форматов: (смещение, байты, MIME-тип)
+MAGIC_SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'Rar!\x1a\x07', 'application/x-rar-compressed'),
+    (0, b'\x7fELF', 'application/x-executable'),
+    (0, b'MZ', 'application/x-msdownload'),
+    (0, b'BM', 'image/bmp'),
+]
+
+# Форматы-контейнеры, конкретный тип которых определяется по расширению
+ZIP_BASED_TYPES = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+OLE_BASED_TYPES = {
+    '.doc': 'application/msword',
+    '.xls': 'application/vnd.ms-excel',
+    '.ppt': 'application/vnd.ms-powerpoint',
+}
+
+
+def sniff_content_type(head: bytes, filename: str = '') -> str:
+    """
+    Определяет MIME-тип по первым байтам файла
+
+    Args:
+        head: Начало файла (достаточно SNIFF_SIZE байт)
+        filename: Имя файла — уточняет тип для ZIP/OLE-контейнеров и текста
+
+    Returns:
+        MIME-тип; 'application/octet-stream', если тип не распознан
+    """
+    ext = os.path.splitext(filename.lower())[1]
+
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[:4] in (b'PK\x03\x04', b'PK\x05\x06'):
+        return ZIP_BASED_TYPES.get(ext, 'application/zip')
+    if head[:8] == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1':
+        return OLE_BASED_TYPES.get(ext, 'application/x-ole-storage')
+    for offset, signature, content_type in MAGIC_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            # 'BM' слишком короткая сигнатура: проверяем размер заголовка BMP
+            if content_type == 'image/bmp' and (len(head) < 26 or head[14] not in (12, 40, 56, 108, 124)):
+                continue
+            return content_type
+
+    if not head or b'\x00' in head:
+        return 'application/octet-stream'
+    try:
+        # Последние байты могут оказаться обрезанным многобайтовым символом
+        text = head.decode('utf-8-sig', errors='strict')
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:
+            return 'application/octet-stream'
+        text = head[:e.start].decode('utf-8-sig', errors='ignore')
+
+    stripped = text.lstrip().lower()
+    if stripped.startswith('<?xml'):
+        return 'application/xml'
+    if stripped.startswith(('<!doctype html', '<html')):
+        # HTML не сохраняем как активное содержимое: браузер исполнил бы его
+        # на домене приложения, поэтому такой файл — просто текст
+        return 'text/plain'
+    if ext == '.json' and stripped[:1] in ('{', '['):
+        return 'application/json'
+    return 'text/plain'
+
+
+def blob_name(sha256: str, content_type: str) -> str:
+    """Имя файла blob'а в хранилище: blobs/ab/cd/<sha256>.<ext>"""
+    ext = mimetypes.guess_extension(content_type) or ''
+    if ext == '.jpe':
+        ext = '.jpg'
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+
+class BlobStorage:
+    """Сервис хранения файлов с дедупликацией и подсчётом ссылок"""
+
+    @staticmethod
+    def temp_dir() -> str:
+        """Каталог временных файлов (в MEDIA_ROOT, чтобы перенос был rename)"""
+        path = os.path.join(settings.MEDIA_ROOT, 'blobs', 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def ingest(fileobj, filename: str = '') -> Blob:
+        """
+        Принимает файл за один проход и возвращает blob с учтённой ссылкой
+
+        Вызывающий код должен привязать blob к записи в той же транзакции:
+        при откате счётчик ссылок вернётся к прежнему значению.
+
+        Args:
+            fileobj: Загруженный файл (UploadedFile или файлоподобный объект)
+            filename: Оригинальное имя файла
+
+        Returns:
+            Blob: Новый или уже существующий blob
+        """
+        digest = hashlib.sha256()
+        head = b''
+        size = 0
+        temp_path = os.path.join(BlobStorage.temp_dir(), f'{uuid.uuid4().hex}.part')
+
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        chunks = fileobj.chunks(READ_CHUNK_SIZE) if hasattr(fileobj, 'chunks') else \
+            iter(lambda: fileobj.read(READ_CHUNK_SIZE), b'')
+        try:
+            with open(temp_path, 'wb') as out:
+                for chunk in chunks:
+                    if len(head) < SNIFF_SIZE:
+                        head += chunk[:SNIFF_SIZE - len(head)]
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            content_type = sniff_content_type(head, filename or getattr(fileobj, 'name', ''))
+            return BlobStorage.ingest_path(temp_path, digest.hexdigest(), size, content_type)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def ingest_path(path: str, sha256: str, size: int, content_type: str) -> Blob:
+        """
+        Принимает уже посчитанный временный файл (переносом, без копирования)
+
+        Если blob с таким хэшем существует, файл по path удаляется.
+
+        Returns:
+            Blob: blob с увеличенным счётчиком ссылок
+        """
+        blob = BlobStorage.acquire_existing(sha256)
+        if blob is not None:
+            existing_path = os.path.join(settings.MEDIA_ROOT, blob.file.name)
+            if os.path.exists(existing_path):
+                os.remove(path)
+            else:
+                # Файл blob'а потерян — восстанавливаем его из новой загрузки
+                os.makedirs(os.path.dirname(existing_path), exist_ok=True)
+                os.replace(path, existing_path)
+                FileStateService.mark_blob_present(blob)
+            return blob
+
+        name = blob_name(sha256, content_type)
+        final_path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(path, final_path)
+        try:
+            with transaction.atomic():
+                return Blob.objects.create(
+                    sha256=sha256,
+                    file=name,
+                    size=size,
+                    content_type=content_type,
+                    ref_count=1,
+                )
+        except IntegrityError:
+            # Такой же файл параллельно принят другим запросом; файл на диске
+            # у обоих одинаковый, поэтому оставляем его и просто берём ссылку
+            blob = BlobStorage.acquire_existing(sha256)
+            if blob is None:
+                raise
+            return blob
+
+    @staticmethod
+    def acquire_existing(sha256: str) -> Optional[Blob]:
+        """Увеличивает счётчик ссылок существующего blob'а, если он есть"""
+        updated = Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+        if not updated:
+            return None
+        return Blob.objects.get(sha256=sha256)
+
+    @staticmethod
+    def is_visible_to(blob: Blob, employee) -> bool:
+        """
+        Видит ли сотрудник хотя бы одну запись, ссылающуюся на blob
+
+        Права на содержимое выводятся из прав на вложения и отчёты:
+        знание хэша само по себе доступа не даёт.
+        """
+        from testing.models import Feature, FeatureAttachment
+
+        if Attachment.objects.visible_to(employee).filter(blob=blob).exists():
+            return True
+        photos = DailyReportPhoto.objects.filter(blob=blob)
+        if employee.position != 'admin':
+            # Как в списке ежедневных отчётов: только свой отдел
+            photos = photos.filter(daily_report__department_id=employee.department_id)
+            if employee.individual_report:
+                photos = photos.filter(daily_report__employee=employee)
+        if photos.exists():
+            return True
+        return FeatureAttachment.objects.filter(
+            blob=blob, feature__in=Feature.objects.visible_to(employee).values('id')
+        ).exists()
+
+    @staticmethod
+    def release(blob_id: int) -> None:
+        """
+        Уменьшает счётчик ссылок; без ссылок blob удаляется вместе с файлом
+        и его миниатюрами
+
+        Файлы удаляются только после коммита транзакции, чтобы откат
+        удаления записи не оставил её без файла.
+        """
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(pk=blob_id).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1:
+                Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+                return
+            name = blob.file.name
+            # Миниатюры и превью называются по хэшу и удаляются вместе с файлом
+            names = [name] + (derivative_names(blob.sha256) if blob.is_image else [])
+            blob.delete()
+
+        def remove_file():
+            # Файл мог быть заново принят между удалением и коммитом
+            if Blob.objects.filter(file=name).exists():
+                return
+            for file_name in names:
+                try:
+                    os.remove(os.path.join(settings.MEDIA_ROOT, file_name))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Не удалось удалить файл blob {file_name}: {e}")
+
+        transaction.on_commit(remove_file)
+
+
+def release_blob_on_delete(sender, instance, **kwargs):
+    """Обработчик post_delete для моделей, ссылающихся на blob"""
+    if instance.blob_id:
+        BlobStorage.release(instance.blob_id)
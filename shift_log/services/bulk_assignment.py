@@ -0,0 +1,200 @@
+"""
+Массовое назначение сотрудников на смены.
+
+Изменение задаётся наборами «смена → сотрудники» для назначения и снятия
+(или целиком ротацией бригад за период, см. rotation). Применение:
+    1. смены, сотрудники и текущие назначения читаются тремя запросами;
+    2. вычисляется разница: какие назначения создать, какие удалить;
+    3. плановые интервалы затронутых сотрудников за период читаются одним
+       запросом, к ним добавляются новые назначения (без удаляемых), и
+       конфликты ищутся в памяти тем же проходом, что и в
+       ShiftConflictService;
+    4. если конфликтов нет — удаление одним DELETE и bulk_create в одной
+       транзакции, затем сброс кэша графиков затронутых месяцев.
+
+Пересечения смен не допускаются никогда, нехватка отдыха — если не
+разрешена явно. При конфликтах ничего не записывается.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from ..models import Employee, Shift, ShiftAssignment
+from .shift_conflicts import (MARGIN, ShiftConflictService, ShiftInterval,
+                              planned_interval)
+from .shift_generation import BULK_BATCH_SIZE
+from .shift_schedule import ShiftScheduleService
+
+
+class BulkAssignmentService:
+    """Сервис массового назначения на смены"""
+
+    @staticmethod
+    def rotation(shifts: Iterable[Shift], crews: Sequence[Sequence[int]],
+                 offset: int = 0) -> Dict[int, List[int]]:
+        """
+        Распределяет смены по бригадам по кругу
+
+        Смены упорядочиваются по дате и времени начала; i-я смена достаётся
+        бригаде (i + offset) % len(crews). Три бригады и одна смена в сутки
+        дают «A, B, C, A, ...», четыре бригады на дневной и ночной сменах —
+        «A день, B ночь, C день, D ночь, ...».
+
+        Args:
+            shifts: Смены (с shift_type)
+            crews: Бригады — списки id сотрудников
+            offset: Сдвиг ротации (какая бригада выходит первой)
+
+        Returns:
+            {id смены: id сотрудников бригады}
+        """
+        if not crews:
+            return {}
+        ordered = sorted(shifts, key=lambda s: (s.date, s.shift_type.start_time, s.shift_type_id, s.pk))
+        return {
+            shift.pk: list(crews[(index + offset) % len(crews)])
+            for index, shift in enumerate(ordered)
+        }
+
+    @staticmethod
+    def apply(assign: Optional[Dict[int, Iterable[int]]] = None,
+              unassign: Optional[Dict[int, Iterable[int]]] = None,
+              replace: bool = False,
+              min_rest: Optional[timedelta] = None,
+              allow_rest_violations: bool = False,
+              dry_run: bool = False) -> dict:
+        """
+        Назначает и снимает сотрудников со смен одной транзакцией
+
+        Args:
+            assign: {id смены: id сотрудников} — кого назначить
+            unassign: {id смены: id сотрудников} — кого снять
+            replace: Снять со смен из assign всех, кого там нет
+            min_rest: Минимальный отдых (по умолчанию SHIFT_MIN_REST_HOURS)
+            allow_rest_violations: Допускать нехватку отдыха
+            dry_run: Только проверить, ничего не записывать
+
+        Returns:
+            {'applied', 'created', 'deleted', 'conflicts'} — при конфликтах
+            applied=False, а created/deleted — сколько было бы изменено
+
+        Raises:
+            ValidationError: Смена или активный сотрудник не найдены
+        """
+        assign = {shift_id: set(ids) for shift_id, ids in (assign or {}).items()}
+        unassign = {shift_id: set(ids) for shift_id, ids in (unassign or {}).items()}
+        shift_ids = set(assign) | set(unassign)
+        employee_ids = set().union(*assign.values(), *unassign.values())
+
+        with transaction.atomic():
+            # Блокируем сотрудников: параллельное назначение тех же людей
+            # дождётся окончания и увидит наши изменения
+            found = set(
+                Employee.objects.select_for_update().filter(pk__in=employee_ids, is_active=True)
+                .order_by().values_list('pk', flat=True)
+            )
+            if employee_ids - found:
+                raise ValidationError(
+                    'Сотрудники не найдены или неактивны: %s' % ', '.join(map(str, sorted(employee_ids - found)))
+                )
+            shifts = {
+                shift.pk: shift
+                for shift in Shift.objects.filter(pk__in=shift_ids).select_related('shift_type').order_by()
+            }
+            if shift_ids - set(shifts):
+                raise ValidationError(
+                    'Смены не найдены: %s' % ', '.join(map(str, sorted(shift_ids - set(shifts))))
+                )
+
+            current = defaultdict(set)
+            for shift_id, employee_id in ShiftAssignment.objects.filter(shift_id__in=shift_ids).values_list(
+                    'shift_id', 'employee_id'):
+                current[shift_id].add(employee_id)
+
+            to_create, to_delete = [], []
+            for shift_id in sorted(shift_ids):
+                removed = unassign.get(shift_id, set())
+                if replace and shift_id in assign:
+                    removed = removed | (current[shift_id] - assign[shift_id])
+                to_delete += [(shift_id, employee_id) for employee_id in sorted(removed & current[shift_id])]
+                added = assign.get(shift_id, set()) - current[shift_id] - removed
+                to_create += [(shift_id, employee_id) for employee_id in sorted(added)]
+
+            conflicts = BulkAssignmentService.find_conflicts(shifts, to_create, to_delete, min_rest)
+            blocking = [
+                conflict for conflict in conflicts
+                if conflict.kind == 'overlap' or not allow_rest_violations
+            ]
+            result = {
+                'applied': False,
+                'created': len(to_create),
+                'deleted': len(to_delete),
+                'conflicts': blocking,
+            }
+            if blocking or dry_run:
+                return result
+
+            if to_delete:
+                by_shift = defaultdict(list)
+                for shift_id, employee_id in to_delete:
+                    by_shift[shift_id].append(employee_id)
+                condition = Q()
+                for shift_id, ids in by_shift.items():
+                    condition |= Q(shift_id=shift_id, employee_id__in=ids)
+                ShiftAssignment.objects.filter(condition).delete()
+            ShiftAssignment.objects.bulk_create(
+                [ShiftAssignment(shift_id=shift_id, employee_id=employee_id)
+                 for shift_id, employee_id in to_create],
+                batch_size=BULK_BATCH_SIZE
+            )
+
+        # bulk_create не отправляет сигналы — графики сбрасываем сами
+        months = defaultdict(set)
+        for shift_id, _ in to_create + to_delete:
+            shift = shifts[shift_id]
+            months[shift.shift_type.department_id].add((shift.date.year, shift.date.month))
+        for department_id, department_months in months.items():
+            ShiftScheduleService.invalidate(department_id, department_months)
+
+        result['applied'] = True
+        return result
+
+    @staticmethod
+    def find_conflicts(shifts: Dict[int, Shift], to_create, to_delete, min_rest: Optional[timedelta] = None):
+        """
+        Конфликты, которые дадут новые назначения (одним запросом)
+
+        Args:
+            shifts: {id смены: смена} — смены изменения
+            to_create: Пары (id смены, id сотрудника) для создания
+            to_delete: Пары для удаления — их интервалы не учитываются
+        """
+        new = [
+            ShiftInterval(employee_id, shift_id, shifts[shift_id].date, shifts[shift_id].shift_type.name,
+                          *planned_interval(shifts[shift_id].date, shifts[shift_id].shift_type.start_time,
+                                            shifts[shift_id].shift_type.end_time))
+            for shift_id, employee_id in to_create
+            if not shifts[shift_id].is_cancelled
+        ]
+        if not new:
+            return []
+        dates = [interval.date for interval in new]
+        removed = set(to_delete)
+        existing = [
+            interval for interval in ShiftConflictService.load_intervals(
+                ShiftAssignment.objects.filter(
+                    employee_id__in={interval.employee_id for interval in new},
+                    shift__date__range=(min(dates) - MARGIN, max(dates) + MARGIN),
+                )
+            )
+            if (interval.shift_id, interval.employee_id) not in removed
+        ]
+        new_set = set(new)
+        return [
+            conflict for conflict in ShiftConflictService.find_conflicts(existing + new, min_rest)
+            if conflict.first in new_set or conflict.second in new_set
+        ]
@@ -0,0 +1,327 @@
+"""
+Сервис порционной (возобновляемой) загрузки вложений.
+
+Протокол:
+    1. init — клиент сообщает имя, тип, размер и SHA-256 файла и получает
+       идентификатор сеанса;
+    2. PUT порций — тело запроса дописывается во временный файл потоком,
+       смещение порции должно совпадать с уже подтверждённым;
+    3. finalize — сервер сверяет контрольную сумму и тип по сигнатуре,
+       переносит временный файл в хранилище blob'ов и создаёт
+       Attachment/FeatureAttachment.
+
+Если файл с той же суммой уже хранится и доступен сотруднику, init сразу
+создаёт вложение и данные не передаются.
+
+После обрыва связи клиент запрашивает состояние сеанса и продолжает
+с received_size. Ни порция, ни файл целиком в память не читаются.
+"""
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from ..forms import validate_attachment_upload
+from ..models import (Attachment, Blob, Employee, Shift, ShiftLog, Task,
+                      TaskReport, UploadSession)
+from .blob_storage import SNIFF_SIZE, BlobStorage, sniff_content_type
+from .image_derivatives import schedule_derivatives
+
+logger = logging.getLogger(__name__)
+
+# Размер порции, который предлагается клиенту, и максимальный принимаемый
+DEFAULT_CHUNK_SIZE = getattr(settings, 'UPLOAD_CHUNK_SIZE', 1024 * 1024)
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Ошибка протокола загрузки; status — HTTP-код ответа"""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploadService:
+    """Сервис порционной загрузки файлов"""
+
+    @staticmethod
+    def init_upload(
+        employee: Employee,
+        filename: str,
+        content_type: str,
+        total_size: int,
+        sha256: str,
+        object_id: int,
+        attachment_type: str = 'task',
+        target: str = 'attachment'
+    ):
+        """
+        Открывает сеанс загрузки
+
+        Если такой же файл уже хранится и доступен сотруднику, вложение
+        создаётся сразу, без передачи данных.
+
+        Args:
+            employee: Загружающий сотрудник
+            filename: Оригинальное имя файла
+            content_type: MIME-тип
+            total_size: Размер файла в байтах
+            sha256: Ожидаемая контрольная сумма (hex)
+            object_id: ID задания/функционала, к которому относится файл
+            attachment_type: Тип вложения для Attachment
+            target: 'attachment' или 'feature_attachment'
+
+        Returns:
+            UploadSession: Новый сеанс или готовое Attachment/FeatureAttachment
+
+        Raises:
+            UploadError: Если параметры некорректны или нет прав
+        """
+        if total_size <= 0:
+            raise UploadError('Пустой файл')
+        sha256 = (sha256 or '').lower()
+        if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+            raise UploadError('Некорректная контрольная сумма SHA-256')
+        try:
+            validate_attachment_upload(filename, content_type, total_size)
+        except ValidationError as e:
+            raise UploadError(' '.join(e.messages))
+
+        ChunkedUploadService._check_target_access(employee, target, attachment_type, object_id)
+
+        # Файл уже хранится — повторная загрузка не нужна. Знание хэша не даёт
+        # доступа к файлу: blob переиспользуется, только если сотрудник уже
+        # видит запись с этим содержимым (те же права, что при выдаче файла)
+        blob = Blob.objects.filter(sha256=sha256, size=total_size).first()
+        if blob is not None and BlobStorage.is_visible_to(blob, employee):
+            with transaction.atomic():
+                blob = BlobStorage.acquire_existing(sha256)
+                if blob is not None:
+                    return ChunkedUploadService._link_blob(
+                        blob, employee, target,
+                        attachment_type if target == 'attachment' else '',
+                        object_id, os.path.basename(filename)[:255]
+                    )
+
+        session = UploadSession.objects.create(
+            uploaded_by=employee,
+            target=target,
+            attachment_type=attachment_type if target == 'attachment' else '',
+            object_id=object_id,
+            filename=os.path.basename(filename)[:255],
+            content_type=content_type or 'application/octet-stream',
+            total_size=total_size,
+            sha256=sha256,
+        )
+        os.makedirs(os.path.dirname(session.temp_path), exist_ok=True)
+        # Создаём пустой файл сразу, чтобы первая порция дописывалась так же, как остальные
+        open(session.temp_path, 'wb').close()
+        return session
+
+    @staticmethod
+    def append_chunk(session_id, employee: Employee, offset: int, stream, length: int) -> UploadSession:
+        """
+        Дописывает порцию во временный файл
+
+        Смещение проверяется под короткой блокировкой строки сеанса, а сама
+        порция читается из сети вне транзакции: медленный клиент не держит
+        соединение с БД. Подтверждается порция условным UPDATE по прежнему
+        received_size, поэтому из повторно отправленных или параллельных
+        порций с одним смещением засчитывается одна; испорченный ими файл
+        не пройдёт сверку контрольной суммы в finalize.
+
+        Args:
+            session_id: ID сеанса
+            employee: Загружающий сотрудник
+            offset: Смещение порции, заявленное клиентом
+            stream: Файлоподобный объект с телом запроса
+            length: Длина порции (Content-Length)
+
+        Returns:
+            UploadSession: Сеанс с обновлённым received_size
+
+        Raises:
+            UploadError: 409 при несовпадении смещения, 413 при превышении размера
+        """
+        if length <= 0:
+            raise UploadError('Пустая порция')
+        if length > MAX_CHUNK_SIZE:
+            raise UploadError('Слишком большая порция', status=413)
+
+        with transaction.atomic():
+            session = ChunkedUploadService._get_session(session_id, employee, lock=True)
+            if offset != session.received_size:
+                raise UploadError(
+                    'Смещение порции не совпадает с полученными данными',
+                    status=409, offset=session.received_size
+                )
+            if offset + length > session.total_size:
+                raise UploadError('Порция выходит за пределы файла', status=413)
+
+        written = 0
+        with open(session.temp_path, 'r+b') as f:
+            # Обрезаем хвост неподтверждённой порции, оборвавшейся ранее
+            f.truncate(offset)
+            f.seek(offset)
+            while written < length:
+                data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+
+        if written != length:
+            raise UploadError('Порция получена не полностью', status=400, offset=offset)
+
+        now = timezone.now()
+        updated = UploadSession.objects.filter(pk=session.pk, received_size=offset).update(
+            received_size=offset + written, updated_at=now
+        )
+        if not updated:
+            session.refresh_from_db(fields=['received_size'])
+            raise UploadError(
+                'Смещение порции не совпадает с полученными данными',
+                status=409, offset=session.received_size
+            )
+        session.received_size, session.updated_at = offset + written, now
+        return session
+
+    @staticmethod
+    def finalize(session_id, employee: Employee):
+        """
+        Проверяет контрольную сумму и создаёт вложение
+
+        Returns:
+            Attachment или FeatureAttachment
+
+        Raises:
+            UploadError: Если файл получен не полностью или сумма не совпала
+        """
+        with transaction.atomic():
+            session = ChunkedUploadService._get_session(session_id, employee, lock=True)
+            if not session.is_complete:
+                raise UploadError(
+                    'Файл получен не полностью', status=409, offset=session.received_size
+                )
+
+            # Один проход по файлу: контрольная сумма и сигнатура типа
+            digest = hashlib.sha256()
+            head = b''
+            with open(session.temp_path, 'rb') as f:
+                for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+                    if not head:
+                        head = block[:SNIFF_SIZE]
+                    digest.update(block)
+
+            if digest.hexdigest() != session.sha256:
+                error = UploadError('Контрольная сумма не совпадает, загрузите файл заново', status=422)
+            else:
+                content_type = sniff_content_type(head, session.filename)
+                try:
+                    validate_attachment_upload(session.filename, content_type, session.total_size)
+                except ValidationError as e:
+                    error = UploadError(' '.join(e.messages), status=415)
+                else:
+                    # Временный файл лежит в MEDIA_ROOT — переносится без копирования
+                    blob = BlobStorage.ingest_path(
+                        session.temp_path, session.sha256, session.total_size, content_type
+                    )
+                    instance = ChunkedUploadService._link_blob(
+                        blob, session.uploaded_by, session.target,
+                        session.attachment_type, session.object_id, session.filename
+                    )
+                    session.delete()
+                    return instance
+
+        # Такие данные не докачать — сеанс удаляется вне транзакции,
+        # иначе откат вернул бы запись, указывающую на удалённый файл
+        ChunkedUploadService._discard(session)
+        raise error
+
+    @staticmethod
+    def _link_blob(blob: Blob, employee: Employee, target: str, attachment_type: str,
+                   object_id: int, filename: str):
+        """Создаёт запись вложения, ссылающуюся на blob (ссылка уже учтена)"""
+        if target == 'feature_attachment':
+            from testing.models import FeatureAttachment
+            instance = FeatureAttachment(feature_id=object_id)
+        else:
+            instance = Attachment(attachment_type=attachment_type, object_id=object_id)
+        instance.blob = blob
+        instance.file = blob.file.name
+        instance.filename = filename
+        instance.content_type = blob.content_type
+        instance.file_size = blob.size
+        instance.uploaded_by = employee
+        instance.save()
+        schedule_derivatives(blob)
+        return instance
+
+    @staticmethod
+    def get_session(session_id, employee: Employee) -> UploadSession:
+        """Возвращает сеанс сотрудника (для возобновления загрузки)"""
+        return ChunkedUploadService._get_session(session_id, employee)
+
+    @staticmethod
+    def purge_stale(max_age: timedelta = timedelta(days=1)) -> int:
+        """
+        Удаляет брошенные сеансы и их временные файлы
+
+        Returns:
+            Количество удалённых сеансов
+        """
+        stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - max_age)
+        count = 0
+        for session in stale.iterator():
+            ChunkedUploadService._discard(session)
+            count += 1
+        return count
+
+    @staticmethod
+    def _get_session(session_id, employee: Employee, lock: bool = False) -> UploadSession:
+        queryset = UploadSession.objects.filter(uploaded_by=employee)
+        if lock:
+            queryset = queryset.select_for_update()
+        session = queryset.filter(pk=session_id).first()
+        if session is None:
+            raise UploadError('Сеанс загрузки не найден', status=404)
+        return session
+
+    @staticmethod
+    def _discard(session: UploadSession) -> None:
+        try:
+            os.remove(session.temp_path)
+        except FileNotFoundError:
+            pass
+        session.delete()
+
+    @staticmethod
+    def _check_target_access(employee: Employee, target: str, attachment_type: str, object_id) -> None:
+        """Проверяет, что сотрудник видит объект, к которому прикрепляется файл"""
+        if target == 'feature_attachment':
+            from testing.models import Feature
+            if not Feature.objects.visible_to(employee).filter(pk=object_id).exists():
+                raise UploadError('Нет доступа к функционалу', status=403)
+        elif target == 'attachment':
+            valid_types = dict(Attachment.ATTACHMENT_TYPE_CHOICES)
+            if attachment_type not in valid_types:
+                raise UploadError('Некорректный тип вложения')
+            targets = {
+                'task': Task.objects.visible_to(employee),
+                'task_report': TaskReport.objects.filter(task__in=Task.objects.visible_to(employee)),
+                'shift_log': ShiftLog.objects.filter(shift__in=Shift.objects.visible_to(employee)),
+            }
+            if not targets[attachment_type].filter(pk=object_id).exists():
+                raise UploadError(f'Нет доступа к объекту: {valid_types[attachment_type]}', status=403)
+        else:
+            raise UploadError('Некорректное назначение загрузки')
@@ -0,0 +1,296 @@
+"""
+PDF-сводка отдела за день: ежедневные отчёты, миниатюры фотографий,
+выполненные за день задания и списания материалов.
+
+Файл кэшируется на диске под именем с хэшем входных данных:
+    MEDIA_ROOT/daily_pdf/<id отдела>/<дата>_<хэш>.pdf
+
+Входные данные собираются несколькими запросами (это намного дешевле
+вёрстки), сериализуются и хэшируются. Если файл с таким хэшем уже есть —
+он отдаётся без перерисовки; если за день что-то изменилось (новая запись
+отчёта, фотография, выполненное задание, списание), хэш другой и PDF
+строится заново.
+
+Строятся PDF командой build_daily_pdfs (по окончании дня) или по запросу
+при первом скачивании. Прежние версии удаляет только команда: запрос,
+который только что получил имя прежней версии, или медленная вёрстка
+устаревших данных не должны удалять чужой файл.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import uuid
+from datetime import date
+from typing import Optional
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import (Image, Paragraph, SimpleDocTemplate, Spacer,
+                                Table, TableStyle)
+
+from ..models import (Blob, DailyReport, DailyReportPhoto, Department,
+                      MaterialWriteOff, Task)
+from ..utils import local_date_range_filter
+from .image_derivatives import ensure_derivative
+
+logger = logging.getLogger(__name__)
+
+# Меняется при изменении вёрстки — старые файлы перестают совпадать по хэшу
+LAYOUT_VERSION = 'v1'
+PDF_DIR = 'daily_pdf'
+THUMBNAIL_SIZE = 40 * mm
+PHOTOS_PER_ROW = 4
+
+FONT_NAME = 'ShiftLogSans'
+FONT_BOLD_NAME = 'ShiftLogSans-Bold'
+
+
+def _register_fonts():
+    """
+    Регистрирует шрифт с кириллицей (PDF_FONT_PATH, PDF_FONT_BOLD_PATH)
+
+    Returns:
+        (обычный, жирный) — имена шрифтов; встроенный Helvetica, если
+        файлов шрифтов нет
+    """
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return FONT_NAME, FONT_BOLD_NAME
+    regular = getattr(settings, 'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+    bold = getattr(settings, 'PDF_FONT_BOLD_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf')
+    if not os.path.exists(regular):
+        logger.warning(f"Шрифт для PDF не найден: {regular}, кириллица отображаться не будет")
+        return 'Helvetica', 'Helvetica-Bold'
+    pdfmetrics.registerFont(TTFont(FONT_NAME, regular))
+    pdfmetrics.registerFont(TTFont(FONT_BOLD_NAME, bold if os.path.exists(bold) else regular))
+    return FONT_NAME, FONT_BOLD_NAME
+
+
+def _paragraph_text(value: str) -> str:
+    return escape(value or '').replace('\n', '<br/>')
+
+
+def _local(value) -> str:
+    return timezone.localtime(value).strftime('%H:%M') if value else ''
+
+
+class DailyReportPdf:
+    """Сервис PDF-сводок отдела за день"""
+
+    @staticmethod
+    def collect(department: Department, day: date) -> dict:
+        """Входные данные сводки (только значения, без моделей)"""
+        reports = (
+            DailyReport.objects.filter(department=department, date=day)
+            .select_related('employee__user').prefetch_related('entries').order_by('employee_id', 'id')
+        )
+        photos = (
+            DailyReportPhoto.objects.filter(daily_report__department=department, daily_report__date=day,
+                                            file_present=True)
+            .select_related('blob').order_by('uploaded_at', 'id')
+        )
+        tasks = (
+            Task.objects.filter(department=department, status='completed',
+                                **local_date_range_filter('completed_at', day, day))
+            .select_related('assigned_to__user').order_by('completed_at', 'id')
+        )
+        writeoffs = (
+            MaterialWriteOff.objects.filter(department=department, **local_date_range_filter('created_at', day, day))
+            .select_related('created_by__user').order_by('created_at', 'id')
+        )
+        return {
+            'version': LAYOUT_VERSION,
+            'department': department.name,
+            'date': day.isoformat(),
+            'reports': [
+                {
+                    'employee': report.employee.get_full_name() if report.employee else '',
+                    'text': report.text,
+                }
+                for report in reports
+            ],
+            'photos': [
+                {
+                    'sha256': photo.blob.sha256 if photo.blob_id else '',
+                    'path': photo.blob.file.name if photo.blob_id else photo.image.name,
+                    'caption': photo.caption,
+                }
+                for photo in photos
+            ],
+            'tasks': [
+                {
+                    'id': task.pk,
+                    'title': task.title,
+                    'assigned_to': task.assigned_to.get_full_name() if task.assigned_to else '',
+                    'completed_at': _local(task.completed_at),
+                }
+                for task in tasks
+            ],
+            'writeoffs': [
+                {
+                    'time': _local(writeoff.created_at),
+                    'material': writeoff.material_name,
+                    'quantity': str(writeoff.quantity),
+                    'unit': writeoff.get_unit_display(),
+                    'destination': writeoff.destination,
+                    'created_by': writeoff.created_by.get_full_name(),
+                }
+                for writeoff in writeoffs
+            ],
+        }
+
+    @staticmethod
+    def content_hash(data: dict) -> str:
+        return hashlib.sha256(
+            json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    @staticmethod
+    def relative_path(department_id: int, day: date, digest: str) -> str:
+        """Путь файла относительно MEDIA_ROOT"""
+        return f'{PDF_DIR}/{department_id}/{day.isoformat()}_{digest[:16]}.pdf'
+
+    @staticmethod
+    def ensure(department: Department, day: date) -> str:
+        """
+        Актуальный PDF отдела за день, при необходимости строит его
+
+        Returns:
+            Путь относительно MEDIA_ROOT
+        """
+        data = DailyReportPdf.collect(department, day)
+        name = DailyReportPdf.relative_path(department.pk, day, DailyReportPdf.content_hash(data))
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        if os.path.exists(path):
+            return name
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            DailyReportPdf.render(data, temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        logger.info(f"Построен PDF отдела {department.name} за {day}")
+        return name
+
+    @staticmethod
+    def prune(department: Department, day: date, keep: str) -> int:
+        """
+        Удаляет версии PDF отдела за день, кроме keep
+
+        Вызывается только командой build_daily_pdfs; запрос, у которого
+        файл исчез между построением и отдачей, вызывает ensure повторно.
+
+        Returns:
+            Количество удалённых файлов
+        """
+        keep_path = os.path.join(settings.MEDIA_ROOT, keep)
+        pattern = os.path.join(settings.MEDIA_ROOT, PDF_DIR, str(department.pk), f'{day.isoformat()}_*.pdf')
+        removed = 0
+        for stale in glob.glob(pattern):
+            if stale != keep_path:
+                try:
+                    os.remove(stale)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    @staticmethod
+    def _thumbnail(photo: dict) -> Optional[str]:
+        """Путь к миниатюре фотографии (или к исходнику без blob'а)"""
+        try:
+            if photo['sha256']:
+                return ensure_derivative(Blob(sha256=photo['sha256'], file=photo['path']), 'thumb', 'jpg')
+            path = os.path.join(settings.MEDIA_ROOT, photo['path'])
+            return path if os.path.exists(path) else None
+        except OSError:
+            return None
+
+    @staticmethod
+    def render(data: dict, path: str) -> None:
+        """Вёрстка PDF из входных данных"""
+        font, bold = _register_fonts()
+        base = getSampleStyleSheet()
+        normal = base['Normal'].clone('ShiftLogNormal', fontName=font, fontSize=10, leading=13)
+        small = normal.clone('ShiftLogSmall', fontSize=8, leading=10)
+        heading = base['Heading2'].clone('ShiftLogHeading', fontName=bold)
+        title = base['Title'].clone('ShiftLogTitle', fontName=bold)
+        day = date.fromisoformat(data['date'])
+
+        story = [
+            Paragraph(_paragraph_text(f"{data['department']} — {day:%d.%m.%Y}"), title),
+            Paragraph('Ежедневный отчёт', heading),
+        ]
+        if data['reports']:
+            for report in data['reports']:
+                if report['employee']:
+                    story.append(Paragraph(f"<b>{_paragraph_text(report['employee'])}</b>", normal))
+                story.append(Paragraph(_paragraph_text(report['text']) or '—', normal))
+                story.append(Spacer(1, 3 * mm))
+        else:
+            story.append(Paragraph('Отчёт не заполнен', normal))
+
+        images = []
+        for photo in data['photos']:
+            thumbnail = DailyReportPdf._thumbnail(photo)
+            if thumbnail:
+                image = Image(thumbnail)
+                image._restrictSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+                images.append([image, Paragraph(_paragraph_text(photo['caption']), small)])
+        if images:
+            story.append(Paragraph('Фотографии', heading))
+            cells = [images[i:i + PHOTOS_PER_ROW] for i in range(0, len(images), PHOTOS_PER_ROW)]
+            cells[-1] += [''] * (PHOTOS_PER_ROW - len(cells[-1]))
+            story.append(Table(cells, colWidths=[THUMBNAIL_SIZE + 4 * mm] * PHOTOS_PER_ROW,
+                               style=[('VALIGN', (0, 0), (-1, -1), 'TOP')]))
+
+        grid = TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), font),
+            ('FONTNAME', (0, 0), (-1, 0), bold),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e9ecef')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ])
+
+        story.append(Paragraph('Выполненные задания', heading))
+        if data['tasks']:
+            rows = [['№', 'Задание', 'Исполнитель', 'Время']] + [
+                [task['id'], Paragraph(_paragraph_text(task['title']), normal),
+                 Paragraph(_paragraph_text(task['assigned_to']), normal), task['completed_at']]
+                for task in data['tasks']
+            ]
+            story.append(Table(rows, colWidths=[15 * mm, 95 * mm, 50 * mm, 20 * mm], style=grid, repeatRows=1))
+        else:
+            story.append(Paragraph('Нет', normal))
+
+        story.append(Paragraph('Списания материалов', heading))
+        if data['writeoffs']:
+            rows = [['Время', 'Что списали', 'Количество', 'Куда', 'Кем списано']] + [
+                [item['time'], Paragraph(_paragraph_text(item['material']), normal),
+                 f"{item['quantity']} {item['unit']}", Paragraph(_paragraph_text(item['destination']), normal),
+                 Paragraph(_paragraph_text(item['created_by']), normal)]
+                for item in data['writeoffs']
+            ]
+            story.append(Table(rows, colWidths=[15 * mm, 60 * mm, 25 * mm, 45 * mm, 35 * mm],
+                               style=grid, repeatRows=1))
+        else:
+            story.append(Paragraph('Нет', normal))
+
+        document = SimpleDocTemplate(
+            path, pagesize=A4, leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm,
+            title=f"{data['department']} {data['date']}",
+        )
+        document.build(story)
@@ -0,0 +1,219 @@
+"""
+Сервис отдачи файлов-вложений клиенту.
+
+Файл не читается в память целиком: в режиме 'django' он отдаётся потоком
+(FileResponse/StreamingHttpResponse), а в режимах 'x-accel' и 'x-sendfile'
+Django только проверяет права и заголовки, а байты отдаёт веб-сервер.
+
+Поддерживаются условные запросы (ETag/Last-Modified → 304) и Range/If-Range
+для докачки и перемотки PDF.
+
+Настройки:
+    ATTACHMENT_DELIVERY_MODE: 'django' (по умолчанию), 'x-accel' (nginx)
+        или 'x-sendfile' (apache mod_xsendfile, lighttpd)
+    ATTACHMENT_X_ACCEL_PREFIX: internal-location nginx, отображённый
+        на MEDIA_ROOT (по умолчанию '/protected-media/')
+"""
+import logging
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (FileResponse, HttpResponse, HttpResponseBase,
+                         StreamingHttpResponse)
+from django.utils.cache import get_conditional_response
+from django.utils.http import (content_disposition_header, http_date,
+                               parse_http_date_safe)
+
+logger = logging.getLogger(__name__)
+
+# Типы, которые браузер показывает сам и которые не исполняются как
+# страница: HTML, CSS, скрипты и XML отдаются только на скачивание
+VIEWABLE_CONTENT_TYPES = frozenset([
+    'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/webp',
+    'application/pdf',
+    'text/plain', 'application/json',
+])
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.IGNORECASE)
+
+
+class RangeNotSatisfiable(Exception):
+    """Запрошенный диапазон лежит за пределами файла"""
+
+
+def make_etag(size: int, mtime_ns: int) -> str:
+    """Строит сильный ETag из размера и времени изменения файла"""
+    return f'"{size:x}-{mtime_ns:x}"'
+
+
+def parse_range_header(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает заголовок Range
+
+    Поддерживается один диапазон; составные диапазоны (через запятую) и
+    нераспознанные единицы игнорируются — клиент получит файл целиком,
+    как разрешает RFC 9110.
+
+    Args:
+        header: Значение заголовка Range
+        size: Размер файла в байтах
+
+    Returns:
+        Кортеж (start, end) включительно или None, если диапазон игнорируется
+
+    Raises:
+        RangeNotSatisfiable: Если диапазон не пересекается с файлом
+    """
+    match = RANGE_RE.match(header)
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # bytes=-N — последние N байт
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or (last and end < start):
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag: str, last_modified: int) -> bool:
+    """Проверяет условие If-Range: без него Range применяется всегда"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        # Для If-Range допускается только сильное сравнение
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and date == last_modified
+
+
+def _iter_file_range(path: str, start: int, length: int):
+    """Читает из файла length байт начиная со start кусками"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload_response(file_name: str, path: str, content_type: str) -> HttpResponse:
+    """Ответ без тела: байты отдаёт веб-сервер по служебному заголовку"""
+    mode = getattr(settings, 'ATTACHMENT_DELIVERY_MODE', 'django')
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel':
+        prefix = getattr(settings, 'ATTACHMENT_X_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(
+            file_name.replace(os.sep, '/').lstrip('/')
+        )
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_file(request, field_file, filename: str, content_type: str,
+               as_attachment: bool = True, immutable: bool = False) -> HttpResponseBase:
+    """
+    Отдаёт файл из FileField с учётом условных запросов и Range
+
+    Права доступа должны быть проверены до вызова.
+
+    Args:
+        request: HTTP-запрос
+        field_file: Значение FileField (attachment.file)
+        filename: Имя файла для Content-Disposition
+        content_type: MIME-тип файла
+        as_attachment: True — скачивание, False — показ в браузере
+        immutable: Содержимое по этому URL никогда не меняется (имя
+            содержит хэш) — браузер может не перепроверять его
+
+    Returns:
+        HttpResponse/FileResponse/StreamingHttpResponse
+
+    Raises:
+        FileNotFoundError: Если файла нет на диске
+        PermissionError: Если файл недоступен для чтения
+    """
+    path = field_file.path
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = make_etag(size, stat.st_mtime_ns)
+    content_type = content_type or 'application/octet-stream'
+
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if conditional is not None:
+        _set_validators(conditional, etag, last_modified, immutable)
+        return conditional
+
+    mode = getattr(settings, 'ATTACHMENT_DELIVERY_MODE', 'django')
+    disposition = content_disposition_header(as_attachment, filename)
+
+    if mode in ('x-accel', 'x-sendfile'):
+        # Range, If-Range и длину веб-сервер обрабатывает сам
+        response = _offload_response(field_file.name, path, content_type)
+    else:
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and request.method in ('GET', 'HEAD') and \
+                _if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_range_header(range_header, size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                response['Accept-Ranges'] = 'bytes'
+                return response
+
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _iter_file_range(path, start, length),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = str(size)
+        response['Accept-Ranges'] = 'bytes'
+
+    if disposition:
+        response['Content-Disposition'] = disposition
+    _set_validators(response, etag, last_modified, immutable)
+    return response
+
+
+def _set_validators(response: HttpResponseBase, etag: str, last_modified: int,
+                    immutable: bool = False) -> None:
+    """Проставляет валидаторы кэша; ответ зависит от прав пользователя"""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if immutable:
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
@@ -0,0 +1,78 @@
+"""
+Сохранённое состояние файлов вложений и фотографий.
+
+Наличие и размер файла хранятся в самой записи (file_present, file_size,
+file_checked_at), поэтому шаблоны и списки не обращаются к storage при
+отображении: медиа-том бывает сетевым, и stat на каждую фотографию
+заметно тормозит страницу.
+
+Состояние обновляется:
+    - при загрузке (файл только что записан, размер известен из blob);
+    - при отдаче файла, если он оказался на диске не тем, чем числится;
+    - при восстановлении файла blob'а повторной загрузкой;
+    - командой scan_media (см. services.media_scan).
+"""
+import os
+from typing import Optional
+
+from django.utils import timezone
+
+from ..models import Attachment, Blob, DailyReportPhoto
+
+
+def file_field_name(model) -> str:
+    """Имя поля с файлом в модели"""
+    return 'image' if model is DailyReportPhoto else 'file'
+
+
+def file_models():
+    """Модели, записи которых ссылаются на файлы в MEDIA_ROOT"""
+    from testing.models import FeatureAttachment
+    return [Attachment, DailyReportPhoto, FeatureAttachment]
+
+
+class FileStateService:
+    """Сервис сохранённого состояния файлов"""
+
+    @staticmethod
+    def stat_size(field_file) -> Optional[int]:
+        """Размер файла на диске или None, если файла нет"""
+        if not field_file:
+            return None
+        try:
+            return os.stat(field_file.path).st_size
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    @staticmethod
+    def record(instance, present: bool) -> None:
+        """
+        Сохраняет результат проверки, если он отличается от записанного
+
+        Вызывается из мест, где наличие файла выяснилось попутно
+        (например, при отдаче), поэтому лишних UPDATE не делает.
+        """
+        if instance.file_present == present:
+            return
+        instance.file_present = present
+        instance.file_checked_at = timezone.now()
+        type(instance).objects.filter(pk=instance.pk).update(
+            file_present=present, file_checked_at=instance.file_checked_at
+        )
+
+    @staticmethod
+    def mark_blob_present(blob: Blob) -> None:
+        """Отмечает все записи blob'а как имеющие файл (файл восстановлен)"""
+        now = timezone.now()
+        for model in file_models():
+            model.objects.filter(blob=blob, file_present=False).update(
+                file_present=True, file_checked_at=now
+            )
+
+    @staticmethod
+    def save_states(model, objects) -> None:
+        """Сохраняет проверенное состояние пачки записей одним запросом"""
+        fields = ['file_present', 'file_checked_at']
+        if any(field.name == 'file_size' for field in model._meta.concrete_fields):
+            fields.append('file_size')
+        model.objects.bulk_update(objects, fields, batch_size=len(objects))
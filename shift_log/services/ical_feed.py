@@ -0,0 +1,154 @@
+"""
+Календарь смен в формате iCalendar (RFC 5545) для подписки из приложений.
+
+Ленты строятся на get_employee_schedule/get_department_schedule и
+отдаются потоком: события формируются генератором по мере чтения смен
+из БД, поэтому длинный период не собирается в памяти целиком.
+
+Приложения календаря опрашивают ленту каждые 15–60 минут. Чтобы такие
+опросы не строили расписание заново, валидаторы (ETag и Last-Modified)
+вычисляются одним агрегатным запросом: последние Shift.updated_at,
+ShiftAssignment.assigned_at и ShiftType.updated_at за период плюс число
+смен (удаление смены не сдвигает максимумы, но меняет число). Если клиент
+прислал совпадающие валидаторы, отвечаем 304 без чтения смен.
+"""
+import hashlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Iterator, Optional, Tuple
+
+from django.db.models import Count, Max, QuerySet
+from django.utils import timezone
+
+# Длина строки iCalendar без CRLF, в октетах
+LINE_LIMIT = 75
+
+PRODID = '-//Shift Log//Shifts//RU'
+
+
+def escape_text(value: str) -> str:
+    """Экранирует значение типа TEXT"""
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold(line: str) -> str:
+    """Переносит строку длиннее 75 октетов (продолжение начинается с пробела)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= LINE_LIMIT:
+        return line + '\r\n'
+    parts = []
+    limit = LINE_LIMIT
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Не разрываем многобайтовый символ UTF-8
+        while cut < len(encoded) and encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = LINE_LIMIT - 1
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_utc(value: datetime) -> str:
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def shift_bounds(shift) -> Tuple[datetime, datetime]:
+    """Плановые начало и конец смены (ночная смена заканчивается на следующий день)"""
+    start = timezone.make_aware(datetime.combine(shift.date, shift.shift_type.start_time))
+    end = timezone.make_aware(datetime.combine(shift.date, shift.shift_type.end_time))
+    if end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+
+class ICalFeed:
+    """Сервис лент календаря смен"""
+
+    @staticmethod
+    def validators(shifts: QuerySet, scope: str) -> Tuple[str, Optional[datetime]]:
+        """
+        Валидаторы ленты одним агрегатным запросом
+
+        Args:
+            shifts: Смены ленты (до select_related/prefetch)
+            scope: Что входит в ключ помимо данных (лента, период)
+
+        Returns:
+            (ETag, Last-Modified или None для пустой ленты)
+        """
+        stats = shifts.order_by().aggregate(
+            shift_updated=Max('updated_at'),
+            assigned=Max('shiftassignment__assigned_at'),
+            type_updated=Max('shift_type__updated_at'),
+            count=Count('pk', distinct=True),
+            assignments=Count('shiftassignment', distinct=True),
+        )
+        stamps = [stats[key] for key in ('shift_updated', 'assigned', 'type_updated') if stats[key]]
+        last_modified = max(stamps) if stamps else None
+        key = '|'.join([scope] + [str(stats[key]) for key in sorted(stats)])
+        etag = '"%s"' % hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        return etag, last_modified
+
+    @staticmethod
+    def render(shifts: QuerySet, name: str, host: str, with_attendees: bool = False) -> Iterator[str]:
+        """
+        Генератор текста календаря (по строке/событию за раз)
+
+        Args:
+            shifts: Смены ленты
+            name: Название календаря
+            host: Домен для UID событий
+            with_attendees: Перечислять ли назначенных сотрудников в описании
+        """
+        yield fold('BEGIN:VCALENDAR')
+        yield fold('VERSION:2.0')
+        yield fold(f'PRODID:{PRODID}')
+        yield fold('CALSCALE:GREGORIAN')
+        yield fold('METHOD:PUBLISH')
+        yield fold(f'X-WR-CALNAME:{escape_text(name)}')
+        yield fold('X-PUBLISHED-TTL:PT15M')
+
+        shifts = shifts.select_related('shift_type', 'shift_type__department')
+        if with_attendees:
+            shifts = shifts.prefetch_related('employees__user')
+        for shift in shifts.iterator(chunk_size=500):
+            yield ICalFeed.render_event(shift, host, with_attendees)
+
+        yield fold('END:VCALENDAR')
+
+    @staticmethod
+    def render_event(shift, host: str, with_attendees: bool = False) -> str:
+        """Событие VEVENT одной смены"""
+        start, end = shift_bounds(shift)
+        shift_type = shift.shift_type
+        description = [shift_type.get_periodicity_description()]
+        if with_attendees:
+            names = [employee.get_full_name() for employee in shift.employees.all()]
+            if names:
+                description.append('Сотрудники: ' + ', '.join(names))
+        if shift.notes:
+            description.append(shift.notes)
+
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:shift-{shift.pk}@{host}',
+            f'DTSTAMP:{format_utc(shift.updated_at)}',
+            f'LAST-MODIFIED:{format_utc(shift.updated_at)}',
+            f'DTSTART:{format_utc(start)}',
+            f'DTEND:{format_utc(end)}',
+            f'SUMMARY:{escape_text(shift_type.name)}',
+            f'LOCATION:{escape_text(shift_type.department.name)}',
+            f'DESCRIPTION:{escape_text(chr(10).join(description))}',
+            'STATUS:' + ('CANCELLED' if shift.is_cancelled else 'CONFIRMED'),
+            'TRANSP:OPAQUE',
+            'END:VEVENT',
+        ]
+        return ''.join(fold(line) for line in lines)
+
+
+def feed_period(today: date, past_days: int, future_days: int) -> Tuple[date, date]:
+    """Период ленты относительно сегодняшней даты"""
+    return today - timedelta(days=past_days), today + timedelta(days=future_days)
@@ -0,0 +1,169 @@
+"""
+Производные изображения (миниатюры и превью) для фотографий и вложений.
+
+Для каждого blob-изображения строятся варианты из DERIVATIVE_SIZES в двух
+форматах — WebP и JPEG (запасной для старых браузеров). Изображение
+поворачивается по EXIF, уменьшается с сохранением пропорций и пишется
+в MEDIA_ROOT/derivatives/<ab>/<sha256>_<вариант>_<версия>.<формат>.
+
+Имя файла зависит только от хэша содержимого и параметров варианта, поэтому
+URL неизменяемы и отдаются с Cache-Control: immutable. При изменении
+параметров меняется DERIVATIVES_VERSION — а с ним и URL.
+
+Варианты строятся в фоне после коммита загрузки (пул потоков), а если
+запрос пришёл раньше — синхронно при первом обращении.
+"""
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Наибольшая сторона в пикселях
+DERIVATIVE_SIZES = {
+    'thumb': 320,
+    'preview': 1280,
+}
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVES_VERSION = 'v1'
+
+IMAGE_CONTENT_TYPES = frozenset([
+    'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/webp',
+])
+
+_executor = None
+_executor_lock = threading.Lock()
+# Не даём двум потокам строить один и тот же набор одновременно
+_in_progress = set()
+_in_progress_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                thread_name_prefix='image-derivatives',
+            )
+        return _executor
+
+
+def derivative_name(sha256: str, variant: str, fmt: str) -> str:
+    """Имя файла варианта относительно MEDIA_ROOT"""
+    return f'derivatives/{sha256[:2]}/{sha256}_{variant}_{DERIVATIVES_VERSION}.{fmt}'
+
+
+def derivative_names(sha256: str) -> List[str]:
+    """Имена всех вариантов blob'а (для удаления вместе с ним)"""
+    return [
+        derivative_name(sha256, variant, fmt)
+        for variant in DERIVATIVE_SIZES for fmt in DERIVATIVE_FORMATS
+    ]
+
+
+def derivative_path(sha256: str, variant: str, fmt: str) -> str:
+    return os.path.join(settings.MEDIA_ROOT, derivative_name(sha256, variant, fmt))
+
+
+def generate_derivatives(sha256: str, source_path: str) -> None:
+    """
+    Строит все варианты изображения, которых ещё нет на диске
+
+    Исходник декодируется один раз: сначала строится наибольший вариант,
+    меньшие получаются из него.
+    """
+    missing = [
+        (variant, size) for variant, size in DERIVATIVE_SIZES.items()
+        if not all(os.path.exists(derivative_path(sha256, variant, fmt)) for fmt in DERIVATIVE_FORMATS)
+    ]
+    if not missing:
+        return
+
+    with _in_progress_lock:
+        if sha256 in _in_progress:
+            return
+        _in_progress.add(sha256)
+    try:
+        img = _load_image(source_path, max(size for _, size in missing))
+        for variant, size in sorted(missing, key=lambda item: -item[1]):
+            img.thumbnail((size, size), Image.LANCZOS)
+            for fmt, (pil_format, options) in DERIVATIVE_FORMATS.items():
+                _save_atomic(img, derivative_path(sha256, variant, fmt), pil_format, options)
+    finally:
+        with _in_progress_lock:
+            _in_progress.discard(sha256)
+
+
+def _load_image(source_path: str, largest: int):
+    """Открывает исходник, поворачивает по EXIF и приводит к RGB/RGBA"""
+    with Image.open(source_path) as img:
+        # Для JPEG декодер сразу уменьшает изображение кратно 2 — в разы быстрее
+        img.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    return img
+
+
+def _save_atomic(img, path: str, pil_format: str, options: dict) -> None:
+    """Сохраняет файл через временное имя, чтобы не отдать недописанный"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if pil_format == 'JPEG' and img.mode == 'RGBA':
+        # JPEG без альфа-канала: подкладываем белый фон
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        img = background
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        img.save(temp_path, pil_format, **options)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def ensure_derivative(blob, variant: str, fmt: str) -> str:
+    """
+    Возвращает путь к варианту, при необходимости строя его синхронно
+
+    Raises:
+        FileNotFoundError: Если исходный файл отсутствует
+    """
+    path = derivative_path(blob.sha256, variant, fmt)
+    if not os.path.exists(path):
+        generate_derivatives(blob.sha256, blob.file.path)
+        if not os.path.exists(path):
+            # Набор строится другим потоком прямо сейчас — строим только нужное
+            size = DERIVATIVE_SIZES[variant]
+            img = _load_image(blob.file.path, size)
+            img.thumbnail((size, size), Image.LANCZOS)
+            pil_format, options = DERIVATIVE_FORMATS[fmt]
+            _save_atomic(img, path, pil_format, options)
+    return path
+
+
+def schedule_derivatives(blob) -> None:
+    """Ставит построение вариантов в фон после коммита транзакции"""
+    if blob is None or blob.content_type not in IMAGE_CONTENT_TYPES:
+        return
+    sha256, source_path = blob.sha256, blob.file.path
+
+    def run():
+        try:
+            generate_derivatives(sha256, source_path)
+        except Exception as e:
+            logger.error(f"Не удалось построить миниатюры для {sha256}: {e}", exc_info=True)
+
+    transaction.on_commit(lambda: _get_executor().submit(run))
@@ -0,0 +1,194 @@
+"""
+Учёт рабочего времени по сменам: план, факт, переработка, опоздания.
+
+Исходные данные отдела за период читаются одним запросом (values_list по
+ShiftAssignment с полями смены и типа смены). Времена переводятся в
+минуты от фиксированной точки и считаются по столбцам: плановые начало и
+конец (через полночь — на следующий день), фактические начало и конец,
+затем длительности, переработка и опоздания — без создания моделей и
+обращений к свойствам вроде Shift.duration_hours на каждую смену.
+
+Месячные сводки хранятся в LaborHoursMonth/LaborHoursRollup вместе с
+отпечатком исходных данных. При запросе отпечаток сверяется одним
+агрегатным запросом; если смены или назначения за месяц менялись, сводка
+пересчитывается.
+
+Правила:
+    - отменённые смены не учитываются;
+    - факт считается только по сменам, где заполнены оба фактических времени
+      (остальные попадают в «смен без факта»);
+    - переработка — превышение фактической длительности над плановой по каждой смене;
+    - опоздание — фактическое начало позже планового больше чем на
+      LABOR_LATE_GRACE_MINUTES минут.
+"""
+import csv
+import hashlib
+from datetime import date, datetime
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from ..models import (Department, LaborHoursMonth, LaborHoursRollup,
+                      ShiftAssignment)
+from .shift_schedule import month_bounds
+
+# Точка отсчёта минут (локальное время)
+ORIGIN = datetime(2000, 1, 1)
+
+METRICS = ['shifts', 'planned_minutes', 'actual_minutes', 'overtime_minutes',
+           'late_starts', 'late_minutes', 'missing_actuals']
+
+CSV_HEADER = ['Сотрудник', 'Смен', 'Часов по плану', 'Часов фактически',
+              'Переработка, ч', 'Опозданий', 'Опоздания, мин', 'Смен без факта']
+
+
+def _local_minutes(value: datetime) -> int:
+    """Минуты от ORIGIN в локальном времени (для наивных и aware значений)"""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value).replace(tzinfo=None)
+    return int((value - ORIGIN).total_seconds() // 60)
+
+
+def _time_minutes(value) -> int:
+    return value.hour * 60 + value.minute
+
+
+class LaborHoursService:
+    """Сервис учёта рабочего времени"""
+
+    @staticmethod
+    def source(department_id: int, start_date: date, end_date: date):
+        """Назначения на неотменённые смены отдела за период"""
+        return ShiftAssignment.objects.filter(
+            shift__shift_type__department_id=department_id,
+            shift__date__range=(start_date, end_date),
+            shift__is_cancelled=False,
+        )
+
+    @staticmethod
+    def compute(department_id: int, start_date: date, end_date: date) -> Dict[int, Dict[str, int]]:
+        """
+        Считает показатели сотрудников отдела за период одним запросом
+
+        Returns:
+            {id сотрудника: {показатель из METRICS: значение}}
+        """
+        rows = list(LaborHoursService.source(department_id, start_date, end_date).values_list(
+            'employee_id', 'shift__date', 'shift__shift_type__start_time', 'shift__shift_type__end_time',
+            'shift__actual_start_time', 'shift__actual_end_time',
+        ))
+        if not rows:
+            return {}
+        employee_ids, dates, start_times, end_times, actual_starts, actual_ends = zip(*rows)
+        grace = getattr(settings, 'LABOR_LATE_GRACE_MINUTES', 5)
+
+        # Плановые интервалы: конец не позже начала — смена через полночь
+        day_minutes = [(d - ORIGIN.date()).days * 1440 for d in dates]
+        planned_start = [day + _time_minutes(t) for day, t in zip(day_minutes, start_times)]
+        planned_length = [
+            (_time_minutes(e) - _time_minutes(s)) % 1440 or 1440
+            for s, e in zip(start_times, end_times)
+        ]
+        # Фактические интервалы (None, если факт не заполнен)
+        has_actual = [a is not None and b is not None for a, b in zip(actual_starts, actual_ends)]
+        actual_start = [_local_minutes(a) if a is not None else None for a in actual_starts]
+        actual_length = [
+            max(0, _local_minutes(b) - a) if ok else 0
+            for ok, a, b in zip(has_actual, actual_start, actual_ends)
+        ]
+        overtime = [
+            max(0, actual - planned) if ok else 0
+            for ok, actual, planned in zip(has_actual, actual_length, planned_length)
+        ]
+        lateness = [
+            a - p if a is not None and a - p > grace else 0
+            for a, p in zip(actual_start, planned_start)
+        ]
+
+        totals: Dict[int, Dict[str, int]] = {}
+        for employee_id, planned, ok, actual, extra, late in zip(
+                employee_ids, planned_length, has_actual, actual_length, overtime, lateness):
+            entry = totals.get(employee_id)
+            if entry is None:
+                entry = totals[employee_id] = dict.fromkeys(METRICS, 0)
+            entry['shifts'] += 1
+            entry['planned_minutes'] += planned
+            entry['actual_minutes'] += actual
+            entry['overtime_minutes'] += extra
+            entry['missing_actuals'] += not ok
+            if late:
+                entry['late_starts'] += 1
+                entry['late_minutes'] += late
+        return totals
+
+    @staticmethod
+    def signature(department_id: int, start_date: date, end_date: date) -> str:
+        """Отпечаток исходных данных периода (один агрегатный запрос)"""
+        stats = LaborHoursService.source(department_id, start_date, end_date).aggregate(
+            count=Count('pk'),
+            assigned=Max('assigned_at'),
+            shift_updated=Max('shift__updated_at'),
+            type_updated=Max('shift__shift_type__updated_at'),
+        )
+        key = '|'.join(str(stats[key]) for key in sorted(stats))
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_month(department: Department, year: int, month: int, force: bool = False) -> LaborHoursMonth:
+        """
+        Актуальная месячная сводка отдела
+
+        Пересчитывается, только если исходные данные изменились с прошлого
+        расчёта (или force).
+        """
+        first, last = month_bounds(year, month)
+        signature = LaborHoursService.signature(department.pk, first, last)
+        summary = LaborHoursMonth.objects.filter(department=department, month=first).first()
+        if summary is not None and summary.signature == signature and not force:
+            return summary
+
+        totals = LaborHoursService.compute(department.pk, first, last)
+        with transaction.atomic():
+            summary, _ = LaborHoursMonth.objects.update_or_create(
+                department=department, month=first, defaults={'signature': signature}
+            )
+            summary.rows.all().delete()
+            LaborHoursRollup.objects.bulk_create([
+                LaborHoursRollup(summary=summary, employee_id=employee_id, **values)
+                for employee_id, values in totals.items()
+            ])
+        return summary
+
+    @staticmethod
+    def report(department: Department, year: int, month: int) -> List[LaborHoursRollup]:
+        """Строки месячной сводки с сотрудниками, по фамилии"""
+        summary = LaborHoursService.get_month(department, year, month)
+        return list(
+            summary.rows.select_related('employee__user')
+            .order_by('employee__user__last_name', 'employee__user__first_name', 'employee_id')
+        )
+
+    @staticmethod
+    def write_csv(rows: List[LaborHoursRollup], stream) -> None:
+        """
+        Пишет сводку в CSV
+
+        Разделитель «;» и запятая в дробях — так файл открывается в Excel
+        с русской локалью без мастера импорта.
+        """
+        writer = csv.writer(stream, delimiter=';')
+        writer.writerow(CSV_HEADER)
+
+        def hours(minutes: int) -> str:
+            return f'{minutes / 60:.2f}'.replace('.', ',')
+
+        for row in rows:
+            writer.writerow([
+                row.employee.get_full_name(), row.shifts, hours(row.planned_minutes),
+                hours(row.actual_minutes), hours(row.overtime_minutes), row.late_starts,
+                row.late_minutes, row.missing_actuals,
+            ])
+
@@ -0,0 +1,195 @@
+"""
+Учёт остатков материалов.
+
+Каждое поступление, списание и корректировка записывается движением
+(MaterialMovement) в журнал материала отдела, а текущий остаток хранится
+в строке MaterialStock. Движение меняет остаток под блокировкой этой
+строки (SELECT ... FOR UPDATE): параллельные движения одного материала
+выполняются по очереди, и каждое видит остаток предыдущего — поэтому
+balance_after в журнале идёт без пропусков, а «сколько осталось кабеля»
+читается одной строкой без суммирования истории.
+
+Списания (MaterialWriteOff) попадают в журнал сигналами: создание —
+движение «списание», изменение — пара «исправлений» (возврат прежнего
+количества и списание нового), удаление — возврат.
+
+check() пересчитывает остатки по журналу одним агрегирующим запросом и
+находит (и при fix=True исправляет) расхождения.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import List, Optional
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+
+from ..models import Employee, MaterialMovement, MaterialStock, MaterialWriteOff
+
+
+@dataclass
+class BalanceMismatch:
+    """Остаток, не совпадающий с суммой движений"""
+    stock: MaterialStock
+    stored: Decimal
+    expected: Decimal
+
+
+def _normalize_name(material_name: str) -> str:
+    return ' '.join(material_name.split())
+
+
+class MaterialStockService:
+    """Сервис остатков материалов"""
+
+    @staticmethod
+    def _locked_stock(department_id: int, material_name: str, unit: str) -> MaterialStock:
+        """Строка остатка, заблокированная до конца транзакции (создаётся при первом движении)"""
+        key = {'department_id': department_id, 'material_name': _normalize_name(material_name), 'unit': unit}
+        stock = MaterialStock.objects.select_for_update().filter(**key).first()
+        if stock is not None:
+            return stock
+        try:
+            with transaction.atomic():
+                # Вставленная строка заблокирована нашей транзакцией
+                return MaterialStock.objects.create(**key)
+        except IntegrityError:
+            # Строку только что создало параллельное движение
+            return MaterialStock.objects.select_for_update().get(**key)
+
+    @staticmethod
+    def record(department_id: int, material_name: str, unit: str, quantity: Decimal, kind: str,
+               created_by: Optional[Employee] = None, writeoff: Optional[MaterialWriteOff] = None,
+               comment: str = '') -> MaterialMovement:
+        """
+        Записывает движение и меняет остаток
+
+        Args:
+            department_id: Отдел
+            material_name: Материал
+            unit: Единица измерения
+            quantity: Изменение остатка (поступление > 0, списание < 0)
+            kind: Вид движения (MaterialMovement.KIND_CHOICES)
+
+        Returns:
+            Движение с остатком после него
+        """
+        with transaction.atomic():
+            stock = MaterialStockService._locked_stock(department_id, material_name, unit)
+            stock.balance += quantity
+            stock.save(update_fields=['balance', 'updated_at'])
+            return MaterialMovement.objects.create(
+                stock=stock, kind=kind, quantity=quantity, balance_after=stock.balance,
+                writeoff=writeoff, comment=comment, created_by=created_by,
+            )
+
+    @staticmethod
+    def receive(department_id: int, material_name: str, unit: str, quantity: Decimal,
+                created_by: Optional[Employee] = None, comment: str = '') -> MaterialMovement:
+        """
+        Поступление материала
+
+        Raises:
+            ValidationError: Количество не положительное
+        """
+        if quantity <= 0:
+            raise ValidationError('Количество поступления должно быть больше нуля')
+        return MaterialStockService.record(department_id, material_name, unit, quantity, 'receipt',
+                                           created_by=created_by, comment=comment)
+
+    @staticmethod
+    def adjust(stock: MaterialStock, actual_balance: Decimal, created_by: Optional[Employee] = None,
+               comment: str = '') -> Optional[MaterialMovement]:
+        """
+        Инвентаризация: приводит остаток к фактическому
+
+        Returns:
+            Движение на разницу или None, если остаток уже совпадает
+        """
+        with transaction.atomic():
+            stock = MaterialStock.objects.select_for_update().get(pk=stock.pk)
+            difference = actual_balance - stock.balance
+            if not difference:
+                return None
+            return MaterialStockService.record(stock.department_id, stock.material_name, stock.unit, difference,
+                                               'adjustment', created_by=created_by, comment=comment)
+
+    @staticmethod
+    def check(fix: bool = False) -> List[BalanceMismatch]:
+        """
+        Сверяет остатки с суммами движений
+
+        Args:
+            fix: Записать в остатки суммы движений
+
+        Returns:
+            Найденные расхождения (до исправления)
+        """
+        totals = dict(
+            MaterialMovement.objects.order_by().values('stock_id').annotate(total=Sum('quantity'))
+            .values_list('stock_id', 'total')
+        )
+        mismatches = [
+            BalanceMismatch(stock, stock.balance, totals.get(stock.pk) or Decimal('0'))
+            for stock in MaterialStock.objects.select_related('department').iterator(chunk_size=2000)
+            if stock.balance != (totals.get(stock.pk) or Decimal('0'))
+        ]
+        if fix and mismatches:
+            with transaction.atomic():
+                # Под блокировкой пересчитываем заново: между запросами могли пройти движения
+                stocks = list(
+                    MaterialStock.objects.select_for_update()
+                    .filter(pk__in=[mismatch.stock.pk for mismatch in mismatches]).order_by('pk')
+                )
+                locked_totals = dict(
+                    MaterialMovement.objects.filter(stock__in=stocks).order_by().values('stock_id')
+                    .annotate(total=Sum('quantity')).values_list('stock_id', 'total')
+                )
+                for stock in stocks:
+                    stock.balance = locked_totals.get(stock.pk) or Decimal('0')
+                MaterialStock.objects.bulk_update(stocks, ['balance'], batch_size=1000)
+        return mismatches
+
+
+def stock_on_writeoff_save(sender, instance, created, raw=False, **kwargs):
+    """post_save: списание уменьшает остаток, изменение списания его исправляет"""
+    if raw:
+        return
+    quantity = Decimal(str(instance.quantity))
+    if created:
+        MaterialStockService.record(instance.department_id, instance.material_name, instance.unit, -quantity,
+                                    'writeoff', created_by=instance.created_by, writeoff=instance)
+        return
+
+    # Прежние значения запомнил pre_save (services.writeoff_summary.remember_writeoff_state)
+    previous = getattr(instance, '_previous_state', None)
+    if not previous:
+        return
+    changed = (
+        previous['department_id'] != instance.department_id
+        or _normalize_name(previous['material_name']) != _normalize_name(instance.material_name)
+        or previous['unit'] != instance.unit
+        or previous['quantity'] != quantity
+    )
+    if changed:
+        with transaction.atomic():
+            MaterialStockService.record(previous['department_id'], previous['material_name'], previous['unit'],
+                                        previous['quantity'], 'correction', writeoff=instance,
+                                        comment='Возврат прежнего количества')
+            MaterialStockService.record(instance.department_id, instance.material_name, instance.unit, -quantity,
+                                        'correction', writeoff=instance, comment='Списание после исправления')
+
+
+def stock_on_writeoff_delete(sender, instance, origin=None, **kwargs):
+    """
+    post_delete: удалённое списание возвращает количество в остаток
+
+    Только если удаляли само списание: при каскадном удалении (отдела,
+    сотрудника) материал всё равно был израсходован, а остаток отдела
+    удаляется вместе с ним.
+    """
+    if not (isinstance(origin, MaterialWriteOff) or getattr(origin, 'model', None) is MaterialWriteOff):
+        return
+    MaterialStockService.record(instance.department_id, instance.material_name, instance.unit,
+                                Decimal(str(instance.quantity)), 'correction',
+                                comment=f'Удалено списание №{instance.pk}')
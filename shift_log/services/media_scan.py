@@ -0,0 +1,322 @@
+"""
+Проверка целостности медиафайлов (команда scan_media).
+
+Два прохода:
+    - записи: строки Attachment, DailyReportPhoto и FeatureAttachment читаются
+      пачками по pk, файлы проверяются в пуле потоков, результат
+      сохраняется в file_present/file_size одним bulk_update на пачку;
+    - файлы: каталоги MEDIA_ROOT обходятся через os.scandir, файлы без записи
+      (включая варианты изображений удалённых blob'ов и брошенные временные
+      файлы загрузок) считаются лишними.
+
+Инкрементальность:
+    - без full проверяются только записи, которые ещё не проверялись или
+      числятся без файла; полный проход продолжается после прерывания,
+      пропуская записи, проверенные после его начала;
+    - в проходе по файлам пропускаются файлы каталогов, не менявшихся
+      после начала предыдущего завершённого прохода (mtime каталога
+      меняется при добавлении и удалении файлов).
+"""
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Blob, MediaScanCheckpoint, UploadSession
+from .blob_storage import READ_CHUNK_SIZE
+from .file_state import FileStateService, file_field_name, file_models
+
+# Каталоги MEDIA_ROOT, содержимое которых принадлежит записям в БД
+MANAGED_DIRS = [
+    'attachments',
+    'daily_reports/photos',
+    'testing/attachments',
+    'blobs',
+    'derivatives',
+    'uploads/partial',
+]
+
+# Сколько найденных, но не удалённых файлов помнить до следующего прохода
+MAX_PENDING_ORPHANS = 10000
+
+
+def _batched(iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _check_file(job: Tuple[Optional[str], Optional[str]]) -> Tuple[Optional[int], Optional[bool]]:
+    """
+    Проверяет один файл (выполняется в пуле потоков)
+
+    Returns:
+        (размер или None, совпала ли контрольная сумма — None, если не проверялась)
+    """
+    path, expected_sha256 = job
+    if path is None:
+        return None, None
+    try:
+        size = os.stat(path).st_size
+    except (FileNotFoundError, NotADirectoryError):
+        return None, None
+    if expected_sha256 is None:
+        return size, None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(block)
+    return size, digest.hexdigest() == expected_sha256
+
+
+class MediaScanner:
+    """Один запуск проверки медиафайлов"""
+
+    def __init__(
+        self,
+        full: bool = False,
+        workers: int = 8,
+        chunk_size: int = 500,
+        verify_checksums: bool = False,
+        delete_missing: bool = False,
+        delete_orphans: bool = False,
+        orphan_min_age: timedelta = timedelta(hours=1),
+        dry_run: bool = False,
+        report: Optional[Callable[[str], None]] = None,
+    ):
+        self.full = full
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.verify_checksums = verify_checksums
+        self.delete_missing = delete_missing and not dry_run
+        self.delete_orphans = delete_orphans and not dry_run
+        self.orphan_min_age = orphan_min_age
+        self.dry_run = dry_run
+        self.report = report or (lambda message: None)
+        # blob проверяется один раз, сколько бы записей на него ни ссылалось
+        self._verified_blobs: Dict[int, bool] = {}
+
+    # ---- Записи ----
+
+    def scan_rows(self) -> Dict[str, Dict[str, int]]:
+        """
+        Проверяет файлы записей всех моделей
+
+        Отметка ведётся только для полного прохода: инкрементальный
+        и так выбирает лишь непроверенные записи.
+
+        Returns:
+            {verbose_name_plural: {'checked', 'missing', 'corrupt', 'deleted'}}
+        """
+        started_at = timezone.now()
+        checkpoint = None
+        if self.full:
+            checkpoint = MediaScanCheckpoint.objects.filter(scope='rows').first()
+            if checkpoint is not None and checkpoint.finished_at is None:
+                # Продолжаем прерванный полный проход
+                started_at = checkpoint.started_at
+            elif not self.dry_run:
+                checkpoint, _ = MediaScanCheckpoint.objects.update_or_create(
+                    scope='rows', defaults={'started_at': started_at, 'finished_at': None}
+                )
+
+        results = {}
+        for model in file_models():
+            results[str(model._meta.verbose_name_plural)] = self._scan_model(model, started_at)
+
+        if checkpoint is not None and not self.dry_run:
+            checkpoint.finished_at = timezone.now()
+            checkpoint.stats = results
+            checkpoint.save(update_fields=['finished_at', 'stats'])
+        return results
+
+    def _scan_model(self, model, started_at) -> Dict[str, int]:
+        field_name = file_field_name(model)
+        queryset = model.objects.order_by('pk')
+        if self.full:
+            # Продолжение прерванного полного прохода: проверенное после его начала пропускаем
+            queryset = queryset.filter(
+                Q(file_checked_at__isnull=True) | Q(file_checked_at__lt=started_at)
+            )
+        else:
+            queryset = queryset.filter(Q(file_checked_at__isnull=True) | Q(file_present=False))
+        if self.verify_checksums:
+            queryset = queryset.select_related('blob')
+
+        stats = {'checked': 0, 'missing': 0, 'corrupt': 0, 'deleted': 0}
+        missing_pks = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for batch in self._iter_batches(queryset):
+                jobs = [self._row_job(obj, field_name) for obj in batch]
+                now = timezone.now()
+                for obj, (size, checksum_ok) in zip(batch, pool.map(_check_file, jobs)):
+                    stats['checked'] += 1
+                    if checksum_ok is not None:
+                        self._verified_blobs[obj.blob_id] = checksum_ok
+                    elif self.verify_checksums and obj.blob_id in self._verified_blobs:
+                        checksum_ok = self._verified_blobs[obj.blob_id]
+                    if checksum_ok is False:
+                        stats['corrupt'] += 1
+                        self.report(f'  Содержимое не совпадает с SHA-256: {getattr(obj, field_name).name} (ID: {obj.pk})')
+                    if size is None:
+                        stats['missing'] += 1
+                        missing_pks.append(obj.pk)
+                        self.report(f'  Файл не найден: {getattr(obj, field_name).name} (ID: {obj.pk})')
+                    else:
+                        obj.file_size = size
+                    obj.file_present = size is not None
+                    obj.file_checked_at = now
+                if not self.dry_run:
+                    FileStateService.save_states(model, batch)
+
+        if self.delete_missing:
+            for pks in _batched(missing_pks, self.chunk_size):
+                # QuerySet.delete отправляет post_delete — ссылки на blob'ы освобождаются
+                stats['deleted'] += model.objects.filter(pk__in=pks, file_present=False).delete()[1].get(
+                    model._meta.label, 0
+                )
+        return stats
+
+    def _iter_batches(self, queryset) -> Iterator[list]:
+        """
+        Читает записи пачками по первичному ключу
+
+        Пачки выбираются по pk > последнего, а не одним курсором: во время
+        обхода те же строки обновляются, а SQLite не изолирует курсор от
+        записи в том же соединении.
+        """
+        last_pk = None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(page[:self.chunk_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def _row_job(self, obj, field_name: str) -> Tuple[Optional[str], Optional[str]]:
+        field_file = getattr(obj, field_name)
+        if not field_file:
+            return None, None
+        expected = None
+        if self.verify_checksums and obj.blob_id and obj.blob_id not in self._verified_blobs:
+            expected = obj.blob.sha256
+        return os.path.join(settings.MEDIA_ROOT, field_file.name), expected
+
+    # ---- Файлы ----
+
+    def scan_files(self) -> Dict[str, int]:
+        """
+        Ищет файлы без записей в управляемых каталогах MEDIA_ROOT
+
+        Returns:
+            {'scanned', 'orphans', 'orphan_bytes', 'deleted'}
+        """
+        checkpoint = MediaScanCheckpoint.objects.filter(scope='files').first()
+        since = None
+        pending = []
+        if not self.full and checkpoint is not None and checkpoint.finished_at is not None:
+            # Каталоги, изменённые незадолго до прошлого прохода, могли содержать
+            # слишком свежие тогда файлы — их просматриваем снова
+            since = (checkpoint.started_at - self.orphan_min_age).timestamp()
+            # Лишние файлы, найденные прошлым проходом и не удалённые им
+            pending = checkpoint.stats.get('pending_orphans', [])
+        started_at = timezone.now()
+
+        known = self._known_names()
+        blob_hashes = set(Blob.objects.values_list('sha256', flat=True).iterator())
+        session_ids = {str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)}
+        cutoff = time.time() - self.orphan_min_age.total_seconds()
+
+        stats = {'scanned': 0, 'orphans': 0, 'orphan_bytes': 0, 'deleted': 0}
+        remaining = []
+
+        def candidates():
+            for top in MANAGED_DIRS:
+                for entry, name in self._walk(top, since):
+                    yield name, entry.path, entry.stat
+            for name in set(pending) - set(remaining):
+                path = os.path.join(settings.MEDIA_ROOT, name)
+                yield name, path, lambda path=path: os.stat(path)
+
+        for name, path, get_stat in candidates():
+            stats['scanned'] += 1
+            if not self._is_orphan(name, known, blob_hashes, session_ids):
+                continue
+            try:
+                stat = get_stat()
+            except FileNotFoundError:
+                continue
+            # Свежий файл может принадлежать ещё не закоммиченной загрузке
+            if stat.st_mtime > cutoff:
+                continue
+            stats['orphans'] += 1
+            stats['orphan_bytes'] += stat.st_size
+            self.report(f'  Файл без записи: {name} ({stat.st_size} B)')
+            if self.delete_orphans:
+                try:
+                    os.remove(path)
+                    stats['deleted'] += 1
+                except FileNotFoundError:
+                    pass
+            else:
+                remaining.append(name)
+
+        if not self.dry_run:
+            # Отметка ставится только по завершении: прерванный проход повторится целиком
+            MediaScanCheckpoint.objects.update_or_create(scope='files', defaults={
+                'started_at': started_at,
+                'finished_at': timezone.now(),
+                'stats': dict(stats, pending_orphans=remaining[:MAX_PENDING_ORPHANS]),
+            })
+        return stats
+
+    def _walk(self, top: str, since: Optional[float]) -> Iterator[Tuple[os.DirEntry, str]]:
+        """Обходит каталог через os.scandir; отдаёт (DirEntry, имя относительно MEDIA_ROOT)"""
+        stack = [top]
+        while stack:
+            relative = stack.pop()
+            try:
+                with os.scandir(os.path.join(settings.MEDIA_ROOT, relative)) as entries:
+                    # Состав каталога не менялся — файлы в нём уже проверены
+                    skip_files = since is not None and \
+                        os.stat(os.path.join(settings.MEDIA_ROOT, relative)).st_mtime < since
+                    for entry in entries:
+                        name = f'{relative}/{entry.name}'
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(name)
+                        elif not skip_files and entry.is_file(follow_symlinks=False):
+                            yield entry, name
+            except FileNotFoundError:
+                continue
+
+    @staticmethod
+    def _known_names() -> Set[str]:
+        """Имена всех файлов, на которые ссылаются записи"""
+        names = set(Blob.objects.values_list('file', flat=True).iterator())
+        for model in file_models():
+            names.update(model.objects.values_list(file_field_name(model), flat=True).iterator())
+        names.discard('')
+        return names
+
+    @staticmethod
+    def _is_orphan(name: str, known: Set[str], blob_hashes: Set[str], session_ids: Set[str]) -> bool:
+        if name.startswith('derivatives/'):
+            # derivatives/ab/<sha256>_<вариант>_<версия>.<формат>
+            return os.path.basename(name).split('_', 1)[0] not in blob_hashes
+        if name.startswith('uploads/partial/'):
+            return os.path.basename(name).rsplit('.', 1)[0] not in session_ids
+        if name.startswith('blobs/tmp/'):
+            # Временные файлы прерванного приёма
+            return True
+        return name not in known
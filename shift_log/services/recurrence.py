@@ -0,0 +1,186 @@
+"""
+Правила повторения смен.
+
+Настройки ShiftType (периодичность, рабочие дни недели, день месяца,
+интервал, даты действия) компилируются в неизменяемый объект Recurrence.
+Скомпилированные правила кэшируются по значениям настроек, поэтому
+изменение и сохранение типа смены автоматически даёт новое правило.
+
+Развёртывание за период не перебирает даты по одной:
+    - интервальные правила — арифметическая прогрессия порядковых номеров дат;
+    - недельные — для каждого дня из битовой маски своя прогрессия с шагом
+      7 × интервал недель;
+    - месячные — по одной дате на месяц, день месяца ограничивается
+      последним днём (31-е в феврале — это 28/29-е).
+
+Для интервальных правил отсчёт ведётся от даты начала действия типа смены,
+если она не задана — от фиксированной даты EPOCH (понедельник).
+"""
+import calendar
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import List, Optional
+
+EPOCH = date(2000, 1, 3)
+
+# Бит (n - 1) маски — день недели n по ISO (1 — понедельник)
+ALL_WEEKDAYS = 0b1111111
+
+WEEKDAY_NAMES = {1: 'Пн', 2: 'Вт', 3: 'Ср', 4: 'Чт', 5: 'Пт', 6: 'Сб', 7: 'Вс'}
+
+INTERVAL_DAYS = {
+    'daily': 1,
+    'every_2_days': 2,
+    'every_3_days': 3,
+}
+
+
+def parse_weekdays(value: str) -> List[int]:
+    """Разбирает строку рабочих дней ('1,2,3') в список дней недели 1..7"""
+    days = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if part.isdigit() and 1 <= int(part) <= 7 and int(part) not in days:
+            days.append(int(part))
+    return days
+
+
+def weekday_mask(days) -> int:
+    mask = 0
+    for day in days:
+        mask |= 1 << (day - 1)
+    return mask
+
+
+class Recurrence:
+    """
+    Скомпилированное правило повторения
+
+    kind: 'interval' (каждые interval дней), 'weekly' (дни из маски раз
+    в interval недель) или 'monthly' (day_of_month каждого месяца).
+    """
+
+    __slots__ = ('kind', 'interval', 'mask', 'day_of_month', 'anchor', 'start', 'end')
+
+    def __init__(self, kind: str, interval: int = 1, mask: int = ALL_WEEKDAYS,
+                 day_of_month: int = 1, anchor: date = EPOCH,
+                 start: Optional[date] = None, end: Optional[date] = None):
+        self.kind = kind
+        self.interval = max(1, interval)
+        self.mask = mask
+        self.day_of_month = day_of_month
+        self.anchor = anchor
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return (f'Recurrence({self.kind}, interval={self.interval}, mask={self.mask:07b}, '
+                f'day={self.day_of_month}, {self.start}..{self.end})')
+
+    def between(self, start: date, end: date) -> List[date]:
+        """Даты повторения в диапазоне [start, end] по возрастанию"""
+        if self.start is not None and start < self.start:
+            start = self.start
+        if self.end is not None and end > self.end:
+            end = self.end
+        if start > end:
+            return []
+        lo, hi = start.toordinal(), end.toordinal()
+
+        if self.kind == 'interval':
+            first = lo + (self.anchor.toordinal() - lo) % self.interval
+            return [date.fromordinal(o) for o in range(first, hi + 1, self.interval)]
+
+        if self.kind == 'weekly':
+            # Понедельник недели отсчёта; date.fromordinal(1) — понедельник
+            anchor_monday = self.anchor.toordinal() - (self.anchor.toordinal() - 1) % 7
+            step = 7 * self.interval
+            ordinals = []
+            for weekday in range(7):
+                if not self.mask >> weekday & 1:
+                    continue
+                first = lo + (weekday - (lo - 1) % 7) % 7
+                # Сдвигаем на ближайшую «рабочую» неделю цикла
+                week = (first - anchor_monday) // 7
+                first += (-week % self.interval) * 7
+                ordinals.extend(range(first, hi + 1, step))
+            ordinals.sort()
+            return [date.fromordinal(o) for o in ordinals]
+
+        if self.kind == 'monthly':
+            result = []
+            year, month = start.year, start.month
+            while (year, month) <= (end.year, end.month):
+                day = min(self.day_of_month, calendar.monthrange(year, month)[1])
+                occurrence = date(year, month, day)
+                if start <= occurrence <= end:
+                    result.append(occurrence)
+                month += 1
+                if month > 12:
+                    year, month = year + 1, 1
+            return result
+
+        return []
+
+    def occurs_on(self, day: date) -> bool:
+        """Есть ли смена в указанную дату"""
+        if (self.start is not None and day < self.start) or (self.end is not None and day > self.end):
+            return False
+        if self.kind == 'interval':
+            return (day - self.anchor).days % self.interval == 0
+        if self.kind == 'weekly':
+            if not self.mask >> (day.isoweekday() - 1) & 1:
+                return False
+            anchor_monday = self.anchor - timedelta(days=self.anchor.isoweekday() - 1)
+            return ((day - anchor_monday).days // 7) % self.interval == 0
+        if self.kind == 'monthly':
+            return day.day == min(self.day_of_month, calendar.monthrange(day.year, day.month)[1])
+        return False
+
+    def next_after(self, day: date) -> Optional[date]:
+        """Ближайшая дата повторения после day (None, если правило закончилось)"""
+        # Любое правило повторяется не реже раза в max(интервал, 2 месяца) —
+        # берём окно с запасом и расширяем, пока не найдём
+        window = max(self.interval * 7, 62)
+        start = day + timedelta(days=1)
+        while self.end is None or start <= self.end:
+            found = self.between(start, start + timedelta(days=window))
+            if found:
+                return found[0]
+            if self.kind == 'weekly' and not self.mask:
+                return None
+            start += timedelta(days=window + 1)
+        return None
+
+
+@lru_cache(maxsize=1024)
+def compile_recurrence(
+    periodicity: str,
+    working_days: str,
+    day_of_month: Optional[int],
+    custom_interval_days: Optional[int],
+    start_date: Optional[date],
+    end_date: Optional[date],
+) -> Recurrence:
+    """
+    Компилирует настройки типа смены в правило (результат кэшируется)
+
+    Аргументы — значения одноимённых полей ShiftType.
+    """
+    anchor = start_date or EPOCH
+    bounds = {'anchor': anchor, 'start': start_date, 'end': end_date}
+
+    if periodicity in INTERVAL_DAYS:
+        return Recurrence('interval', interval=INTERVAL_DAYS[periodicity], **bounds)
+    if periodicity == 'custom':
+        return Recurrence('interval', interval=custom_interval_days or 1, **bounds)
+    if periodicity in ('weekly', 'biweekly'):
+        return Recurrence(
+            'weekly',
+            interval=2 if periodicity == 'biweekly' else 1,
+            mask=weekday_mask(parse_weekdays(working_days)),
+            **bounds
+        )
+    if periodicity == 'monthly':
+        return Recurrence('monthly', day_of_month=day_of_month or anchor.day, **bounds)
+    return Recurrence('interval', interval=1, **bounds)
@@ -0,0 +1,144 @@
+"""
+Подбор замены на смену.
+
+Для смены (отменённой у сотрудника или недоукомплектованной) ищутся
+сотрудники того же отдела, которые:
+    - ещё не назначены на эту смену;
+    - не заняты на пересекающейся смене;
+    - успевают отдохнуть SHIFT_MIN_REST_HOURS до и после неё.
+
+Кандидаты упорядочиваются по числу часов на неделе смены (меньше
+нагруженные — первыми), затем по числу смен и имени.
+
+Индекс занятости строится в памяти из одного запроса ShiftAssignment за
+окно «неделя смены ± 2 дня» по всем сотрудникам отдела: для каждого
+сотрудника — интервалы, отсортированные по началу, соседи смены находятся
+двоичным поиском.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from django.db import transaction
+
+from ..models import Employee, Shift, ShiftAssignment
+from ..utils import send_bulk_notifications, send_notification
+from .shift_conflicts import (MARGIN, ShiftConflictService, default_min_rest,
+                              planned_interval)
+
+# Смена не длиннее суток: интервалы, начавшиеся раньше, до смены не дотягиваются
+MAX_SHIFT_LENGTH = timedelta(days=1)
+
+
+class AvailabilityIndex:
+    """Занятость сотрудников: интервалы смен по сотрудникам, отсортированные по началу"""
+
+    def __init__(self, intervals):
+        self._intervals = defaultdict(list)
+        for interval in sorted(intervals, key=lambda i: i.start):
+            self._intervals[interval.employee_id].append(interval)
+        self._starts = {
+            employee_id: [interval.start for interval in items]
+            for employee_id, items in self._intervals.items()
+        }
+
+    def blocking(self, employee_id: int, start, end, min_rest: timedelta):
+        """Интервал сотрудника, мешающий смене [start, end) с учётом отдыха, или None"""
+        items = self._intervals.get(employee_id)
+        if not items:
+            return None
+        starts = self._starts[employee_id]
+        # Кандидаты — интервалы, начавшиеся до конца смены плюс отдых
+        upper = bisect_left(starts, end + min_rest)
+        lower = bisect_left(starts, start - min_rest - MAX_SHIFT_LENGTH)
+        for interval in items[lower:upper]:
+            if interval.end + min_rest > start:
+                return interval
+        return None
+
+    def hours_between(self, employee_id: int, first_day, last_day) -> float:
+        return sum(
+            (interval.end - interval.start).total_seconds() / 3600
+            for interval in self._intervals.get(employee_id, ())
+            if first_day <= interval.date <= last_day
+        )
+
+    def shifts_between(self, employee_id: int, first_day, last_day) -> int:
+        return sum(
+            1 for interval in self._intervals.get(employee_id, ())
+            if first_day <= interval.date <= last_day
+        )
+
+
+class ReplacementService:
+    """Сервис подбора замены на смену"""
+
+    @staticmethod
+    def find_candidates(shift: Shift, limit: Optional[int] = None,
+                        min_rest: Optional[timedelta] = None) -> List[dict]:
+        """
+        Кандидаты на замену, лучшие первыми
+
+        Returns:
+            [{'employee', 'week_hours', 'week_shifts'}]
+        """
+        min_rest = default_min_rest() if min_rest is None else min_rest
+        department_id = shift.shift_type.department_id
+        week_start = shift.date - timedelta(days=shift.date.weekday())
+        week_end = week_start + timedelta(days=6)
+
+        assigned = ShiftAssignment.objects.filter(shift=shift).values('employee_id')
+        employees = list(
+            Employee.objects.filter(department_id=department_id, is_active=True)
+            .exclude(pk__in=assigned).select_related('user')
+        )
+        index = AvailabilityIndex(ShiftConflictService.load_intervals(
+            ShiftAssignment.objects.filter(
+                employee__department_id=department_id,
+                shift__date__range=(min(week_start, shift.date - MARGIN), max(week_end, shift.date + MARGIN)),
+            ).exclude(shift=shift)
+        ))
+
+        start, end = planned_interval(shift.date, shift.shift_type.start_time, shift.shift_type.end_time)
+        candidates = []
+        for employee in employees:
+            if index.blocking(employee.pk, start, end, min_rest) is not None:
+                continue
+            candidates.append({
+                'employee': employee,
+                'week_hours': index.hours_between(employee.pk, week_start, week_end),
+                'week_shifts': index.shifts_between(employee.pk, week_start, week_end),
+            })
+        candidates.sort(key=lambda c: (c['week_hours'], c['week_shifts'], c['employee'].get_full_name()))
+        return candidates[:limit] if limit else candidates
+
+    @staticmethod
+    def assign(shift: Shift, employee: Employee, assigned_by: Optional[Employee] = None) -> ShiftAssignment:
+        """
+        Назначает сотрудника на смену и уведомляет его
+
+        Raises:
+            ValidationError: Если назначение даёт пересечение или нехватку отдыха
+        """
+        with transaction.atomic():
+            assignment = ShiftAssignment(shift=shift, employee=employee)
+            assignment.full_clean()
+            assignment.save()
+        send_notification(
+            employee, 'shift_assigned', f'Назначена смена {shift.date:%d.%m.%Y}',
+            f'Вы назначены на смену «{shift.shift_type.name}» {shift.date:%d.%m.%Y} '
+            f'{shift.shift_type.start_time:%H:%M}–{shift.shift_type.end_time:%H:%M}'
+            + (f' (назначил: {assigned_by.get_full_name()})' if assigned_by else '')
+        )
+        return assignment
+
+    @staticmethod
+    def notify_candidates(shift: Shift, employees: Iterable[Employee]) -> int:
+        """Рассылает кандидатам запрос на замену одной пачкой уведомлений"""
+        return send_bulk_notifications(
+            employees, 'shift_replacement', f'Нужна замена {shift.date:%d.%m.%Y}',
+            f'Требуется замена на смену «{shift.shift_type.name}» {shift.date:%d.%m.%Y} '
+            f'{shift.shift_type.start_time:%H:%M}–{shift.shift_type.end_time:%H:%M}. '
+            'Если можете выйти, сообщите руководителю.'
+        )
@@ -0,0 +1,150 @@
+"""
+Материализованный календарь типов смен (таблица ShiftOccurrence).
+
+Даты развёртываются из правил повторения на окно вокруг текущей даты
+(SHIFT_CALENDAR_PAST_DAYS назад и SHIFT_CALENDAR_HORIZON_DAYS вперёд).
+Развёрнутый период хранится в ShiftType.calendar_from/calendar_until:
+даты внутри него берутся из таблицы по индексу, вне его — вычисляются
+по правилу в памяти. По календарю планирует даты пакетная генерация
+смен (ShiftGenerationService).
+
+Календарь типа смены перестраивается при каждом его сохранении
+(сигнал post_save), окно продлевается командой build_shift_calendar.
+"""
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import ShiftOccurrence, ShiftType
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 1000
+
+
+def default_window() -> Tuple[date, date]:
+    """Окно календаря по умолчанию относительно сегодняшней даты"""
+    today = timezone.localdate()
+    past = getattr(settings, 'SHIFT_CALENDAR_PAST_DAYS', 31)
+    horizon = getattr(settings, 'SHIFT_CALENDAR_HORIZON_DAYS', 400)
+    return today - timedelta(days=past), today + timedelta(days=horizon)
+
+
+class ShiftCalendar:
+    """Сервис календаря типов смен"""
+
+    @staticmethod
+    def rebuild(shift_type: ShiftType, start: Optional[date] = None, end: Optional[date] = None) -> int:
+        """
+        Заново разворачивает даты типа смены за окно
+
+        Returns:
+            Количество записанных дат
+        """
+        if start is None or end is None:
+            start, end = default_window()
+        with transaction.atomic():
+            ShiftOccurrence.objects.filter(shift_type=shift_type).delete()
+            dates = shift_type.recurrence.between(start, end) if shift_type.is_active else []
+            ShiftCalendar._insert(shift_type, dates)
+            # update(), а не save(): сохранение типа смены снова вызвало бы перестроение
+            ShiftType.objects.filter(pk=shift_type.pk).update(calendar_from=start, calendar_until=end)
+        shift_type.calendar_from, shift_type.calendar_until = start, end
+        return len(dates)
+
+    @staticmethod
+    def extend(shift_types: Iterable[ShiftType], start: date, end: date) -> int:
+        """
+        Дополняет календарь до окна [start, end], не трогая уже развёрнутое
+
+        Returns:
+            Количество добавленных дат
+        """
+        added = 0
+        for shift_type in shift_types:
+            covered_from, covered_until = shift_type.calendar_from, shift_type.calendar_until
+            if covered_from is None or covered_until is None or \
+                    covered_until < start - timedelta(days=1) or covered_from > end + timedelta(days=1):
+                # Не развёрнут или между окнами был бы пропуск — разворачиваем целиком
+                added += ShiftCalendar.rebuild(shift_type, min(start, covered_from or start),
+                                               max(end, covered_until or end))
+                continue
+
+            new_from, new_until = min(start, covered_from), max(end, covered_until)
+            if (new_from, new_until) == (covered_from, covered_until):
+                continue
+            dates = []
+            if shift_type.is_active:
+                if new_from < covered_from:
+                    dates += shift_type.recurrence.between(new_from, covered_from - timedelta(days=1))
+                if new_until > covered_until:
+                    dates += shift_type.recurrence.between(covered_until + timedelta(days=1), new_until)
+            with transaction.atomic():
+                ShiftCalendar._insert(shift_type, dates)
+                ShiftType.objects.filter(pk=shift_type.pk).update(
+                    calendar_from=new_from, calendar_until=new_until
+                )
+            shift_type.calendar_from, shift_type.calendar_until = new_from, new_until
+            added += len(dates)
+        return added
+
+    @staticmethod
+    def dates_between(shift_types: Iterable[ShiftType], start: date, end: date) -> Dict[int, List[date]]:
+        """
+        Даты типов смен за период (включительно)
+
+        Часть периода внутри развёрнутого окна активного типа читается из
+        таблицы одним запросом на все типы; остальное вычисляется по
+        правилу в памяти.
+
+        Returns:
+            {id типа смены: отсортированный список дат}
+        """
+        result, windows = {}, {}
+        for shift_type in shift_types:
+            if not shift_type.is_active or shift_type.calendar_from is None or \
+                    shift_type.calendar_until is None or \
+                    shift_type.calendar_from > end or shift_type.calendar_until < start:
+                # Календарь не покрывает период — только по правилу
+                result[shift_type.id] = shift_type.recurrence.between(start, end)
+                continue
+            covered_from, covered_until = max(start, shift_type.calendar_from), min(end, shift_type.calendar_until)
+            windows[shift_type.id] = (covered_from, covered_until)
+            result[shift_type.id] = []
+            if start < covered_from:
+                result[shift_type.id] += shift_type.recurrence.between(start, covered_from - timedelta(days=1))
+            if covered_until < end:
+                result[shift_type.id] += shift_type.recurrence.between(covered_until + timedelta(days=1), end)
+
+        if windows:
+            occurrences = ShiftOccurrence.objects.filter(
+                shift_type_id__in=windows,
+                date__range=(min(lo for lo, _ in windows.values()), max(hi for _, hi in windows.values()))
+            ).values_list('shift_type_id', 'date')
+            for shift_type_id, day in occurrences:
+                covered_from, covered_until = windows[shift_type_id]
+                if covered_from <= day <= covered_until:
+                    result[shift_type_id].append(day)
+            for shift_type_id in windows:
+                result[shift_type_id].sort()
+        return result
+
+    @staticmethod
+    def _insert(shift_type: ShiftType, dates: List[date]) -> None:
+        ShiftOccurrence.objects.bulk_create(
+            [ShiftOccurrence(shift_type=shift_type, department_id=shift_type.department_id, date=d)
+             for d in dates],
+            batch_size=BULK_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+
+def rebuild_calendar_on_save(sender, instance, raw=False, **kwargs):
+    """Обработчик post_save ShiftType: правило могло измениться"""
+    if raw:
+        return
+    ShiftCalendar.rebuild(instance)
@@ -0,0 +1,187 @@
+"""
+Поиск конфликтов в назначениях на смены.
+
+Конфликты двух видов:
+    - overlap: плановые интервалы двух смен сотрудника пересекаются;
+    - rest: между концом одной смены и началом следующей меньше
+      SHIFT_MIN_REST_HOURS часов (например, ночная смена, а за ней
+      утренняя смена другого типа).
+
+Плановые интервалы всех назначений за период читаются одним запросом
+(values_list без создания моделей), затем для каждого сотрудника
+интервалы сортируются по началу и проходятся один раз: текущий интервал
+сравнивается с тем из предыдущих, что заканчивается позже всех. Проверка
+отдела за месяц — O(n log n) в памяти вместо запроса на каждую пару.
+
+Отменённые смены не учитываются.
+"""
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from ..models import Department, Employee, Shift, ShiftAssignment
+
+# Смена может закончиться на следующий день — соседние дни тоже читаем
+MARGIN = timedelta(days=2)
+
+ShiftInterval = namedtuple('ShiftInterval', 'employee_id shift_id date shift_type start end')
+
+
+class ShiftConflict(namedtuple('ShiftConflict', 'kind employee_id first second rest')):
+    """
+    Конфликт двух смен сотрудника
+
+    kind: 'overlap' или 'rest'; first, second — ShiftInterval в порядке
+    начала; rest — перерыв между ними (timedelta, отрицательный при
+    пересечении).
+    """
+
+    def describe(self) -> str:
+        first, second = self.first, self.second
+        if self.kind == 'overlap':
+            return (f'Смены пересекаются: {first.shift_type} {first.start:%d.%m %H:%M}–{first.end:%H:%M} '
+                    f'и {second.shift_type} {second.start:%d.%m %H:%M}–{second.end:%H:%M}')
+        hours = self.rest.total_seconds() / 3600
+        return (f'Недостаточный отдых ({hours:g} ч): {first.shift_type} до {first.end:%d.%m %H:%M}, '
+                f'{second.shift_type} с {second.start:%d.%m %H:%M}')
+
+    def to_dict(self) -> dict:
+        return {
+            'kind': self.kind,
+            'employee_id': self.employee_id,
+            'shift_ids': [self.first.shift_id, self.second.shift_id],
+            'first': {'shift_id': self.first.shift_id, 'shift_type': self.first.shift_type,
+                      'start': self.first.start.isoformat(), 'end': self.first.end.isoformat()},
+            'second': {'shift_id': self.second.shift_id, 'shift_type': self.second.shift_type,
+                       'start': self.second.start.isoformat(), 'end': self.second.end.isoformat()},
+            'rest_hours': round(self.rest.total_seconds() / 3600, 2),
+            'message': self.describe(),
+        }
+
+
+def planned_interval(shift_date: date, start_time: time, end_time: time) -> Tuple[datetime, datetime]:
+    """
+    Плановые начало и конец смены
+
+    Конец не позже начала означает переход через полночь (ночная или
+    суточная смена), как в ShiftType.get_shift_duration.
+    """
+    start = datetime.combine(shift_date, start_time)
+    end = datetime.combine(shift_date, end_time)
+    if end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+
+def default_min_rest() -> timedelta:
+    return timedelta(hours=getattr(settings, 'SHIFT_MIN_REST_HOURS', 12))
+
+
+class ShiftConflictService:
+    """Сервис поиска конфликтов назначений"""
+
+    @staticmethod
+    def load_intervals(assignments) -> List[ShiftInterval]:
+        """Плановые интервалы назначений одним запросом"""
+        rows = assignments.filter(shift__is_cancelled=False).values_list(
+            'employee_id', 'shift_id', 'shift__date', 'shift__shift_type__name',
+            'shift__shift_type__start_time', 'shift__shift_type__end_time',
+        )
+        return [
+            ShiftInterval(employee_id, shift_id, shift_date, type_name,
+                          *planned_interval(shift_date, start_time, end_time))
+            for employee_id, shift_id, shift_date, type_name, start_time, end_time in rows
+        ]
+
+    @staticmethod
+    def find_conflicts(intervals: Iterable[ShiftInterval],
+                       min_rest: Optional[timedelta] = None) -> List[ShiftConflict]:
+        """
+        Находит конфликты сортировкой и одним проходом
+
+        Returns:
+            Конфликты по сотрудникам и времени
+        """
+        min_rest = default_min_rest() if min_rest is None else min_rest
+        conflicts = []
+        latest = None
+        for interval in sorted(intervals, key=lambda i: (i.employee_id, i.start, i.end)):
+            if latest is None or latest.employee_id != interval.employee_id:
+                latest = interval
+                continue
+            rest = interval.start - latest.end
+            if rest < timedelta(0):
+                conflicts.append(ShiftConflict('overlap', interval.employee_id, latest, interval, rest))
+            elif rest < min_rest:
+                conflicts.append(ShiftConflict('rest', interval.employee_id, latest, interval, rest))
+            if interval.end > latest.end:
+                latest = interval
+        return conflicts
+
+    @staticmethod
+    def check(assignments, start_date: date, end_date: date,
+              min_rest: Optional[timedelta] = None) -> List[ShiftConflict]:
+        """
+        Конфликты назначений, затрагивающие период
+
+        Соседние дни читаются тоже, чтобы найти конфликты на границах
+        периода; в результат попадают пары, где хотя бы одна смена в периоде.
+        """
+        intervals = ShiftConflictService.load_intervals(
+            assignments.filter(shift__date__range=(start_date - MARGIN, end_date + MARGIN))
+        )
+        return [
+            conflict for conflict in ShiftConflictService.find_conflicts(intervals, min_rest)
+            if start_date <= conflict.first.date <= end_date or start_date <= conflict.second.date <= end_date
+        ]
+
+    @staticmethod
+    def for_employee(employee: Employee, start_date: date, end_date: date,
+                     min_rest: Optional[timedelta] = None) -> List[ShiftConflict]:
+        return ShiftConflictService.check(
+            ShiftAssignment.objects.filter(employee=employee), start_date, end_date, min_rest
+        )
+
+    @staticmethod
+    def for_department(department: Department, start_date: date, end_date: date,
+                       min_rest: Optional[timedelta] = None) -> List[ShiftConflict]:
+        """
+        Конфликты сотрудников отдела
+
+        Учитываются все смены сотрудников отдела, в том числе смены других
+        отделов, на которые они назначены.
+        """
+        return ShiftConflictService.check(
+            ShiftAssignment.objects.filter(employee__department=department), start_date, end_date, min_rest
+        )
+
+    @staticmethod
+    def for_assignment(shift: Shift, employee: Employee, min_rest: Optional[timedelta] = None,
+                       exclude_shift_ids: Iterable[int] = ()) -> List[ShiftConflict]:
+        """Конфликты, которые возникнут при назначении сотрудника на смену"""
+        return ShiftConflictService.for_assignments(shift, [employee], min_rest, exclude_shift_ids)
+
+    @staticmethod
+    def for_assignments(shift: Shift, employees: Iterable[Employee], min_rest: Optional[timedelta] = None,
+                        exclude_shift_ids: Iterable[int] = ()) -> List[ShiftConflict]:
+        """Конфликты, которые возникнут при назначении сотрудников на смену (одним запросом)"""
+        employee_ids = {employee.pk for employee in employees}
+        if shift.is_cancelled or not employee_ids:
+            return []
+        neighbours = ShiftConflictService.load_intervals(
+            ShiftAssignment.objects.filter(
+                employee_id__in=employee_ids, shift__date__range=(shift.date - MARGIN, shift.date + MARGIN)
+            ).exclude(Q(shift_id=shift.pk) | Q(shift_id__in=list(exclude_shift_ids)))
+        )
+        start, end = planned_interval(shift.date, shift.shift_type.start_time, shift.shift_type.end_time)
+        candidates = {
+            ShiftInterval(employee_id, shift.pk, shift.date, shift.shift_type.name, start, end)
+            for employee_id in employee_ids
+        }
+        return [
+            conflict for conflict in ShiftConflictService.find_conflicts(neighbours + list(candidates), min_rest)
+            if conflict.first in candidates or conflict.second in candidates
+        ]
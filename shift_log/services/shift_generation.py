@@ -0,0 +1,278 @@
+"""
+Пакетная генерация смен по типам смен.
+
+Для каждого отдела:
+    1. даты всех активных типов смен на период берутся из календаря
+       ShiftOccurrence одним запросом, вне развёрнутого окна вычисляются
+       по правилу в памяти;
+    2. уже существующие пары (дата, тип смены) читаются одним запросом;
+    3. недостающие смены и назначения сотрудников создаются через
+       bulk_create; назначения, пересекающиеся с другими сменами
+       сотрудника, перед этим отбрасываются проверкой в памяти.
+
+Отделы обрабатываются параллельно, каждый в своей транзакции: ошибка
+в одном отделе не откатывает остальные. Количество запросов на отдел
+не зависит от длины периода, поэтому год расписания строится за секунды.
+"""
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection, transaction
+
+from ..models import Department, Employee, Shift, ShiftAssignment, ShiftType
+from .shift_calendar import ShiftCalendar
+from .shift_conflicts import (MARGIN, ShiftConflict, ShiftConflictService,
+                              ShiftInterval, planned_interval)
+from .shift_schedule import ShiftScheduleService, months_between
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+BULK_BATCH_SIZE = 1000
+
+
+class ShiftGenerationService:
+    """Сервис пакетной генерации смен"""
+
+    @staticmethod
+    def create_shifts(
+        shift_types: Iterable[ShiftType],
+        start_date: date,
+        end_date: date,
+        employees: Optional[List[Employee]] = None,
+        dry_run: bool = False
+    ) -> Dict[int, dict]:
+        """
+        Создаёт недостающие смены указанных типов за период
+
+        Должна вызываться внутри транзакции.
+
+        Returns:
+            {id типа смены: {'shift_type', 'planned', 'existing', 'dates', 'created', 'skipped'}},
+            где dates — даты недостающих смен, created — созданные смены
+            (пусто при dry_run), skipped — конфликты пропущенных назначений
+        """
+        shift_types = list(shift_types)
+        planned = ShiftCalendar.dates_between(shift_types, start_date, end_date)
+        report = {}
+        for shift_type in shift_types:
+            report[shift_type.id] = {
+                'shift_type': shift_type,
+                'planned': planned[shift_type.id],
+                'existing': 0,
+                'dates': [],
+                'created': [],
+                'skipped': [],
+            }
+        if not shift_types:
+            return report
+
+        existing = set(
+            Shift.objects.filter(
+                shift_type__in=shift_types, date__range=(start_date, end_date)
+            ).values_list('shift_type_id', 'date')
+        )
+        new_shifts = []
+        for shift_type_id, entry in report.items():
+            for shift_date in entry['planned']:
+                if (shift_type_id, shift_date) in existing:
+                    entry['existing'] += 1
+                else:
+                    entry['dates'].append(shift_date)
+                    new_shifts.append(Shift(date=shift_date, shift_type_id=shift_type_id))
+
+        if dry_run or not new_shifts:
+            return report
+
+        created = Shift.objects.bulk_create(new_shifts, batch_size=BULK_BATCH_SIZE)
+        if created and created[0].pk is None:
+            # СУБД не вернула первичные ключи — дочитываем их одним запросом
+            ids = {
+                (shift_type_id, shift_date): pk
+                for pk, shift_type_id, shift_date in Shift.objects.filter(
+                    shift_type__in=shift_types, date__range=(start_date, end_date)
+                ).values_list('pk', 'shift_type_id', 'date')
+            }
+            for shift in created:
+                shift.pk = ids[(shift.shift_type_id, shift.date)]
+
+        if employees:
+            assignments, skipped = ShiftGenerationService.assignments_without_overlaps(
+                created, {shift_type.id: shift_type for shift_type in shift_types},
+                employees, start_date, end_date
+            )
+            ShiftAssignment.objects.bulk_create(assignments, batch_size=BULK_BATCH_SIZE)
+            shift_type_ids = {shift.pk: shift.shift_type_id for shift in created}
+            for conflict in skipped:
+                report[shift_type_ids[conflict.second.shift_id]]['skipped'].append(conflict)
+
+        for shift in created:
+            report[shift.shift_type_id]['created'].append(shift)
+        # bulk_create не отправляет сигналы — графики отделов сбрасываем сами
+        for department_id in {shift_type.department_id for shift_type in shift_types}:
+            ShiftScheduleService.invalidate(department_id, months_between(start_date, end_date))
+        logger.info(f"Создано смен: {len(created)} ({start_date} - {end_date})")
+        return report
+
+    @staticmethod
+    def assignments_without_overlaps(
+        shifts: List[Shift],
+        shift_types: Dict[int, ShiftType],
+        employees: List[Employee],
+        start_date: date,
+        end_date: date
+    ) -> Tuple[List[ShiftAssignment], List[ShiftConflict]]:
+        """
+        Назначения сотрудников на новые смены без пересечений
+
+        Смены сотрудников за период (с соседними днями) читаются одним
+        запросом, дальше всё в памяти: назначение отбрасывается, если оно
+        пересекается с имеющейся сменой сотрудника или с уже принятым
+        назначением на более раннюю новую смену. Нехватка отдыха не
+        мешает назначению, как и при ручном назначении.
+
+        Returns:
+            (назначения для bulk_create, конфликты отброшенных назначений;
+            second — отброшенная смена)
+        """
+        existing = defaultdict(list)
+        for interval in ShiftConflictService.load_intervals(
+            ShiftAssignment.objects.filter(
+                employee__in=employees, shift__date__range=(start_date - MARGIN, end_date + MARGIN)
+            )
+        ):
+            existing[interval.employee_id].append(interval)
+
+        assignments, skipped = [], []
+        for employee in employees:
+            # Имеющиеся смены по началу и самая поздно заканчивающаяся среди первых i
+            busy = sorted(existing[employee.pk], key=lambda i: i.start)
+            starts = [interval.start for interval in busy]
+            latest_busy = []
+            for interval in busy:
+                latest_busy.append(
+                    interval if not latest_busy or interval.end > latest_busy[-1].end else latest_busy[-1]
+                )
+
+            candidates = []
+            for shift in shifts:
+                shift_type = shift_types[shift.shift_type_id]
+                start, end = planned_interval(shift.date, shift_type.start_time, shift_type.end_time)
+                candidates.append(ShiftInterval(employee.pk, shift.pk, shift.date, shift_type.name, start, end))
+
+            accepted = None
+            for candidate in sorted(candidates, key=lambda i: (i.start, i.end)):
+                index = bisect_left(starts, candidate.end)
+                blocking = latest_busy[index - 1] if index and latest_busy[index - 1].end > candidate.start else None
+                if blocking is None and accepted is not None and accepted.end > candidate.start:
+                    blocking = accepted
+                if blocking is not None:
+                    skipped.append(ShiftConflict(
+                        'overlap', employee.pk, blocking, candidate, candidate.start - blocking.end
+                    ))
+                    continue
+                accepted = candidate
+                assignments.append(ShiftAssignment(shift_id=candidate.shift_id, employee=employee))
+        return assignments, skipped
+
+    @staticmethod
+    def generate_for_department(
+        department: Department,
+        start_date: date,
+        end_date: date,
+        employees: Optional[List[Employee]] = None,
+        dry_run: bool = False
+    ) -> dict:
+        """
+        Генерирует смены отдела в одной транзакции
+
+        Строка отдела блокируется на время генерации, чтобы параллельный
+        запуск для того же отдела не создал те же смены.
+
+        Returns:
+            Словарь с результатами (формат generate_shift_schedule)
+            и разницей по типам смен в 'diff'
+        """
+        results = {
+            'department': department.name,
+            'period': f"{start_date} - {end_date}",
+            'total_shifts_created': 0,
+            'shifts_by_type': {},
+            'diff': [],
+            'skipped_assignments': [],
+            'errors': [],
+        }
+        try:
+            with transaction.atomic():
+                Department.objects.select_for_update().filter(pk=department.pk).first()
+                shift_types = ShiftType.objects.filter(department=department, is_active=True)
+                report = ShiftGenerationService.create_shifts(
+                    shift_types, start_date, end_date, employees, dry_run=dry_run
+                )
+        except Exception as e:
+            error_msg = f"Ошибка при создании смен отдела '{department.name}': {e}"
+            results['errors'].append(error_msg)
+            logger.error(error_msg)
+            return results
+
+        for entry in report.values():
+            name = entry['shift_type'].name
+            created = len(entry['dates']) if dry_run else len(entry['created'])
+            results['shifts_by_type'][name] = created
+            results['total_shifts_created'] += created
+            results['diff'].append({
+                'shift_type': name,
+                'planned': len(entry['planned']),
+                'existing': entry['existing'],
+                'missing': entry['dates'],
+            })
+            results['skipped_assignments'].extend(conflict.describe() for conflict in entry['skipped'])
+        if results['skipped_assignments']:
+            logger.warning(
+                f"Отдел '{department.name}': пропущено назначений из-за пересечения смен: "
+                f"{len(results['skipped_assignments'])}"
+            )
+        return results
+
+    @staticmethod
+    def generate(
+        departments: Iterable[Department],
+        start_date: date,
+        end_date: date,
+        employees: Optional[List[Employee]] = None,
+        dry_run: bool = False,
+        workers: int = DEFAULT_WORKERS
+    ) -> List[dict]:
+        """
+        Генерирует смены для нескольких отделов параллельно
+
+        SQLite не допускает параллельной записи, для него отделы
+        обрабатываются по очереди.
+
+        Returns:
+            Результаты generate_for_department в порядке отделов
+        """
+        departments = list(departments)
+        if workers <= 1 or len(departments) <= 1 or connection.vendor == 'sqlite':
+            return [
+                ShiftGenerationService.generate_for_department(
+                    department, start_date, end_date, employees, dry_run
+                )
+                for department in departments
+            ]
+
+        def run(department):
+            try:
+                return ShiftGenerationService.generate_for_department(
+                    department, start_date, end_date, employees, dry_run
+                )
+            finally:
+                # У каждого потока своё соединение — закрываем его сами
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shift-generation') as pool:
+            return list(pool.map(run, departments))
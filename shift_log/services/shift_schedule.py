@@ -0,0 +1,264 @@
+"""
+График смен отдела на месяц (сотрудники × дни).
+
+Сетка строится двумя запросами — активные сотрудники отдела и
+ShiftAssignment с соединением Shift, ShiftType и Employee.user (только
+нужные колонки через values_list) — и разворачивается в памяти в
+компактную структуру:
+
+    {
+        'year', 'month', 'days',
+        'shift_types': [{'id', 'name', 'color', 'start_time', 'end_time', 'hours'}],
+        'rows': [{'employee_id', 'name', 'cells', 'shifts', 'hours'}],
+    }
+
+где cells — список длиной в число дней месяца, элемент — кортеж пар
+(индекс в shift_types, id смены); пустой, если смен нет. В строках есть
+все активные сотрудники отдела, в том числе без смен (видно, кто свободен),
+и сотрудники других отделов, назначенные на смены отдела.
+
+Готовая сетка кэшируется по (отдел, месяц) и удаляется из кэша при
+изменении назначений, смен и типов смен отдела. Изменение сотрудника
+(имя, активность, отдел) затрагивает все месяцы, поэтому в ключ входит
+метка отдела, которая при этом заменяется. Сигналы подключены в
+ShiftLogConfig.ready, пакетная генерация сбрасывает кэш явно.
+"""
+import calendar
+import uuid
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+from ..models import Employee, Shift, ShiftAssignment
+
+# Версия в префиксе меняется вместе с форматом сетки
+CACHE_PREFIX = 'shift_schedule:v2'
+
+
+def month_bounds(year: int, month: int) -> Tuple[date, date]:
+    """Первый и последний день месяца"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def months_between(start: date, end: date) -> List[Tuple[int, int]]:
+    """Месяцы (год, месяц), которые затрагивает период"""
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return months
+
+
+def _hours(start_time, end_time) -> float:
+    minutes = (end_time.hour * 60 + end_time.minute) - (start_time.hour * 60 + start_time.minute)
+    if minutes <= 0:
+        # Смена через полночь
+        minutes += 24 * 60
+    return minutes / 60
+
+
+class ShiftScheduleService:
+    """Сервис графика смен отдела"""
+
+    @staticmethod
+    def department_token(department_id: int) -> str:
+        """Метка отдела в ключах кэша; новая метка делает недоступными все месяцы"""
+        key = f'{CACHE_PREFIX}:{department_id}:token'
+        token = cache.get(key)
+        if token is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            token = cache.get(key)
+        return token
+
+    @staticmethod
+    def cache_key(department_id: int, year: int, month: int) -> str:
+        token = ShiftScheduleService.department_token(department_id)
+        return f'{CACHE_PREFIX}:{department_id}:{token}:{year}-{month:02d}'
+
+    @staticmethod
+    def get_month(department_id: int, year: int, month: int) -> dict:
+        """Сетка отдела за месяц (из кэша или построенная заново)"""
+        key = ShiftScheduleService.cache_key(department_id, year, month)
+        grid = cache.get(key)
+        if grid is None:
+            grid = ShiftScheduleService.build_month(department_id, year, month)
+            cache.set(key, grid, getattr(settings, 'SHIFT_SCHEDULE_CACHE_TIMEOUT', 3600))
+        return grid
+
+    @staticmethod
+    def build_month(department_id: int, year: int, month: int) -> dict:
+        """Строит сетку отдела за месяц двумя запросами"""
+        first, last = month_bounds(year, month)
+        days = last.day
+        staff = Employee.objects.filter(department_id=department_id, is_active=True).values_list(
+            'id', 'user__first_name', 'user__last_name', 'user__username'
+        )
+        rows = ShiftAssignment.objects.filter(
+            shift__shift_type__department_id=department_id,
+            shift__date__range=(first, last),
+            shift__is_cancelled=False,
+        ).order_by(
+            'employee__user__last_name', 'employee__user__first_name', 'employee_id',
+            'shift__date', 'shift__shift_type__start_time'
+        ).values_list(
+            'employee_id', 'employee__user__first_name', 'employee__user__last_name',
+            'employee__user__username', 'shift_id', 'shift__date', 'shift__shift_type_id',
+            'shift__shift_type__name', 'shift__shift_type__color',
+            'shift__shift_type__start_time', 'shift__shift_type__end_time',
+        )
+
+        shift_types = []
+        type_index = {}
+        employees = []
+        employee_index = {}
+        sort_keys = {}
+
+        def add_employee(employee_id, first_name, last_name, username):
+            employee_index[employee_id] = len(employees)
+            sort_keys[employee_id] = (last_name, first_name, employee_id)
+            employees.append({
+                'employee_id': employee_id,
+                'name': f'{first_name} {last_name}'.strip() or username,
+                'cells': [()] * days,
+                'shifts': 0,
+                'hours': 0.0,
+            })
+
+        for employee_id, first_name, last_name, username in staff:
+            add_employee(employee_id, first_name, last_name, username)
+        for (employee_id, first_name, last_name, username, shift_id, shift_date,
+             shift_type_id, type_name, color, start_time, end_time) in rows:
+            if shift_type_id not in type_index:
+                type_index[shift_type_id] = len(shift_types)
+                shift_types.append({
+                    'id': shift_type_id,
+                    'name': type_name,
+                    'color': color,
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'hours': _hours(start_time, end_time),
+                })
+            if employee_id not in employee_index:
+                # Назначен на смену отдела, но не числится в нём (или неактивен)
+                add_employee(employee_id, first_name, last_name, username)
+            row = employees[employee_index[employee_id]]
+            index = type_index[shift_type_id]
+            row['cells'][shift_date.day - 1] += ((index, shift_id),)
+            row['shifts'] += 1
+            row['hours'] += shift_types[index]['hours']
+
+        return {
+            'year': year,
+            'month': month,
+            'days': days,
+            'shift_types': shift_types,
+            'rows': sorted(employees, key=lambda row: sort_keys[row['employee_id']]),
+        }
+
+    @staticmethod
+    def invalidate(department_id: int, months: Iterable[Tuple[int, int]]) -> None:
+        """Удаляет из кэша сетки отдела за указанные месяцы"""
+        cache.delete_many([
+            ShiftScheduleService.cache_key(department_id, year, month) for year, month in months
+        ])
+
+    @staticmethod
+    def invalidate_department(department_id: Optional[int]) -> None:
+        """Сбрасывает сетки отдела за все месяцы (заменой метки отдела)"""
+        if department_id is not None:
+            cache.set(f'{CACHE_PREFIX}:{department_id}:token', uuid.uuid4().hex, None)
+
+    @staticmethod
+    def invalidate_shift(shift_id: Optional[int]) -> None:
+        """Сбрасывает сетку месяца, в котором стоит смена"""
+        found = Shift.objects.filter(pk=shift_id).values_list('date', 'shift_type__department_id').first()
+        if found is not None:
+            shift_date, department_id = found
+            ShiftScheduleService.invalidate(department_id, [(shift_date.year, shift_date.month)])
+
+
+def invalidate_on_assignment_change(sender, instance, **kwargs):
+    """Обработчик post_save/post_delete ShiftAssignment"""
+    ShiftScheduleService.invalidate_shift(instance.shift_id)
+
+
+def invalidate_on_employees_change(sender, instance, action, pk_set=None, **kwargs):
+    """
+    Обработчик m2m_changed Shift.employees
+
+    Shift.employees.set()/add() создают назначения через bulk_create,
+    минуя сигналы ShiftAssignment.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Shift):
+        ShiftScheduleService.invalidate(
+            instance.shift_type.department_id, [(instance.date.year, instance.date.month)]
+        )
+    else:
+        # Изменение со стороны сотрудника: pk_set — смены
+        for shift_id in pk_set or ():
+            ShiftScheduleService.invalidate_shift(shift_id)
+
+
+def invalidate_on_shift_change(sender, instance, raw=False, **kwargs):
+    """Обработчик post_save/post_delete Shift: сбрасывает месяц даты смены"""
+    if raw:
+        return
+    ShiftScheduleService.invalidate(
+        instance.shift_type.department_id, [(instance.date.year, instance.date.month)]
+    )
+
+
+def invalidate_on_shift_move(sender, instance, raw=False, **kwargs):
+    """Обработчик pre_save Shift: сбрасывает месяц прежней даты (смену могли перенести)"""
+    if raw or instance.pk is None:
+        return
+    ShiftScheduleService.invalidate_shift(instance.pk)
+
+
+def invalidate_on_shift_type_change(sender, instance, raw=False, **kwargs):
+    """Обработчик post_save ShiftType: могли измениться подписи и цвета во всех месяцах"""
+    if raw:
+        return
+    bounds = Shift.objects.filter(shift_type=instance).aggregate(first=Min('date'), last=Max('date'))
+    if bounds['first'] is not None:
+        ShiftScheduleService.invalidate(
+            instance.department_id, months_between(bounds['first'], bounds['last'])
+        )
+
+
+# Поля пользователя, попадающие в сетку
+USER_NAME_FIELDS = frozenset(['first_name', 'last_name', 'username'])
+
+
+def invalidate_on_employee_move(sender, instance, raw=False, **kwargs):
+    """Обработчик pre_save Employee: сбрасывает прежний отдел (сотрудника могли перевести)"""
+    if raw or instance.pk is None:
+        return
+    previous = Employee.objects.filter(pk=instance.pk).values_list('department_id', flat=True).first()
+    if previous != instance.department_id:
+        ShiftScheduleService.invalidate_department(previous)
+
+
+def invalidate_on_employee_change(sender, instance, raw=False, **kwargs):
+    """Обработчик post_save/post_delete Employee: строка сотрудника есть во всех месяцах"""
+    if raw:
+        return
+    ShiftScheduleService.invalidate_department(instance.department_id)
+
+
+def invalidate_on_user_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Обработчик post_save User: имя сотрудника показывается в сетке"""
+    if raw or (update_fields is not None and not USER_NAME_FIELDS & set(update_fields)):
+        # Например, обновление last_login при входе
+        return
+    ShiftScheduleService.invalidate_department(
+        Employee.objects.filter(user_id=instance.pk).values_list('department_id', flat=True).first()
+    )
@@ -0,0 +1,177 @@
+"""
+Сводка списаний материалов за период.
+
+Суммы считаются по таблице MaterialWriteOffDaily — списаниям за день,
+сгруппированным по отделу, материалу, единице измерения и назначению.
+Таблица поддерживается инкрементально сигналами MaterialWriteOff:
+создание прибавляет количество к строке своего дня, изменение переносит
+его из старой строки в новую, удаление вычитает. Сводка за год — это
+сумма нескольких сотен строк за 365 дней, а не проход по всем списаниям.
+
+Массовые операции (QuerySet.update/delete, bulk_create) сигналов не
+отправляют — после них таблицу нужно пересчитать командой
+rebuild_writeoff_rollups (WriteOffSummaryService.rebuild).
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, List, Optional, Sequence
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import MaterialWriteOff, MaterialWriteOffDaily
+from ..utils import local_date_range_filter
+
+# Группировки сводки: материал с единицей измерения есть всегда
+GROUPINGS = {
+    'department': ('department_id', 'department__name'),
+    'material': ('material_name', 'unit'),
+    'destination': ('destination',),
+}
+GROUP_ORDER = ('department', 'material', 'destination')
+
+ROLLUP_BATCH_SIZE = 1000
+
+
+def _rollup_key(department_id, created_at, material_name, unit, destination) -> dict:
+    return {
+        'department_id': department_id,
+        'date': timezone.localdate(created_at),
+        'material_name': material_name,
+        'unit': unit,
+        'destination': destination,
+    }
+
+
+class WriteOffSummaryService:
+    """Сервис сводок списаний материалов"""
+
+    @staticmethod
+    def add(key: dict, quantity: Decimal, writeoffs: int) -> None:
+        """
+        Прибавляет к строке дня количество и число списаний (или вычитает)
+
+        Строка создаётся при первом списании и удаляется, когда списаний в
+        ней не остаётся.
+        """
+        rows = MaterialWriteOffDaily.objects.filter(**key)
+        with transaction.atomic():
+            updated = rows.update(quantity=F('quantity') + quantity, writeoffs=F('writeoffs') + writeoffs)
+            if not updated and writeoffs > 0:
+                try:
+                    with transaction.atomic():
+                        MaterialWriteOffDaily.objects.create(quantity=quantity, writeoffs=writeoffs, **key)
+                except IntegrityError:
+                    # Строку только что создало параллельное списание
+                    rows.update(quantity=F('quantity') + quantity, writeoffs=F('writeoffs') + writeoffs)
+            elif writeoffs < 0:
+                rows.filter(writeoffs__lte=0).delete()
+
+    @staticmethod
+    def summary(date_from: date, date_to: date, department_ids: Optional[Iterable[int]] = None,
+                group_by: Sequence[str] = ('material',)) -> List[dict]:
+        """
+        Итоги списаний за период
+
+        Args:
+            date_from: Первый день
+            date_to: Последний день включительно
+            department_ids: Отделы (None — все)
+            group_by: Группировки из GROUPINGS; материал добавляется всегда
+
+        Returns:
+            Строки с полями группировок, total_quantity и total_writeoffs,
+            по убыванию количества внутри отдела и единицы измерения
+        """
+        groups = [name for name in GROUP_ORDER if name in group_by or name == 'material']
+        fields = [field for name in groups for field in GROUPINGS[name]]
+        rows = MaterialWriteOffDaily.objects.filter(date__range=(date_from, date_to))
+        if department_ids is not None:
+            rows = rows.filter(department_id__in=list(department_ids))
+        ordering = (['department__name'] if 'department' in groups else []) + ['unit', '-total_quantity']
+        return list(
+            rows.values(*fields)
+            .annotate(total_quantity=Sum('quantity'), total_writeoffs=Sum('writeoffs'))
+            .order_by(*ordering, 'material_name')
+        )
+
+    @staticmethod
+    def rebuild(date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
+        """
+        Пересчитывает строки дней периода по самим списаниям
+
+        Returns:
+            Число строк после пересчёта
+        """
+        rollups = MaterialWriteOffDaily.objects.all()
+        if date_from:
+            rollups = rollups.filter(date__gte=date_from)
+        if date_to:
+            rollups = rollups.filter(date__lte=date_to)
+        totals = (
+            MaterialWriteOff.objects.filter(**local_date_range_filter('created_at', date_from, date_to))
+            .annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+            .values('department_id', 'day', 'material_name', 'unit', 'destination')
+            .annotate(total_quantity=Sum('quantity'), total_writeoffs=Count('id'))
+            .order_by()
+        )
+        with transaction.atomic():
+            rollups.delete()
+            created = MaterialWriteOffDaily.objects.bulk_create(
+                [
+                    MaterialWriteOffDaily(
+                        department_id=row['department_id'], date=row['day'], material_name=row['material_name'],
+                        unit=row['unit'], destination=row['destination'], quantity=row['total_quantity'],
+                        writeoffs=row['total_writeoffs'],
+                    )
+                    for row in totals.iterator()
+                ],
+                batch_size=ROLLUP_BATCH_SIZE
+            )
+        return len(created)
+
+
+def remember_writeoff_state(sender, instance, raw=False, **kwargs):
+    """
+    pre_save: запоминает прежние значения изменяемого списания
+
+    По ним обработчики post_save (сводка и остатки, services.material_stock)
+    переносят количество из старой строки в новую.
+    """
+    instance._previous_state = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_state = (
+        MaterialWriteOff.objects.filter(pk=instance.pk)
+        .values('department_id', 'created_at', 'material_name', 'unit', 'destination', 'quantity')
+        .first()
+    )
+
+
+def rollup_on_writeoff_save(sender, instance, created, raw=False, **kwargs):
+    """post_save: переносит количество в строку дня списания"""
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_previous_state', None)
+    if previous:
+        WriteOffSummaryService.add(
+            _rollup_key(previous['department_id'], previous['created_at'], previous['material_name'],
+                        previous['unit'], previous['destination']),
+            -previous['quantity'], -1
+        )
+    WriteOffSummaryService.add(
+        _rollup_key(instance.department_id, instance.created_at, instance.material_name,
+                    instance.unit, instance.destination),
+        Decimal(str(instance.quantity)), 1
+    )
+
+
+def rollup_on_writeoff_delete(sender, instance, **kwargs):
+    """post_delete: вычитает списание из строки его дня"""
+    WriteOffSummaryService.add(
+        _rollup_key(instance.department_id, instance.created_at, instance.material_name,
+                    instance.unit, instance.destination),
+        -Decimal(str(instance.quantity)), -1
+    )
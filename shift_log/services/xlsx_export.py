@@ -0,0 +1,273 @@
+"""
+Потоковая выгрузка списков в XLSX.
+
+XLSX — это ZIP-архив XML-частей. Служебные части (книга, стили, связи)
+маленькие и пишутся целиком, а XML листа пишется в архив по мере чтения
+строк: строки читаются из БД через .iterator() (на PostgreSQL —
+серверный курсор) и сжимаются zipfile, а накопленные сжатые байты
+отдаются клиенту каждые FLUSH_ROWS строк. Скачивание начинается сразу,
+в памяти не держится ни queryset, ни лист, ни файл целиком.
+
+Архив пишется стандартным zipfile в поток без перемотки (размеры частей
+записываются после данных), поэтому от внутренних механизмов openpyxl
+выгрузка не зависит. Строки пишутся как inline-строки: пользовательский
+текст, начинающийся с «=», не может стать формулой.
+"""
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from io import RawIOBase
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from django.db.models import Count
+from django.utils import timezone
+
+CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Через сколько строк листа накопленные байты отдаются клиенту
+FLUSH_ROWS = 500
+# Размер порции при чтении из БД
+CHUNK_SIZE = 2000
+
+Column = Tuple[str, int]  # (заголовок, ширина)
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+# Стили ячеек (индексы cellXfs в STYLES_XML)
+STYLE_HEADER, STYLE_DATETIME, STYLE_DATE = 1, 2, 3
+
+# Символы, недопустимые в XML 1.0
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Символы, недопустимые в названии листа Excel
+ILLEGAL_TITLE_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+CONTENT_TYPES_XML = XML_HEADER + (
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+ROOT_RELS_XML = XML_HEADER + (
+    f'<Relationships xmlns="{PACKAGE_REL_NS}">'
+    f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+WORKBOOK_RELS_XML = XML_HEADER + (
+    f'<Relationships xmlns="{PACKAGE_REL_NS}">'
+    f'<Relationship Id="rId1" Type="{REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+    f'<Relationship Id="rId2" Type="{REL_NS}/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+STYLES_XML = XML_HEADER + (
+    f'<styleSheet xmlns="{MAIN_NS}">'
+    '<numFmts count="2">'
+    '<numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/>'
+    '<numFmt numFmtId="165" formatCode="yyyy-mm-dd"/>'
+    '</numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+class _Sink(RawIOBase):
+    """Поток без перемотки, накапливающий байты архива до отдачи клиенту"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _column_letter(index: int) -> str:
+    """Буквенное имя колонки: 1 → A, 27 → AA"""
+    letters = ''
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell_xml(ref: str, value, style: int = 0) -> str:
+    """
+    XML ячейки; пустая строка для None
+
+    Excel не хранит часовой пояс — aware-время переводим в местное.
+    """
+    style_attr = f' s="{style}"' if style else ''
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"{style_attr}><v>{int(value)}</v></c>'
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value).replace(tzinfo=None)
+        serial = (value - EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c r="{ref}" s="{STYLE_DATETIME}"><v>{serial!r}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="{STYLE_DATE}"><v>{(value - EXCEL_EPOCH.date()).days}</v></c>'
+    if isinstance(value, Decimal):
+        return f'<c r="{ref}"{style_attr}><v>{value:f}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{style_attr}><v>{value!r}</v></c>'
+    text = escape(ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c r="{ref}" t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row_xml(number: int, letters: Sequence[str], values: Sequence, style: int = 0) -> str:
+    cells = ''.join(
+        _cell_xml(f'{letter}{number}', value, style) for letter, value in zip(letters, values)
+    )
+    return f'<row r="{number}">{cells}</row>'
+
+
+def stream_xlsx(title: str, columns: Sequence[Column], rows: Iterable[Sequence]) -> Iterator[bytes]:
+    """
+    Генератор байтов XLSX-файла
+
+    Первая порция (служебные части и строка заголовков) отдаётся до
+    чтения строк данных, дальше — каждые FLUSH_ROWS строк.
+
+    Args:
+        title: Название листа
+        columns: Колонки (заголовок, ширина)
+        rows: Строки значений
+    """
+    title = ILLEGAL_TITLE_CHARS.sub(' ', title)[:31] or 'Лист1'
+    letters = [_column_letter(index) for index in range(1, len(columns) + 1)]
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+        archive.writestr('_rels/.rels', ROOT_RELS_XML)
+        archive.writestr('xl/workbook.xml', XML_HEADER + (
+            f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+            f'<sheet name={quoteattr(title)} sheetId="1" r:id="rId1"/>'
+            '</sheets></workbook>'
+        ))
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS_XML)
+        archive.writestr('xl/styles.xml', STYLES_XML)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            cols = ''.join(
+                f'<col min="{index}" max="{index}" width="{width}" customWidth="1"/>'
+                for index, (_, width) in enumerate(columns, 1)
+            )
+            sheet.write((XML_HEADER + (
+                f'<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+                '<sheetViews><sheetView workbookViewId="0">'
+                '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                '<selection pane="bottomLeft" activeCell="A2" sqref="A2"/>'
+                '</sheetView></sheetViews>'
+                f'<cols>{cols}</cols><sheetData>'
+                + _row_xml(1, letters, [name for name, _ in columns], STYLE_HEADER)
+            )).encode('utf-8'))
+            # Начало архива отдаём до чтения строк: клиент сразу видит загрузку
+            yield sink.drain()
+
+            for number, row in enumerate(rows, 2):
+                sheet.write(_row_xml(number, letters, row).encode('utf-8'))
+                if number % FLUSH_ROWS == 0:
+                    data = sink.drain()
+                    if data:
+                        yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def _user_name(user) -> str:
+    if user is None:
+        return ''
+    return user.get_full_name() or user.username
+
+
+class XlsxExport:
+    """Колонки и строки выгрузок"""
+
+    TASK_COLUMNS: List[Column] = [
+        ('№', 8), ('Название', 40), ('Отдел', 20), ('Проект', 20), ('Исполнитель', 25),
+        ('Создал', 25), ('Тип', 15), ('Приоритет', 12), ('Статус', 15), ('Срок', 18),
+        ('Создано', 18), ('Завершено', 18), ('Комментарий', 50),
+    ]
+    WRITEOFF_COLUMNS: List[Column] = [
+        ('Дата и время', 18), ('Отдел', 20), ('Что списали', 40), ('Количество', 12),
+        ('Ед. изм.', 10), ('Куда', 30), ('Кем списано', 25),
+    ]
+    DAILY_REPORT_COLUMNS: List[Column] = [
+        ('Дата', 12), ('Отдел', 20), ('Сотрудник', 25), ('Отчёт', 80), ('Фотографий', 12),
+        ('Автор', 25), ('Обновлено', 18),
+    ]
+
+    @staticmethod
+    def tasks(queryset) -> Iterator[list]:
+        queryset = queryset.select_related(
+            'department', 'project', 'assigned_to__user', 'created_by__user'
+        ).prefetch_related(None)
+        for task in queryset.iterator(chunk_size=CHUNK_SIZE):
+            yield [
+                task.pk, task.title, task.department.name,
+                task.project.name if task.project else '',
+                task.assigned_to.get_full_name() if task.assigned_to else '',
+                task.created_by.get_full_name(),
+                task.get_task_type_display(), task.get_priority_display(), task.get_status_display(),
+                task.due_date, task.created_at, task.completed_at, task.comment,
+            ]
+
+    @staticmethod
+    def writeoffs(queryset) -> Iterator[list]:
+        queryset = queryset.select_related('department', 'created_by__user')
+        for writeoff in queryset.iterator(chunk_size=CHUNK_SIZE):
+            yield [
+                writeoff.created_at, writeoff.department.name, writeoff.material_name,
+                writeoff.quantity, writeoff.get_unit_display(), writeoff.destination,
+                writeoff.created_by.get_full_name(),
+            ]
+
+    @staticmethod
+    def daily_reports(queryset) -> Iterator[list]:
+        queryset = queryset.select_related('department', 'employee__user', 'created_by').annotate(
+            photos_total=Count('photos')
+        ).prefetch_related('entries')
+        for report in queryset.iterator(chunk_size=CHUNK_SIZE):
+            yield [
+                report.date, report.department.name,
+                report.employee.get_full_name() if report.employee else '',
+                report.text, report.photos_total, _user_name(report.created_by), report.last_updated,
+            ]
+
+
+def export_filename(prefix: str, day: Optional[date] = None) -> str:
+    return f'{prefix} {(day or timezone.localdate()):%Y-%m-%d}.xlsx'
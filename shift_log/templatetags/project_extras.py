@@ -1,9 +1,21 @@
 from django import template
-from django.contrib.auth.models import AnonymousUser
 
 register = template.Library()
 
 
+def _get_employee(user):
+    """
+    Returns the employee attached to the user or None.
+
+    EmployeeContextMiddleware preloads user.employee (or caches its absence),
+    so this never hits the database during template rendering.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+
+    return getattr(user, 'employee', None)
+
+
 @register.filter
 def get_item(dictionary, key):
     return dictionary.get(key)
@@ -21,10 +33,11 @@ def has_role(user, role_name):
     Returns:
         bool: True if user has the role, False otherwise
     """
-    if isinstance(user, AnonymousUser) or not hasattr(user, 'employee'):
+    employee = _get_employee(user)
+    if employee is None:
         return False
 
-    return user.employee.role == role_name
+    return employee.role == role_name
 
 
 @register.filter
@@ -38,10 +51,11 @@ def is_tester(user):
     Returns:
         bool: True if user is a tester, False otherwise
     """
-    if isinstance(user, AnonymousUser) or not hasattr(user, 'employee'):
+    employee = _get_employee(user)
+    if employee is None:
         return False
 
-    return user.employee.is_tester
+    return employee.is_tester
 
 
 @register.filter
@@ -55,7 +69,20 @@ def is_programmer(user):
     Returns:
         bool: True if user is a programmer, False otherwise
     """
-    if isinstance(user, AnonymousUser) or not hasattr(user, 'employee'):
+    employee = _get_employee(user)
+    if employee is None:
         return False
 
-    return user.employee.is_programmer
+    return employee.is_programmer
+
+
+@register.filter
+def minutes_as_hours(minutes):
+    """
+    Format a number of minutes as hours with up to two decimals.
+
+    Example: 450 -> "7.5"
+    """
+    if minutes in (None, ''):
+        return ''
+    return f'{minutes / 60:.2f}'.rstrip('0').rstrip('.')
@@ -1,9 +1,59 @@
+import hashlib
+import json
+import io
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest.mock import patch
+
+from django.apps import apps
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import Image
+
+from testing.models import Feature, TestProject
 
-from .models import Department, Employee, Task, TaskProject
+from .middleware import EmployeeContextMiddleware
+from .forms import ShiftAssignmentForm
+from .mixins import CachedObjectMixin
+from .models import (Attachment, Blob, DailyReport, DailyReportEntry,
+                     DailyReportPhoto, Department, Employee, MaterialMovement,
+                     MaterialStock, MaterialWriteOff, MaterialWriteOffDaily, Notification,
+                     Shift, ShiftAssignment, ShiftLog, ShiftType, Task,
+                     TaskProject, TaskReport, UploadSession)
+from .services.autocomplete import AutocompleteService
+from .services.blob_storage import sniff_content_type
+from .services.chunked_upload import ChunkedUploadService, UploadError
+from .services.bulk_assignment import BulkAssignmentService
+from .services.daily_pdf import DailyReportPdf
+from .services.image_derivatives import (DERIVATIVE_SIZES, derivative_names,
+                                        ensure_derivative)
+from .services.labor_hours import LaborHoursService
+from .services.material_stock import MaterialStockService
+from .services.replacements import ReplacementService
+from .services.shift_calendar import ShiftCalendar
+from .services.shift_conflicts import ShiftConflictService
+from .services.shift_schedule import ShiftScheduleService
+from .services.shift_generation import ShiftGenerationService
+from .services.writeoff_summary import WriteOffSummaryService
+from .services.xlsx_export import CONTENT_TYPE as XLSX_CONTENT_TYPE
+from .services.xlsx_export import stream_xlsx
+from .templatetags.project_extras import is_tester
+from .views import TaskDetailView
+from .utils import validate_shift_pattern
 
 
 class EmployeeRoleTestCase(TestCase):
@@ -232,3 +282,1808 @@ class TaskCreationFlowTestCase(TestCase):
         task = Task.objects.first()
         self.assertIsNotNone(task)
         self.assertEqual(task.project, project)
+
+
+class VisibilityQuerySetTestCase(TestCase):
+    """Тесты правил видимости заданий и вложений."""
+
+    def setUp(self):
+        """Создание отделов, сотрудников и заданий."""
+        self.department = Department.objects.create(name='Цех 1')
+        self.other_department = Department.objects.create(name='Цех 2')
+        self.supervisor = self._employee('boss', self.department, 'supervisor')
+        self.worker = self._employee('worker', self.department, 'employee')
+        self.stranger = self._employee('stranger', self.other_department, 'employee')
+        self.admin = self._employee('admin', self.other_department, 'admin')
+
+        due = timezone.now()
+        self.individual = Task.objects.create(
+            title='Индивидуальная', description='-', department=self.department,
+            assigned_to=self.worker, created_by=self.supervisor, due_date=due
+        )
+        self.general = Task.objects.create(
+            title='Общая', description='-', department=self.department,
+            task_scope='general', created_by=self.supervisor, due_date=due
+        )
+        self.foreign = Task.objects.create(
+            title='Чужая', description='-', department=self.other_department,
+            assigned_to=self.stranger, created_by=self.admin, due_date=due
+        )
+
+    def _employee(self, username, department, position):
+        user = User.objects.create_user(username=username, password='testpass123')
+        return Employee.objects.create(user=user, department=department, position=position)
+
+    def test_task_visibility_by_position(self):
+        """Проверяет, что каждое правило видимости компилируется в фильтр."""
+        self.assertEqual(Task.objects.visible_to(self.admin).count(), 3)
+        self.assertEqual(
+            set(Task.objects.visible_to(self.supervisor)),
+            {self.individual, self.general}
+        )
+        self.assertEqual(
+            set(Task.objects.visible_to(self.worker)),
+            {self.individual, self.general}
+        )
+        self.assertEqual(set(Task.objects.visible_to(self.stranger)), {self.foreign})
+        self.assertFalse(Task.objects.visible_to(None).exists())
+
+    def test_employee_rules(self):
+        """Сотрудник не видит созданные им чужие задания; в отчётах — только назначенные"""
+        created = Task.objects.create(
+            title='Поручение', description='-', department=self.department,
+            assigned_to=self.supervisor, created_by=self.worker, due_date=timezone.now()
+        )
+        self.assertNotIn(created, Task.objects.visible_to(self.worker))
+        self.assertEqual(
+            set(Task.objects.visible_to(self.worker, assigned_only=True)), {self.individual}
+        )
+        self.assertEqual(
+            set(Task.objects.visible_to(self.supervisor, assigned_only=True)),
+            {self.individual, self.general, created}
+        )
+
+        # Вложения задания, созданного сотрудником, ему по-прежнему доступны
+        attachment = Attachment.objects.create(
+            file='attachments/plan.txt', filename='plan.txt',
+            content_type='text/plain', file_size=1,
+            attachment_type='task', object_id=created.id,
+            uploaded_by=self.supervisor
+        )
+        self.assertIn(attachment, Attachment.objects.visible_to(self.worker))
+
+        self.client.login(username='worker', password='testpass123')
+        response = self.client.get(reverse('shift_log:reports_list'))
+        self.assertEqual([task.pk for task in response.context['tasks']], [self.individual.pk])
+
+    def test_user_without_employee_sees_all_tasks_and_features(self):
+        """Пользователь без профиля сотрудника, как и раньше, видит все задания и функционал"""
+        guest = User.objects.create_user(username='guest', password='testpass123')
+        feature = Feature.objects.create(
+            test_project=TestProject.objects.create(name='Проект', created_by=self.admin),
+            title='Функционал', description='-', created_by=self.admin
+        )
+        self.client.force_login(guest)
+        response = self.client.get(reverse('shift_log:task_list'))
+        self.assertEqual(set(response.context['tasks']), {self.individual, self.general, self.foreign})
+        response = self.client.get(reverse('shift_log:task_detail', args=[self.foreign.pk]))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('testing:feature_detail', args=[feature.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_task_history_follows_assignment_and_authorship(self):
+        """История задания: сотруднику — назначенные и созданные им, без общих задач отдела"""
+        created = Task.objects.create(
+            title='Поручение', description='-', department=self.other_department,
+            assigned_to=self.stranger, created_by=self.worker, due_date=timezone.now()
+        )
+        self.client.force_login(self.worker.user)
+        for task, allowed in ((self.individual, True), (created, True),
+                              (self.general, False), (self.foreign, False)):
+            response = self.client.get(reverse('shift_log:api_task_history', args=[task.pk]))
+            self.assertEqual(response.json()['success'], allowed, task.title)
+
+        self.client.force_login(self.supervisor.user)
+        response = self.client.get(reverse('shift_log:api_task_history', args=[created.pk]))
+        self.assertFalse(response.json()['success'])
+
+    def test_attachment_access_per_view(self):
+        """Вложения общих задач и загруженные к чужим задачам сотруднику недоступны"""
+        def attach(task, uploaded_by):
+            return Attachment.objects.create(
+                file='attachments/test.txt', filename='test.txt',
+                content_type='text/plain', file_size=1,
+                attachment_type='task', object_id=task.id, uploaded_by=uploaded_by
+            )
+        on_general = attach(self.general, self.supervisor)
+        own_on_foreign = attach(self.foreign, self.worker)
+        on_individual = attach(self.individual, self.supervisor)
+
+        self.client.force_login(self.worker.user)
+        for url_name in ('shift_log:view_attachment', 'shift_log:download_attachment'):
+            for attachment in (on_general, own_on_foreign):
+                response = self.client.get(reverse(url_name, args=[attachment.id]))
+                self.assertEqual(response.json()['error'], 'Access denied')
+        self.assertEqual(set(Attachment.objects.visible_to(self.worker)), {on_individual})
+        self.assertEqual(
+            set(Attachment.objects.visible_to(self.supervisor)), {on_general, on_individual}
+        )
+
+    def test_attachment_visibility_follows_task(self):
+        """Проверяет, что вложение видно только при доступе к заданию."""
+        attachment = Attachment.objects.create(
+            file='attachments/test.txt', filename='test.txt',
+            content_type='text/plain', file_size=1,
+            attachment_type='task', object_id=self.individual.id,
+            uploaded_by=self.supervisor
+        )
+        self.assertIn(attachment, Attachment.objects.visible_to(self.worker))
+        self.assertNotIn(attachment, Attachment.objects.visible_to(self.stranger))
+
+        self.client.login(username='stranger', password='testpass123')
+        response = self.client.get(
+            reverse('shift_log:view_attachment', args=[attachment.id])
+        )
+        self.assertEqual(response.json()['error'], 'Access denied')
+
+
+class EmployeeContextMiddlewareTestCase(TestCase):
+    """Тесты загрузки сотрудника и прав на уровне запроса"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name="Отдел")
+        self.user = User.objects.create_user(username='tester')
+        self.employee = Employee.objects.create(
+            user=self.user,
+            department=self.department,
+            position='supervisor',
+            role='tester'
+        )
+        self.middleware = EmployeeContextMiddleware(lambda request: None)
+
+    def _process(self, user):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=user.pk)
+        self.middleware.process_request(request)
+        return request
+
+    def test_employee_and_department_loaded_in_one_query(self):
+        """Сотрудник и отдел загружаются одним запросом"""
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.middleware.process_request(request)
+            self.assertEqual(request.user.employee, self.employee)
+            self.assertEqual(request.user.employee.department.name, "Отдел")
+            self.assertIs(request.user.employee.user, request.user)
+            self.assertTrue(is_tester(request.user))
+
+    def test_user_without_employee_is_negatively_cached(self):
+        """Отсутствие профиля сотрудника кэшируется на запрос"""
+        user = User.objects.create_user(username='nobody')
+        request = self._process(user)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(hasattr(request.user, 'employee'))
+            self.assertFalse(is_tester(request.user))
+
+
+class CachedObjectMixinTestCase(TestCase):
+    """Тесты кэширования объекта и прав в представлениях"""
+
+    def setUp(self):
+        department = Department.objects.create(name='Цех')
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass'),
+            department=department, position='supervisor'
+        )
+        self.task = Task.objects.create(
+            title='Задание', description='-', department=department,
+            created_by=self.supervisor, due_date=timezone.now()
+        )
+
+    def test_object_and_facts_are_computed_once(self):
+        """get_object() обращается к БД один раз, факт о правах вычисляется один раз"""
+        request = RequestFactory().get('/')
+        request.user = self.supervisor.user
+        view = TaskDetailView()
+        view.setup(request, pk=self.task.pk)
+        self.assertIsInstance(view, CachedObjectMixin)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(view.get_object(), self.task)
+            self.assertIs(view.get_object(), view.get_object())
+
+        calls = []
+        for _ in range(3):
+            view.get_permission_fact('checked', lambda: calls.append(1) or True)
+        self.assertEqual(calls, [1])
+
+    def test_detail_and_update_views_load_task_once(self):
+        """Страницы задания и его редактирования загружают задание одним запросом"""
+        self.client.login(username='boss', password='pass')
+        for name in ('task_detail', 'task_edit'):
+            url = reverse(f'shift_log:{name}', args=[self.task.pk])
+            # Сессия, пользователь, сотрудник, задание и по два запроса самой страницы
+            with self.assertNumQueries(6):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            task_queries = [
+                query for query in queries.captured_queries
+                if query['sql'].startswith('SELECT "shift_log_task"."id"')
+            ]
+            self.assertEqual(len(task_queries), 1)
+
+
+class AttachmentDeliveryTestCase(TestCase):
+    """Тесты потоковой отдачи вложений"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        department = Department.objects.create(name='Цех')
+        user = User.objects.create_user(username='admin', password='testpass123')
+        self.employee = Employee.objects.create(
+            user=user, department=department, position='admin'
+        )
+        self.attachment = Attachment(
+            filename='отчёт.pdf', content_type='application/pdf', file_size=10,
+            attachment_type='task', object_id=1, uploaded_by=self.employee
+        )
+        self.attachment.file.save('report.pdf', ContentFile(b'0123456789'))
+        self.url = reverse('shift_log:download_attachment', args=[self.attachment.id])
+        self.client.login(username='admin', password='testpass123')
+
+    def test_full_download_is_streamed_with_validators(self):
+        """Файл отдаётся потоком с ETag, Last-Modified и Accept-Ranges"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn("filename*=utf-8''", response['Content-Disposition'])
+
+        revalidate = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidate.status_code, 304)
+
+    def test_range_requests(self):
+        """Range отдаёт часть файла, If-Range с чужим ETag — файл целиком"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=50-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    @override_settings(ATTACHMENT_DELIVERY_MODE='x-accel')
+    def test_x_accel_redirect_mode(self):
+        """В режиме x-accel тело отдаёт nginx"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/' + self.attachment.file.name
+        )
+
+
+class ChunkedUploadTestCase(TestCase):
+    """Тесты порционной загрузки вложений"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        department = Department.objects.create(name='Цех')
+        user = User.objects.create_user(username='worker', password='testpass123')
+        self.employee = Employee.objects.create(user=user, department=department)
+        self.task = Task.objects.create(
+            title='Задание', description='-', department=department,
+            assigned_to=self.employee, created_by=self.employee, due_date=timezone.now()
+        )
+        self.client.login(username='worker', password='testpass123')
+        self.data = b'0123456789' * 10
+
+    def _init(self, data):
+        response = self.client.post(reverse('shift_log:upload_init'), {
+            'filename': 'log.txt',
+            'content_type': 'text/plain',
+            'total_size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'attachment_type': 'task',
+            'object_id': self.task.id,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload_id']
+
+    def _put(self, upload_id, offset, chunk):
+        return self.client.put(
+            reverse('shift_log:upload_chunk', args=[upload_id]), chunk,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_resumable_upload_creates_attachment(self):
+        """Порции дописываются по смещению, после обрыва загрузка продолжается"""
+        upload_id = self._init(self.data)
+        self.assertEqual(self._put(upload_id, 0, self.data[:40]).json()['offset'], 40)
+
+        # Повтор уже принятой порции отклоняется с текущим смещением
+        response = self._put(upload_id, 0, self.data[:40])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 40)
+
+        status = self.client.get(reverse('shift_log:upload_chunk', args=[upload_id]))
+        self.assertEqual(status.json()['offset'], 40)
+        self._put(upload_id, 40, self.data[40:])
+
+        response = self.client.post(reverse('shift_log:upload_finalize', args=[upload_id]))
+        self.assertTrue(response.json()['success'])
+        attachment = Attachment.objects.get(id=response.json()['attachment_id'])
+        self.assertEqual(attachment.file_size, len(self.data))
+        with attachment.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_checksum_mismatch_discards_session(self):
+        """При несовпадении SHA-256 вложение не создаётся"""
+        upload_id = self._init(self.data)
+        self._put(upload_id, 0, b'x' * len(self.data))
+
+        response = self.client.post(reverse('shift_log:upload_finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Attachment.objects.exists())
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_reuse_follows_blob_visibility(self):
+        """Файл из фотографий отчётов переиспользуется по тем же правам, что и выдаётся"""
+        colleague = Employee.objects.create(
+            user=User.objects.create_user(username='colleague'), department=self.employee.department
+        )
+        stranger = Employee.objects.create(
+            user=User.objects.create_user(username='stranger'),
+            department=Department.objects.create(name='Склад')
+        )
+        own_data, foreign_data = b'own' * 20, b'foreign' * 20
+        for data, author in ((own_data, colleague), (foreign_data, stranger)):
+            blob = Blob.objects.create(
+                sha256=hashlib.sha256(data).hexdigest(), size=len(data),
+                content_type='text/plain', file=f'blobs/{len(data)}.txt'
+            )
+            report = DailyReport.objects.create(department=author.department, date=timezone.localdate())
+            DailyReportPhoto.objects.create(
+                daily_report=report, image=blob.file.name, blob=blob, uploaded_by=author
+            )
+
+        def init(data):
+            return self.client.post(reverse('shift_log:upload_init'), {
+                'filename': 'log.txt', 'content_type': 'text/plain', 'total_size': len(data),
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'attachment_type': 'task', 'object_id': self.task.id,
+            }).json()
+
+        self.assertTrue(init(own_data).get('deduplicated'))
+        self.assertFalse(init(foreign_data).get('deduplicated'))
+
+    def test_chunk_is_read_outside_transaction(self):
+        """Тело порции читается из сети без открытой транзакции и блокировки сеанса"""
+        upload_id = self._init(self.data)
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        class Stream(io.BytesIO):
+            def read(self, size=-1):
+                depths.append(len(connection.atomic_blocks))
+                return super().read(size)
+
+        session = ChunkedUploadService.append_chunk(
+            upload_id, self.employee, 0, Stream(self.data[:40]), 40
+        )
+        self.assertEqual(session.received_size, 40)
+        self.assertEqual(set(depths), {depth})
+
+        # Повтор уже подтверждённой порции отклоняется с текущим смещением
+        with self.assertRaises(UploadError) as raised:
+            ChunkedUploadService.append_chunk(upload_id, self.employee, 0, io.BytesIO(self.data[:40]), 40)
+        self.assertEqual((raised.exception.status, raised.exception.offset), (409, 40))
+
+    def test_target_is_checked_for_every_attachment_type(self):
+        """Доступ к объекту проверяется для всех типов вложений"""
+        other = Department.objects.create(name='Склад')
+        stranger = Employee.objects.create(user=User.objects.create_user(username='stranger'), department=other)
+        foreign_task = Task.objects.create(
+            title='Чужое', description='-', department=other,
+            assigned_to=stranger, created_by=stranger, due_date=timezone.now()
+        )
+        shift_type = ShiftType.objects.create(
+            name='Дневная', department=other, start_time=time(8), end_time=time(20)
+        )
+        foreign_shift = Shift.objects.create(date=timezone.localdate(), shift_type=shift_type)
+        ShiftAssignment.objects.create(shift=foreign_shift, employee=stranger)
+        own_report = TaskReport.objects.create(task=self.task, employee=self.employee, report_text='-', status='in_progress')
+        targets = (
+            ('task_report', own_report.id, 201),
+            ('task_report', TaskReport.objects.create(task=foreign_task, employee=stranger, report_text='-', status='in_progress').id, 403),
+            ('shift_log', ShiftLog.objects.create(shift=foreign_shift, created_by=stranger).id, 403),
+        )
+        for attachment_type, object_id, status in targets:
+            response = self.client.post(reverse('shift_log:upload_init'), {
+                'filename': 'log.txt', 'content_type': 'text/plain', 'total_size': len(self.data),
+                'sha256': hashlib.sha256(self.data).hexdigest(),
+                'attachment_type': attachment_type, 'object_id': object_id,
+            })
+            self.assertEqual(response.status_code, status, attachment_type)
+
+
+class BlobStorageTestCase(TestCase):
+    """Тесты хранилища с дедупликацией по содержимому"""
+
+    PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        department = Department.objects.create(name='Цех')
+        user = User.objects.create_user(username='admin', password='testpass123')
+        self.employee = Employee.objects.create(
+            user=user, department=department, position='admin'
+        )
+        self.task = Task.objects.create(
+            title='Задание', description='-', department=department,
+            created_by=self.employee, due_date=timezone.now()
+        )
+        self.client.login(username='admin', password='testpass123')
+
+    def _upload(self, name, data, content_type='text/plain'):
+        return self.client.post(reverse('shift_log:upload_attachment'), {
+            'file': SimpleUploadedFile(name, data, content_type=content_type),
+            'attachment_type': 'task',
+            'object_id': self.task.id,
+        }).json()
+
+    def test_sniff_content_type(self):
+        """Тип определяется по сигнатуре, а не по расширению"""
+        self.assertEqual(sniff_content_type(self.PNG, 'photo.txt'), 'image/png')
+        self.assertEqual(sniff_content_type(b'%PDF-1.7', 'doc.bin'), 'application/pdf')
+        self.assertEqual(sniff_content_type(b'PK\x03\x04', 'a.docx'),
+                         'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+        self.assertEqual(sniff_content_type('журнал смены'.encode(), 'a.txt'), 'text/plain')
+        self.assertEqual(sniff_content_type(b'MZ\x90\x00', 'manual.pdf'), 'application/x-msdownload')
+
+    def test_duplicate_uploads_share_one_blob(self):
+        """Одинаковые файлы хранятся один раз, файл удаляется с последней ссылкой"""
+        first = self._upload('scan.png', self.PNG, content_type='text/plain')
+        second = self._upload('copy.png', self.PNG)
+        self.assertTrue(first['success'] and second['success'])
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.content_type, 'image/png')
+        attachments = list(Attachment.objects.order_by('id'))
+        self.assertEqual({a.file.name for a in attachments}, {blob.file.name})
+        self.assertEqual(attachments[0].content_type, 'image/png')
+        path = blob.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('shift_log:delete_attachment', args=[attachments[0].id]))
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('shift_log:delete_attachment', args=[attachments[1].id]))
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_html_disguised_as_text_is_not_served_as_page(self):
+        """HTML с расширением .txt хранится и отдаётся как текст, а не как страница"""
+        html = b'<html><body><script>alert(1)</script></body></html>'
+        self.assertTrue(self._upload('notes.txt', html)['success'])
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.content_type, 'text/plain')
+
+        response = self.client.get(reverse('shift_log:view_attachment', args=[attachment.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response['Content-Type'].startswith('text/html'))
+
+        # Записи, сохранённые с активным типом раньше, отдаются только на скачивание
+        Attachment.objects.filter(pk=attachment.pk).update(content_type='text/html')
+        response = self.client.get(reverse('shift_log:view_attachment', args=[attachment.id]))
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+
+    def test_executable_disguised_as_pdf_is_rejected(self):
+        """Исполняемый файл с расширением .pdf не принимается"""
+        response = self._upload('manual.pdf', b'MZ' + b'\x90' * 100, 'application/pdf')
+        self.assertFalse(response['success'])
+        self.assertFalse(Blob.objects.exists())
+
+    def test_chunked_init_reuses_visible_blob(self):
+        """Повторная загрузка уже доступного файла завершается сразу на init"""
+        self._upload('scan.png', self.PNG)
+        response = self.client.post(reverse('shift_log:upload_init'), {
+            'filename': 'again.png',
+            'content_type': 'image/png',
+            'total_size': len(self.PNG),
+            'sha256': hashlib.sha256(self.PNG).hexdigest(),
+            'attachment_type': 'task',
+            'object_id': self.task.id,
+        })
+        data = response.json()
+        self.assertTrue(data['deduplicated'])
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class ImageDerivativeTestCase(TestCase):
+    """Тесты миниатюр и превью изображений"""
+
+    setUp = BlobStorageTestCase.setUp
+    _upload = BlobStorageTestCase._upload
+
+    def _jpeg_with_orientation(self, width, height, orientation):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        Image.new('RGB', (width, height), (200, 40, 40)).save(buffer, 'JPEG', exif=exif)
+        return buffer.getvalue()
+
+    def test_thumbnail_is_rotated_scaled_and_immutable(self):
+        """Миниатюра повёрнута по EXIF, уменьшена и кэшируется как неизменяемая"""
+        self.assertTrue(self._upload('photo.jpg', self._jpeg_with_orientation(800, 400, 6))['success'])
+        blob = Blob.objects.get()
+        self.assertTrue(blob.is_image)
+
+        response = self.client.get(blob.get_derivative_url('thumb', 'webp'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as thumb:
+            self.assertEqual(thumb.size, (160, 320))
+
+        response = self.client.get(
+            blob.get_derivative_url('preview', 'jpg'), HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_derivatives_are_removed_with_blob(self):
+        """Миниатюры и превью удаляются вместе с последней ссылкой на blob"""
+        self._upload('photo.jpg', self._jpeg_with_orientation(64, 64, 1))
+        blob = Blob.objects.get()
+        for variant in DERIVATIVE_SIZES:
+            ensure_derivative(blob, variant, 'jpg')
+        paths = [os.path.join(self.media_root, name) for name in derivative_names(blob.sha256)]
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('shift_log:delete_attachment', args=[Attachment.objects.get().id]))
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(any(os.path.exists(path) for path in paths + [blob.file.path]))
+
+    def test_derivative_requires_access_to_content(self):
+        """Знание хэша не даёт доступа к миниатюре чужого файла"""
+        self._upload('photo.jpg', self._jpeg_with_orientation(64, 64, 1))
+        blob = Blob.objects.get()
+        other = User.objects.create_user(username='other', password='testpass123')
+        Employee.objects.create(
+            user=other, department=Department.objects.create(name='Склад'), position='employee'
+        )
+        self.client.login(username='other', password='testpass123')
+        response = self.client.get(blob.get_derivative_url('thumb', 'jpg'))
+        self.assertEqual(response.status_code, 404)
+
+
+class FileStateTestCase(TestCase):
+    """Тесты сохранённого состояния файлов"""
+
+    setUp = BlobStorageTestCase.setUp
+    _upload = BlobStorageTestCase._upload
+
+    def test_missing_file_is_recorded_and_restored(self):
+        """Пропажа файла сохраняется в записи, повторная загрузка её снимает"""
+        self._upload('notes.txt', b'journal')
+        attachment = Attachment.objects.get()
+        self.assertTrue(attachment.file_present)
+        os.remove(attachment.file.path)
+
+        response = self.client.get(reverse('shift_log:download_attachment', args=[attachment.id]))
+        self.assertFalse(response.json()['success'])
+        attachment.refresh_from_db()
+        self.assertFalse(attachment.file_present)
+        self.assertIsNotNone(attachment.file_checked_at)
+
+        self._upload('again.txt', b'journal')
+        attachment.refresh_from_db()
+        self.assertTrue(attachment.file_present)
+
+    def test_scan_media_updates_flags_and_removes_orphans(self):
+        """scan_media обновляет флаги, удаляет записи без файлов и лишние файлы"""
+        self._upload('a.txt', b'first')
+        self._upload('b.txt', b'second')
+        missing = Attachment.objects.get(filename='a.txt')
+        os.remove(missing.file.path)
+        orphan = os.path.join(self.media_root, 'attachments', 'lost.txt')
+        os.makedirs(os.path.dirname(orphan))
+        with open(orphan, 'wb') as f:
+            f.write(b'lost')
+
+        out = io.StringIO()
+        call_command('scan_media', chunk_size=1, orphan_min_age=0, stdout=out)
+        self.assertIn('проверено 2, файлов не найдено 1', out.getvalue())
+        self.assertIn('без записей 1', out.getvalue())
+        self.assertEqual(
+            dict(Attachment.objects.values_list('filename', 'file_present')),
+            {'a.txt': False, 'b.txt': True}
+        )
+
+        # Повторный запуск проверяет только запись без файла
+        out = io.StringIO()
+        call_command('scan_media', delete_missing=True, delete_orphans=True,
+                     orphan_min_age=0, stdout=out)
+        self.assertIn('проверено 1, файлов не найдено 1', out.getvalue())
+        self.assertEqual(list(Attachment.objects.values_list('filename', flat=True)), ['b.txt'])
+        self.assertEqual(Blob.objects.count(), 1)
+        # Лишний файл найден прошлым проходом и удалён, хотя каталог не менялся
+        self.assertFalse(os.path.exists(orphan))
+
+        out = io.StringIO()
+        call_command('scan_media', full=True, verify_checksums=True, stdout=out)
+        self.assertIn('проверено 1, файлов не найдено 0, повреждено 0', out.getvalue())
+
+
+class ShiftGenerationTestCase(TestCase):
+    """Тесты пакетной генерации смен"""
+
+    def setUp(self):
+        self.departments = [Department.objects.create(name=f'Цех {n}') for n in (1, 2)]
+        for department in self.departments:
+            ShiftType.objects.create(
+                name='Дневная', department=department, start_time=time(8), end_time=time(16),
+                periodicity='weekly', working_days='1,2,3,4,5'
+            )
+            ShiftType.objects.create(
+                name='Суточная', department=department, start_time=time(8), end_time=time(8),
+                is_overnight=True, periodicity='daily'
+            )
+        user = User.objects.create_user(username='worker')
+        self.employee = Employee.objects.create(user=user, department=self.departments[0])
+        self.start, self.end = date(2025, 1, 1), date(2025, 12, 31)
+
+    def test_year_generation_is_bulk_and_idempotent(self):
+        """Год смен создаётся постоянным числом запросов, повторный запуск ничего не создаёт"""
+        with CaptureQueriesContext(connection) as queries:
+            results = ShiftGenerationService.generate(
+                self.departments, self.start, self.end, employees=[self.employee]
+            )
+        # Раньше — запрос на каждую дату; теперь только пачки INSERT (SQLite дробит их мельче)
+        self.assertLess(len(queries), 50)
+        self.assertEqual([r['total_shifts_created'] for r in results], [261 + 365] * 2)
+        self.assertEqual(Shift.objects.count(), 2 * (261 + 365))
+        # Суточная смена пересекается с дневной: в будни сотрудник назначается на дневную,
+        # в выходные — на суточную, а на такие же смены второго цеха не назначается
+        self.assertEqual(ShiftAssignment.objects.filter(employee=self.employee).count(), 365)
+        self.assertEqual([len(r['skipped_assignments']) for r in results], [261, 261 + 365])
+        self.assertFalse([
+            conflict for conflict in ShiftConflictService.for_employee(self.employee, self.start, self.end)
+            if conflict.kind == 'overlap'
+        ])
+
+        again = ShiftGenerationService.generate(self.departments, self.start, self.end)
+        self.assertEqual([r['total_shifts_created'] for r in again], [0, 0])
+
+    def test_dry_run_reports_diff_without_writing(self):
+        """Пробный запуск показывает недостающие даты и ничего не создаёт"""
+        daily = ShiftType.objects.get(department=self.departments[0], name='Суточная')
+        Shift.objects.create(date=date(2025, 1, 2), shift_type=daily)
+
+        result = ShiftGenerationService.generate_for_department(
+            self.departments[0], date(2025, 1, 1), date(2025, 1, 3), dry_run=True
+        )
+        diff = {entry['shift_type']: entry for entry in result['diff']}
+        self.assertEqual(diff['Суточная']['existing'], 1)
+        self.assertEqual(diff['Суточная']['missing'], [date(2025, 1, 1), date(2025, 1, 3)])
+        self.assertEqual(len(diff['Дневная']['missing']), 3)
+        self.assertEqual(Shift.objects.count(), 1)
+
+    def test_generation_skips_assignments_overlapping_existing_shifts(self):
+        """Дневная смена 7-го, попадающая на ночную смену сотрудника, не назначается"""
+        night = ShiftType.objects.create(
+            name='Ночная', department=self.departments[1], start_time=time(20), end_time=time(10),
+            is_overnight=True, periodicity='daily', is_active=False
+        )
+        ShiftAssignment.objects.create(
+            shift=Shift.objects.create(date=date(2025, 1, 6), shift_type=night), employee=self.employee
+        )
+        ShiftType.objects.filter(department=self.departments[0], name='Суточная').update(is_active=False)
+
+        result = ShiftGenerationService.generate_for_department(
+            self.departments[0], date(2025, 1, 6), date(2025, 1, 8), employees=[self.employee]
+        )
+        self.assertEqual(len(result['skipped_assignments']), 1)
+        self.assertEqual(
+            sorted(ShiftAssignment.objects.filter(
+                employee=self.employee, shift__shift_type__name='Дневная'
+            ).values_list('shift__date', flat=True)),
+            [date(2025, 1, 6), date(2025, 1, 8)]
+        )
+
+
+class ShiftRecurrenceTestCase(TestCase):
+    """Тесты правил повторения и календаря типов смен"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+
+    def _shift_type(self, **kwargs):
+        defaults = {'name': 'Смена', 'department': self.department,
+                    'start_time': time(8), 'end_time': time(16)}
+        defaults.update(kwargs)
+        return ShiftType.objects.create(**defaults)
+
+    def test_monthly_day_is_clamped_to_month_end(self):
+        """31-е число в коротких месяцах переносится на последний день"""
+        shift_type = self._shift_type(periodicity='monthly', day_of_month=31)
+        self.assertEqual(
+            shift_type.recurrence.between(date(2024, 1, 1), date(2024, 4, 30)),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)]
+        )
+        self.assertTrue(shift_type.is_working_day(date(2023, 2, 28)))
+
+    def test_interval_and_biweekly_are_anchored(self):
+        """Отсчёт «через день» и «раз в две недели» ведётся от даты начала действия"""
+        every_2 = self._shift_type(periodicity='every_2_days', start_date=date(2025, 1, 2))
+        self.assertEqual(
+            every_2.recurrence.between(date(2024, 12, 25), date(2025, 1, 7)),
+            [date(2025, 1, 2), date(2025, 1, 4), date(2025, 1, 6)]
+        )
+        self.assertEqual(every_2.get_next_shift_date(date(2025, 1, 2)), date(2025, 1, 4))
+
+        biweekly = self._shift_type(
+            periodicity='biweekly', working_days='1,3', start_date=date(2025, 1, 6),
+            end_date=date(2025, 1, 31)
+        )
+        self.assertEqual(
+            biweekly.recurrence.between(date(2025, 1, 1), date(2025, 2, 28)),
+            [date(2025, 1, 6), date(2025, 1, 8), date(2025, 1, 20), date(2025, 1, 22)]
+        )
+        self.assertIsNone(biweekly.get_next_shift_date(date(2025, 1, 22)))
+
+    def test_validate_shift_pattern(self):
+        """Проверка паттерна сообщает об ошибках вместо падения"""
+        self.assertEqual(validate_shift_pattern(self._shift_type(periodicity='weekly')), [])
+        errors = validate_shift_pattern(self._shift_type(
+            periodicity='weekly', working_days='1,9', start_date=date(2025, 2, 1),
+            end_date=date(2025, 1, 1)
+        ))
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(len(validate_shift_pattern(self._shift_type(periodicity='custom'))), 1)
+
+    @override_settings(SHIFT_CALENDAR_PAST_DAYS=0, SHIFT_CALENDAR_HORIZON_DAYS=13)
+    def test_calendar_is_rebuilt_on_save(self):
+        """Сохранение типа смены перестраивает календарь, выборка дат идёт по нему"""
+        today = timezone.localdate()
+        shift_type = self._shift_type(periodicity='every_2_days', start_date=today)
+        self.assertEqual(shift_type.occurrences.count(), 7)
+        with self.assertNumQueries(1):
+            planned = ShiftCalendar.dates_between([shift_type], today, today + timedelta(days=4))
+        self.assertEqual(planned, {shift_type.id: [today, today + timedelta(days=2), today + timedelta(days=4)]})
+
+        shift_type.periodicity = 'daily'
+        shift_type.save()
+        self.assertEqual(shift_type.occurrences.count(), 14)
+
+        # Внутри окна даты читаются из таблицы, за его пределами — вычисляются по правилу
+        shift_type.occurrences.filter(date=today + timedelta(days=1)).delete()
+        self.assertEqual(
+            ShiftCalendar.dates_between([shift_type], today + timedelta(days=12), today + timedelta(days=15)),
+            {shift_type.id: [today + timedelta(days=d) for d in (12, 13, 14, 15)]}
+        )
+        self.assertNotIn(
+            today + timedelta(days=1),
+            ShiftCalendar.dates_between([shift_type], today, today + timedelta(days=2))[shift_type.id]
+        )
+        self.assertEqual(
+            ShiftCalendar.extend([shift_type], today, today + timedelta(days=19)), 6
+        )
+
+        shift_type.is_active = False
+        shift_type.save()
+        self.assertFalse(shift_type.occurrences.exists())
+
+    def test_generate_shifts_command_dry_run(self):
+        """Команда generate_shifts проходит валидацию и строит план"""
+        self._shift_type(periodicity='weekly', working_days='1,2,3,4,5')
+        out = io.StringIO()
+        call_command('generate_shifts', '--dry-run', '--start-date', '2025-01-06',
+                     '--end-date', '2025-01-12', stdout=out)
+        self.assertIn('будет создано 5', out.getvalue())
+        self.assertFalse(Shift.objects.exists())
+
+
+class ShiftScheduleTestCase(TestCase):
+    """Тесты графика смен отдела на месяц"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='Цех')
+        self.day = ShiftType.objects.create(
+            name='Дневная', department=self.department, start_time=time(8), end_time=time(20),
+            periodicity='daily'
+        )
+        self.night = ShiftType.objects.create(
+            name='Ночная', department=self.department, start_time=time(20), end_time=time(8),
+            is_overnight=True, periodicity='daily'
+        )
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass', last_name='Борисов'),
+            department=self.department, position='supervisor'
+        )
+        self.worker = Employee.objects.create(
+            user=User.objects.create_user(username='worker', password='pass', last_name='Алексеев'),
+            department=self.department, position='employee'
+        )
+        for day in (1, 2):
+            shift = Shift.objects.create(date=date(2025, 2, day), shift_type=self.day)
+            ShiftAssignment.objects.create(shift=shift, employee=self.worker)
+        shift = Shift.objects.create(date=date(2025, 2, 2), shift_type=self.night)
+        ShiftAssignment.objects.create(shift=shift, employee=self.worker)
+        ShiftAssignment.objects.create(shift=shift, employee=self.supervisor)
+
+    def test_grid_is_built_from_two_queries_and_cached(self):
+        """Сетка строится двумя запросами, повторное обращение берёт её из кэша"""
+        with self.assertNumQueries(2):
+            grid = ShiftScheduleService.get_month(self.department.pk, 2025, 2)
+        with self.assertNumQueries(0):
+            ShiftScheduleService.get_month(self.department.pk, 2025, 2)
+
+        self.assertEqual(grid['days'], 28)
+        self.assertEqual([row['name'] for row in grid['rows']], ['Алексеев', 'Борисов'])
+        worker_row = grid['rows'][0]
+        self.assertEqual(len(worker_row['cells']), 28)
+        self.assertEqual(
+            [[grid['shift_types'][i]['name'] for i, _ in cell] for cell in worker_row['cells'][:3]],
+            [['Дневная'], ['Дневная', 'Ночная'], []]
+        )
+        self.assertEqual((worker_row['shifts'], worker_row['hours']), (3, 36.0))
+
+    def test_cache_is_invalidated_by_changes(self):
+        """Изменение назначений и пакетная генерация сбрасывают кэш месяца"""
+        ShiftScheduleService.get_month(self.department.pk, 2025, 2)
+        ShiftAssignment.objects.filter(employee=self.supervisor).get().delete()
+        grid = ShiftScheduleService.get_month(self.department.pk, 2025, 2)
+        self.assertEqual([row['shifts'] for row in grid['rows']], [3, 0])
+
+        ShiftGenerationService.generate(
+            [self.department], date(2025, 2, 10), date(2025, 2, 10), employees=[self.supervisor]
+        )
+        grid = ShiftScheduleService.get_month(self.department.pk, 2025, 2)
+        self.assertEqual(grid['rows'][1]['shifts'], 2)
+
+    def test_grid_lists_free_employees_and_follows_renames(self):
+        """В сетке есть сотрудники без смен; имена и типы смен обновляются сразу"""
+        newcomer = Employee.objects.create(
+            user=User.objects.create_user(username='newcomer', last_name='Васильев'),
+            department=self.department
+        )
+        grid = ShiftScheduleService.get_month(self.department.pk, 2025, 2)
+        self.assertEqual([row['name'] for row in grid['rows']], ['Алексеев', 'Борисов', 'Васильев'])
+        self.assertEqual(grid['rows'][2]['shifts'], 0)
+
+        self.worker.user.last_name = 'Абрамов'
+        self.worker.user.save()
+        self.day.name = 'Утренняя'
+        self.day.save()
+        grid = ShiftScheduleService.get_month(self.department.pk, 2025, 2)
+        self.assertEqual(grid['rows'][0]['name'], 'Абрамов')
+        self.assertIn('Утренняя', [shift_type['name'] for shift_type in grid['shift_types']])
+
+        # Вход в систему (last_login) кэш не сбрасывает
+        self.client.login(username='worker', password='pass')
+        with self.assertNumQueries(0):
+            ShiftScheduleService.get_month(self.department.pk, 2025, 2)
+
+        newcomer.is_active = False
+        newcomer.save()
+        other = Department.objects.create(name='Склад')
+        ShiftScheduleService.get_month(other.pk, 2025, 2)
+        self.supervisor.department = other
+        self.supervisor.save()
+        self.assertEqual(
+            [row['name'] for row in ShiftScheduleService.get_month(self.department.pk, 2025, 2)['rows']],
+            ['Абрамов', 'Борисов']
+        )
+        self.assertEqual(
+            [row['name'] for row in ShiftScheduleService.get_month(other.pk, 2025, 2)['rows']], ['Борисов']
+        )
+
+    def test_view_limits_employee_to_own_row(self):
+        """Руководитель видит весь отдел, сотрудник — только свою строку"""
+        url = reverse('shift_log:shift_schedule') + '?month=2025-02'
+        self.client.login(username='boss', password='pass')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['rows']), 2)
+
+        self.client.login(username='worker', password='pass')
+        response = self.client.get(url)
+        self.assertEqual([row['name'] for row in response.context['rows']], ['Алексеев'])
+
+
+class CalendarFeedTestCase(TestCase):
+    """Тесты лент календаря смен (.ics)"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        shift_type = ShiftType.objects.create(
+            name='Ночная; усиленная', department=self.department, start_time=time(20),
+            end_time=time(8), is_overnight=True, periodicity='daily'
+        )
+        self.employee = Employee.objects.create(
+            user=User.objects.create_user(username='worker', first_name='Иван', last_name='Петров'),
+            department=self.department
+        )
+        self.shift = Shift.objects.create(date=timezone.localdate(), shift_type=shift_type)
+        ShiftAssignment.objects.create(shift=self.shift, employee=self.employee)
+        Shift.objects.create(date=timezone.localdate(), shift_type=ShiftType.objects.create(
+            name='Чужая', department=self.department, start_time=time(8), end_time=time(20)
+        ))
+        self.url = reverse('shift_log:employee_calendar_feed', args=[self.employee.get_calendar_token()])
+
+    def test_feed_is_streamed_ics(self):
+        """Лента отдаётся потоком и содержит только смены сотрудника"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:shift-{self.shift.pk}@', body)
+        self.assertIn('SUMMARY:Ночная\\; усиленная', body)
+        self.assertTrue(all(len(line.encode('utf-8')) <= 75 for line in body.split('\r\n')))
+
+    def test_conditional_get_returns_304_until_schedule_changes(self):
+        """Повторный опрос с ETag получает 304, изменение смены — новую ленту"""
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(2):
+            # Сотрудник по токену и агрегат валидаторов — смены не читаются
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.shift.notes = 'Перенос'
+        self.shift.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_token_controls_access(self):
+        """Неизвестный токен и старый токен после сброса дают 404, лента отдела — только руководителю"""
+        self.assertEqual(self.client.get(
+            reverse('shift_log:employee_calendar_feed', args=['wrong'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse(
+            'shift_log:department_calendar_feed', args=[self.employee.calendar_token])).status_code, 404)
+
+        self.employee.reset_calendar_token()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ShiftConflictTestCase(TestCase):
+    """Тесты поиска конфликтов назначений"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        self.night = ShiftType.objects.create(
+            name='Ночная', department=self.department, start_time=time(20), end_time=time(8),
+            is_overnight=True
+        )
+        self.morning = ShiftType.objects.create(
+            name='Утренняя', department=self.department, start_time=time(7), end_time=time(15)
+        )
+        self.evening = ShiftType.objects.create(
+            name='Вечерняя', department=self.department, start_time=time(15), end_time=time(23)
+        )
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass'),
+            department=self.department, position='supervisor'
+        )
+        self.worker = Employee.objects.create(
+            user=User.objects.create_user(username='worker', password='pass'), department=self.department
+        )
+        self.night_shift = Shift.objects.create(date=date(2025, 3, 3), shift_type=self.night)
+        ShiftAssignment.objects.create(shift=self.night_shift, employee=self.worker)
+
+    def test_overlap_is_rejected_by_clean(self):
+        """Утренняя смена, начинающаяся до конца ночной, не проходит full_clean()"""
+        morning = Shift.objects.create(date=date(2025, 3, 4), shift_type=self.morning)
+        with self.assertRaises(ValidationError):
+            ShiftAssignment(shift=morning, employee=self.worker).full_clean()
+        # save() не проверяет конфликты — это дело вызывающего кода
+        ShiftAssignment.objects.create(shift=morning, employee=self.worker)
+
+        conflicts = ShiftConflictService.for_employee(self.worker, date(2025, 3, 1), date(2025, 3, 31))
+        self.assertEqual([conflict.kind for conflict in conflicts], ['overlap'])
+        self.assertEqual(conflicts[0].rest, timedelta(hours=-1))
+
+    def test_rest_violation_is_reported_by_clean_and_department_sweep(self):
+        """Нехватка отдыха допускается при сохранении, но видна в clean() и проверке отдела"""
+        evening = Shift.objects.create(date=date(2025, 3, 4), shift_type=self.evening)
+        assignment = ShiftAssignment.objects.create(shift=evening, employee=self.worker)
+        with self.assertRaises(ValidationError):
+            assignment.clean()
+
+        with self.assertNumQueries(1):
+            conflicts = ShiftConflictService.for_department(self.department, date(2025, 3, 1), date(2025, 3, 31))
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual((conflicts[0].kind, conflicts[0].rest), ('rest', timedelta(hours=7)))
+        self.assertEqual(
+            ShiftConflictService.for_department(
+                self.department, date(2025, 3, 1), date(2025, 3, 31), min_rest=timedelta(hours=6)
+            ), []
+        )
+
+    def test_assignment_form_checks_all_employees_in_one_query(self):
+        """Форма назначения проверяет всех выбранных сотрудников одним запросом конфликтов"""
+        morning = Shift.objects.create(date=date(2025, 3, 4), shift_type=self.morning)
+        form = ShiftAssignmentForm(
+            data={'employees': [self.worker.pk, self.supervisor.pk]},
+            instance=Shift.objects.select_related('shift_type').get(pk=morning.pk)
+        )
+        # Выбор сотрудников и конфликты
+        with self.assertNumQueries(2):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(len(form.errors['employees']), 1)
+        self.assertTrue(form.errors['employees'][0].startswith('worker: Смены пересекаются'))
+
+    def test_api_and_command(self):
+        """API отдаёт конфликты отдела руководителю, команда печатает отчёт"""
+        evening = Shift.objects.create(date=date(2025, 3, 4), shift_type=self.evening)
+        ShiftAssignment.objects.create(shift=evening, employee=self.worker)
+
+        self.client.login(username='boss', password='pass')
+        response = self.client.get(reverse('shift_log:api_shift_conflicts'),
+                                   {'date_from': '2025-03-01', 'date_to': '2025-03-31'})
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['conflicts'][0]['shift_ids'], [self.night_shift.pk, evening.pk])
+
+        out = io.StringIO()
+        call_command('check_shift_conflicts', '--start-date', '2025-03-01', '--end-date', '2025-03-31',
+                     stdout=out)
+        self.assertIn('Найдено конфликтов: 1', out.getvalue())
+
+
+class ReplacementTestCase(TestCase):
+    """Тесты подбора замены на смену"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        self.day = ShiftType.objects.create(
+            name='Дневная', department=self.department, start_time=time(8), end_time=time(20)
+        )
+        self.night = ShiftType.objects.create(
+            name='Ночная', department=self.department, start_time=time(20), end_time=time(8),
+            is_overnight=True
+        )
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass', last_name='Я'),
+            department=self.department, position='supervisor'
+        )
+        self.busy, self.tired, self.loaded, self.free = [
+            Employee.objects.create(
+                user=User.objects.create_user(username=name, last_name=name), department=self.department
+            )
+            for name in ('busy', 'tired', 'loaded', 'free')
+        ]
+        # Смена, на которую ищем замену: среда 5 марта, день
+        self.shift = Shift.objects.create(date=date(2025, 3, 5), shift_type=self.day)
+        ShiftAssignment.objects.create(shift=self.shift, employee=self.supervisor)
+        # busy — ночная смена накануне (до 08:00 5-го), tired — ночная сразу после дневной,
+        # loaded — свободен, но уже отработал смену на этой неделе
+        ShiftAssignment.objects.create(
+            shift=Shift.objects.create(date=date(2025, 3, 4), shift_type=self.night), employee=self.busy
+        )
+        ShiftAssignment.objects.create(
+            shift=Shift.objects.create(date=date(2025, 3, 5), shift_type=self.night), employee=self.tired
+        )
+        ShiftAssignment.objects.create(
+            shift=Shift.objects.create(date=date(2025, 3, 3), shift_type=self.day), employee=self.loaded
+        )
+
+    def test_candidates_are_filtered_and_ranked(self):
+        """Занятые и не успевающие отдохнуть исключаются, менее загруженные — первыми"""
+        with self.assertNumQueries(2):
+            # Сотрудники отдела и занятость за окно
+            candidates = ReplacementService.find_candidates(self.shift)
+        self.assertEqual([c['employee'] for c in candidates], [self.free, self.loaded])
+        self.assertEqual(candidates[1]['week_hours'], 12)
+
+    def test_one_click_assign_and_batched_notifications(self):
+        """Назначение из списка кандидатов и рассылка запроса выбранным"""
+        self.client.login(username='boss', password='pass')
+        url = reverse('shift_log:shift_replacements', args=[self.shift.pk])
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['candidates']), 2)
+
+        with self.assertNumQueries(6):
+            # Сессия, пользователь, сотрудник, смена, кандидаты, bulk_create уведомлений
+            self.client.post(url, {'action': 'notify', 'employee_ids': [self.free.pk, self.loaded.pk]})
+        self.assertEqual(Notification.objects.filter(notification_type='shift_replacement').count(), 2)
+
+        self.client.post(url, {'action': 'assign', 'employee_id': self.free.pk})
+        self.assertTrue(self.shift.has_employee(self.free))
+        self.assertTrue(Notification.objects.filter(recipient=self.free, notification_type='shift_assigned').exists())
+
+        # Не успевающего отдохнуть назначить нельзя
+        self.client.post(url, {'action': 'assign', 'employee_id': self.tired.pk})
+        self.assertFalse(self.shift.has_employee(self.tired))
+
+
+class LaborHoursTestCase(TestCase):
+    """Тесты сводки рабочего времени"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        self.day = ShiftType.objects.create(
+            name='Дневная', department=self.department, start_time=time(8), end_time=time(20)
+        )
+        self.night = ShiftType.objects.create(
+            name='Ночная', department=self.department, start_time=time(20), end_time=time(8),
+            is_overnight=True
+        )
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass', last_name='Б'),
+            department=self.department, position='supervisor'
+        )
+        self.worker = Employee.objects.create(
+            user=User.objects.create_user(username='worker', last_name='А'), department=self.department
+        )
+        tz = timezone.get_current_timezone()
+        # Ночная смена: по плану 12 ч, факт 20:10–09:10 — опоздание 10 мин и 1 ч переработки
+        self.night_shift = Shift.objects.create(
+            date=date(2025, 3, 3), shift_type=self.night,
+            actual_start_time=datetime(2025, 3, 3, 20, 10, tzinfo=tz),
+            actual_end_time=datetime(2025, 3, 4, 9, 10, tzinfo=tz),
+        )
+        # Дневная смена без факта и отменённая смена
+        self.day_shift = Shift.objects.create(date=date(2025, 3, 5), shift_type=self.day)
+        cancelled = Shift.objects.create(date=date(2025, 3, 7), shift_type=self.day, is_cancelled=True)
+        for shift in (self.night_shift, self.day_shift, cancelled):
+            ShiftAssignment.objects.create(shift=shift, employee=self.worker)
+
+    def test_month_totals(self):
+        """План через полночь, переработка, опоздания и смены без факта"""
+        rows = LaborHoursService.report(self.department, 2025, 3)
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row.employee, self.worker)
+        self.assertEqual(row.shifts, 2)
+        self.assertEqual(row.planned_minutes, 24 * 60)
+        self.assertEqual(row.actual_minutes, 13 * 60)
+        self.assertEqual(row.overtime_minutes, 60)
+        self.assertEqual((row.late_starts, row.late_minutes), (1, 10))
+        self.assertEqual(row.missing_actuals, 1)
+
+    def test_rollup_recomputed_only_on_change(self):
+        """Неизменённый месяц берётся из сводки, изменение смены вызывает пересчёт"""
+        summary = LaborHoursService.get_month(self.department, 2025, 3)
+        with self.assertNumQueries(2):
+            # Отпечаток и сохранённая сводка
+            self.assertEqual(LaborHoursService.get_month(self.department, 2025, 3), summary)
+
+        self.day_shift.actual_start_time = timezone.make_aware(datetime(2025, 3, 5, 8))
+        self.day_shift.actual_end_time = timezone.make_aware(datetime(2025, 3, 5, 20))
+        self.day_shift.save()
+        row = LaborHoursService.report(self.department, 2025, 3)[0]
+        self.assertEqual(row.actual_minutes, 25 * 60)
+        self.assertEqual(row.missing_actuals, 0)
+
+    def test_csv_download(self):
+        """Руководитель выгружает сводку в CSV"""
+        self.client.login(username='boss', password='pass')
+        response = self.client.get(reverse('shift_log:labor_hours_report'), {'month': '2025-03', 'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = response.content.decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(';')[0], 'Сотрудник')
+        self.assertEqual(lines[1].split(';')[1:5], ['2', '24,00', '13,00', '1,00'])
+
+
+class BulkAssignmentTestCase(TestCase):
+    """Тесты массового назначения на смены"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        self.day = ShiftType.objects.create(
+            name='Дневная', department=self.department, start_time=time(8), end_time=time(20)
+        )
+        self.night = ShiftType.objects.create(
+            name='Ночная', department=self.department, start_time=time(20), end_time=time(8),
+            is_overnight=True
+        )
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass'),
+            department=self.department, position='supervisor'
+        )
+        self.crews = [
+            [Employee.objects.create(user=User.objects.create_user(username=f'{crew}{i}'),
+                                     department=self.department).pk for i in range(2)]
+            for crew in 'abc'
+        ]
+        self.shifts = [
+            Shift.objects.create(date=date(2025, 3, 1) + timedelta(days=i), shift_type=self.day)
+            for i in range(6)
+        ]
+
+    def test_rotation_in_one_transaction(self):
+        """Ротация трёх бригад: бригады по кругу, число запросов не зависит от числа смен"""
+        plan = BulkAssignmentService.rotation(self.shifts, self.crews)
+        with self.assertNumQueries(7):
+            # Savepoint и его освобождение, сотрудники, смены, текущие назначения,
+            # интервалы для проверки конфликтов, bulk_create
+            result = BulkAssignmentService.apply(plan)
+        self.assertTrue(result['applied'])
+        self.assertEqual(result['created'], 12)
+        self.assertEqual(set(self.shifts[0].employees.values_list('pk', flat=True)), set(self.crews[0]))
+        self.assertEqual(set(self.shifts[4].employees.values_list('pk', flat=True)), set(self.crews[1]))
+
+        # Повторная ротация со сдвигом с заменой составов
+        shifted = BulkAssignmentService.rotation(self.shifts, self.crews, offset=1)
+        result = BulkAssignmentService.apply(shifted, replace=True)
+        self.assertEqual((result['created'], result['deleted']), (12, 12))
+        self.assertEqual(set(self.shifts[0].employees.values_list('pk', flat=True)), set(self.crews[1]))
+
+    def test_conflicts_block_whole_batch(self):
+        """Нехватка отдыха отклоняет всю пачку, пока её не разрешат явно"""
+        night = Shift.objects.create(date=date(2025, 3, 1), shift_type=self.night)
+        worker = self.crews[0][0]
+        result = BulkAssignmentService.apply({night.pk: [worker], self.shifts[1].pk: [worker]})
+        self.assertFalse(result['applied'])
+        self.assertEqual([conflict.kind for conflict in result['conflicts']], ['rest'])
+        self.assertFalse(ShiftAssignment.objects.exists())
+
+        result = BulkAssignmentService.apply(
+            {night.pk: [worker], self.shifts[1].pk: [worker]}, allow_rest_violations=True
+        )
+        self.assertTrue(result['applied'])
+        result = BulkAssignmentService.apply({self.shifts[1].pk: [self.crews[1][0]]},
+                                             unassign={self.shifts[1].pk: [worker]})
+        self.assertEqual((result['created'], result['deleted']), (1, 1))
+
+    def test_api(self):
+        """Руководитель задаёт ротацию месяца одним запросом"""
+        self.client.login(username='boss', password='pass')
+        url = reverse('shift_log:api_shift_bulk_assign')
+        response = self.client.post(url, json.dumps({
+            'rotation': {'date_from': '2025-03-01', 'date_to': '2025-03-31', 'crews': self.crews},
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 12)
+
+        response = self.client.post(url, json.dumps({
+            'operations': [{'action': 'assign', 'shift_ids': [self.shifts[0].pk], 'employee_ids': [0]}],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_api_supervisor_limited_to_own_department(self):
+        """Руководитель не назначает и не снимает сотрудников других отделов"""
+        other_department = Department.objects.create(name='Склад')
+        stranger = Employee.objects.create(
+            user=User.objects.create_user(username='stranger'), department=other_department
+        )
+        ShiftAssignment.objects.create(shift=self.shifts[1], employee=stranger)
+        self.client.login(username='boss', password='pass')
+        url = reverse('shift_log:api_shift_bulk_assign')
+
+        for payload in (
+            {'operations': [{'action': 'assign', 'shift_ids': [self.shifts[0].pk], 'employee_ids': [stranger.pk]}]},
+            {'operations': [{'action': 'unassign', 'shift_ids': [self.shifts[1].pk], 'employee_ids': [stranger.pk]}]},
+            {'operations': [{'action': 'assign', 'shift_ids': [self.shifts[1].pk],
+                             'employee_ids': [self.crews[0][0]]}], 'replace': True},
+        ):
+            response = self.client.post(url, json.dumps(payload), content_type='application/json')
+            self.assertEqual(response.status_code, 403)
+        self.assertEqual(list(ShiftAssignment.objects.values_list('employee_id', flat=True)), [stranger.pk])
+
+
+class DailyReportEntryTestCase(TestCase):
+    """Тесты записей ежедневного отчёта"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        self.first, self.second = [
+            Employee.objects.create(
+                user=User.objects.create_user(username=name, password='pass'), department=self.department
+            )
+            for name in ('first', 'second')
+        ]
+        self.report = DailyReport.objects.create(
+            department=self.department, date=timezone.localdate(), comment='Текст до записей'
+        )
+
+    def test_dashboard_appends_entries(self):
+        """Каждая отправка — отдельная запись; строка отчёта не перезаписывается"""
+        updated_at = self.report.updated_at
+        for employee, text in ((self.first, 'Запуск линии'), (self.second, 'Замена фильтра')):
+            self.client.login(username=employee.user.username, password='pass')
+            self.client.post(reverse('shift_log:dashboard'), {'daily_report_submit': '1', 'comment': text})
+
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.updated_at, updated_at)
+        self.assertEqual(self.report.comment, 'Текст до записей')
+        self.assertEqual(
+            [(entry.author, entry.text) for entry in self.report.entries.all()],
+            [(self.first, 'Запуск линии'), (self.second, 'Замена фильтра')]
+        )
+        self.assertEqual(self.report.text, 'Текст до записей\nЗапуск линии\nЗамена фильтра')
+        self.assertEqual(self.report.created_by, self.second.user)
+
+    def test_close_materializes_text_once(self):
+        """Закрытие дня собирает записи в comment; повторное закрытие ничего не меняет"""
+        self.report.add_entry(self.first, 'Запуск линии')
+        self.assertTrue(self.report.close())
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.comment, 'Текст до записей\nЗапуск линии')
+        self.assertEqual(self.report.pending_entries(), [])
+        self.assertFalse(self.report.close())
+
+        # Запись после закрытия показывается поверх собранного текста
+        self.report.add_entry(self.second, 'Поздняя запись')
+        self.assertEqual(self.report.text, 'Текст до записей\nЗапуск линии\nПоздняя запись')
+        call_command('close_daily_reports', '--include-today', stdout=io.StringIO())
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.comment, 'Текст до записей\nЗапуск линии\nПоздняя запись')
+
+    def test_entry_committed_after_close_with_lower_id_is_kept(self):
+        """Запись с меньшим id, закоммиченная после закрытия, не теряется"""
+        # id выдаётся при INSERT: долгая транзакция получила id раньше,
+        # а закоммитилась уже после закрытия по более поздней записи
+        reserved = self.report.add_entry(self.first, 'Резерв id')
+        reserved_id = reserved.pk
+        reserved.delete()
+        self.report.add_entry(self.second, 'Замена фильтра')
+        self.assertTrue(self.report.close())
+        late = DailyReportEntry.objects.create(
+            pk=reserved_id, daily_report=self.report, author=self.first, text='Долгая транзакция'
+        )
+
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.pending_entries(), [late])
+        call_command('close_daily_reports', '--include-today', stdout=io.StringIO())
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.comment, 'Текст до записей\nЗамена фильтра\nДолгая транзакция')
+        self.assertEqual(self.report.pending_entries(), [])
+
+
+@override_settings(DAILY_REPORTS_PAGE_SIZE=3, DAILY_REPORTS_DEFAULT_DAYS=30)
+class DailyReportsListTestCase(TestCase):
+    """Тесты списка ежедневных отчётов"""
+
+    def setUp(self):
+        self.admin = Employee.objects.create(
+            user=User.objects.create_user(username='admin', password='pass'),
+            department=Department.objects.create(name='Администрация'), position='admin'
+        )
+        self.departments = [Department.objects.create(name=f'Цех {i}') for i in range(2)]
+        today = timezone.localdate()
+        self.reports = [
+            DailyReport.objects.create(department=department, date=today - timedelta(days=days))
+            for days in range(3) for department in self.departments
+        ]
+        self.old = DailyReport.objects.create(department=self.departments[0], date=today - timedelta(days=90))
+        self.client.login(username='admin', password='pass')
+
+    def test_default_window_and_keyset_pages(self):
+        """По умолчанию — последние 30 дней; страницы по (-date, id) без пропусков и повторов"""
+        url = reverse('shift_log:daily_reports_list')
+        seen = []
+        response = self.client.get(url)
+        while True:
+            seen += [report.pk for report in response.context['reports']]
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+            response = self.client.get(url, {'after': cursor})
+        self.assertEqual(seen, [report.pk for report in self.reports])
+        self.assertNotIn(self.old.pk, seen)
+
+        response = self.client.get(url, {'date_from': self.old.date.isoformat(), 'date_to': self.old.date.isoformat()})
+        self.assertEqual([report.pk for report in response.context['reports']], [self.old.pk])
+
+    def test_page_cost_does_not_depend_on_photos(self):
+        """Фотографии: число — аннотацией, миниатюры — одним запросом, галерея — отдельно"""
+        report = self.reports[0]
+        blob = Blob.objects.create(sha256='0' * 64, size=1, content_type='image/png', file='blobs/x.png')
+        for i in range(8):
+            DailyReportPhoto.objects.create(
+                daily_report=report, image='daily_reports/photos/x.png', blob=blob, uploaded_by=self.admin
+            )
+        url = reverse('shift_log:daily_reports_list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['reports'][0].photo_count, 8)
+        self.assertEqual(len(response.context['reports'][0].preview_photos), 6)
+        photo_queries = [q for q in queries.captured_queries if 'dailyreportphoto' in q['sql']]
+        self.assertEqual(len(photo_queries), 2)
+
+        response = self.client.get(reverse('shift_log:daily_report_photos', args=[report.pk]))
+        self.assertEqual(len(response.json()['photos']), 8)
+
+
+class XlsxExportTestCase(TestCase):
+    """Тесты выгрузки списков в Excel"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass', last_name='Иванов'),
+            department=self.department, position='supervisor'
+        )
+        for i in range(3):
+            Task.objects.create(
+                title=f'Задание {i}', description='-', department=self.department,
+                created_by=self.supervisor, due_date=timezone.now()
+            )
+        self.client.login(username='boss', password='pass')
+
+    def _load(self, response):
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        return load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+
+    def test_tasks_export_respects_filters(self):
+        """Выгружаются все отфильтрованные задания, а не только страница"""
+        sheet = self._load(self.client.get(
+            reverse('shift_log:reports_list'), {'search': 'Задание 1', 'format': 'xlsx'}
+        ))
+        rows = list(sheet.values)
+        self.assertEqual(rows[0][:2], ('№', 'Название'))
+        self.assertEqual([row[1] for row in rows[1:]], ['Задание 1'])
+
+    def test_writeoffs_and_daily_reports_export(self):
+        """Списания и ежедневные отчёты выгружаются с текстом записей"""
+        MaterialWriteOff.objects.create(
+            material_name='Болт', quantity=Decimal('2.50'), destination='Линия 1',
+            department=self.department, created_by=self.supervisor
+        )
+        today = timezone.localdate().isoformat()
+        sheet = self._load(self.client.get(
+            reverse('shift_log:material_writeoff_list'), {'date_from': today, 'date_to': today, 'format': 'xlsx'}
+        ))
+        row = list(sheet.values)[1]
+        self.assertEqual((row[2], row[3], row[6]), ('Болт', 2.5, 'Иванов'))
+
+        report = DailyReport.objects.create(department=self.department, date=timezone.localdate())
+        report.add_entry(self.supervisor, 'Запуск линии')
+        sheet = self._load(self.client.get(reverse('shift_log:daily_reports_list'), {'format': 'xlsx'}))
+        self.assertEqual(list(sheet.values)[1][3], 'Запуск линии')
+
+    def test_user_text_is_not_exported_as_formula(self):
+        """Текст, начинающийся с «=», выгружается строкой, а не формулой"""
+        Task.objects.create(
+            title='=HYPERLINK("http://evil","x")', description='-', department=self.department,
+            created_by=self.supervisor, due_date=timezone.now()
+        )
+        sheet = self._load(self.client.get(
+            reverse('shift_log:reports_list'), {'search': 'HYPERLINK', 'format': 'xlsx'}
+        ))
+        cell = sheet.cell(row=2, column=2)
+        self.assertEqual(cell.value, '=HYPERLINK("http://evil","x")')
+        self.assertEqual(cell.data_type, 's')
+
+    @patch('shift_log.services.xlsx_export.FLUSH_ROWS', 100)
+    def test_stream_starts_before_rows_are_read(self):
+        """Первая порция отдаётся до чтения строк, дальше файл идёт по частям"""
+        consumed = []
+
+        def rows():
+            for i in range(3000):
+                consumed.append(i)
+                # Плохо сжимаемый текст, чтобы zlib отдавал данные по ходу
+                text = hashlib.sha256(str(i).encode()).hexdigest()
+                yield [i, f'{text}\x01', Decimal('1.50'), date(2025, 1, 6),
+                       datetime(2025, 1, 6, 8, 30), None, True]
+
+        stream = stream_xlsx('Лист: [тест]', [('№', 8)] * 7, rows())
+        chunks = [next(stream)]
+        self.assertEqual(consumed, [])
+        chunks.append(next(stream))
+        self.assertLess(len(consumed), 3000)
+        chunks.extend(stream)
+
+        workbook = load_workbook(io.BytesIO(b''.join(chunks)))
+        sheet = workbook.active
+        self.assertEqual(sheet.title, 'Лист   тест ')
+        self.assertEqual(sheet.freeze_panes, 'A2')
+        self.assertTrue(sheet['A1'].font.b)
+        last = list(sheet.values)[3000]
+        self.assertEqual(
+            last, (2999, hashlib.sha256(b'2999').hexdigest(), 1.5, datetime(2025, 1, 6),
+                   datetime(2025, 1, 6, 8, 30), None, True)
+        )
+        self.assertEqual(sheet['D3001'].number_format, 'yyyy-mm-dd')
+
+
+class DailyReportPdfTestCase(TestCase):
+    """Тесты PDF-сводки отдела за день"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.department = Department.objects.create(name='Цех')
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass', last_name='Иванов'),
+            department=self.department, position='supervisor'
+        )
+        self.today = timezone.localdate()
+        self.report = DailyReport.objects.create(department=self.department, date=self.today)
+        self.report.add_entry(self.supervisor, 'Запуск линии')
+        MaterialWriteOff.objects.create(
+            material_name='Болт', quantity=Decimal('3'), destination='Линия 1',
+            department=self.department, created_by=self.supervisor
+        )
+
+    def test_cached_until_day_changes(self):
+        """PDF строится один раз и перестраивается только после изменений за день"""
+        name = DailyReportPdf.ensure(self.department, self.today)
+        path = os.path.join(self.media_root, name)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(5), b'%PDF-')
+
+        with patch.object(DailyReportPdf, 'render') as render:
+            self.assertEqual(DailyReportPdf.ensure(self.department, self.today), name)
+        render.assert_not_called()
+
+        # Прежняя версия остаётся до build_daily_pdfs: её имя мог уже получить другой запрос
+        self.report.add_entry(self.supervisor, 'Остановка на обслуживание')
+        changed = DailyReportPdf.ensure(self.department, self.today)
+        self.assertNotEqual(changed, name)
+        self.assertTrue(os.path.exists(path))
+        call_command('build_daily_pdfs', '--date', self.today.isoformat(), stdout=io.StringIO())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, changed)))
+
+    def test_download_rebuilds_pdf_removed_before_serving(self):
+        """Файл, удалённый между построением и отдачей, строится заново"""
+        ensure = DailyReportPdf.ensure
+        calls = []
+
+        def ensure_removed_once(department, day):
+            name = ensure(department, day)
+            if not calls:
+                os.remove(os.path.join(self.media_root, name))
+            calls.append(name)
+            return name
+
+        self.client.login(username='boss', password='pass')
+        url = reverse('shift_log:daily_report_pdf', args=[self.department.pk, self.today.isoformat()])
+        with patch.object(DailyReportPdf, 'ensure', side_effect=ensure_removed_once):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+
+    def test_download_access(self):
+        """Сводку скачивают сотрудники отдела, но не других отделов"""
+        url = reverse('shift_log:daily_report_pdf', args=[self.department.pk, self.today.isoformat()])
+        self.client.login(username='boss', password='pass')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+        Employee.objects.create(
+            user=User.objects.create_user(username='other', password='pass'),
+            department=Department.objects.create(name='Склад')
+        )
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class WriteOffSummaryTestCase(TestCase):
+    """Тесты сводки списаний по дням"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        self.employee = Employee.objects.create(
+            user=User.objects.create_user(username='worker', password='pass'),
+            department=self.department
+        )
+        self.today = timezone.localdate()
+
+    def _writeoff(self, material='Болт', quantity='2', destination='Линия 1', **kwargs):
+        return MaterialWriteOff.objects.create(
+            material_name=material, quantity=Decimal(quantity), destination=destination,
+            department=self.department, created_by=self.employee, **kwargs
+        )
+
+    def _totals(self, **kwargs):
+        return [
+            (row['material_name'], row['total_quantity'], row['total_writeoffs'])
+            for row in WriteOffSummaryService.summary(self.today, self.today, **kwargs)
+        ]
+
+    def test_rollup_follows_changes(self):
+        """Создание, изменение и удаление списаний сразу отражаются в сводке"""
+        first = self._writeoff(quantity='2')
+        self._writeoff(quantity='3', destination='Линия 2')
+        self._writeoff(material='Гайка', quantity='10')
+        self.assertEqual(self._totals(), [('Гайка', Decimal('10'), 1), ('Болт', Decimal('5'), 2)])
+
+        first.material_name = 'Гайка'
+        first.save()
+        self.assertEqual(self._totals(), [('Гайка', Decimal('12'), 2), ('Болт', Decimal('3'), 1)])
+
+        first.delete()
+        self.assertEqual(self._totals(group_by=['destination']),
+                         [('Гайка', Decimal('10'), 1), ('Болт', Decimal('3'), 1)])
+
+        expected = list(MaterialWriteOffDaily.objects.values_list('date', 'material_name', 'quantity', 'writeoffs'))
+        WriteOffSummaryService.rebuild()
+        self.assertCountEqual(
+            MaterialWriteOffDaily.objects.values_list('date', 'material_name', 'quantity', 'writeoffs'), expected
+        )
+
+    def test_list_filters_by_local_day(self):
+        """Списание поздно вечером по местному времени попадает в свой день"""
+        writeoff = self._writeoff()
+        late = timezone.make_aware(datetime.combine(self.today - timedelta(days=1), time(23, 30)))
+        MaterialWriteOff.objects.filter(pk=writeoff.pk).update(created_at=late)
+        WriteOffSummaryService.rebuild()
+
+        self.client.login(username='worker', password='pass')
+        day = (self.today - timedelta(days=1)).isoformat()
+        response = self.client.get(reverse('shift_log:material_writeoff_list'), {'date_from': day, 'date_to': day})
+        self.assertEqual(list(response.context['writeoffs']), [writeoff])
+
+        response = self.client.get(reverse('shift_log:material_writeoff_summary'), {'date_from': day, 'date_to': day})
+        self.assertEqual([row['total_writeoffs'] for row in response.context['rows']], [1])
+
+
+class MaterialStockTestCase(TestCase):
+    """Тесты журнала движений и остатков материалов"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Цех')
+        self.employee = Employee.objects.create(
+            user=User.objects.create_user(username='worker', password='pass'),
+            department=self.department
+        )
+
+    def _balance(self, material='Кабель', unit='m'):
+        return MaterialStock.objects.get(department=self.department, material_name=material, unit=unit).balance
+
+    def test_movements_update_balance(self):
+        """Поступления и списания (с исправлением и удалением) меняют остаток"""
+        MaterialStockService.receive(self.department.pk, ' Кабель ', 'm', Decimal('100'), created_by=self.employee)
+        writeoff = MaterialWriteOff.objects.create(
+            material_name='Кабель', quantity=Decimal('30'), unit='m', destination='Линия 1',
+            department=self.department, created_by=self.employee
+        )
+        self.assertEqual(self._balance(), Decimal('70'))
+
+        writeoff.quantity = Decimal('25')
+        writeoff.save()
+        self.assertEqual(self._balance(), Decimal('75'))
+
+        writeoff.delete()
+        stock = MaterialStock.objects.get()
+        self.assertEqual(stock.balance, Decimal('100'))
+        self.assertEqual(
+            list(stock.movements.order_by('id').values_list('kind', 'balance_after')),
+            [('receipt', Decimal('100')), ('writeoff', Decimal('70')), ('correction', Decimal('100')),
+             ('correction', Decimal('75')), ('correction', Decimal('100'))]
+        )
+        with self.assertRaises(ValidationError):
+            MaterialStockService.receive(self.department.pk, 'Кабель', 'm', Decimal('0'))
+
+    def test_check_finds_and_fixes_mismatch(self):
+        """Проверка находит остаток, разошедшийся с журналом, и исправляет его"""
+        MaterialStockService.receive(self.department.pk, 'Кабель', 'm', Decimal('10'))
+        MaterialStockService.adjust(MaterialStock.objects.get(), Decimal('8'), comment='Пересчёт')
+        self.assertEqual(MaterialStockService.check(), [])
+
+        MaterialStock.objects.update(balance=Decimal('5'))
+        mismatches = MaterialStockService.check(fix=True)
+        self.assertEqual([(m.stored, m.expected) for m in mismatches], [(Decimal('5'), Decimal('8'))])
+        self.assertEqual(self._balance(), Decimal('8'))
+        self.assertEqual(MaterialStockService.check(), [])
+
+    def test_migration_records_writeoffs_made_before_stock(self):
+        """Старые списания получают движение, и их исправление не завышает остаток"""
+        migration = import_module('shift_log.migrations.0042_material_writeoff_movements')
+
+        writeoff = MaterialWriteOff.objects.create(
+            material_name='Кабель', quantity=Decimal('30'), unit='m', destination='Линия 1',
+            department=self.department, created_by=self.employee
+        )
+        # Как до журнала остатков: списание есть, движений нет
+        MaterialMovement.objects.all().delete()
+        MaterialStock.objects.all().delete()
+
+        migration.record_past_writeoffs(apps, None)
+        migration.record_past_writeoffs(apps, None)
+        self.assertEqual(self._balance(), Decimal('-30'))
+        self.assertEqual(list(writeoff.movements.values_list('kind', 'quantity')), [('writeoff', Decimal('-30'))])
+
+        writeoff.delete()
+        self.assertEqual(self._balance(), Decimal('0'))
+        self.assertEqual(MaterialStockService.check(), [])
+
+
+class AutocompleteTestCase(TestCase):
+    """Тесты подсказок материалов и проектов заданий"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='Цех')
+        self.supervisor = Employee.objects.create(
+            user=User.objects.create_user(username='boss', password='pass'),
+            department=self.department, position='supervisor'
+        )
+        self.client.login(username='boss', password='pass')
+
+    def test_materials_ranked_by_prefix_and_usage(self):
+        """Сначала начинающиеся с текста, среди них — чаще списываемые"""
+        for name, times in (('Кабель ВВГ', 1), ('Кабель-канал', 3), ('Гофра для кабеля', 5)):
+            for _ in range(times):
+                MaterialWriteOff.objects.create(
+                    material_name=name, quantity=Decimal('1'), destination='Линия',
+                    department=self.department, created_by=self.supervisor
+                )
+        response = self.client.get(reverse('shift_log:api_autocomplete_materials'), {'q': 'Кабел'})
+        self.assertEqual(response.json()['results'][:2], ['Кабель-канал', 'Кабель ВВГ'])
+        self.assertEqual(AutocompleteService.materials('абел', self.department.pk),
+                         ['Гофра для кабеля', 'Кабель-канал', 'Кабель ВВГ'])
+
+        other = Department.objects.create(name='Склад')
+        self.assertEqual(AutocompleteService.materials('абел', other.pk), [])
+
+    @patch('shift_log.services.autocomplete.CANDIDATE_LIMIT', 2)
+    def test_candidate_limit_keeps_prefix_and_frequent_matches(self):
+        """Обрезка кандидатов не отбрасывает начинающиеся с текста и частые названия"""
+        for name, times in (('Гофра для кабеля', 1), ('Лоток под кабель', 1), ('Стяжка для кабеля', 4),
+                            ('Кабель ВВГ', 1), ('Кабель-канал', 2), ('Кабель NYM', 3)):
+            for _ in range(times):
+                MaterialWriteOff.objects.create(
+                    material_name=name, quantity=Decimal('1'), destination='Линия',
+                    department=self.department, created_by=self.supervisor
+                )
+        # Из списаний — два самых частых, из остатков — два первых по алфавиту
+        self.assertEqual(AutocompleteService.materials('Кабел', self.department.pk),
+                         ['Кабель NYM', 'Кабель-канал', 'Кабель ВВГ'])
+        self.assertEqual(AutocompleteService.materials('абел', self.department.pk)[:2],
+                         ['Стяжка для кабеля', 'Кабель NYM'])
+
+    def test_task_projects_and_form(self):
+        """Проекты ищутся через API, а форма задания выводит только выбранный"""
+        used = TaskProject.objects.create(name='Модернизация линии')
+        TaskProject.objects.create(name='Модернизация склада')
+        Task.objects.create(
+            title='Задание', description='-', department=self.department, created_by=self.supervisor,
+            due_date=timezone.now(), project=used
+        )
+        response = self.client.get(reverse('shift_log:api_autocomplete_task_projects'), {'q': 'Модерн', 'limit': 1})
+        self.assertEqual(response.json()['results'], [{'id': used.pk, 'name': 'Модернизация линии'}])
+
+        response = self.client.get(reverse('shift_log:task_create'))
+        self.assertNotContains(response, 'Модернизация')
@@ -1,5 +1,5 @@
 from django.contrib.auth import views as auth_views
-from django.urls import path
+from django.urls import path, re_path
 
 from . import views
 from .views import (MaterialWriteOffCreateView, MaterialWriteOffListView,
@@ -33,18 +33,38 @@ urlpatterns = [
     
     # Отчеты
     path('reports/', views.reports_list, name='reports_list'),
+    path('reports/labor-hours/', views.labor_hours_report, name='labor_hours_report'),
     
     # Ежедневные отчёты
     path('daily-reports/', views.daily_reports_list, name='daily_reports_list'),
+    path('daily-reports/<int:report_id>/photos/', views.daily_report_photos, name='daily_report_photos'),
+    path('daily-reports/pdf/<int:department_id>/<str:day>/', views.daily_report_pdf, name='daily_report_pdf'),
+
+    # График смен
+    path('schedule/', views.shift_schedule, name='shift_schedule'),
+    path('shifts/<int:shift_id>/replacements/', views.shift_replacements, name='shift_replacements'),
+    path('schedule/calendar-token/reset/', views.reset_calendar_token, name='reset_calendar_token'),
+    path('calendar/<str:token>/shifts.ics', views.employee_calendar_feed, name='employee_calendar_feed'),
+    path('calendar/<str:token>/department.ics', views.department_calendar_feed, name='department_calendar_feed'),
     
     # API
     path('api/tasks/<int:task_id>/status/', views.api_task_status_update, name='api_task_status_update'),
     path('api/tasks/<int:task_id>/history/', views.api_task_history, name='api_task_history'),
     path('api/upload-attachment/', views.upload_attachment, name='upload_attachment'),
+    path('api/uploads/', views.upload_init, name='upload_init'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/finalize/', views.upload_finalize, name='upload_finalize'),
     path('attachments/<int:attachment_id>/delete/', views.delete_attachment, name='delete_attachment'),
     path('attachments/<int:attachment_id>/view/', views.view_attachment, name='view_attachment'),
     path('attachments/<int:attachment_id>/download/', views.download_attachment, name='download_attachment'),
+    re_path(r'^derived/(?P<sha256>[0-9a-f]{64})/(?P<variant>thumb|preview)\.(?P<fmt>webp|jpg)$',
+            views.image_derivative, name='image_derivative'),
 
+    path('api/autocomplete/materials/', views.api_autocomplete_materials, name='api_autocomplete_materials'),
+    path('api/autocomplete/task-projects/', views.api_autocomplete_task_projects,
+         name='api_autocomplete_task_projects'),
+    path('api/shift-conflicts/', views.api_shift_conflicts, name='api_shift_conflicts'),
+    path('api/shifts/bulk-assign/', views.api_shift_bulk_assign, name='api_shift_bulk_assign'),
     path('api/get-employees-by-department/', views.get_employees_by_department, name='get_employees_by_department'),
     
     # Уведомления
@@ -59,6 +79,9 @@ urlpatterns = [
 
 urlpatterns += [
     path('materials/writeoff/', MaterialWriteOffListView.as_view(), name='material_writeoff_list'),
+    path('materials/writeoff/summary/', views.material_writeoff_summary, name='material_writeoff_summary'),
+    path('materials/stock/', views.material_stock_list, name='material_stock_list'),
+    path('materials/stock/<int:stock_id>/', views.material_stock_detail, name='material_stock_detail'),
     path('materials/writeoff/create/', MaterialWriteOffCreateView.as_view(), name='material_writeoff_create'),
 ] 
 
@@ -1,6 +1,8 @@
 import logging
-from datetime import date, datetime, timedelta
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import List, Optional, Union
 
 from django.conf import settings
 from django.db import transaction
@@ -8,6 +10,8 @@ from django.utils import timezone
 
 from .models import (ActivityLog, Department, Employee, Notification, Shift,
                      ShiftType)
+from .services.recurrence import WEEKDAY_NAMES
+from .services.shift_generation import ShiftGenerationService
 from .services.telegram_service import TelegramService
 
 logger = logging.getLogger(__name__)
@@ -74,6 +78,43 @@ def send_notification(
         logger.error(f"Error sending notification: {e}")
 
 
+def send_bulk_notifications(
+    recipients: List[Employee],
+    notification_type: str,
+    title: str,
+    message: str
+) -> int:
+    """
+    Отправляет одно уведомление нескольким сотрудникам
+
+    Уведомления создаются одним bulk_create, сообщения в Telegram
+    уходят после фиксации транзакции в фоновом потоке — запрос не ждёт
+    сетевых вызовов к боту.
+
+    Returns:
+        Количество созданных уведомлений
+    """
+    recipients = list(recipients)
+    Notification.objects.bulk_create([
+        Notification(recipient=recipient, notification_type=notification_type, title=title, message=message)
+        for recipient in recipients
+    ])
+    telegram_recipients = [recipient for recipient in recipients if recipient.telegram_id]
+    if telegram_recipients and settings.TELEGRAM_NOTIFICATIONS_ENABLED:
+        def send_all():
+            for recipient in telegram_recipients:
+                send_telegram_notification(recipient, title, message)
+
+        transaction.on_commit(lambda: _notification_executor().submit(send_all))
+    return len(recipients)
+
+
+@lru_cache(maxsize=None)
+def _notification_executor() -> ThreadPoolExecutor:
+    """Один фоновый поток рассылки: сообщения боту уходят по очереди"""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='notifications')
+
+
 def send_telegram_notification(employee: Employee, title: str, message: str) -> None:
     """
     Отправляет уведомление через Telegram
@@ -177,6 +218,27 @@ def get_employee_permissions(employee):
     return permissions
 
 
+def visible_for_user(model, user):
+    """
+    Записи модели, доступные пользователю (model.objects.visible_to)
+
+    Пользователь без профиля сотрудника (например, суперпользователь)
+    видит все записи, как в списках и карточках до переноса правил
+    доступа в QuerySet.
+
+    Args:
+        model: Модель с методом visible_to у менеджера
+        user: Пользователь запроса
+
+    Returns:
+        QuerySet: Доступные записи
+    """
+    employee = getattr(user, 'employee', None)
+    if employee is None:
+        return model.objects.all()
+    return model.objects.visible_to(employee)
+
+
 def format_file_size(size_bytes):
     """
     Форматирует размер файла в читаемый вид
@@ -199,6 +261,43 @@ def format_file_size(size_bytes):
     return f"{size_bytes:.1f} {size_names[i]}"
 
 
+def local_date_range_filter(field: str, date_from: Union[date, str, None] = None,
+                            date_to: Union[date, str, None] = None) -> dict:
+    """
+    Условия фильтра по местным датам для поля даты и времени
+
+    Вместо field__date__gte/lte, которые приводят к дате каждую строку и не
+    используют индекс, даёт полуинтервал [начало date_from, начало
+    следующего за date_to дня) в текущем часовом поясе.
+
+    Args:
+        field: Имя поля DateTimeField
+        date_from: Первый день (date или ГГГГ-ММ-ДД); пустой или неверный не ограничивает
+        date_to: Последний день включительно
+
+    Returns:
+        dict: Аргументы для filter(**...)
+    """
+    def as_date(value):
+        if isinstance(value, str):
+            try:
+                return date.fromisoformat(value) if value else None
+            except ValueError:
+                return None
+        return value
+
+    def day_start(day):
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    date_from, date_to = as_date(date_from), as_date(date_to)
+    lookups = {}
+    if date_from:
+        lookups[f'{field}__gte'] = day_start(date_from)
+    if date_to:
+        lookups[f'{field}__lt'] = day_start(date_to + timedelta(days=1))
+    return lookups
+
+
 def get_task_status_color(status: str) -> str:
     """Возвращает цвет для статуса задания"""
     colors = {
@@ -240,32 +339,11 @@ def create_shifts_for_period(
     Returns:
         Список созданных смен
     """
-    created_shifts = []
-    current_date = start_date
-    
     with transaction.atomic():
-        while current_date <= end_date:
-            if shift_type.is_working_day(current_date):
-                # Проверяем, не существует ли уже смена на эту дату
-                shift, created = Shift.objects.get_or_create(
-                    date=current_date,
-                    shift_type=shift_type,
-                    defaults={
-                        'is_completed': False,
-                    }
-                )
-                
-                if created:
-                    # Назначаем сотрудников, если они указаны
-                    if employees:
-                        shift.employees.set(employees)
-                    
-                    created_shifts.append(shift)
-                    logger.info(f"Создана смена: {shift}")
-            
-            current_date += timedelta(days=1)
-    
-    return created_shifts
+        report = ShiftGenerationService.create_shifts(
+            [shift_type], start_date, end_date, employees
+        )
+    return report[shift_type.id]['created']
 
 
 def generate_shift_schedule(
@@ -286,37 +364,9 @@ def generate_shift_schedule(
     Returns:
         Словарь с результатами генерации
     """
-    shift_types = ShiftType.objects.filter(
-        department=department,
-        is_active=True
+    return ShiftGenerationService.generate_for_department(
+        department, start_date, end_date, employees
     )
-    
-    results = {
-        'department': department.name,
-        'period': f"{start_date} - {end_date}",
-        'total_shifts_created': 0,
-        'shifts_by_type': {},
-        'errors': []
-    }
-    
-    for shift_type in shift_types:
-        try:
-            shifts = create_shifts_for_period(
-                shift_type=shift_type,
-                start_date=start_date,
-                end_date=end_date,
-                employees=employees
-            )
-            
-            results['shifts_by_type'][shift_type.name] = len(shifts)
-            results['total_shifts_created'] += len(shifts)
-            
-        except Exception as e:
-            error_msg = f"Ошибка при создании смен типа '{shift_type.name}': {str(e)}"
-            results['errors'].append(error_msg)
-            logger.error(error_msg)
-    
-    return results
 
 
 def get_employee_schedule(
@@ -373,15 +423,7 @@ def calculate_shift_duration(shift_type: ShiftType) -> float:
     Returns:
         Длительность в часах
     """
-    if shift_type.is_overnight:
-        # Для ночных смен считаем через полночь
-        start = datetime.combine(datetime.today(), shift_type.start_time)
-        end = datetime.combine(datetime.today(), shift_type.end_time)
-        if end <= start:
-            end += timedelta(days=1)
-        return (end - start).total_seconds() / 3600
-    else:
-        return shift_type.shift_duration_hours
+    return shift_type.get_shift_duration()
 
 
 def get_next_working_day(shift_type: ShiftType, from_date: date) -> Optional[date]:
@@ -410,27 +452,29 @@ def validate_shift_pattern(shift_type: ShiftType) -> List[str]:
     """
     errors = []
     
-    # Проверяем рабочие дни
-    working_days = shift_type.get_working_days_list()
-    if not working_days:
-        errors.append("Не указаны рабочие дни")
+    # Проверяем рабочие дни недельных паттернов
+    if shift_type.periodicity in ('weekly', 'biweekly'):
+        if not shift_type.get_working_days_list():
+            errors.append("Не указаны рабочие дни")
+        parts = [part.strip() for part in (shift_type.working_days or '').split(',') if part.strip()]
+        invalid = [part for part in parts if not part.isdigit() or int(part) not in WEEKDAY_NAMES]
+        if invalid:
+            errors.append(f"Неверные рабочие дни: {', '.join(invalid)}")
     
-    # Проверяем выходные дни
-    rest_days = shift_type.get_rest_days_list()
-    if not rest_days:
-        errors.append("Не указаны выходные дни")
+    # Проверяем параметры периодичности
+    if shift_type.periodicity == 'custom' and not shift_type.custom_interval_days:
+        errors.append("Не указан интервал в днях для пользовательской периодичности")
     
-    # Проверяем пересечение рабочих и выходных дней
-    intersection = set(working_days) & set(rest_days)
-    if intersection:
-        errors.append(f"Дни {intersection} указаны и как рабочие, и как выходные")
+    # Проверяем период действия
+    if shift_type.start_date and shift_type.end_date and shift_type.start_date > shift_type.end_date:
+        errors.append("Дата начала действия позже даты окончания")
     
     # Проверяем время смены
     if shift_type.start_time >= shift_type.end_time and not shift_type.is_overnight:
         errors.append("Время окончания должно быть больше времени начала для дневных смен")
     
     # Проверяем длительность
-    if shift_type.shift_duration_hours < 1 or shift_type.shift_duration_hours > 24:
+    if shift_type.duration_hours < 1 or shift_type.duration_hours > 24:
         errors.append("Длительность смены должна быть от 1 до 24 часов")
     
     return errors
@@ -446,28 +490,10 @@ def get_shift_pattern_description(shift_type: ShiftType) -> str:
     Returns:
         Описание паттерна
     """
-    pattern_names = {
-        'daily': 'Ежедневная',
-        'weekly': 'Недельная (5/2)',
-        'weekly_alt': 'Недельная (2/2)',
-        'monthly': 'Месячная',
-        'custom': 'Пользовательская',
-    }
-    
-    pattern_name = pattern_names.get(shift_type.shift_pattern, 'Неизвестный')
+    description = shift_type.get_periodicity_description()
     
-    if shift_type.shift_pattern == 'custom':
-        working_days = shift_type.get_working_days_list()
-        rest_days = shift_type.get_rest_days_list()
-        
-        day_names = {
-            1: 'Пн', 2: 'Вт', 3: 'Ср', 4: 'Чт', 
-            5: 'Пт', 6: 'Сб', 7: 'Вс'
-        }
-        
-        working_names = [day_names.get(day, str(day)) for day in working_days]
-        rest_names = [day_names.get(day, str(day)) for day in rest_days]
-        
-        return f"Пользовательская: {', '.join(working_names)} / {', '.join(rest_names)}"
+    if shift_type.periodicity in ('weekly', 'biweekly'):
+        working_names = [WEEKDAY_NAMES[day] for day in shift_type.get_working_days_list()]
+        return f"{description}: {', '.join(working_names)}"
     
-    return pattern_name 
\ No newline at end of file
+    return description
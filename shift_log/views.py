@@ -1,31 +1,66 @@
 import json
 import os
-from datetime import timedelta
+from collections import defaultdict
+from datetime import date, timedelta
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q, prefetch_related_objects
+from django.db.models.fields.files import FieldFile
+from django.http import (Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
 from django.utils.timezone import localdate
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
                                   UpdateView, View)
 
-from .forms import (AttachmentForm, DailyReportForm, MaterialWriteOffForm,
-                    NoteForm, ProjectTaskForm, ShiftFilterForm, ShiftForm,
-                    ShiftLogForm, TaskFilterForm, TaskForm, TaskReportForm,
+from .forms import (AttachmentForm, DailyReportForm, MaterialAdjustmentForm,
+                    MaterialReceiptForm, MaterialWriteOffForm, NoteForm,
+                    ProjectTaskForm, ShiftFilterForm, ShiftForm, ShiftLogForm,
+                    TaskFilterForm, TaskForm, TaskReportForm,
                     TaskStatusUpdateForm, UserRegistrationForm)
-from .models import (ActivityLog, Attachment, DailyReport, DailyReportPhoto,
-                     Department, Employee, MaterialWriteOff, Note,
-                     Notification, Project, ProjectTask, Shift, ShiftLog, Task,
-                     TaskProject, TaskReport)
-from .utils import log_activity, send_notification
+from .models import (UNIT_CHOICES, ActivityLog, Attachment, Blob,
+                     DailyReport, DailyReportPhoto, Department, Employee,
+                     MaterialStock, MaterialWriteOff, Note, Notification,
+                     Project, ProjectTask, Shift, ShiftAssignment,
+                     ShiftLog, Task, TaskProject, TaskReport,
+                     UploadSession)
+from .mixins import CachedObjectMixin
+from .services.autocomplete import AutocompleteService, parse_limit
+from .services.blob_storage import BlobStorage
+from .services.bulk_assignment import BulkAssignmentService
+from .services.chunked_upload import (DEFAULT_CHUNK_SIZE, ChunkedUploadService,
+                                     UploadError)
+from .services.daily_pdf import DailyReportPdf
+from .services.file_delivery import VIEWABLE_CONTENT_TYPES, serve_file
+from .services.file_state import FileStateService
+from .services.ical_feed import ICalFeed, feed_period
+from .services.image_derivatives import (IMAGE_CONTENT_TYPES,
+                                         derivative_name, ensure_derivative,
+                                         schedule_derivatives)
+from .services.labor_hours import METRICS as LABOR_METRICS, LaborHoursService
+from .services.material_stock import MaterialStockService
+from .services.replacements import ReplacementService
+from .services.shift_conflicts import ShiftConflictService
+from .services.shift_schedule import ShiftScheduleService
+from .services.writeoff_summary import GROUPINGS as WRITEOFF_GROUPINGS
+from .services.writeoff_summary import WriteOffSummaryService
+from .services.xlsx_export import CONTENT_TYPE as XLSX_CONTENT_TYPE
+from .services.xlsx_export import XlsxExport, export_filename, stream_xlsx
+from .utils import (get_department_schedule, get_employee_schedule,
+                    local_date_range_filter, log_activity, send_notification,
+                    visible_for_user)
 
 
 def group_tasks_by_department(tasks):
@@ -129,69 +164,52 @@ def dashboard(request):
         form = DailyReportForm(
             request.POST, 
             request.FILES, 
-            instance=daily_report,
             employee=employee,
             department=employee.department
         )
         if form.is_valid():
-            # Дополняем комментарий, если уже есть текст
-            new_comment = form.cleaned_data['comment']
-            if daily_report.comment and new_comment and new_comment != daily_report.comment:
-                # Добавляем с новой строки
-                daily_report.comment = f"{daily_report.comment}\n{new_comment}"
-            else:
-                daily_report.comment = new_comment
-            daily_report.created_by = request.user
-            daily_report.save()
+            # Текст добавляется отдельной записью, строка отчёта не перезаписывается
+            new_comment = form.cleaned_data['comment'].strip()
+            if new_comment:
+                daily_report.add_entry(employee, new_comment)
+            # Автор последнего изменения — отдельным UPDATE одного поля, текст отчёта не трогаем
+            DailyReport.objects.filter(pk=daily_report.pk).update(created_by=request.user)
             
             # Обрабатываем загруженную фотографию
             photo = form.cleaned_data.get('photo')
             photo_caption = form.cleaned_data.get('photo_caption', '')
             
             if photo:
-                DailyReportPhoto.objects.create(
-                    daily_report=daily_report,
-                    image=photo,
-                    caption=photo_caption.strip(),
-                    uploaded_by=employee
-                )
+                with transaction.atomic():
+                    blob = BlobStorage.ingest(photo, photo.name)
+                    DailyReportPhoto.objects.create(
+                        daily_report=daily_report,
+                        image=blob.file.name,
+                        blob=blob,
+                        caption=photo_caption.strip(),
+                        uploaded_by=employee,
+                        file_size=blob.size
+                    )
+                    schedule_derivatives(blob)
             
             messages.success(request, 'Ежедневный отчёт сохранён')
             return redirect('shift_log:dashboard')
         daily_report_form = form
     else:
         daily_report_form = DailyReportForm(
-            instance=daily_report,
             employee=employee,
             department=employee.department
         )
 
-    # Получаем активные задания в зависимости от роли
-    if employee.position == 'admin':
-        active_tasks = Task.objects.filter(
-            status__in=['pending', 'in_progress', 'rework']
-        ).exclude(status='cancelled').select_related(
-            'department', 'assigned_to', 'assigned_to__user', 'project'
-        )
-        is_admin_view = True
-    elif employee.position == 'supervisor':
-        active_tasks = Task.objects.filter(
-            department=employee.department,
-            status__in=['pending', 'in_progress', 'rework']
-        ).exclude(status='cancelled').select_related(
-            'department', 'assigned_to', 'assigned_to__user', 'project'
-        )
-        is_admin_view = True  # Используем структурированное отображение
-    else:
-        # Обычные сотрудники видят свои задачи и общие задачи отдела
-        active_tasks = Task.objects.filter(
-            Q(assigned_to=employee) |
-            Q(department=employee.department, task_scope='general'),
-            status__in=['pending', 'in_progress', 'rework']
-        ).exclude(status='cancelled').select_related(
-            'department', 'assigned_to', 'assigned_to__user', 'project'
-        )
-        is_admin_view = False  # Будет определено после группировки
+    # Получаем активные задания, доступные сотруднику
+    active_tasks = Task.objects.visible_to(employee).filter(
+        status__in=['pending', 'in_progress', 'rework']
+    ).select_related(
+        'department', 'assigned_to', 'assigned_to__user', 'project'
+    )
+    # Администраторы и руководители видят структурированное отображение,
+    # для обычных сотрудников это определяется после группировки
+    is_admin_view = employee.position in ['admin', 'supervisor']
     
     # Группируем задачи по отделам
     tasks_by_department, department_stats, summary_stats = group_tasks_by_department(active_tasks)
@@ -213,9 +231,16 @@ def dashboard(request):
     # Получаем списания материалов за сегодня
     today_date = localdate()
     if employee.position == 'admin':
-        writeoffs = MaterialWriteOff.objects.filter(created_at__date=today_date).select_related('department', 'created_by')
+        writeoffs = MaterialWriteOff.objects.filter(
+            **local_date_range_filter('created_at', today_date, today_date)
+        ).select_related('department', 'created_by')
     else:
-        writeoffs = MaterialWriteOff.objects.filter(department=employee.department, created_at__date=today_date).select_related('department', 'created_by')
+        writeoffs = MaterialWriteOff.objects.filter(
+            department=employee.department, **local_date_range_filter('created_at', today_date, today_date)
+        ).select_related('department', 'created_by')
+
+    # Миниатюры строятся по blob'ам фотографий — загружаем их одним запросом
+    prefetch_related_objects([daily_report], 'photos__blob', 'entries__author__user')
 
     context = {
         'employee': employee,
@@ -245,20 +270,10 @@ class ShiftListView(LoginRequiredMixin, ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        queryset = Shift.objects.select_related(
+        # Фильтрация по правам доступа выполняется в том же запросе
+        queryset = visible_for_user(Shift, self.request.user).select_related(
             'shift_type', 'shift_type__department'
-        ).prefetch_related('employees')
-        
-        # Фильтрация по правам доступа
-        if hasattr(self.request.user, 'employee'):
-            if self.request.user.employee.position == 'employee':
-                queryset = queryset.filter(
-                    employees=self.request.user.employee
-                )
-            elif self.request.user.employee.position == 'supervisor':
-                queryset = queryset.filter(
-                    shift_type__department=self.request.user.employee.department
-                )
+        ).prefetch_related('employees__user')
 
         # Применяем фильтры
         form = ShiftFilterForm(self.request.GET)
@@ -292,22 +307,21 @@ class ShiftListView(LoginRequiredMixin, ListView):
         return context
 
 
-class ShiftDetailView(LoginRequiredMixin, DetailView):
+class ShiftDetailView(CachedObjectMixin, LoginRequiredMixin, DetailView):
     """Детальная информация о смене"""
     model = Shift
     template_name = 'shift_log/shift_detail.html'
     context_object_name = 'shift'
 
+    def get_queryset(self):
+        """Смены, доступные пользователю (проверка прав в том же запросе)"""
+        return visible_for_user(Shift, self.request.user).select_related(
+            'shift_type', 'shift_type__department'
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         shift = self.get_object()
-        
-        # Проверяем права доступа
-        if hasattr(self.request.user, 'employee'):
-            employee = self.request.user.employee
-            if employee.position == 'employee' and employee not in shift.employees.all():
-                messages.error(self.request, 'У вас нет доступа к этой смене')
-                return context
 
         # Получаем журнал смены
         try:
@@ -338,6 +352,9 @@ class ShiftDetailView(LoginRequiredMixin, DetailView):
 
     def can_edit_shift(self):
         """Проверяет, может ли пользователь редактировать смену"""
+        return self.get_permission_fact('can_edit', self._compute_can_edit)
+
+    def _compute_can_edit(self):
         if not hasattr(self.request.user, 'employee'):
             return False
         
@@ -347,12 +364,12 @@ class ShiftDetailView(LoginRequiredMixin, DetailView):
         if employee.position == 'admin':
             return True
         elif employee.position == 'supervisor':
-            return shift.shift_type.department == employee.department
+            return shift.shift_type.department_id == employee.department_id
         else:
-            return employee in shift.employees.all()
+            return shift.has_employee(employee)
 
 
-class ShiftUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class ShiftUpdateView(CachedObjectMixin, LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     """Редактирование смены"""
     model = Shift
     form_class = ShiftForm
@@ -369,9 +386,9 @@ class ShiftUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         if employee.position == 'admin':
             return True
         elif employee.position == 'supervisor':
-            return shift.shift_type.department == employee.department
+            return shift.shift_type.department_id == employee.department_id
         else:
-            return employee in shift.employees.all()
+            return shift.has_employee(employee)
 
     def get_success_url(self):
         """Возвращает URL для перенаправления после успешного обновления"""
@@ -402,24 +419,12 @@ class TaskListView(LoginRequiredMixin, ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        queryset = Task.objects.select_related(
+        # Фильтрация по правам доступа выполняется в том же запросе
+        queryset = visible_for_user(Task, self.request.user).select_related(
             'department', 'assigned_to', 'created_by', 'project'
         ).exclude(
             status__in=['completed', 'cancelled']
         )
-        # Фильтрация по правам доступа
-        if hasattr(self.request.user, 'employee'):
-            employee = self.request.user.employee
-            if employee.position == 'employee':
-                # Обычные сотрудники видят свои задачи и общие задачи отдела
-                queryset = queryset.filter(
-                    Q(assigned_to=employee) | 
-                    Q(department=employee.department, task_scope='general')
-                )
-            elif employee.position == 'supervisor':
-                # Руководители видят задачи своего отдела
-                queryset = queryset.filter(department=employee.department)
-            # Администраторы видят все задачи (не добавляем фильтр)
         # Применяем фильтры
         form = TaskFilterForm(self.request.GET, user=self.request.user)
         if form.is_valid():
@@ -443,14 +448,9 @@ class TaskListView(LoginRequiredMixin, ListView):
                 queryset = queryset.filter(
                     task_type=form.cleaned_data['task_type']
                 )
-            if form.cleaned_data.get('date_from'):
-                queryset = queryset.filter(
-                    created_at__date__gte=form.cleaned_data['date_from']
-                )
-            if form.cleaned_data.get('date_to'):
-                queryset = queryset.filter(
-                    created_at__date__lte=form.cleaned_data['date_to']
-                )
+            queryset = queryset.filter(**local_date_range_filter(
+                'created_at', form.cleaned_data.get('date_from'), form.cleaned_data.get('date_to')
+            ))
         return queryset.order_by(
             '-priority',
             '-created_at'
@@ -462,41 +462,22 @@ class TaskListView(LoginRequiredMixin, ListView):
         return context
 
 
-class TaskDetailView(LoginRequiredMixin, DetailView):
+class TaskDetailView(CachedObjectMixin, LoginRequiredMixin, DetailView):
     """Детальная информация о задании"""
     model = Task
     template_name = 'shift_log/task_detail.html'
     context_object_name = 'task'
 
     def get_queryset(self):
-        """Оптимизация запросов с select_related"""
-        return Task.objects.select_related(
+        """Оптимизация запросов с select_related и проверкой доступа в том же запросе"""
+        return visible_for_user(Task, self.request.user).select_related(
             'department', 'assigned_to', 'assigned_to__user', 
             'created_by', 'created_by__user', 'project'
         )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        task = self.get_object()
-        
-        # Проверяем права доступа
-        if hasattr(self.request.user, 'employee'):
-            employee = self.request.user.employee
-            
-            # Администраторы имеют доступ ко всем задачам
-            if employee.position == 'admin':
-                pass
-            # Для общих задач - доступ есть у всех сотрудников отдела
-            elif task.task_scope == 'general':
-                if task.department != employee.department:
-                    messages.error(self.request, 'У вас нет доступа к этому заданию')
-                    return context
-            else:
-                # Для индивидуальных задач - доступ только у назначенного сотрудника
-                if (employee.position == 'employee' and 
-                    task.assigned_to != employee):
-                    messages.error(self.request, 'У вас нет доступа к этому заданию')
-                    return context
+        task = self.object
 
         # Получаем отчеты по заданию
         reports = TaskReport.objects.filter(task=task).select_related(
@@ -507,7 +488,7 @@ class TaskDetailView(LoginRequiredMixin, DetailView):
         attachments = Attachment.objects.filter(
             attachment_type='task',
             object_id=task.id
-        )
+        ).select_related('blob')
 
         # Добавляем форму изменения статуса с учетом прав
         status_form = TaskStatusUpdateForm(initial={'status': task.status}, user=self.request.user, task=task)
@@ -527,6 +508,9 @@ class TaskDetailView(LoginRequiredMixin, DetailView):
 
     def can_edit_task(self):
         """Проверяет, может ли пользователь редактировать задание"""
+        return self.get_permission_fact('can_edit', self._compute_can_edit)
+
+    def _compute_can_edit(self):
         if not hasattr(self.request.user, 'employee'):
             return False
         
@@ -537,13 +521,16 @@ class TaskDetailView(LoginRequiredMixin, DetailView):
         if employee.position == 'admin':
             return True
         elif employee.position == 'supervisor':
-            return task.department == employee.department
+            return task.department_id == employee.department_id
         else:
             # Обычные сотрудники не могут редактировать задания
             return False
     
     def can_update_status(self):
         """Проверяет, может ли пользователь изменять статус задания"""
+        return self.get_permission_fact('can_update_status', self._compute_can_update_status)
+
+    def _compute_can_update_status(self):
         if not hasattr(self.request.user, 'employee'):
             return False
         
@@ -553,12 +540,12 @@ class TaskDetailView(LoginRequiredMixin, DetailView):
         # Администраторы и руководители могут изменять любой статус в рамках доступа
         if employee.position == 'admin':
             return True
-        if employee.position == 'supervisor' and task.department == employee.department:
+        if employee.position == 'supervisor' and task.department_id == employee.department_id:
             return True
         
         # Обычные сотрудники могут менять только на in_progress и completed
         if employee.position == 'employee':
-            if task.assigned_to == employee or (task.task_scope == 'general' and task.department == employee.department):
+            if task.assigned_to_id == employee.id or (task.task_scope == 'general' and task.department_id == employee.department_id):
                 return True
         
         return False
@@ -675,12 +662,10 @@ class TaskCreateView(TaskProjectSelectionMixin, LoginRequiredMixin, UserPassesTe
             employee = self.request.user.employee
             context['available_departments'] = employee.get_available_departments_for_tasks()
             context['available_employees'] = employee.get_available_employees_for_assignments()
-            # Добавляем список всех проектов для автодополнения
-            context['task_projects'] = TaskProject.objects.all().order_by('name')
         return context
 
 
-class TaskUpdateView(TaskProjectSelectionMixin, LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class TaskUpdateView(CachedObjectMixin, TaskProjectSelectionMixin, LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     """Редактирование задания"""
     model = Task
     form_class = TaskForm
@@ -699,7 +684,7 @@ class TaskUpdateView(TaskProjectSelectionMixin, LoginRequiredMixin, UserPassesTe
         if employee.position == 'admin':
             return True
         elif employee.position == 'supervisor':
-            return task.department == employee.department
+            return task.department_id == employee.department_id
         else:
             # Обычные сотрудники не могут редактировать задания
             return False
@@ -732,8 +717,6 @@ class TaskUpdateView(TaskProjectSelectionMixin, LoginRequiredMixin, UserPassesTe
             employee = self.request.user.employee
             context['available_departments'] = employee.get_available_departments_for_tasks()
             context['available_employees'] = employee.get_available_employees_for_assignments()
-            # Добавляем список всех проектов для автодополнения
-            context['task_projects'] = TaskProject.objects.all().order_by('name')
         return context
 
 
@@ -748,7 +731,7 @@ def shift_log_create(request, shift_id):
         return redirect('shift_list')
     
     employee = request.user.employee
-    if employee not in shift.employees.all():
+    if not shift.has_employee(employee):
         messages.error(request, 'У вас нет доступа к этой смене')
         return redirect('shift_list')
 
@@ -861,15 +844,22 @@ def upload_attachment(request):
                 attachment = form.save(commit=False)
                 attachment.uploaded_by = request.user.employee
                 attachment.filename = request.FILES['file'].name
-                attachment.content_type = request.FILES['file'].content_type
-                attachment.file_size = request.FILES['file'].size
                 
                 # Получаем тип вложения и ID объекта из POST данных
                 attachment.attachment_type = request.POST.get('attachment_type', 'task')
                 attachment.object_id = request.POST.get('object_id')
                 
-                print(f"DEBUG: Saving attachment with filename={attachment.filename}, size={attachment.file_size}")
-                attachment.save()
+                # Содержимое хранится один раз под своим SHA-256; тип и размер
+                # берём из blob, а не из заголовков запроса
+                with transaction.atomic():
+                    blob = BlobStorage.ingest(request.FILES['file'], attachment.filename)
+                    attachment.blob = blob
+                    attachment.file = blob.file.name
+                    attachment.content_type = blob.content_type
+                    attachment.file_size = blob.size
+                    print(f"DEBUG: Saving attachment with filename={attachment.filename}, size={attachment.file_size}")
+                    attachment.save()
+                    schedule_derivatives(blob)
                 print(f"DEBUG: Attachment saved with ID={attachment.id}")
                 
                 return JsonResponse({
@@ -894,6 +884,119 @@ def upload_attachment(request):
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
 
+def _upload_error_response(error):
+    """JSON-ответ с ошибкой порционной загрузки и текущим смещением"""
+    data = {'success': False, 'error': str(error)}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    return JsonResponse(data, status=error.status)
+
+
+def _upload_session_data(session):
+    return {
+        'success': True,
+        'upload_id': str(session.id),
+        'offset': session.received_size,
+        'total_size': session.total_size,
+        'chunk_size': DEFAULT_CHUNK_SIZE,
+    }
+
+
+def _uploaded_attachment_data(attachment):
+    user = attachment.uploaded_by.user
+    return {
+        'success': True,
+        'attachment_id': attachment.id,
+        'filename': attachment.filename,
+        'file_size': attachment.file_size,
+        'uploaded_by': user.get_full_name() or user.username
+    }
+
+
+@login_required
+def upload_init(request):
+    """Начало порционной загрузки: возвращает ID сеанса и размер порции"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    if not hasattr(request.user, 'employee'):
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+    
+    try:
+        total_size = int(request.POST.get('total_size', ''))
+        object_id = int(request.POST.get('object_id', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректные параметры загрузки'}, status=400)
+    
+    try:
+        result = ChunkedUploadService.init_upload(
+            employee=request.user.employee,
+            filename=request.POST.get('filename', ''),
+            content_type=request.POST.get('content_type', ''),
+            total_size=total_size,
+            sha256=request.POST.get('sha256', ''),
+            object_id=object_id,
+            attachment_type=request.POST.get('attachment_type', 'task'),
+            target=request.POST.get('target', 'attachment'),
+        )
+    except UploadError as e:
+        return _upload_error_response(e)
+    
+    if not isinstance(result, UploadSession):
+        # Такой файл уже хранится — вложение создано без передачи данных
+        return JsonResponse(dict(_uploaded_attachment_data(result), deduplicated=True))
+    return JsonResponse(_upload_session_data(result), status=201)
+
+
+@login_required
+def upload_chunk(request, upload_id):
+    """
+    Состояние сеанса (GET) или приём очередной порции (PUT)
+    
+    Порция передаётся телом PUT-запроса, её смещение — в заголовке
+    Upload-Offset. Тело читается потоком, без request.body.
+    """
+    if not hasattr(request.user, 'employee'):
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+    
+    try:
+        if request.method == 'GET':
+            session = ChunkedUploadService.get_session(upload_id, request.user.employee)
+        elif request.method == 'PUT':
+            try:
+                offset = int(request.headers.get('Upload-Offset', ''))
+                length = int(request.headers.get('Content-Length', ''))
+            except ValueError:
+                return JsonResponse(
+                    {'success': False, 'error': 'Нужны заголовки Upload-Offset и Content-Length'},
+                    status=400
+                )
+            session = ChunkedUploadService.append_chunk(
+                upload_id, request.user.employee, offset, request, length
+            )
+        else:
+            return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    except UploadError as e:
+        return _upload_error_response(e)
+    
+    return JsonResponse(_upload_session_data(session))
+
+
+@login_required
+def upload_finalize(request, upload_id):
+    """Завершение порционной загрузки: проверка SHA-256 и создание вложения"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    if not hasattr(request.user, 'employee'):
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+    
+    try:
+        attachment = ChunkedUploadService.finalize(upload_id, request.user.employee)
+    except UploadError as e:
+        return _upload_error_response(e)
+    
+    return JsonResponse(_uploaded_attachment_data(attachment))
+
+
 @login_required
 def notifications_list(request):
     """Список уведомлений"""
@@ -1323,8 +1426,9 @@ def delete_attachment(request, attachment_id):
         else:
             return JsonResponse({'success': False, 'error': 'Access denied'})
         
-        # Удаляем файл с диска
-        if attachment.file:
+        # Файл старого вложения без blob принадлежит только ему — удаляем с диска.
+        # Файл blob освобождается сигналом post_delete, когда на него не останется ссылок
+        if attachment.file and attachment.blob_id is None:
             if os.path.exists(attachment.file.path):
                 os.remove(attachment.file.path)
         
@@ -1341,65 +1445,37 @@ def delete_attachment(request, attachment_id):
 def view_attachment(request, attachment_id):
     """Просмотр вложения в браузере"""
     try:
-        attachment = get_object_or_404(Attachment, id=attachment_id)
-        
         # Проверяем права доступа
         if not hasattr(request.user, 'employee'):
             return JsonResponse({'success': False, 'error': 'Unauthorized'})
         
-        employee = request.user.employee
-        
-        # Администраторы могут просматривать любые вложения
-        if employee.position == 'admin':
-            pass
-        # Руководители могут просматривать вложения заданий своего отдела
-        elif employee.position == 'supervisor':
-            if attachment.attachment_type == 'task':
-                task = get_object_or_404(Task, id=attachment.object_id)
-                if task.department != employee.department:
-                    return JsonResponse({'success': False, 'error': 'Access denied'})
-            else:
-                return JsonResponse({'success': False, 'error': 'Access denied'})
-        # Обычные сотрудники могут просматривать вложения заданий, к которым у них есть доступ
-        elif employee.position == 'employee':
-            if attachment.attachment_type == 'task':
-                task = get_object_or_404(Task, id=attachment.object_id)
-                if task.assigned_to != employee and task.created_by != employee:
-                    return JsonResponse({'success': False, 'error': 'Access denied'})
-            else:
-                return JsonResponse({'success': False, 'error': 'Access denied'})
-        else:
+        # Права на вложение проверяются в том же запросе, что и его выборка
+        attachment = Attachment.objects.visible_to(
+            request.user.employee
+        ).filter(id=attachment_id).first()
+        if attachment is None:
             return JsonResponse({'success': False, 'error': 'Access denied'})
         
-        # Определяем, можно ли отобразить файл в браузере
-        viewable_types = [
-            'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/webp',
-            'application/pdf',
-            'text/plain', 'text/html', 'text/css', 'text/javascript',
-            'application/json', 'application/xml'
-        ]
-        
-        # Проверяем существование файла
-        if not attachment.file or not attachment.file.storage.exists(attachment.file.name):
+        # Наличие файла выясняется при открытии — отдельный stat не нужен
+        if not attachment.file:
             return JsonResponse({
                 'success': False, 
                 'error': 'Файл не найден на сервере'
             })
         
-        # Отправляем файл
+        # Отправляем файл потоком; просматриваемые типы отображаем в браузере
         try:
-            with open(attachment.file.path, 'rb') as f:
-                response = HttpResponse(f.read(), content_type=attachment.content_type)
-                
-                if attachment.content_type in viewable_types:
-                    # Для просматриваемых файлов - отображаем в браузере
-                    response['Content-Disposition'] = f'inline; filename="{attachment.filename}"'
-                else:
-                    # Для остальных файлов - скачиваем
-                    response['Content-Disposition'] = f'attachment; filename="{attachment.filename}"'
-                
-                return response
+            response = serve_file(
+                request,
+                attachment.file,
+                attachment.filename,
+                attachment.content_type,
+                as_attachment=attachment.content_type not in VIEWABLE_CONTENT_TYPES
+            )
+            FileStateService.record(attachment, present=True)
+            return response
         except FileNotFoundError:
+            FileStateService.record(attachment, present=False)
             return JsonResponse({
                 'success': False, 
                 'error': 'Файл не найден на сервере'
@@ -1418,38 +1494,19 @@ def view_attachment(request, attachment_id):
 def download_attachment(request, attachment_id):
     """Скачивание вложения"""
     try:
-        attachment = get_object_or_404(Attachment, id=attachment_id)
-        
         # Проверяем права доступа
         if not hasattr(request.user, 'employee'):
             return JsonResponse({'success': False, 'error': 'Unauthorized'})
         
-        employee = request.user.employee
-        
-        # Администраторы могут скачивать любые вложения
-        if employee.position == 'admin':
-            pass
-        # Руководители могут скачивать вложения заданий своего отдела
-        elif employee.position == 'supervisor':
-            if attachment.attachment_type == 'task':
-                task = get_object_or_404(Task, id=attachment.object_id)
-                if task.department != employee.department:
-                    return JsonResponse({'success': False, 'error': 'Access denied'})
-            else:
-                return JsonResponse({'success': False, 'error': 'Access denied'})
-        # Обычные сотрудники могут скачивать вложения заданий, к которым у них есть доступ
-        elif employee.position == 'employee':
-            if attachment.attachment_type == 'task':
-                task = get_object_or_404(Task, id=attachment.object_id)
-                if task.assigned_to != employee and task.created_by != employee:
-                    return JsonResponse({'success': False, 'error': 'Access denied'})
-            else:
-                return JsonResponse({'success': False, 'error': 'Access denied'})
-        else:
+        # Права на вложение проверяются в том же запросе, что и его выборка
+        attachment = Attachment.objects.visible_to(
+            request.user.employee
+        ).filter(id=attachment_id).first()
+        if attachment is None:
             return JsonResponse({'success': False, 'error': 'Access denied'})
         
-        # Проверяем существование файла
-        if not attachment.file or not attachment.file.storage.exists(attachment.file.name):
+        # Наличие файла выясняется при открытии — отдельный stat не нужен
+        if not attachment.file:
             return JsonResponse({
                 'success': False, 
                 'error': 'Файл не найден на сервере'
@@ -1457,11 +1514,17 @@ def download_attachment(request, attachment_id):
         
         # Отправляем файл для скачивания
         try:
-            with open(attachment.file.path, 'rb') as f:
-                response = HttpResponse(f.read(), content_type=attachment.content_type)
-                response['Content-Disposition'] = f'attachment; filename="{attachment.filename}"'
-                return response
+            response = serve_file(
+                request,
+                attachment.file,
+                attachment.filename,
+                attachment.content_type,
+                as_attachment=True
+            )
+            FileStateService.record(attachment, present=True)
+            return response
         except FileNotFoundError:
+            FileStateService.record(attachment, present=False)
             return JsonResponse({
                 'success': False, 
                 'error': 'Файл не найден на сервере'
@@ -1476,9 +1539,51 @@ def download_attachment(request, attachment_id):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+@login_required
+def image_derivative(request, sha256, variant, fmt):
+    """
+    Миниатюра или превью изображения
+
+    URL зависит только от содержимого, поэтому ответ кэшируется браузером
+    как неизменяемый. Если фоновая генерация ещё не закончилась, вариант
+    строится синхронно.
+    """
+    employee = getattr(request.user, 'employee', None)
+    blob = Blob.objects.filter(sha256=sha256, content_type__in=IMAGE_CONTENT_TYPES).first()
+    if employee is None or blob is None or not BlobStorage.is_visible_to(blob, employee):
+        raise Http404
+
+    try:
+        ensure_derivative(blob, variant, fmt)
+    except OSError:
+        # Исходный файл потерян или не читается как изображение
+        raise Http404
+
+    derived = FieldFile(blob, blob.file.field, derivative_name(sha256, variant, fmt))
+    return serve_file(
+        request,
+        derived,
+        f'{sha256[:12]}_{variant}.{fmt}',
+        'image/webp' if fmt == 'webp' else 'image/jpeg',
+        as_attachment=False,
+        immutable=True,
+    )
+
+
+def _xlsx_response(filename, title, columns, rows):
+    """Отдаёт XLSX потоком по мере формирования (см. services.xlsx_export)"""
+    response = StreamingHttpResponse(stream_xlsx(title, columns, rows), content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
 @login_required
 def reports_list(request):
-    """Список заданий с поиском по ключевым словам"""
+    """
+    Список заданий с поиском по ключевым словам
+
+    ?format=xlsx выгружает все отфильтрованные задания в Excel.
+    """
     if not hasattr(request.user, 'employee'):
         messages.error(request, 'Профиль сотрудника не найден')
         return redirect('shift_log:dashboard')
@@ -1490,26 +1595,10 @@ def reports_list(request):
     status_filter = request.GET.get('status')
     search_query = request.GET.get('search', '').strip()
     
-    # Получаем задания в зависимости от роли пользователя
-    if employee.position == 'admin':
-        # Администратор видит все задания
-        tasks = Task.objects.exclude(status='cancelled').select_related(
-            'department', 'assigned_to', 'assigned_to__user', 'created_by', 'created_by__user', 'project'
-        ).prefetch_related('taskreport_set').order_by('-created_at')
-    elif employee.position == 'supervisor':
-        # Руководитель видит задания только своего отдела
-        tasks = Task.objects.filter(
-            department=employee.department
-        ).exclude(status='cancelled').select_related(
-            'department', 'assigned_to', 'assigned_to__user', 'created_by', 'created_by__user', 'project'
-        ).prefetch_related('taskreport_set').order_by('-created_at')
-    else:
-        # Сотрудник видит только свои задания
-        tasks = Task.objects.filter(
-            assigned_to=employee
-        ).exclude(status='cancelled').select_related(
-            'department', 'assigned_to', 'assigned_to__user', 'created_by', 'created_by__user', 'project'
-        ).prefetch_related('taskreport_set').order_by('-created_at')
+    # Получаем задания, доступные пользователю (сотрудник — только назначенные ему)
+    tasks = Task.objects.visible_to(employee, assigned_only=True).exclude(status='cancelled').select_related(
+        'department', 'assigned_to', 'assigned_to__user', 'created_by', 'created_by__user', 'project'
+    ).prefetch_related('taskreport_set').order_by('-created_at')
     
     # Для руководителей автоматически устанавливаем фильтр по их отделу, если не указан другой
     if employee.position == 'supervisor' and not department_filter:
@@ -1548,6 +1637,11 @@ def reports_list(request):
             # Поиск по статусу (по отображаемому названию)
             Q(status__icontains=search_query)
         )
+
+    if request.GET.get('format') == 'xlsx':
+        return _xlsx_response(
+            export_filename('Задания'), 'Задания', XlsxExport.TASK_COLUMNS, XlsxExport.tasks(tasks)
+        )
     
     # Пагинация
     paginator = Paginator(tasks, 20)
@@ -1655,24 +1749,15 @@ def update_task_comment(request, task_id):
 @login_required
 def api_task_history(request, task_id):
     """API для получения истории изменений задания"""
-    task = get_object_or_404(Task, pk=task_id)
-    
     # Проверяем права доступа
     if not hasattr(request.user, 'employee'):
         return JsonResponse({'success': False, 'error': 'Профиль сотрудника не найден'})
     
     employee = request.user.employee
     
-    # Проверяем, может ли пользователь просматривать задание
-    can_view = False
-    if employee.position == 'admin':
-        can_view = True
-    elif employee.position == 'supervisor':
-        can_view = task.department == employee.department
-    else:
-        can_view = task.assigned_to == employee or task.created_by == employee
-    
-    if not can_view:
+    # Проверка прав выполняется в том же запросе, что и выборка задания
+    task = Task.objects.handled_by(employee).filter(pk=task_id).first()
+    if task is None:
         return JsonResponse({'success': False, 'error': 'У вас нет прав для просмотра этого задания'})
     
     try:
@@ -1719,32 +1804,86 @@ def api_task_history(request, task_id):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
-@login_required
-def daily_reports_list(request):
-    """Список ежедневных отчётов по отделу (или всем отделам для администратора)"""
-    employee = request.user.employee
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
+# Миниатюр в строке списка ежедневных отчётов (остальные — в галерее)
+DAILY_REPORT_THUMBNAILS = 6
 
+
+def _visible_daily_reports(employee):
+    """Ежедневные отчёты, доступные сотруднику"""
     reports = DailyReport.objects.all()
-    if employee.position == 'admin':
-        # Администратор видит все
-        if request.GET.get('department'):
-            reports = reports.filter(department_id=request.GET['department'])
-    else:
+    if employee.position != 'admin':
         # Сотрудник и руководитель — только свой отдел
         reports = reports.filter(department=employee.department)
-        
-        # В индивидуальном режиме показываем только свои отчеты
+        # В индивидуальном режиме — только свои отчеты
         if employee.individual_report:
             reports = reports.filter(employee=employee)
+    return reports
+
 
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+@login_required
+def daily_reports_list(request):
+    """
+    Список ежедневных отчётов по отделу (или всем отделам для администратора)
+
+    Без фильтра по датам показываются последние DAILY_REPORTS_DEFAULT_DAYS
+    дней; ?format=xlsx выгружает все отчёты периода в Excel.
+    Постраничный вывод по ключу (-date, id): следующая страница
+    начинается после последнего показанного отчёта (?after=дата_id), так
+    что стоимость страницы не зависит от глубины истории. Для каждого
+    отчёта загружаются только первые миниатюры и число фотографий;
+    вся галерея подгружается при открытии (daily_report_photos).
+    """
+    employee = request.user.employee
+    date_from = _parse_date(request.GET.get('date_from'))
+    date_to = _parse_date(request.GET.get('date_to'))
+    if date_from is None and date_to is None:
+        date_from = localdate() - timedelta(days=getattr(settings, 'DAILY_REPORTS_DEFAULT_DAYS', 30))
+
+    reports = _visible_daily_reports(employee)
+    if employee.position == 'admin' and request.GET.get('department', '').isdigit():
+        reports = reports.filter(department_id=request.GET['department'])
     if date_from:
         reports = reports.filter(date__gte=date_from)
     if date_to:
         reports = reports.filter(date__lte=date_to)
 
-    reports = reports.select_related('department', 'employee', 'created_by').prefetch_related('photos').order_by('-date')
+    if request.GET.get('format') == 'xlsx':
+        return _xlsx_response(
+            export_filename('Ежедневные отчёты'), 'Ежедневные отчёты',
+            XlsxExport.DAILY_REPORT_COLUMNS, XlsxExport.daily_reports(reports.order_by('-date', 'id'))
+        )
+
+    after = request.GET.get('after', '')
+    after_date, _, after_id = after.partition('_')
+    after_date = _parse_date(after_date)
+    if after_date and after_id.isdigit():
+        reports = reports.filter(Q(date__lt=after_date) | Q(date=after_date, id__gt=int(after_id)))
+
+    page_size = getattr(settings, 'DAILY_REPORTS_PAGE_SIZE', 30)
+    reports = list(
+        reports.select_related('department', 'employee__user', 'created_by')
+        .annotate(photo_count=Count('photos'))
+        .prefetch_related(
+            'entries',
+            Prefetch(
+                'photos',
+                queryset=DailyReportPhoto.objects.select_related('blob')[:DAILY_REPORT_THUMBNAILS],
+                to_attr='preview_photos'
+            ),
+        )
+        .order_by('-date', 'id')[:page_size + 1]
+    )
+    next_cursor = None
+    if len(reports) > page_size:
+        reports = reports[:page_size]
+        next_cursor = f'{reports[-1].date.isoformat()}_{reports[-1].id}'
 
     # Для фильтрации по отделу (только для админа)
     departments = Department.objects.all() if employee.position == 'admin' else None
@@ -1753,14 +1892,499 @@ def daily_reports_list(request):
         'reports': reports,
         'departments': departments,
         'employee': employee,
-        'date_from': date_from,
-        'date_to': date_to,
+        'date_from': date_from.isoformat() if date_from else '',
+        'date_to': date_to.isoformat() if date_to else '',
         'selected_department': request.GET.get('department', ''),
         'is_individual_mode': employee.individual_report if not employee.position == 'admin' else False,
+        'next_cursor': next_cursor,
+        'is_first_page': not after,
+        'thumbnail_limit': DAILY_REPORT_THUMBNAILS,
+        'can_download_pdf': _can_download_daily_pdf(employee, employee.department_id),
     }
     return render(request, 'shift_log/daily_reports_list.html', context)
 
 
+def _can_download_daily_pdf(employee, department_id):
+    """
+    Сводка отдела за день содержит отчёты всех сотрудников, поэтому в
+    индивидуальном режиме она доступна только руководителю
+    """
+    if employee.position == 'admin':
+        return True
+    return employee.department_id == department_id and (
+        not employee.individual_report or employee.is_supervisor
+    )
+
+
+@login_required
+def daily_report_pdf(request, department_id, day):
+    """
+    PDF-сводка отдела за день (services.daily_pdf)
+
+    Обычно файл уже построен командой build_daily_pdfs; если его нет или
+    за день что-то изменилось, он строится при запросе.
+    """
+    employee = getattr(request.user, 'employee', None)
+    day = _parse_date(day)
+    if employee is None or day is None or not _can_download_daily_pdf(employee, department_id):
+        raise Http404
+    department = get_object_or_404(Department, pk=department_id)
+
+    def serve(name):
+        pdf = FieldFile(None, DailyReportPhoto._meta.get_field('image'), name)
+        return serve_file(request, pdf, f'{department.name} {day:%Y-%m-%d}.pdf', 'application/pdf',
+                          as_attachment=False)
+
+    try:
+        return serve(DailyReportPdf.ensure(department, day))
+    except FileNotFoundError:
+        # Версию удалила build_daily_pdfs между построением и отдачей
+        return serve(DailyReportPdf.ensure(department, day))
+
+
+@login_required
+def daily_report_photos(request, report_id):
+    """JSON: все фотографии отчёта для галереи (загружается при открытии)"""
+    employee = getattr(request.user, 'employee', None)
+    if employee is None:
+        return JsonResponse({'success': False, 'error': 'Профиль сотрудника не найден'}, status=403)
+    report = get_object_or_404(_visible_daily_reports(employee), pk=report_id)
+    photos = report.photos.filter(file_present=True).select_related('blob', 'uploaded_by__user')
+    return JsonResponse({
+        'success': True,
+        'photos': [
+            {
+                'id': photo.id,
+                'url': photo.get_image_url(),
+                'preview_url': photo.get_preview_url(),
+                'preview_webp_url': photo.get_preview_webp_url(),
+                'thumbnail_url': photo.get_thumbnail_url(),
+                'caption': photo.caption,
+                'uploaded_at': timezone.localtime(photo.uploaded_at).strftime('%d.%m.%Y %H:%M'),
+                'uploaded_by': photo.uploaded_by.get_full_name(),
+            }
+            for photo in photos
+        ],
+    })
+
+
+@login_required
+def shift_schedule(request):
+    """График смен отдела на месяц (сотрудники × дни)"""
+    employee = getattr(request.user, 'employee', None)
+    if employee is None:
+        messages.error(request, 'Профиль сотрудника не найден')
+        return redirect('shift_log:dashboard')
+
+    today = localdate()
+    try:
+        year, month = (int(part) for part in request.GET.get('month', '').split('-'))
+        first_day = date(year, month, 1)
+    except ValueError:
+        first_day = today.replace(day=1)
+
+    # Администратор выбирает отдел, остальные видят свой
+    department = employee.department
+    departments = None
+    if employee.position == 'admin':
+        departments = Department.objects.all()
+        if request.GET.get('department', '').isdigit():
+            department = get_object_or_404(Department, pk=request.GET['department'])
+
+    grid = ShiftScheduleService.get_month(department.pk, first_day.year, first_day.month)
+    rows = grid['rows']
+    if employee.position == 'employee':
+        # Сотрудник видит только свои смены (как в Shift.objects.visible_to)
+        rows = [row for row in rows if row['employee_id'] == employee.pk]
+
+    shift_types = grid['shift_types']
+    days = [first_day.replace(day=day) for day in range(1, grid['days'] + 1)]
+    previous_month = first_day - timedelta(days=1)
+    next_month = first_day + timedelta(days=grid['days'])
+
+    return render(request, 'shift_log/shift_schedule.html', {
+        'department': department,
+        'departments': departments,
+        'month': first_day,
+        'days': days,
+        'today': today,
+        'shift_types': shift_types,
+        'rows': [
+            {
+                'name': row['name'],
+                'shifts': row['shifts'],
+                'hours': row['hours'],
+                'cells': [
+                    [{'shift_type': shift_types[index], 'shift_id': shift_id} for index, shift_id in cell]
+                    for cell in row['cells']
+                ],
+            }
+            for row in rows
+        ],
+        'previous_month': previous_month.strftime('%Y-%m'),
+        'next_month': next_month.strftime('%Y-%m'),
+        'employee_feed_url': request.build_absolute_uri(
+            reverse('shift_log:employee_calendar_feed', args=[employee.get_calendar_token()])
+        ),
+        'department_feed_url': request.build_absolute_uri(
+            reverse('shift_log:department_calendar_feed', args=[employee.get_calendar_token()])
+        ) if employee.is_supervisor else None,
+        'can_find_replacements': employee.is_supervisor,
+    })
+
+
+@login_required
+def shift_replacements(request, shift_id):
+    """
+    Подбор замены на смену
+
+    GET — кандидаты из отдела смены, свободные и отдохнувшие, меньше
+    загруженные на неделе первыми. POST action=assign назначает одного
+    кандидата, action=notify рассылает запрос выбранным кандидатам.
+    """
+    employee = getattr(request.user, 'employee', None)
+    if employee is None or not employee.is_supervisor:
+        messages.error(request, 'Подбор замены доступен только руководителям')
+        return redirect('shift_log:shift_schedule')
+    shift = get_object_or_404(
+        Shift.objects.visible_to(employee).select_related('shift_type', 'shift_type__department'),
+        pk=shift_id
+    )
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        candidates = Employee.objects.filter(
+            department_id=shift.shift_type.department_id, is_active=True
+        ).select_related('user')
+        if action == 'assign':
+            candidate = get_object_or_404(candidates, pk=request.POST.get('employee_id'))
+            try:
+                ReplacementService.assign(shift, candidate, assigned_by=employee)
+            except ValidationError as e:
+                messages.error(request, '; '.join(e.messages))
+            else:
+                messages.success(request, f'{candidate.get_full_name()} назначен(а) на смену')
+                return redirect(
+                    reverse('shift_log:shift_schedule') + f'?month={shift.date:%Y-%m}'
+                    + (f'&department={shift.shift_type.department_id}' if employee.is_admin else '')
+                )
+        elif action == 'notify':
+            recipients = list(candidates.filter(pk__in=request.POST.getlist('employee_ids')))
+            if recipients:
+                count = ReplacementService.notify_candidates(shift, recipients)
+                messages.success(request, f'Запрос на замену отправлен: {count}')
+            else:
+                messages.warning(request, 'Не выбраны сотрудники для оповещения')
+        return redirect('shift_log:shift_replacements', shift_id=shift.pk)
+
+    return render(request, 'shift_log/shift_replacements.html', {
+        'shift': shift,
+        'assigned': shift.employees.select_related('user'),
+        'candidates': ReplacementService.find_candidates(shift),
+    })
+
+
+@login_required
+def labor_hours_report(request):
+    """
+    Сводка рабочего времени отдела за месяц (план, факт, переработка, опоздания)
+
+    Доступна руководителям и администраторам; ?format=csv отдаёт файл.
+    """
+    employee = getattr(request.user, 'employee', None)
+    if employee is None or not employee.is_supervisor:
+        messages.error(request, 'Сводка рабочего времени доступна только руководителям')
+        return redirect('shift_log:dashboard')
+
+    try:
+        year, month = (int(part) for part in request.GET.get('month', '').split('-'))
+        first_day = date(year, month, 1)
+    except ValueError:
+        first_day = localdate().replace(day=1)
+
+    department = employee.department
+    departments = None
+    if employee.is_admin:
+        departments = Department.objects.all()
+        if request.GET.get('department', '').isdigit():
+            department = get_object_or_404(Department, pk=request.GET['department'])
+
+    rows = LaborHoursService.report(department, first_day.year, first_day.month)
+
+    if request.GET.get('format') == 'csv':
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = content_disposition_header(
+            True, f'Рабочее время {department.name} {first_day:%Y-%m}.csv'
+        )
+        # BOM — чтобы Excel распознал UTF-8
+        response.write('\ufeff')
+        LaborHoursService.write_csv(rows, response)
+        return response
+
+    totals = {
+        key: sum(getattr(row, key) for row in rows)
+        for key in LABOR_METRICS
+    }
+    return render(request, 'shift_log/labor_hours.html', {
+        'department': department,
+        'departments': departments,
+        'month': first_day,
+        'rows': rows,
+        'totals': totals,
+    })
+
+
+@login_required
+def reset_calendar_token(request):
+    """Выпускает новый токен подписки на календарь (старые ссылки перестают работать)"""
+    employee = getattr(request.user, 'employee', None)
+    if employee is None or request.method != 'POST':
+        return redirect('shift_log:shift_schedule')
+    employee.reset_calendar_token()
+    messages.success(request, 'Ссылка на календарь обновлена. Подпишитесь на календарь заново.')
+    return redirect('shift_log:shift_schedule')
+
+
+@login_required
+def api_autocomplete_materials(request):
+    """
+    API: подсказки названий материалов (?q=, ?limit=)
+
+    Материалы своего отдела; администратор может указать ?department=.
+    """
+    employee = getattr(request.user, 'employee', None)
+    if employee is None:
+        return JsonResponse({'success': False, 'error': 'Профиль сотрудника не найден'}, status=403)
+    department_id = employee.department_id
+    if employee.is_admin and request.GET.get('department', '').isdigit():
+        department_id = int(request.GET['department'])
+    return JsonResponse({
+        'success': True,
+        'results': AutocompleteService.materials(
+            request.GET.get('q', ''), department_id, parse_limit(request.GET.get('limit'))
+        ),
+    })
+
+
+@login_required
+def api_autocomplete_task_projects(request):
+    """API: подсказки проектов заданий (?q=, ?limit=) — [{'id', 'name'}]"""
+    if getattr(request.user, 'employee', None) is None:
+        return JsonResponse({'success': False, 'error': 'Профиль сотрудника не найден'}, status=403)
+    return JsonResponse({
+        'success': True,
+        'results': AutocompleteService.task_projects(
+            request.GET.get('q', ''), parse_limit(request.GET.get('limit'))
+        ),
+    })
+
+
+@login_required
+def api_shift_conflicts(request):
+    """
+    API: конфликты назначений (пересечения смен и недостаточный отдых)
+
+    Параметры: employee или department, date_from, date_to (по умолчанию
+    текущий месяц), min_rest_hours. Сотрудник видит только свои конфликты,
+    руководитель — своего отдела, администратор — любого.
+    """
+    employee = getattr(request.user, 'employee', None)
+    if employee is None:
+        return JsonResponse({'success': False, 'error': 'Профиль сотрудника не найден'}, status=403)
+
+    today = localdate()
+    try:
+        date_from = date.fromisoformat(request.GET['date_from']) if request.GET.get('date_from') \
+            else today.replace(day=1)
+        date_to = date.fromisoformat(request.GET['date_to']) if request.GET.get('date_to') \
+            else (date_from.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        min_rest = timedelta(hours=float(request.GET['min_rest_hours'])) \
+            if request.GET.get('min_rest_hours') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректные параметры'}, status=400)
+    if date_from > date_to or (date_to - date_from).days > 366:
+        return JsonResponse({'success': False, 'error': 'Некорректный период (не более года)'}, status=400)
+
+    target = None
+    if request.GET.get('employee', '').isdigit():
+        target = Employee.objects.filter(pk=request.GET['employee']).first()
+        if target is None:
+            return JsonResponse({'success': False, 'error': 'Сотрудник не найден'}, status=404)
+    elif not employee.is_supervisor:
+        target = employee
+
+    if target is not None:
+        if not (employee.is_admin or target.pk == employee.pk or
+                (employee.is_supervisor and target.department_id == employee.department_id)):
+            return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+        conflicts = ShiftConflictService.for_employee(target, date_from, date_to, min_rest)
+    else:
+        department = employee.department
+        if request.GET.get('department', '').isdigit():
+            department = get_object_or_404(Department, pk=request.GET['department'])
+            if not employee.is_admin and department.pk != employee.department_id:
+                return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+        conflicts = ShiftConflictService.for_department(department, date_from, date_to, min_rest)
+
+    return JsonResponse({
+        'success': True,
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'conflicts': [conflict.to_dict() for conflict in conflicts],
+    })
+
+
+def _id_list(value):
+    """Список id из JSON (ValueError, если это не список целых)"""
+    if not isinstance(value, list) or not all(isinstance(item, int) for item in value):
+        raise ValueError(value)
+    return value
+
+
+@login_required
+def api_shift_bulk_assign(request):
+    """
+    API: массовое назначение на смены (JSON, POST)
+
+    Формат запроса:
+        {"operations": [{"action": "assign" | "unassign",
+                         "shift_ids": [...], "employee_ids": [...]}],
+         "rotation": {"date_from": "YYYY-MM-DD", "date_to": "YYYY-MM-DD",
+                      "shift_type_ids": [...], "crews": [[...], [...]], "offset": 0,
+                      "department": id},
+         "replace": false, "allow_rest_violations": false, "dry_run": false}
+
+    operations и rotation можно сочетать. rotation распределяет
+    существующие неотменённые смены отдела за период по бригадам по кругу.
+    Доступно руководителям (смены своего отдела) и администраторам.
+    При конфликтах ничего не записывается, ответ 409 со списком конфликтов.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    employee = getattr(request.user, 'employee', None)
+    if employee is None or not employee.is_supervisor:
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+
+    assign, unassign = defaultdict(set), defaultdict(set)
+    try:
+        data = json.loads(request.body)
+        for operation in data.get('operations', []):
+            target = {'assign': assign, 'unassign': unassign}[operation.get('action', 'assign')]
+            for shift_id in _id_list(operation['shift_ids']):
+                target[shift_id].update(_id_list(operation['employee_ids']))
+
+        rotation = data.get('rotation')
+        if rotation:
+            department_id = rotation.get('department', employee.department_id)
+            shifts = Shift.objects.filter(
+                shift_type__department_id=department_id,
+                date__range=(date.fromisoformat(rotation['date_from']), date.fromisoformat(rotation['date_to'])),
+                is_cancelled=False,
+            ).select_related('shift_type')
+            if rotation.get('shift_type_ids'):
+                shifts = shifts.filter(shift_type_id__in=_id_list(rotation['shift_type_ids']))
+            crews = [_id_list(crew) for crew in rotation['crews']]
+            plan = BulkAssignmentService.rotation(shifts, crews, int(rotation.get('offset', 0)))
+            for shift_id, employee_ids in plan.items():
+                assign[shift_id].update(employee_ids)
+    except (json.JSONDecodeError, AttributeError, KeyError, TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Некорректные параметры'}, status=400)
+
+    shift_ids = set(assign) | set(unassign)
+    if not shift_ids:
+        return JsonResponse({'success': False, 'error': 'Нет смен для изменения'}, status=400)
+    if not employee.is_admin:
+        # Руководитель меняет только смены и сотрудников своего отдела; при замене
+        # составов сотрудники других отделов сняты были бы неявно — это тоже запрещено
+        employee_ids = set().union(*assign.values(), *unassign.values())
+        if Shift.objects.filter(pk__in=shift_ids).exclude(
+                shift_type__department_id=employee.department_id).exists() \
+                or Employee.objects.filter(pk__in=employee_ids).exclude(
+                    department_id=employee.department_id).exists() \
+                or data.get('replace') and ShiftAssignment.objects.filter(shift_id__in=assign).exclude(
+                    employee__department_id=employee.department_id).exists():
+            return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+
+    try:
+        result = BulkAssignmentService.apply(
+            assign, unassign,
+            replace=bool(data.get('replace')),
+            allow_rest_violations=bool(data.get('allow_rest_violations')),
+            dry_run=bool(data.get('dry_run')),
+        )
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': '; '.join(e.messages)}, status=400)
+
+    return JsonResponse({
+        'success': not result['conflicts'],
+        'applied': result['applied'],
+        'created': result['created'],
+        'deleted': result['deleted'],
+        'conflicts': [conflict.to_dict() for conflict in result['conflicts']],
+    }, status=409 if result['conflicts'] else 200)
+
+
+def _calendar_feed_response(request, shifts, scope, name, with_attendees=False):
+    """Отдаёт ленту iCalendar потоком или 304, если она не менялась"""
+    etag, last_modified = ICalFeed.validators(shifts, scope)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = StreamingHttpResponse(
+            (chunk.encode('utf-8') for chunk in
+             ICalFeed.render(shifts, name, request.get_host().split(':')[0], with_attendees)),
+            content_type='text/calendar; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'inline; filename="shifts.ics"'
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # Лента доступна по секретной ссылке — общим кэшам её хранить нельзя
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _calendar_feed_owner(token):
+    return get_object_or_404(
+        Employee.objects.select_related('user', 'department'), calendar_token=token, is_active=True
+    )
+
+
+def _calendar_feed_period():
+    return feed_period(
+        localdate(),
+        getattr(settings, 'CALENDAR_FEED_PAST_DAYS', 31),
+        getattr(settings, 'CALENDAR_FEED_FUTURE_DAYS', 180),
+    )
+
+
+def employee_calendar_feed(request, token):
+    """Лента .ics смен сотрудника (доступ по токену, без входа в систему)"""
+    employee = _calendar_feed_owner(token)
+    start_date, end_date = _calendar_feed_period()
+    shifts = get_employee_schedule(employee, start_date, end_date)
+    return _calendar_feed_response(
+        request, shifts, f'employee:{employee.pk}:{start_date}:{end_date}',
+        f'Смены: {employee.get_full_name()}'
+    )
+
+
+def department_calendar_feed(request, token):
+    """Лента .ics всех смен отдела — для руководителей и администраторов"""
+    employee = _calendar_feed_owner(token)
+    if not employee.is_supervisor:
+        raise Http404
+    department = employee.department
+    if employee.is_admin and request.GET.get('department', '').isdigit():
+        department = get_object_or_404(Department, pk=request.GET['department'])
+    start_date, end_date = _calendar_feed_period()
+    shifts = get_department_schedule(department, start_date, end_date)
+    return _calendar_feed_response(
+        request, shifts, f'department:{department.pk}:{start_date}:{end_date}',
+        f'Смены отдела: {department.name}', with_attendees=True
+    )
+
+
 class MaterialWriteOffListView(LoginRequiredMixin, ListView):
     model = MaterialWriteOff
     template_name = 'shift_log/material_writeoff_list.html'
@@ -1791,13 +2415,19 @@ class MaterialWriteOffListView(LoginRequiredMixin, ListView):
             # Фильтрация по сотруднику
             if created_by_id:
                 qs = qs.filter(created_by_id=created_by_id)
-        # Фильтрация по дате
-        if date_from:
-            qs = qs.filter(created_at__date__gte=date_from)
-        if date_to:
-            qs = qs.filter(created_at__date__lte=date_to)
+        # Фильтрация по дате: диапазон времени, а не приведение к дате, — работает индекс
+        qs = qs.filter(**local_date_range_filter('created_at', date_from, date_to))
         return qs.order_by('-created_at')
 
+    def get(self, request, *args, **kwargs):
+        # Выгрузка в Excel с теми же фильтрами, без постраничного вывода
+        if request.GET.get('format') == 'xlsx':
+            return _xlsx_response(
+                export_filename('Списания материалов'), 'Списания',
+                XlsxExport.WRITEOFF_COLUMNS, XlsxExport.writeoffs(self.get_queryset())
+            )
+        return super().get(request, *args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
@@ -1851,6 +2481,154 @@ class MaterialWriteOffCreateView(LoginRequiredMixin, CreateView):
         return context
 
 
+@login_required
+def material_writeoff_summary(request):
+    """
+    Итоги списаний за период по материалам (с единицей измерения), а также
+    по назначению и отделу, если они выбраны в ?group=
+
+    Считается по списаниям за день (services.writeoff_summary), поэтому
+    период может быть любым. По умолчанию — с начала текущего месяца;
+    ?format=xlsx выгружает итоги в Excel.
+    """
+    employee = getattr(request.user, 'employee', None)
+    if employee is None:
+        messages.error(request, 'Профиль сотрудника не найден')
+        return redirect('shift_log:dashboard')
+
+    today = localdate()
+    date_from = _parse_date(request.GET.get('date_from')) or today.replace(day=1)
+    date_to = _parse_date(request.GET.get('date_to')) or today
+    group_by = [name for name in request.GET.getlist('group') if name in WRITEOFF_GROUPINGS]
+
+    departments = None
+    if employee.position == 'admin':
+        departments = Department.objects.all()
+        department_ids = [int(request.GET['department'])] if request.GET.get('department', '').isdigit() else None
+    else:
+        department_ids = [employee.department_id]
+
+    rows = WriteOffSummaryService.summary(date_from, date_to, department_ids, group_by)
+    unit_names = dict(UNIT_CHOICES)
+    for row in rows:
+        row['unit_display'] = unit_names.get(row['unit'], row['unit'])
+
+    if request.GET.get('format') == 'xlsx':
+        columns = (
+            ([('Отдел', 20)] if 'department' in group_by else [])
+            + [('Что списали', 40), ('Ед. изм.', 10)]
+            + ([('Куда', 30)] if 'destination' in group_by else [])
+            + [('Количество', 14), ('Списаний', 12)]
+        )
+        return _xlsx_response(
+            f'Итоги списаний {date_from:%Y-%m-%d} — {date_to:%Y-%m-%d}.xlsx', 'Итоги списаний', columns,
+            (
+                ([row['department__name']] if 'department' in group_by else [])
+                + [row['material_name'], row['unit_display']]
+                + ([row['destination']] if 'destination' in group_by else [])
+                + [row['total_quantity'], row['total_writeoffs']]
+                for row in rows
+            )
+        )
+
+    return render(request, 'shift_log/material_writeoff_summary.html', {
+        'employee': employee,
+        'rows': rows,
+        'departments': departments,
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'group_by': group_by,
+        'selected_department': request.GET.get('department', ''),
+    })
+
+
+@login_required
+def material_stock_list(request):
+    """
+    Остатки материалов отдела и внесение поступлений
+
+    Остаток — одна строка MaterialStock, история не суммируется
+    (см. services.material_stock).
+    """
+    employee = getattr(request.user, 'employee', None)
+    if employee is None:
+        messages.error(request, 'Профиль сотрудника не найден')
+        return redirect('shift_log:dashboard')
+
+    if request.method == 'POST':
+        form = MaterialReceiptForm(request.POST, employee=employee)
+        if form.is_valid():
+            data = form.cleaned_data
+            movement = MaterialStockService.receive(
+                data['department'].pk, data['material_name'], data['unit'], data['quantity'],
+                created_by=employee, comment=data['comment']
+            )
+            messages.success(
+                request,
+                f'Поступление записано, остаток: {movement.balance_after} {movement.stock.get_unit_display()}'
+            )
+            return redirect('shift_log:material_stock_list')
+    else:
+        form = MaterialReceiptForm(employee=employee)
+
+    stocks = MaterialStock.objects.select_related('department')
+    departments = None
+    if employee.is_admin:
+        departments = Department.objects.all()
+        if request.GET.get('department', '').isdigit():
+            stocks = stocks.filter(department_id=request.GET['department'])
+    else:
+        stocks = stocks.filter(department_id=employee.department_id)
+    search = request.GET.get('search', '').strip()
+    if search:
+        stocks = stocks.filter(material_name__icontains=search)
+
+    return render(request, 'shift_log/material_stock_list.html', {
+        'employee': employee,
+        'stocks': stocks.order_by('department__name', 'material_name', 'unit'),
+        'departments': departments,
+        'selected_department': request.GET.get('department', ''),
+        'search': search,
+        'form': form,
+    })
+
+
+@login_required
+def material_stock_detail(request, stock_id):
+    """Журнал движений материала; руководитель вносит результат инвентаризации"""
+    employee = getattr(request.user, 'employee', None)
+    if employee is None:
+        messages.error(request, 'Профиль сотрудника не найден')
+        return redirect('shift_log:dashboard')
+    stocks = MaterialStock.objects.select_related('department')
+    if not employee.is_admin:
+        stocks = stocks.filter(department_id=employee.department_id)
+    stock = get_object_or_404(stocks, pk=stock_id)
+
+    form = None
+    if employee.is_supervisor:
+        form = MaterialAdjustmentForm(request.POST or None, initial={'balance': stock.balance})
+        if request.method == 'POST' and form.is_valid():
+            movement = MaterialStockService.adjust(
+                stock, form.cleaned_data['balance'], created_by=employee, comment=form.cleaned_data['comment']
+            )
+            if movement is None:
+                messages.info(request, 'Остаток уже совпадает с фактическим')
+            else:
+                messages.success(request, f'Остаток исправлен на {movement.quantity:+}')
+            return redirect('shift_log:material_stock_detail', stock_id=stock.pk)
+
+    movements = Paginator(
+        stock.movements.select_related('created_by__user', 'writeoff').order_by('-id'), 50
+    ).get_page(request.GET.get('page'))
+    return render(request, 'shift_log/material_stock_detail.html', {
+        'employee': employee,
+        'stock': stock,
+        'movements': movements,
+        'form': form,
+    })
+
+
 class NoteListView(LoginRequiredMixin, ListView):
     model = Note
     template_name = 'shift_log/note_list.html'
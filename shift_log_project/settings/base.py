@@ -45,6 +45,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shift_log.middleware.EmployeeContextMiddleware',  # user.employee и отдел за один запрос
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -126,6 +127,12 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Отдача вложений: 'django' — потоком из Django,
+# 'x-accel' — через nginx (X-Accel-Redirect), 'x-sendfile' — через apache/lighttpd
+ATTACHMENT_DELIVERY_MODE = os.environ.get('ATTACHMENT_DELIVERY_MODE', 'django')
+# internal-location nginx, указывающий на MEDIA_ROOT (для режима 'x-accel')
+ATTACHMENT_X_ACCEL_PREFIX = os.environ.get('ATTACHMENT_X_ACCEL_PREFIX', '/protected-media/')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -157,9 +164,35 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
 
 # File upload settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
-DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
+# Файлы крупнее FILE_UPLOAD_MAX_MEMORY_SIZE пишутся во временный файл, а не в память
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB (значение Django по умолчанию)
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB, без учёта файлов
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB
+# Размер порции для возобновляемой загрузки (api/uploads/)
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+# Потоки фоновой генерации миниатюр и превью изображений
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Окно календаря типов смен (таблица ShiftOccurrence), дней от сегодня
+SHIFT_CALENDAR_PAST_DAYS = 31
+SHIFT_CALENDAR_HORIZON_DAYS = 400
+# Время жизни кэша графика смен отдела за месяц, секунд
+SHIFT_SCHEDULE_CACHE_TIMEOUT = 3600
+# Минимальный отдых между сменами сотрудника, часов (проверка конфликтов назначений)
+SHIFT_MIN_REST_HOURS = 12
+# Опоздание меньше этого числа минут в сводке рабочего времени не учитывается
+LABOR_LATE_GRACE_MINUTES = 5
+# Период лент календаря смен (.ics), дней назад и вперёд от сегодня
+CALENDAR_FEED_PAST_DAYS = 31
+CALENDAR_FEED_FUTURE_DAYS = 180
+# Список ежедневных отчётов: период по умолчанию (дней назад) и отчётов на странице
+DAILY_REPORTS_DEFAULT_DAYS = 30
+DAILY_REPORTS_PAGE_SIZE = 30
+# Шрифты PDF-сводок (нужна кириллица)
+PDF_FONT_PATH = os.environ.get('PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+PDF_FONT_BOLD_PATH = os.environ.get('PDF_FONT_BOLD_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf')
+# Время жизни кэша частоты использования для автодополнения, секунд
+AUTOCOMPLETE_CACHE_TIMEOUT = 300
 
 # Celery settings (for background tasks)
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
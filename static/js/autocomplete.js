@@ -0,0 +1,99 @@
+// Автодополнение полей ввода по API подсказок (api/autocomplete/...)
+//
+// <input data-autocomplete-url="..."> — подсказки подставляются в <datalist>;
+// если в форме есть поле department, подсказки берутся для выбранного отдела.
+// <input data-autocomplete-select="id списка"> — поиск по списку <select>:
+// найденные варианты заменяют опции списка, выбранная опция и опции с
+// нечисловыми значениями (без проекта, создать новый) сохраняются.
+
+(function (window, document) {
+    'use strict';
+
+    var DELAY = 200;
+
+    function fetchResults(url, query, extra) {
+        var params = new URLSearchParams(extra || {});
+        params.set('q', query);
+        return fetch(url + '?' + params.toString(), {credentials: 'same-origin'})
+            .then(function (response) { return response.ok ? response.json() : {results: []}; })
+            .then(function (data) { return data.results || []; })
+            .catch(function () { return []; });
+    }
+
+    function debounce(fn) {
+        var timer = null;
+        return function () {
+            var args = arguments;
+            clearTimeout(timer);
+            timer = setTimeout(function () { fn.apply(null, args); }, DELAY);
+        };
+    }
+
+    function attachDatalist(input) {
+        var list = document.createElement('datalist');
+        list.id = (input.id || input.name) + '-suggestions';
+        input.setAttribute('list', list.id);
+        input.parentNode.appendChild(list);
+
+        var lastQuery = null;
+        var update = debounce(function () {
+            var query = input.value.trim();
+            if (query === lastQuery) {
+                return;
+            }
+            lastQuery = query;
+            var extra = {};
+            var department = input.form && input.form.elements.department;
+            if (department && department.value) {
+                extra.department = department.value;
+            }
+            fetchResults(input.dataset.autocompleteUrl, query, extra).then(function (names) {
+                list.innerHTML = '';
+                names.forEach(function (name) {
+                    var option = document.createElement('option');
+                    option.value = name;
+                    list.appendChild(option);
+                });
+            });
+        });
+        input.addEventListener('input', update);
+        input.addEventListener('focus', update);
+    }
+
+    function attachSelectSearch(input) {
+        var select = document.getElementById(input.dataset.autocompleteSelect);
+        if (!select) {
+            return;
+        }
+        var update = debounce(function () {
+            fetchResults(input.dataset.autocompleteUrl, input.value.trim()).then(function (items) {
+                Array.prototype.slice.call(select.options).forEach(function (option) {
+                    if (/^\d+$/.test(option.value) && !option.selected) {
+                        select.removeChild(option);
+                    }
+                });
+                items.forEach(function (item) {
+                    if (String(item.id) === select.value) {
+                        return;
+                    }
+                    var option = document.createElement('option');
+                    option.value = item.id;
+                    option.textContent = item.name;
+                    select.appendChild(option);
+                });
+            });
+        });
+        input.addEventListener('input', update);
+        update();
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('input[data-autocomplete-url]').forEach(function (input) {
+            if (input.dataset.autocompleteSelect) {
+                attachSelectSearch(input);
+            } else {
+                attachDatalist(input);
+            }
+        });
+    });
+})(window, document);
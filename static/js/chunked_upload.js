@@ -0,0 +1,254 @@
+// Порционная (возобновляемая) загрузка файлов: init → PUT порций → finalize
+//
+// Контрольная сумма считается инкрементально по тем же порциям, поэтому
+// файл не читается в память целиком. Собственная реализация SHA-256 нужна,
+// потому что crypto.subtle доступен только в защищённом контексте (HTTPS),
+// а система работает и по HTTP во внутренней сети.
+
+(function (window) {
+    'use strict';
+
+    // ---- SHA-256 (FIPS 180-4), инкрементальный ----
+    var K = new Uint32Array([
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+    ]);
+
+    function Sha256() {
+        this.h = new Uint32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+            0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+        ]);
+        this.w = new Uint32Array(64);
+        this.buffer = new Uint8Array(64);
+        this.bufferLength = 0;
+        this.bytes = 0;
+    }
+
+    Sha256.prototype._block = function (data, offset) {
+        var w = this.w, h = this.h, i, t1, t2;
+        for (i = 0; i < 16; i++) {
+            w[i] = (data[offset + i * 4] << 24) | (data[offset + i * 4 + 1] << 16) |
+                (data[offset + i * 4 + 2] << 8) | data[offset + i * 4 + 3];
+        }
+        for (i = 16; i < 64; i++) {
+            var a = w[i - 15], b = w[i - 2];
+            var s0 = ((a >>> 7) | (a << 25)) ^ ((a >>> 18) | (a << 14)) ^ (a >>> 3);
+            var s1 = ((b >>> 17) | (b << 15)) ^ ((b >>> 19) | (b << 13)) ^ (b >>> 10);
+            w[i] = (w[i - 16] + s0 + w[i - 7] + s1) | 0;
+        }
+        var A = h[0], B = h[1], C = h[2], D = h[3], E = h[4], F = h[5], G = h[6], H = h[7];
+        for (i = 0; i < 64; i++) {
+            var S1 = ((E >>> 6) | (E << 26)) ^ ((E >>> 11) | (E << 21)) ^ ((E >>> 25) | (E << 7));
+            var ch = (E & F) ^ (~E & G);
+            t1 = (H + S1 + ch + K[i] + w[i]) | 0;
+            var S0 = ((A >>> 2) | (A << 30)) ^ ((A >>> 13) | (A << 19)) ^ ((A >>> 22) | (A << 10));
+            var maj = (A & B) ^ (A & C) ^ (B & C);
+            t2 = (S0 + maj) | 0;
+            H = G; G = F; F = E; E = (D + t1) | 0;
+            D = C; C = B; B = A; A = (t1 + t2) | 0;
+        }
+        h[0] += A; h[1] += B; h[2] += C; h[3] += D;
+        h[4] += E; h[5] += F; h[6] += G; h[7] += H;
+    };
+
+    Sha256.prototype.update = function (data) {
+        var pos = 0;
+        this.bytes += data.length;
+        if (this.bufferLength > 0) {
+            while (this.bufferLength < 64 && pos < data.length) {
+                this.buffer[this.bufferLength++] = data[pos++];
+            }
+            if (this.bufferLength === 64) {
+                this._block(this.buffer, 0);
+                this.bufferLength = 0;
+            }
+        }
+        while (pos + 64 <= data.length) {
+            this._block(data, pos);
+            pos += 64;
+        }
+        while (pos < data.length) {
+            this.buffer[this.bufferLength++] = data[pos++];
+        }
+        return this;
+    };
+
+    Sha256.prototype.hex = function () {
+        var bitsHigh = Math.floor(this.bytes / 0x20000000), bitsLow = (this.bytes << 3) >>> 0;
+        var padLength = (this.bufferLength < 56 ? 56 : 120) - this.bufferLength;
+        var pad = new Uint8Array(padLength + 8);
+        pad[0] = 0x80;
+        for (var i = 0; i < 4; i++) {
+            pad[padLength + i] = (bitsHigh >>> (24 - i * 8)) & 0xff;
+            pad[padLength + 4 + i] = (bitsLow >>> (24 - i * 8)) & 0xff;
+        }
+        this.update(pad);
+        var out = '';
+        for (var j = 0; j < 8; j++) {
+            out += ('00000000' + this.h[j].toString(16)).slice(-8);
+        }
+        return out;
+    };
+
+    // ---- Загрузчик ----
+    function readSlice(file, start, end) {
+        return new Promise(function (resolve, reject) {
+            var reader = new FileReader();
+            reader.onload = function () { resolve(new Uint8Array(reader.result)); };
+            reader.onerror = function () { reject(reader.error); };
+            reader.readAsArrayBuffer(file.slice(start, end));
+        });
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    /**
+     * options: initUrl, chunkUrl(id), finalizeUrl(id), csrfToken,
+     *          params (object_id, attachment_type, target), onProgress(fraction, stage)
+     */
+    function ChunkedUploader(options) {
+        this.options = options;
+        this.maxRetries = options.maxRetries || 8;
+    }
+
+    ChunkedUploader.prototype._storageKey = function (file) {
+        var p = this.options.params;
+        return 'chunked-upload:' + [p.target || 'attachment', p.attachment_type || '', p.object_id,
+            file.name, file.size, file.lastModified].join(':');
+    };
+
+    ChunkedUploader.prototype._request = function (method, url, body, headers) {
+        headers = headers || {};
+        headers['X-CSRFToken'] = this.options.csrfToken;
+        return fetch(url, { method: method, body: body, headers: headers, credentials: 'same-origin' })
+            .then(function (response) {
+                return response.json().then(function (data) {
+                    data.status = response.status;
+                    return data;
+                });
+            });
+    };
+
+    ChunkedUploader.prototype._checksum = function (file, chunkSize) {
+        var self = this, hash = new Sha256(), offset = 0;
+        function next() {
+            if (offset >= file.size) {
+                return Promise.resolve(hash.hex());
+            }
+            var end = Math.min(offset + chunkSize, file.size);
+            return readSlice(file, offset, end).then(function (bytes) {
+                hash.update(bytes);
+                offset = end;
+                self._progress(offset / file.size, 'hash');
+                return next();
+            });
+        }
+        return next();
+    };
+
+    ChunkedUploader.prototype._progress = function (fraction, stage) {
+        if (this.options.onProgress) {
+            this.options.onProgress(fraction, stage);
+        }
+    };
+
+    ChunkedUploader.prototype._resumeOrInit = function (file) {
+        var self = this, key = this._storageKey(file);
+        var saved = window.localStorage ? localStorage.getItem(key) : null;
+
+        function init() {
+            return self._checksum(file, 4 * 1024 * 1024).then(function (sha256) {
+                var form = new FormData();
+                var params = self.options.params;
+                Object.keys(params).forEach(function (name) { form.append(name, params[name]); });
+                form.append('filename', file.name);
+                form.append('content_type', file.type || 'application/octet-stream');
+                form.append('total_size', file.size);
+                form.append('sha256', sha256);
+                return self._request('POST', self.options.initUrl, form);
+            }).then(function (data) {
+                if (!data.success) {
+                    throw new Error(data.error || 'Не удалось начать загрузку');
+                }
+                if (window.localStorage && data.upload_id) {
+                    localStorage.setItem(key, data.upload_id);
+                }
+                return data;
+            });
+        }
+
+        if (!saved) {
+            return init();
+        }
+        // Продолжаем прерванную загрузку с последнего подтверждённого смещения
+        return this._request('GET', this.options.chunkUrl(saved)).then(function (data) {
+            return data.success ? data : init();
+        }, init);
+    };
+
+    ChunkedUploader.prototype.upload = function (file) {
+        var self = this, key = this._storageKey(file);
+        return this._resumeOrInit(file).then(function (session) {
+            if (session.attachment_id) {
+                // Такой файл уже есть на сервере — вложение создано без передачи данных
+                return session;
+            }
+            var uploadId = session.upload_id, chunkSize = session.chunk_size, retries = 0;
+
+            function sendFrom(offset) {
+                self._progress(offset / file.size, 'upload');
+                if (offset >= file.size) {
+                    return self._request('POST', self.options.finalizeUrl(uploadId));
+                }
+                var end = Math.min(offset + chunkSize, file.size);
+                return self._request('PUT', self.options.chunkUrl(uploadId), file.slice(offset, end), {
+                    'Upload-Offset': String(offset),
+                    'Content-Type': 'application/octet-stream'
+                }).then(function (data) {
+                    if (data.success) {
+                        retries = 0;
+                        return sendFrom(data.offset);
+                    }
+                    if (data.status === 409 && typeof data.offset === 'number') {
+                        return sendFrom(data.offset);
+                    }
+                    throw new Error(data.error || 'Ошибка загрузки');
+                }, function () {
+                    // Обрыв связи: ждём и уточняем смещение у сервера
+                    if (++retries > self.maxRetries) {
+                        throw new Error('Нет связи с сервером, загрузка будет продолжена при повторной попытке');
+                    }
+                    return sleep(Math.min(1000 * Math.pow(2, retries), 30000)).then(function () {
+                        return self._request('GET', self.options.chunkUrl(uploadId));
+                    }).then(function (data) {
+                        return sendFrom(data.success ? data.offset : offset);
+                    }, function () {
+                        return sendFrom(offset);
+                    });
+                });
+            }
+
+            return sendFrom(session.offset);
+        }).then(function (data) {
+            if (data.success || data.status === 415 || data.status === 422 || data.status === 404) {
+                // Сеанс завершён или больше не существует на сервере
+                if (window.localStorage) {
+                    localStorage.removeItem(key);
+                }
+            }
+            return data;
+        });
+    };
+
+    window.Sha256 = Sha256;
+    window.ChunkedUploader = ChunkedUploader;
+})(window);
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class TestingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'testing'
+
+    def ready(self):
+        from django.db.models.signals import post_delete
+
+        from shift_log.services.blob_storage import release_blob_on_delete
+
+        from .models import FeatureAttachment
+
+        post_delete.connect(
+            release_blob_on_delete, sender=FeatureAttachment,
+            dispatch_uid='release_blob_FeatureAttachment'
+        )
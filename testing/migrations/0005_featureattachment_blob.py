@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift_log', '0028_blob'),
+        ('testing', '0004_featurecomment_completed_at_featurecomment_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='featureattachment',
+            name='blob',
+            field=models.ForeignKey(blank=True, help_text='Хранимое один раз содержимое файла', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='feature_attachments', to='shift_log.blob', verbose_name='Содержимое'),
+        ),
+        migrations.AlterField(
+            model_name='featureattachment',
+            name='file',
+            field=models.FileField(help_text='Загруженный файл', max_length=255, upload_to='testing/attachments/', verbose_name='Файл'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-19 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testing', '0005_featureattachment_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='featureattachment',
+            name='file_checked_at',
+            field=models.DateTimeField(blank=True, help_text='Когда наличие файла проверялось в последний раз', null=True, verbose_name='Проверено'),
+        ),
+        migrations.AddField(
+            model_name='featureattachment',
+            name='file_present',
+            field=models.BooleanField(default=True, help_text='Сохранённый результат проверки наличия файла', verbose_name='Файл на диске'),
+        ),
+    ]
@@ -4,6 +4,8 @@
 Следует принципам DDD (Domain-Driven Design) и Django Best Practices.
 """
 
+from typing import Optional
+
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.urls import reverse
@@ -71,6 +73,23 @@ class TestProject(models.Model):
         return self.features.exclude(status='done').count()
 
 
+class FeatureQuerySet(models.QuerySet):
+    """QuerySet функционала с правилами видимости"""
+
+    def visible_to(self, employee: Optional[Employee]) -> 'FeatureQuerySet':
+        """
+        Ограничивает функционал тем, что доступен сотруднику
+
+        Администраторы и тестировщики видят весь функционал,
+        остальные - только созданный ими.
+        """
+        if employee is None:
+            return self.none()
+        if employee.position == 'admin' or employee.role == 'tester':
+            return self
+        return self.filter(created_by=employee)
+
+
 class Feature(models.Model):
     """Модель функционала для тестирования"""
     
@@ -141,6 +160,8 @@ class Feature(models.Model):
         help_text="Дата окончательного завершения"
     )
 
+    objects = FeatureQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Функционал"
         verbose_name_plural = "Функционал"
@@ -197,7 +218,7 @@ class Feature(models.Model):
         elif employee.position == 'supervisor':
             return True
         elif (employee.role == 'programmer' and 
-              self.created_by == employee):
+              self.created_by_id == employee.id):
             return self.status in ['new', 'rework']
         return False
 
@@ -208,7 +229,7 @@ class Feature(models.Model):
         elif employee.role == 'tester':
             return True
         elif (employee.role == 'programmer' and 
-              self.created_by == employee):
+              self.created_by_id == employee.id):
             return self.status == 'rework'
         return False
 
@@ -449,9 +470,19 @@ class FeatureAttachment(models.Model):
     )
     file = models.FileField(
         upload_to='testing/attachments/',
+        max_length=255,
         verbose_name="Файл",
         help_text="Загруженный файл"
     )
+    blob = models.ForeignKey(
+        'shift_log.Blob',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='feature_attachments',
+        verbose_name="Содержимое",
+        help_text="Хранимое один раз содержимое файла"
+    )
     filename = models.CharField(
         max_length=255,
         verbose_name="Имя файла",
@@ -477,6 +508,17 @@ class FeatureAttachment(models.Model):
         auto_now_add=True,
         verbose_name="Дата загрузки"
     )
+    file_present = models.BooleanField(
+        default=True,
+        verbose_name="Файл на диске",
+        help_text="Сохранённый результат проверки наличия файла"
+    )
+    file_checked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Проверено",
+        help_text="Когда наличие файла проверялось в последний раз"
+    )
 
     class Meta:
         verbose_name = "Вложение к функционалу"
@@ -520,13 +562,8 @@ class FeatureAttachment(models.Model):
 
     def is_viewable_in_browser(self) -> bool:
         """Проверяет, можно ли отобразить файл в браузере"""
-        viewable_types = [
-            'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/webp',
-            'application/pdf',
-            'text/plain', 'text/html', 'text/css', 'text/javascript',
-            'application/json', 'application/xml'
-        ]
-        return self.content_type.lower() in viewable_types
+        from shift_log.services.file_delivery import VIEWABLE_CONTENT_TYPES
+        return self.content_type.lower() in VIEWABLE_CONTENT_TYPES
 
 
 class FeatureStatusHistory(models.Model):
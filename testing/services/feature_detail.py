@@ -0,0 +1,75 @@
+"""
+Загрузка данных страницы функционала.
+
+Функционал читается вместе с замечаниями (с авторами), историей каждого
+замечания и вложениями: один запрос на функционал и по одному на
+замечания, историю и вложения — число запросов не зависит от количества
+замечаний. Разбиение замечаний по статусам делается в памяти, а общая
+лента истории получается слиянием уже упорядоченных историй замечаний
+(heapq.merge) без повторной сортировки.
+"""
+import heapq
+from operator import attrgetter
+from typing import Dict, List
+
+from django.db.models import Prefetch, QuerySet
+
+from ..models import (Feature, FeatureAttachment, FeatureComment,
+                      FeatureCommentHistory)
+
+OPEN_STATUSES = ('open', 'in_progress', 'rework')
+
+
+class FeatureDetailLoader:
+    """Данные страницы функционала за фиксированное число запросов"""
+
+    @staticmethod
+    def prefetch(queryset: QuerySet) -> QuerySet:
+        """
+        Добавляет к queryset функционала всё, что нужно странице
+
+        Замечания (новые первыми) попадают в feature.detail_comments, их
+        история (новая первой) — в comment.timeline, вложения — в
+        feature.detail_attachments.
+        """
+        history = FeatureCommentHistory.objects.select_related('changed_by__user').order_by('-changed_at', '-id')
+        comments = (
+            FeatureComment.objects.select_related('author__user')
+            .prefetch_related(Prefetch('history', queryset=history, to_attr='timeline'))
+            .order_by('-created_at', '-id')
+        )
+        attachments = FeatureAttachment.objects.select_related('uploaded_by__user').order_by('-uploaded_at')
+        return queryset.select_related('test_project', 'created_by__user').prefetch_related(
+            Prefetch('comments', queryset=comments, to_attr='detail_comments'),
+            Prefetch('attachments', queryset=attachments, to_attr='detail_attachments'),
+        )
+
+    @staticmethod
+    def context(feature: Feature) -> Dict[str, List]:
+        """
+        Замечания по статусам, общая лента истории и вложения
+
+        Args:
+            feature: Функционал, загруженный через prefetch()
+        """
+        open_comments, resolved_comments, completed_comments = [], [], []
+        for comment in feature.detail_comments:
+            if comment.status in OPEN_STATUSES:
+                open_comments.append(comment)
+            elif comment.status == 'resolved':
+                resolved_comments.append(comment)
+            elif comment.status == 'completed':
+                completed_comments.append(comment)
+
+        # История каждого замечания уже упорядочена от новых к старым
+        comment_history = list(heapq.merge(
+            *(comment.timeline for comment in feature.detail_comments),
+            key=attrgetter('changed_at'), reverse=True
+        ))
+        return {
+            'open_comments': open_comments,
+            'resolved_comments': resolved_comments,
+            'completed_comments': completed_comments,
+            'comment_history': comment_history,
+            'attachments': feature.detail_attachments,
+        }
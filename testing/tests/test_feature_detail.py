@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from shift_log.models import Department, Employee
+from testing.models import (Feature, FeatureAttachment, FeatureComment,
+                            FeatureCommentHistory, TestProject)
+
+
+class FeatureDetailLoaderTestCase(TestCase):
+    """Тесты загрузки страницы функционала"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        department = Department.objects.create(name="Тестовый отдел")
+        self.tester = Employee.objects.create(
+            user=User.objects.create_user(username='tester', password='pass', first_name='Пётр'),
+            department=department,
+            position='employee',
+            role='tester'
+        )
+        self.project = TestProject.objects.create(name="Проект", created_by=self.tester)
+        self.feature = Feature.objects.create(
+            test_project=self.project,
+            title="Функционал",
+            description="Описание",
+            created_by=self.tester
+        )
+        self.base_time = timezone.now() - timedelta(days=1)
+        self.client.login(username='tester', password='pass')
+
+    def add_comment(self, status, minutes):
+        """Создаёт замечание с записью истории на base_time + minutes"""
+        comment = FeatureComment.objects.create(
+            feature=self.feature, author=self.tester, comment=f"Замечание {minutes}", status=status
+        )
+        history = FeatureCommentHistory.objects.create(comment=comment, action='created', changed_by=self.tester)
+        FeatureCommentHistory.objects.filter(pk=history.pk).update(
+            changed_at=self.base_time + timedelta(minutes=minutes)
+        )
+        return comment
+
+    def get_detail(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('testing:feature_detail', args=[self.feature.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_depend_on_comments(self):
+        """Число запросов не растёт с числом замечаний"""
+        self.add_comment('open', 1)
+        _, single = self.get_detail()
+
+        for minutes in range(2, 8):
+            self.add_comment('resolved' if minutes % 2 else 'open', minutes)
+        FeatureAttachment.objects.create(
+            feature=self.feature, file='attachments/log.txt', filename='log.txt',
+            file_size=10, uploaded_by=self.tester
+        )
+        _, many = self.get_detail()
+        self.assertEqual(single, many)
+
+    def test_comments_partitioned_and_timeline_merged(self):
+        """Замечания разбиты по статусам, история идёт от новых записей к старым"""
+        first = self.add_comment('open', 5)
+        second = self.add_comment('resolved', 1)
+        third = self.add_comment('completed', 3)
+        later = FeatureCommentHistory.objects.create(comment=second, action='resolved', changed_by=self.tester)
+        FeatureCommentHistory.objects.filter(pk=later.pk).update(changed_at=self.base_time + timedelta(minutes=9))
+
+        response, _ = self.get_detail()
+
+        self.assertEqual(response.context['open_comments'], [first])
+        self.assertEqual(response.context['resolved_comments'], [second])
+        self.assertEqual(response.context['completed_comments'], [third])
+        self.assertEqual(
+            [(history.comment_id, history.action) for history in response.context['comment_history']],
+            [(second.pk, 'resolved'), (first.pk, 'created'), (third.pk, 'created'), (second.pk, 'created')]
+        )
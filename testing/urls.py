@@ -26,6 +26,8 @@ urlpatterns = [
     path('features/<int:pk>/comment/<int:comment_id>/complete/', views.FeatureCommentCompleteView.as_view(), name='feature_comment_complete'),
     path('features/<int:pk>/comment/<int:comment_id>/return-to-rework/', views.FeatureCommentReturnToReworkView.as_view(), name='feature_comment_return_to_rework'),
     path('features/<int:pk>/return-to-rework/', views.FeatureReturnToReworkView.as_view(), name='feature_return_to_rework'),
+    path('features/<int:pk>/attachments/<int:attachment_id>/view/', views.FeatureAttachmentFileView.as_view(as_attachment=False), name='feature_attachment_view'),
+    path('features/<int:pk>/attachments/<int:attachment_id>/download/', views.FeatureAttachmentFileView.as_view(), name='feature_attachment_download'),
     
     # API
     path('api/features/<int:pk>/mark-completed/', views.mark_completed_api, name='api_mark_completed'),
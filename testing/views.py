@@ -7,18 +7,24 @@
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.db.models import Q
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import (CreateView, DetailView, ListView, UpdateView,
                                   View)
 
+from shift_log.mixins import CachedObjectMixin
+from shift_log.services.file_delivery import serve_file
+from shift_log.services.file_state import FileStateService
+from shift_log.utils import visible_for_user
+
 from .forms import (FeatureCommentCompleteForm, FeatureCommentForm,
                     FeatureCommentReworkForm, FeatureFilterForm, FeatureForm,
                     FeatureStatusUpdateForm, TestProjectFilterForm,
                     TestProjectForm)
-from .models import Feature, FeatureComment, TestProject
+from .models import Feature, FeatureAttachment, FeatureComment, TestProject
+from .services.feature_detail import FeatureDetailLoader
 from .services.feature_service import FeatureService, TestProjectService
 
 
@@ -116,7 +122,7 @@ class TestProjectCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView)
             return self.form_invalid(form)
 
 
-class TestProjectDetailView(LoginRequiredMixin, DetailView):
+class TestProjectDetailView(CachedObjectMixin, LoginRequiredMixin, DetailView):
     """Детальная информация о тестовом проекте"""
     
     model = TestProject
@@ -174,7 +180,7 @@ class TestProjectDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
-class TestProjectUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class TestProjectUpdateView(CachedObjectMixin, LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     """Редактирование тестового проекта"""
     
     model = TestProject
@@ -192,7 +198,7 @@ class TestProjectUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView)
         
         return (
             employee.position == 'admin' or 
-            project.created_by == employee
+            project.created_by_id == employee.id
         )
 
     def get_queryset(self):
@@ -232,23 +238,10 @@ class FeatureListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         """Возвращает queryset функционала с учетом прав доступа"""
-        queryset = Feature.objects.select_related(
+        queryset = visible_for_user(Feature, self.request.user).select_related(
             'test_project', 'created_by', 'created_by__user'
         ).prefetch_related('comments')
         
-        if hasattr(self.request.user, 'employee'):
-            employee = self.request.user.employee
-            
-            if employee.position == 'admin':
-                # Администраторы видят весь функционал
-                pass
-            elif employee.role == 'tester':
-                # Тестировщики видят весь функционал
-                pass
-            else:
-                # Программисты видят только свой функционал
-                queryset = queryset.filter(created_by=employee)
-        
         # Применяем фильтры
         form = FeatureFilterForm(self.request.GET, user=self.request.user)
         if form.is_valid():
@@ -341,7 +334,7 @@ class FeatureCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
             return self.form_invalid(form)
 
 
-class FeatureDetailView(LoginRequiredMixin, DetailView):
+class FeatureDetailView(CachedObjectMixin, LoginRequiredMixin, DetailView):
     """Детальная информация о функционале"""
     
     model = Feature
@@ -350,64 +343,27 @@ class FeatureDetailView(LoginRequiredMixin, DetailView):
 
     def get_queryset(self):
         """Возвращает queryset с учетом прав доступа"""
-        queryset = Feature.objects.select_related(
-            'test_project', 'created_by', 'created_by__user'
-        ).prefetch_related('comments', 'comments__author', 'attachments')
-        
-        if hasattr(self.request.user, 'employee'):
-            employee = self.request.user.employee
-            
-            if employee.position == 'admin':
-                # Администраторы видят весь функционал
-                pass
-            elif employee.role == 'tester':
-                # Тестировщики видят весь функционал
-                pass
-            else:
-                # Программисты видят только свой функционал
-                queryset = queryset.filter(created_by=employee)
-        
-        return queryset
+        return FeatureDetailLoader.prefetch(
+            visible_for_user(Feature, self.request.user)
+        )
 
     def get_context_data(self, **kwargs):
         """Добавляет дополнительные данные в контекст"""
         context = super().get_context_data(**kwargs)
         feature = self.get_object()
         
-        # Получаем замечания сгруппированные по статусу
-        all_comments = feature.comments.select_related('author', 'author__user').order_by('-created_at')
-        
-        # Группируем замечания по статусу
-        open_comments = all_comments.filter(status__in=['open', 'in_progress', 'rework'])
-        resolved_comments = all_comments.filter(status='resolved')
-        completed_comments = all_comments.filter(status='completed')
-        
-        # Получаем историю замечаний
-        comment_history = []
-        for comment in all_comments:
-            history = comment.history.select_related('changed_by', 'changed_by__user').order_by('-changed_at')
-            comment_history.extend(history)
-        
-        # Сортируем всю историю по дате
-        comment_history.sort(key=lambda x: x.changed_at, reverse=True)
-        
-        # Получаем вложения
-        attachments = feature.attachments.select_related('uploaded_by', 'uploaded_by__user').order_by('-uploaded_at')
-        
-        # Формы
-        comment_form = FeatureCommentForm()
+        # Замечания по статусам, лента истории и вложения — из уже загруженных данных
+        context.update(FeatureDetailLoader.context(feature))
         
         # Проверяем права
         employee = self.request.user.employee if hasattr(self.request.user, 'employee') else None
-        can_edit = feature.can_be_edited_by(employee) if employee else False
+        can_edit = self.get_permission_fact(
+            'can_edit',
+            lambda: feature.can_be_edited_by(employee) if employee else False
+        )
         
         context.update({
-            'open_comments': open_comments,
-            'resolved_comments': resolved_comments,
-            'completed_comments': completed_comments,
-            'comment_history': comment_history,
-            'attachments': attachments,
-            'comment_form': comment_form,
+            'comment_form': FeatureCommentForm(),
             'employee': employee,
             'can_edit': can_edit
         })
@@ -415,7 +371,7 @@ class FeatureDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
-class FeatureUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class FeatureUpdateView(CachedObjectMixin, LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     """Редактирование функционала"""
     
     model = Feature
@@ -430,7 +386,9 @@ class FeatureUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         feature = self.get_object()
         employee = self.request.user.employee
         
-        return feature.can_be_edited_by(employee)
+        return self.get_permission_fact(
+            'can_edit', lambda: feature.can_be_edited_by(employee)
+        )
     
     def get_form_kwargs(self):
         """Передает пользователя в форму"""
@@ -573,6 +531,42 @@ class FeatureReturnToReworkView(LoginRequiredMixin, View):
         return redirect('testing:feature_detail', pk=pk)
 
 
+class FeatureAttachmentFileView(LoginRequiredMixin, View):
+    """Отдача файла вложения к функционалу (просмотр или скачивание)"""
+    
+    as_attachment = True
+    
+    def get(self, request, pk, attachment_id):
+        """Проверяет доступ к функционалу и отдаёт файл потоком"""
+        employee = getattr(request.user, 'employee', None)
+        attachment = get_object_or_404(
+            FeatureAttachment.objects.filter(
+                feature__in=Feature.objects.visible_to(employee).values('id')
+            ),
+            pk=attachment_id,
+            feature_id=pk
+        )
+        
+        if not attachment.file:
+            raise Http404('Файл не найден на сервере')
+        
+        try:
+            response = serve_file(
+                request,
+                attachment.file,
+                attachment.filename,
+                attachment.content_type,
+                as_attachment=self.as_attachment or not attachment.is_viewable_in_browser()
+            )
+        except FileNotFoundError:
+            FileStateService.record(attachment, present=False)
+            raise Http404('Файл не найден на сервере')
+        except PermissionError:
+            raise Http404('Файл не найден на сервере')
+        FileStateService.record(attachment, present=True)
+        return response
+
+
 @csrf_exempt
 def mark_completed_api(request, pk):
     """API для отметки функционала как выполненного"""